@@ -1,8 +1,11 @@
 """Load records into elasticsearch clusters."""
 
+from collections import deque
 from itertools import islice
 import logging
 import random
+import sys
+import threading
 import time
 
 try:
@@ -31,6 +34,74 @@ REJECTED_REQUEST_STATUS = 429
 HTTP_SERVICE_UNAVAILABLE_STATUS_CODE = 503
 HTTP_GATEWAY_TIMEOUT_STATUS_CODE = 504
 
+# Counters may be incremented by the threads that send bulk requests as well as by the reducer itself.
+COUNTER_LOCK = threading.Lock()
+
+
+class BackgroundCall(object):
+    """
+    Calls a function in a separate thread, keeping its result or the exception it raised until it is requested.
+    """
+
+    def __init__(self, function, *args, **kwargs):
+        self.result = None
+        self.exc_info = None
+        self.thread = threading.Thread(target=self._run, args=(function, args, kwargs))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self, function, args, kwargs):
+        """Call the function, capturing whatever it returns or raises."""
+        try:
+            self.result = function(*args, **kwargs)
+        except Exception:  # pylint: disable=broad-except
+            self.exc_info = sys.exc_info()
+
+    def get(self):
+        """Wait for the call to finish and return its result, re-raising any exception it raised."""
+        self.thread.join()
+        if self.exc_info is not None:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+        return self.result
+
+
+class BulkBatchSizer(object):
+    """
+    Adjusts the number of documents sent in each bulk request based on how the cluster responds to them.
+
+    The size grows slowly while requests complete well within the target latency and shrinks quickly when they take
+    longer than that, or when the cluster rejects them because its queues are full. This is safe to use from multiple
+    threads.
+    """
+
+    GROWTH_FRACTION = 0.1
+    SLOW_RESPONSE_FACTOR = 0.75
+    REJECTION_FACTOR = 0.5
+
+    def __init__(self, initial_size, max_size, target_latency, min_size=1):
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size)
+        self.target_latency = target_latency
+        self.batch_size = self._bound(initial_size)
+        self.lock = threading.Lock()
+
+    def _bound(self, size):
+        """Restrict a batch size to the configured range."""
+        return max(self.min_size, min(self.max_size, int(size)))
+
+    def record_response(self, latency):
+        """Adjust the batch size given the number of seconds it took for a bulk request to be acknowledged."""
+        with self.lock:
+            if latency > self.target_latency:
+                self.batch_size = self._bound(self.batch_size * self.SLOW_RESPONSE_FACTOR)
+            elif latency < self.target_latency / 2:
+                self.batch_size = self._bound(self.batch_size + max(1, self.max_size * self.GROWTH_FRACTION))
+
+    def record_rejection(self):
+        """Shrink the batch size after the cluster rejected a bulk request."""
+        with self.lock:
+            self.batch_size = self._bound(self.batch_size * self.REJECTION_FACTOR)
+
 
 class ElasticsearchIndexTask(OverwriteOutputMixin, MapReduceJobTask):
     """
@@ -43,6 +114,8 @@ class ElasticsearchIndexTask(OverwriteOutputMixin, MapReduceJobTask):
       index.
     * Delete any indexes that were previously pointed at by the alias, leaving only the newly loaded index.
 
+    Subclasses that can determine which documents have changed since the index the alias points at was loaded can
+    instead update that index in place, see `should_update_live_index`.
     """
 
     host = luigi.Parameter(
@@ -104,6 +177,26 @@ class ElasticsearchIndexTask(OverwriteOutputMixin, MapReduceJobTask):
                     ' indexing process will retry up to this many times before giving up. It uses an exponential back-'
                     'off strategy, so a high value here can result in very significant wait times before retrying.'
     )
+    max_concurrent_requests = luigi.IntParameter(
+        config_path={'section': 'elasticsearch', 'name': 'max_concurrent_requests'},
+        default=1,
+        significant=False,
+        description='Maximum number of bulk requests each indexing process will have in flight at the same time. The'
+                    ' next batch of records is always prepared while the previous ones are being indexed.'
+    )
+    target_batch_latency = luigi.FloatParameter(
+        default=None,
+        significant=False,
+        description='If specified, the number of records in each batch is adjusted so that bulk requests take roughly'
+                    ' this many seconds to be acknowledged by the cluster, starting at `batch_size`. Batches are made'
+                    ' smaller when requests are slower than this or rejected by the cluster.'
+    )
+    max_batch_size = luigi.IntParameter(
+        default=None,
+        significant=False,
+        description='The largest number of records a batch can grow to when `target_batch_latency` is specified.'
+                    ' Defaults to `batch_size`.'
+    )
 
     # These attributes should be overridden, but don't need to be.
     settings = {}
@@ -127,10 +220,17 @@ class ElasticsearchIndexTask(OverwriteOutputMixin, MapReduceJobTask):
 
         # Find all indexes that are referred to by this alias (currently). These will be deleted after a successful
         # load of the new index.
-        aliases = elasticsearch_client.indices.get_aliases(name=self.alias)
-        self.indexes_for_alias.update(
-            [index for index, alias_info in aliases.iteritems() if self.alias in alias_info['aliases'].keys()]
-        )
+        self.indexes_for_alias.update(self.get_alias_indexes(elasticsearch_client))
+
+        if self.should_update_live_index():
+            if len(self.indexes_for_alias) != 1:
+                raise RuntimeError(
+                    'Unable to update alias {0} in place, it must point at exactly one index'.format(self.alias)
+                )
+            # Write the documents to the index the alias already points at, leaving the alias unchanged.
+            self.index = self.indexes_for_alias.pop()
+            self.attempted_removal = True
+            return
 
         if self.index in self.indexes_for_alias:
             if not self.overwrite:
@@ -173,6 +273,21 @@ class ElasticsearchIndexTask(OverwriteOutputMixin, MapReduceJobTask):
             }
         })
 
+    def get_alias_indexes(self, elasticsearch_client):
+        """Returns the names of the indexes the alias currently points at."""
+        aliases = elasticsearch_client.indices.get_aliases(name=self.alias)
+        return set(index for index, alias_info in aliases.iteritems() if self.alias in alias_info['aliases'].keys())
+
+    def should_update_live_index(self):
+        """
+        Returns True if documents should be written to the index currently pointed at by the alias.
+
+        By default a new index is built on every run. Subclasses may override this to send only the documents that have
+        changed, and delete actions for documents that no longer exist, to the live index instead. Note that users can
+        see the changes as they are made, and they are not undone if the load fails.
+        """
+        return False
+
     def create_elasticsearch_client(self):
         """Build an elasticsearch client using the various parameters passed into this task."""
         kwargs = {}
@@ -193,37 +308,69 @@ class ElasticsearchIndexTask(OverwriteOutputMixin, MapReduceJobTask):
         """
         Given a batch of records, transmit them to the elasticsearch cluster to be indexed.
 
-        There should be one reducer per parallel indexing thread. Controlling the number of reducers is the way to
-        control the level of parallelism in the load process.
+        Each reducer keeps up to `max_concurrent_requests` bulk requests in flight, preparing the next batch while the
+        previous ones are being indexed. The level of parallelism in the load process is controlled by both the number
+        of reducers and this limit.
         """
         elasticsearch_client = self.create_elasticsearch_client()
 
+        batch_sizer = None
+        if self.target_batch_latency:
+            batch_sizer = BulkBatchSizer(
+                self.batch_size,
+                self.max_batch_size or self.batch_size,
+                self.target_batch_latency
+            )
+
+        # Requests that are still in flight when an error is raised are abandoned, their threads do not prevent the
+        # process from exiting.
+        pending_requests = deque()
         document_iterator = self.document_generator(lines)
         first_batch = True
         while True:
-            bulk_action_batch = self.next_bulk_action_batch(document_iterator)
+            batch_size = batch_sizer.batch_size if batch_sizer else self.batch_size
+            documents = list(islice(document_iterator, batch_size))
 
-            if not bulk_action_batch:
+            if not documents:
                 break
 
+            while len(pending_requests) >= self.max_concurrent_requests:
+                self.complete_bulk_request(*pending_requests.popleft())
+
             if not first_batch and self.throttle:
                 time.sleep(self.throttle)
             first_batch = False
 
-            if self.send_bulk_action_batch(elasticsearch_client, bulk_action_batch):
-                self.incr_counter('Elasticsearch', 'Committed Batches', 1)
+            # Count the documents rather than the bulk actions, delete actions only produce a single entry each.
+            bulk_action_batch = self.next_bulk_action_batch(iter(documents), batch_size=len(documents))
+            bulk_request = BackgroundCall(
+                self.send_bulk_action_batch,
+                elasticsearch_client,
+                bulk_action_batch,
+                batch_sizer=batch_sizer
+            )
+            pending_requests.append((len(documents), bulk_request))
 
-                # Note that each document produces two entries in the bulk_action_batch list.
-                num_records = len(bulk_action_batch) / 2
-                self.incr_counter('Elasticsearch', 'Records Indexed', num_records)
-            else:
-                raise IndexingError('Batch of records rejected too many times. Aborting.')
+        while pending_requests:
+            self.complete_bulk_request(*pending_requests.popleft())
 
         # Luigi requires the reducer to actually return something, so we just return empty strings that are written
         # to a temp file in HDFS that is immediately cleaned up after the job finishes.
         yield ('', '')
 
-    def next_bulk_action_batch(self, document_iterator):
+    def complete_bulk_request(self, num_records, bulk_request):
+        """Wait for a bulk request sent by the reducer to be acknowledged, raising any error it encountered."""
+        if bulk_request.get():
+            self.incr_counter('Elasticsearch', 'Committed Batches', 1)
+            self.incr_counter('Elasticsearch', 'Records Indexed', num_records)
+        else:
+            raise IndexingError('Batch of records rejected too many times. Aborting.')
+
+    def incr_counter(self, *args, **kwargs):
+        with COUNTER_LOCK:
+            super(ElasticsearchIndexTask, self).incr_counter(*args, **kwargs)
+
+    def next_bulk_action_batch(self, document_iterator, batch_size=None):
         """
         Read a batch of documents from the iterator and convert them into bulk index actions.
 
@@ -234,18 +381,19 @@ class ElasticsearchIndexTask(OverwriteOutputMixin, MapReduceJobTask):
 
         Arguments:
             document_iterator (iterator of dicts):
+            batch_size (int): The maximum number of documents to read, defaults to `batch_size`.
 
         Returns: A list of dicts that can be transmitted to elasticsearch using the "bulk" request.
         """
         bulk_action_batch = []
-        for raw_data in islice(document_iterator, self.batch_size):
+        for raw_data in islice(document_iterator, batch_size or self.batch_size):
             action, data = elasticsearch.helpers.expand_action(raw_data)
             bulk_action_batch.append(action)
             if data is not None:
                 bulk_action_batch.append(data)
         return bulk_action_batch
 
-    def send_bulk_action_batch(self, elasticsearch_client, bulk_action_batch):
+    def send_bulk_action_batch(self, elasticsearch_client, bulk_action_batch, batch_sizer=None):
         """
         Given a batch of actions, transmit them in bulk to the elasticsearch cluster.
 
@@ -256,6 +404,8 @@ class ElasticsearchIndexTask(OverwriteOutputMixin, MapReduceJobTask):
         Arguments:
             elasticsearch_client (elasticsearch.Elasticsearch): A reference to an elasticsearch client.
             bulk_action_batch (list of dicts): A list of bulk actions followed by their respective documents.
+            batch_sizer (BulkBatchSizer): If specified, it is informed of the latency of each request and of any
+                rejections.
 
         Raises:
             IndexingError: If a record cannot be indexed by elasticsearch this method assumes that is a fatal error and
@@ -268,16 +418,24 @@ class ElasticsearchIndexTask(OverwriteOutputMixin, MapReduceJobTask):
         attempts = 0
         batch_written_successfully = False
         while True:
+            start_time = time.time()
             try:
                 resp = elasticsearch_client.bulk(bulk_action_batch, index=self.index, doc_type=self.doc_type)
             except TransportError as transport_error:
                 if transport_error.status_code not in (REJECTED_REQUEST_STATUS, HTTP_SERVICE_UNAVAILABLE_STATUS_CODE):
                     raise transport_error
+                if batch_sizer:
+                    batch_sizer.record_rejection()
             else:
+                if batch_sizer:
+                    batch_sizer.record_response(time.time() - start_time)
+
                 num_errors = 0
                 for raw_data in resp['items']:
-                    _op_type, item = raw_data.popitem()
-                    successful = 200 <= item.get('status', 500) < 300
+                    op_type, item = raw_data.popitem()
+                    status = item.get('status', 500)
+                    # Deleting a document that has already been removed is not an error.
+                    successful = 200 <= status < 300 or (op_type == 'delete' and status == 404)
                     if not successful:
                         log.error('Failed to index: %s', str(item))
                         num_errors += 1
@@ -367,9 +525,14 @@ class ElasticsearchIndexTask(OverwriteOutputMixin, MapReduceJobTask):
             client=self.create_elasticsearch_client(),
             index=self.alias,
             doc_type=self.doc_type,
-            update_id=self.update_id()
+            update_id=self.update_id(),
+            marker_fields=self.marker_fields()
         )
 
+    def marker_fields(self):
+        """Additional fields to record in the marker document, by default the name of the index that was written."""
+        return {'written_index': self.index}
+
     def commit(self):
         """
         If all documents have been loaded successfully, make the changes visible to users.
@@ -382,13 +545,15 @@ class ElasticsearchIndexTask(OverwriteOutputMixin, MapReduceJobTask):
         # step is necessary to ensure all of the documents are properly indexed and user-visible.
         elasticsearch_client.indices.refresh(index=self.index)
 
-        # Perform an atomic swap of the alias.
-        actions = []
-        old_indexes = [ix for ix in self.indexes_for_alias if elasticsearch_client.indices.exists(index=ix)]
-        for old_index in old_indexes:
-            actions.append({"remove": {"index": old_index, "alias": self.alias}})
-        actions.append({"add": {"index": self.index, "alias": self.alias}})
-        elasticsearch_client.indices.update_aliases({"actions": actions})
+        # Perform an atomic swap of the alias, unless it already points at the index that was updated.
+        old_indexes = []
+        if not self.should_update_live_index():
+            actions = []
+            old_indexes = [ix for ix in self.indexes_for_alias if elasticsearch_client.indices.exists(index=ix)]
+            for old_index in old_indexes:
+                actions.append({"remove": {"index": old_index, "alias": self.alias}})
+            actions.append({"add": {"index": self.index, "alias": self.alias}})
+            elasticsearch_client.indices.update_aliases({"actions": actions})
 
         # Update the luigi metadata to indicate that the task ran successfully.
         self.output().touch()
@@ -401,6 +566,11 @@ class ElasticsearchIndexTask(OverwriteOutputMixin, MapReduceJobTask):
         """
         If something goes wrong during the load, attempt to clean up the partially loaded index.
         """
+        if self.should_update_live_index():
+            # The index is still in use, the next full load will replace any partial updates.
+            log.error('Failed to update index %s in place, it may be partially updated.', self.index)
+            return
+
         elasticsearch_client = self.create_elasticsearch_client()
         try:
             if elasticsearch_client.indices.exists(index=self.index):
@@ -3,12 +3,19 @@ Support executing map reduce tasks.
 """
 from __future__ import absolute_import
 
+import glob
 import gzip
 from hashlib import md5
+import heapq
+import multiprocessing
 import os
+import shutil
 import StringIO
 import logging
 import logging.config
+import sys
+import tempfile
+import zlib
 
 import luigi
 import luigi.hdfs
@@ -16,12 +23,56 @@ import luigi.hadoop
 import luigi.task
 from luigi import configuration
 
+from edx.analytics.tasks.util import compact_encoding
 from edx.analytics.tasks.util.manifest import convert_to_manifest_input_if_necessary
 from edx.analytics.tasks.util.url import get_target_from_url, url_path_join
 
 
 log = logging.getLogger(__name__)
 
+# Whether the packages that Hadoop jobs depend on have been attached yet.
+_hadoop_dependencies_attached = False  # pylint: disable=invalid-name
+
+
+def attach_hadoop_dependencies():
+    """
+    Tell luigi what dependencies to pass to the Hadoop nodes.
+
+    These packages are imported here, when the first Hadoop job is run, rather than when launch-task starts, so that
+    tasks that never run a Hadoop job do not pay for importing them.
+
+    - edx.analytics.tasks is used to load the pipeline code, since we cannot trust all will be loaded automatically.
+    - boto is used for all direct interactions with s3.
+    - cjson is used for all parsing event logs.
+    - filechunkio is used for multipart uploads of large files to s3.
+    - opaque_keys is used to interpret serialized course_ids
+      - opaque_keys extensions:  ccx_keys
+      - dependencies of opaque_keys:  bson, stevedore
+    """
+    global _hadoop_dependencies_attached  # pylint: disable=global-statement,invalid-name
+    if _hadoop_dependencies_attached:
+        return
+
+    import boto
+    import bson
+    import ciso8601
+    import cjson
+    import filechunkio
+    import opaque_keys
+    import requests
+    import stevedore
+
+    import edx.analytics.tasks
+
+    luigi.hadoop.attach(edx.analytics.tasks)
+    luigi.hadoop.attach(boto, cjson, filechunkio, opaque_keys, bson, stevedore, ciso8601, requests)
+
+    if configuration.get_config().getboolean('ccx', 'enabled', default=False):
+        import ccx_keys
+        luigi.hadoop.attach(ccx_keys)
+
+    _hadoop_dependencies_attached = True
+
 
 class MapReduceJobTaskMixin(object):
     """Defines arguments used by downstream tasks to pass to upstream MapReduceJobTask."""
@@ -29,7 +80,8 @@ class MapReduceJobTaskMixin(object):
     mapreduce_engine = luigi.Parameter(
         config_path={'section': 'map-reduce', 'name': 'engine'},
         significant=False,
-        description='Name of the map reduce job engine to use.  Use `hadoop` (the default) or `local`.',
+        description='Name of the map reduce job engine to use.  Use `hadoop` (the default), `local`, `emu` or '
+        '`local-parallel`.',
     )
     # TODO: remove these parameters
     input_format = luigi.Parameter(
@@ -60,8 +112,23 @@ class MapReduceJobTask(MapReduceJobTaskMixin, luigi.hadoop.JobTask):
     """
     Execute a map reduce job.  Typically using Hadoop, but can execute the
     job in process as well.
+
+    Jobs that emit many records with the same key from the mapper, such as counting jobs, can set
+    `enable_map_side_aggregation` to combine the values for each key before they are written out by the mapper. The
+    values are combined using aggregate_map_output_values(), which sums them by default. Up to
+    `map_side_aggregation_max_keys` keys are held in memory at a time, all of them are written out when that limit is
+    reached. Since a key may still be written out several times, the reducer must produce the same result when given
+    partially aggregated values as when given the original ones.
+
+    Jobs that shuffle a lot of data can set `enable_compact_map_output` to pass data from the mappers to the reducers
+    using the encoding in compact_encoding instead of repr() and eval(). Keys and values are decoded to the same types
+    they were emitted with, except that lists and other containers nested inside of tuples are encoded using repr().
     """
 
+    enable_map_side_aggregation = False
+    map_side_aggregation_max_keys = 10000
+    enable_compact_map_output = False
+
     def init_hadoop(self):
         log_format = '%(asctime)s %(levelname)s %(process)d [%(name)s] %(filename)s:%(lineno)d - %(message)s'
         logging.config.dictConfig(
@@ -87,6 +154,46 @@ class MapReduceJobTask(MapReduceJobTaskMixin, luigi.hadoop.JobTask):
         )
         return super(MapReduceJobTask, self).init_hadoop()
 
+    def _map_input(self, input_stream):
+        outputs = super(MapReduceJobTask, self)._map_input(input_stream)
+        if self.enable_map_side_aggregation:
+            outputs = self._aggregate_map_output(outputs)
+        return outputs
+
+    def _aggregate_map_output(self, outputs):
+        """Combine the values of mapper outputs that have the same key, holding a bounded number of keys in memory."""
+        aggregated = {}
+        for key, value in outputs:
+            if key in aggregated:
+                aggregated[key] = self.aggregate_map_output_values(aggregated[key], value)
+            else:
+                if len(aggregated) >= self.map_side_aggregation_max_keys:
+                    for aggregated_output in aggregated.iteritems():
+                        yield aggregated_output
+                    aggregated.clear()
+                aggregated[key] = value
+
+        for aggregated_output in aggregated.iteritems():
+            yield aggregated_output
+
+    def aggregate_map_output_values(self, value, other_value):
+        """Returns the combination of two values emitted by the mapper for the same key."""
+        return value + other_value
+
+    def internal_writer(self, outputs, stdout):
+        if not self.enable_compact_map_output:
+            return super(MapReduceJobTask, self).internal_writer(outputs, stdout)
+
+        for output in outputs:
+            stdout.write(compact_encoding.encode_map_output(output))
+            stdout.write('\n')
+
+    def internal_reader(self, input_stream):
+        if not self.enable_compact_map_output:
+            return super(MapReduceJobTask, self).internal_reader(input_stream)
+
+        return (compact_encoding.decode_map_output(input_line) for input_line in input_stream)
+
     def job_runner(self):
         # Lazily import this since this module will be loaded on hadoop worker nodes however stevedore will not be
         # available in that environment.
@@ -144,6 +251,8 @@ class MapReduceJobRunner(luigi.hadoop.HadoopJobRunner):
     """
 
     def __init__(self, libjars_in_hdfs=None, input_format=None):
+        attach_hadoop_dependencies()
+
         libjars_in_hdfs = libjars_in_hdfs or []
         config = configuration.get_config()
         streaming_jar = config.get('hadoop', 'streaming-jar', '/tmp/hadoop-streaming.jar')
@@ -174,27 +283,28 @@ class EmulatedMapReduceJobRunner(luigi.hadoop.JobRunner):
       that should be processed by the task. It makes use of this information to "do the right thing". This mirrors the
       behavior of a manifest input format in hadoop.
     * It sets the "map_input_file" environment variable when running the mapper just like the hadoop streaming library.
+    * It sorts the map output on disk when it does not fit within a memory budget, and streams the merged result
+      directly into the reducer. The budget, in megabytes, is set using the `local_memory_budget_mb` option in the
+      `map-reduce` section of the configuration file. At most `local_max_merge_fan_in` sorted runs are opened at the
+      same time, more runs than that are first merged into larger intermediate runs.
 
     Other than that it should behave identically to LocalJobRunner.
 
     """
 
-    def group(self, input):
-        output = StringIO.StringIO()
-        lines = []
-        for i, line in enumerate(input):
-            parts = line.rstrip('\n').split('\t')
-            blob = md5(str(i)).hexdigest()  # pseudo-random blob to make sure the input isn't sorted
-            lines.append((parts[:-1], blob, line))
-        for k, _, line in sorted(lines):
-            output.write(line)
-        output.seek(0)
-        return output
+    def __init__(self):
+        config = configuration.get_config()
+        self.memory_budget = config.getint('map-reduce', 'local_memory_budget_mb', 256) * 1024 * 1024
+        self.max_merge_fan_in = config.getint('map-reduce', 'local_max_merge_fan_in', 64)
 
-    def run_job(self, job):
-        job.init_hadoop()
-        job.init_mapper()
-        map_output = StringIO.StringIO()
+    def get_map_input_targets(self, job):
+        """
+        Returns the list of files that should be passed to the mapper.
+
+        Directories are assumed to be Hadoop output and are replaced by their contents, and manifest files are replaced
+        by the files that they list.
+        """
+        map_input_targets = []
         input_targets = luigi.task.flatten(job.input_hadoop())
         for input_target in input_targets:
             # if file is a directory, then assume that it's Hadoop output,
@@ -206,38 +316,319 @@ class EmulatedMapReduceJobRunner(luigi.hadoop.JobRunner):
                     input_targets.append(get_target_from_url(url.strip()))
                 continue
 
-            with input_target.open('r') as input_file:
-
-                # S3 files not yet supported since they don't support tell() and seek()
-                if input_target.path.endswith('.gz'):
-                    input_file = gzip.GzipFile(fileobj=input_file)
-                elif input_target.path.endswith('.manifest'):
+            if input_target.path.endswith('.manifest'):
+                with input_target.open('r') as input_file:
                     for url in input_file:
                         input_targets.append(get_target_from_url(url.strip()))
-                    continue
+                continue
 
-                os.environ['map_input_file'] = input_target.path
-                try:
-                    outputs = job._map_input((line[:-1] for line in input_file))
-                    job.internal_writer(outputs, map_output)
-                finally:
-                    del os.environ['map_input_file']
+            map_input_targets.append(input_target)
 
-        map_output.seek(0)
+        return map_input_targets
 
-        reduce_input = self.group(map_output)
-        try:
-            reduce_output = job.output().open('w')
-        except Exception:
-            reduce_output = StringIO.StringIO()
+    def map_input_target(self, job, input_target, map_output):
+        """Run the mapper over the contents of a single input file and write the results to `map_output`."""
+        with input_target.open('r') as input_file:
+
+            # S3 files not yet supported since they don't support tell() and seek()
+            if input_target.path.endswith('.gz'):
+                input_file = gzip.GzipFile(fileobj=input_file)
+
+            os.environ['map_input_file'] = input_target.path
+            try:
+                outputs = job._map_input((line[:-1] for line in input_file))
+                job.internal_writer(outputs, map_output)
+            finally:
+                del os.environ['map_input_file']
+
+    def run_job(self, job):
+        job.init_hadoop()
+        job.init_mapper()
 
+        work_dir = tempfile.mkdtemp(prefix='mapreduce-')
         try:
-            job._run_reducer(reduce_input, reduce_output)
+            map_output = PartitionedMapOutput(
+                os.path.join(work_dir, 'map-part-{partition}-run-{run:05d}'),
+                1,
+                memory_budget=self.memory_budget,
+                shuffle_values=True,
+            )
+            for input_target in self.get_map_input_targets(job):
+                self.map_input_target(job, input_target, map_output)
+            map_output.close()
+
+            run_paths = combine_sorted_runs(
+                map_output.run_paths[0], os.path.join(work_dir, 'merge'), self.max_merge_fan_in
+            )
+            reduce_input = merge_sorted_map_output(run_paths)
+            try:
+                reduce_output = job.output().open('w')
+            except Exception:
+                reduce_output = StringIO.StringIO()
+
+            try:
+                job._run_reducer(reduce_input, reduce_output)
+            finally:
+                try:
+                    reduce_output.close()
+                except Exception:
+                    pass
         finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+# The number of bytes used by each reference to a buffered line in the list that holds its partition.
+POINTER_SIZE = 8
+
+
+def get_map_output_key(line):
+    """Returns the parts of a line of map output that make up its key, in the form used for sorting and grouping."""
+    return line.rstrip('\n').split('\t')[:-1]
+
+
+class PartitionedMapOutput(object):
+    """
+    A file-like object that splits lines of map output into partitions based on a hash of their key.
+
+    The lines of each partition are sorted by key and written to disk as one or more sorted runs. Lines are buffered in
+    memory until the memory budget is exceeded, at which point all of the buffered lines are sorted and spilled to disk.
+    The runs of each partition can be combined using merge_sorted_map_output().
+
+    Args:
+        path_template (str): A template for the path of each run, with `{partition}` and `{run}` placeholders.
+        num_partitions (int): The number of partitions to split the output into.
+        memory_budget (int): The approximate number of bytes of memory to use to buffer map output before spilling it
+            to disk. This counts the Python objects that hold each buffered line and its sort key, which take up
+            several times as much memory as the text of the line. If not specified, all of the output is buffered until
+            the object is closed.
+        shuffle_values (bool): If True, the values for each key are sorted in a pseudo-random order instead of being
+            kept in the order they were written, to make sure reducers do not depend on the order of their input.
+    """
+
+    def __init__(self, path_template, num_partitions, memory_budget=None, shuffle_values=False):
+        self.path_template = path_template
+        self.num_partitions = num_partitions
+        self.memory_budget = memory_budget
+        self.shuffle_values = shuffle_values
+        self.partitions = [[] for _ in xrange(num_partitions)]
+        self.run_paths = [[] for _ in xrange(num_partitions)]
+        self.num_runs = 0
+        self.num_lines = 0
+        self.buffered_bytes = 0
+        self.pending = ''
+
+    def write(self, data):
+        """Buffer the data until complete lines are available, then assign each line to its partition."""
+        self.pending += data
+        while True:
+            index = self.pending.find('\n')
+            if index < 0:
+                break
+            line = self.pending[:index + 1]
+            self.pending = self.pending[index + 1:]
+            key = get_map_output_key(line)
+            if self.num_partitions > 1:
+                partition = (zlib.crc32('\t'.join(key)) & 0xffffffff) % self.num_partitions
+            else:
+                partition = 0
+            if self.shuffle_values:
+                # pseudo-random blob to make sure the input isn't sorted
+                sort_key = (key, md5(str(self.num_lines)).hexdigest())
+            else:
+                sort_key = key
+            entry = (sort_key, line)
+            self.partitions[partition].append(entry)
+            self.num_lines += 1
+            self.buffered_bytes += self.get_entry_size(entry)
+            if self.memory_budget is not None and self.buffered_bytes >= self.memory_budget:
+                self.spill()
+
+    @staticmethod
+    def get_entry_size(entry):
+        """Returns the number of bytes of memory used by a buffered line, its sort key and the reference to them."""
+        sort_key, line = entry
+        size = sys.getsizeof(entry) + sys.getsizeof(line) + POINTER_SIZE
+        if isinstance(sort_key, tuple):
+            key, random_blob = sort_key
+            size += sys.getsizeof(sort_key) + sys.getsizeof(random_blob)
+        else:
+            key = sort_key
+        size += sys.getsizeof(key) + sum(sys.getsizeof(key_part) for key_part in key)
+        return size
+
+    def spill(self):
+        """Write each non-empty partition to a new sorted run on disk."""
+        for partition, lines in enumerate(self.partitions):
+            if not lines:
+                continue
+            # The sort is stable, so unless the values are shuffled they retain their original order within each key.
+            lines.sort(key=lambda key_and_line: key_and_line[0])
+            path = self.path_template.format(partition=partition, run=self.num_runs)
+            with open(path, 'w') as run_file:
+                for _key, line in lines:
+                    run_file.write(line)
+            self.run_paths[partition].append(path)
+            self.partitions[partition] = []
+        self.num_runs += 1
+        self.buffered_bytes = 0
+
+    def close(self):
+        """Write any remaining buffered lines to disk."""
+        if self.pending:
+            self.write('\n')
+        self.spill()
+
+
+def merge_sorted_map_output(paths):
+    """
+    Merge several files of map output, each sorted by key, into a single stream of lines that is sorted by key.
+
+    Values with the same key are not compared, they are taken from the files in the order the files are given.
+    """
+    files = [open(path, 'r') for path in paths]
+    try:
+        decorated_files = [
+            ((get_map_output_key(line), file_index, line) for line in input_file)
+            for file_index, input_file in enumerate(files)
+        ]
+        for _key, _file_index, line in heapq.merge(*decorated_files):
+            yield line
+    finally:
+        for input_file in files:
+            input_file.close()
+
+
+def combine_sorted_runs(paths, path_prefix, max_fan_in):
+    """
+    Merge groups of sorted runs into larger intermediate runs until there are no more than `max_fan_in` of them.
+
+    This bounds the number of files that are open at the same time when the runs are finally merged. Consecutive runs
+    are merged together, so values with the same key are still taken from the runs in the order the runs are given.
+    The runs that are merged are removed.
+
+    Returns: The list of paths to the remaining runs.
+    """
+    max_fan_in = max(max_fan_in, 2)
+    merge_pass = 0
+    while len(paths) > max_fan_in:
+        merged_paths = []
+        for group_index, start in enumerate(xrange(0, len(paths), max_fan_in)):
+            group = paths[start:start + max_fan_in]
+            if len(group) == 1:
+                merged_paths.append(group[0])
+                continue
+            merged_path = '{0}-pass-{1:03d}-run-{2:05d}'.format(path_prefix, merge_pass, group_index)
+            with open(merged_path, 'w') as merged_file:
+                for line in merge_sorted_map_output(group):
+                    merged_file.write(line)
+            for path in group:
+                os.remove(path)
+            merged_paths.append(merged_path)
+        paths = merged_paths
+        merge_pass += 1
+    return paths
+
+
+# The state of the job being executed by the LocalParallelMapReduceJobRunner.  Worker processes are forked from the
+# process that runs the job, so they can access the job, the runner and the input targets through this global instead
+# of having them pickled for every task.
+_PARALLEL_JOB_STATE = {}
+
+
+def _run_parallel_map_task(args):
+    """Map a single input file in a worker process, splitting the output into partition files."""
+    task_index, work_dir, num_partitions = args
+    runner = _PARALLEL_JOB_STATE['runner']
+    map_output = PartitionedMapOutput(
+        os.path.join(work_dir, 'map-{0:05d}-part-{{partition}}-run-{{run:05d}}'.format(task_index)),
+        num_partitions,
+        memory_budget=runner.memory_budget,
+    )
+    runner.map_input_target(_PARALLEL_JOB_STATE['job'], _PARALLEL_JOB_STATE['input_targets'][task_index], map_output)
+    map_output.close()
+
+
+def _run_parallel_reduce_task(args):
+    """Merge all of the map output for a single partition and run the reducer over it in a worker process."""
+    partition, work_dir = args
+    paths = sorted(glob.glob(os.path.join(work_dir, 'map-*-part-{0}-run-*'.format(partition))))
+    if not paths:
+        return None
+
+    merge_path_prefix = os.path.join(work_dir, 'merge-part-{0}'.format(partition))
+    paths = combine_sorted_runs(paths, merge_path_prefix, _PARALLEL_JOB_STATE['runner'].max_merge_fan_in)
+    reduce_output_path = os.path.join(work_dir, 'reduce-{0:05d}'.format(partition))
+    with open(reduce_output_path, 'w') as reduce_output:
+        _PARALLEL_JOB_STATE['job']._run_reducer(merge_sorted_map_output(paths), reduce_output)
+    return reduce_output_path
+
+
+class LocalParallelMapReduceJobRunner(EmulatedMapReduceJobRunner):
+    """
+    Execute map reduce tasks on the machine that is running luigi, using several processes.
+
+    Like the EmulatedMapReduceJobRunner, but input files are mapped in parallel by a pool of worker processes. The map
+    output is split into `n_reduce_tasks` partitions by hashing its key and is written to disk in sorted runs. Each
+    partition is then merged and reduced in parallel, and the output of the reducers is concatenated to produce the
+    output of the job. Like the part files produced by Hadoop, the output is only sorted within each partition.
+
+    The number of worker processes can be set using the `local_parallel_processes` option in the `map-reduce` section
+    of the configuration file. It defaults to the number of CPUs on the machine. The `local_memory_budget_mb` option
+    applies to each worker process.
+
+    """
+
+    def __init__(self):
+        super(LocalParallelMapReduceJobRunner, self).__init__()
+        config = configuration.get_config()
+        self.num_processes = config.getint('map-reduce', 'local_parallel_processes', multiprocessing.cpu_count())
+
+    def run_job(self, job):
+        job.init_hadoop()
+        job.init_mapper()
+        map_input_targets = self.get_map_input_targets(job)
+        num_partitions = max(int(job.n_reduce_tasks), 1)
+
+        work_dir = tempfile.mkdtemp(prefix='mapreduce-')
+        _PARALLEL_JOB_STATE.update(job=job, runner=self, input_targets=map_input_targets)
+        pool = multiprocessing.Pool(self.num_processes)
+        try:
+            log.info('Mapping %d input files using %d processes', len(map_input_targets), self.num_processes)
+            pool.map(
+                _run_parallel_map_task,
+                [(task_index, work_dir, num_partitions) for task_index in xrange(len(map_input_targets))],
+                chunksize=1
+            )
+
+            log.info('Reducing %d partitions using %d processes', num_partitions, self.num_processes)
+            reduce_output_paths = pool.map(
+                _run_parallel_reduce_task,
+                [(partition, work_dir) for partition in xrange(num_partitions)],
+                chunksize=1
+            )
+            pool.close()
+            pool.join()
+
             try:
-                reduce_output.close()
+                reduce_output = job.output().open('w')
             except Exception:
-                pass
+                reduce_output = StringIO.StringIO()
+
+            try:
+                for reduce_output_path in reduce_output_paths:
+                    if reduce_output_path is None:
+                        continue
+                    with open(reduce_output_path, 'r') as reduce_output_file:
+                        shutil.copyfileobj(reduce_output_file, reduce_output)
+            finally:
+                try:
+                    reduce_output.close()
+                except Exception:
+                    pass
+        finally:
+            pool.terminate()
+            _PARALLEL_JOB_STATE.clear()
+            shutil.rmtree(work_dir, ignore_errors=True)
 
 
 class MultiOutputMapReduceJobTask(MapReduceJobTask):
@@ -1,14 +1,18 @@
 """
 Support for loading data into a Mysql database.
 """
+import datetime
 import json
 import logging
+import re
+import tempfile
 from itertools import chain
 
 import luigi
 import luigi.configuration
 from luigi.contrib.mysqldb import MySqlTarget
 
+from edx.analytics.tasks.util.connection_pool import ConnectionPool
 from edx.analytics.tasks.util.overwrite import OverwriteOutputMixin
 from edx.analytics.tasks.util.url import ExternalURL
 
@@ -18,6 +22,7 @@ try:
     import mysql.connector
     from mysql.connector.errors import ProgrammingError
     from mysql.connector import errorcode
+    from mysql.connector.constants import ClientFlag
     mysql_client_available = True
 except ImportError:
     log.warn('Unable to import mysql client libraries')
@@ -26,6 +31,42 @@ except ImportError:
     mysql_client_available = False
 
 
+class MysqlConnectionPool(ConnectionPool):
+    """Reuses connections to MySQL databases."""
+
+    def is_healthy(self, connection):
+        return connection.is_connected()
+
+    def reset(self, connection):
+        connection.rollback()
+        # Clear session variables, such as the transaction isolation level set by MysqlInsertTask.
+        connection.reset_session()
+
+
+MYSQL_CONNECTION_POOL = MysqlConnectionPool('mysql')
+
+
+def connect_to_mysql(user, password, host, port, database=None, autocommit=False, allow_local_infile=False):
+    """Returns a connection to a MySQL server, reusing an idle connection if connection pooling is enabled."""
+    kwargs = {
+        'user': user,
+        'password': password,
+        'host': host,
+        'port': port,
+        'autocommit': autocommit,
+    }
+    if database is not None:
+        kwargs['database'] = database
+    if allow_local_infile:
+        kwargs['client_flags'] = [ClientFlag.LOCAL_FILES]
+
+    return MYSQL_CONNECTION_POOL.connect(
+        (host, port, user, password, database, allow_local_infile),
+        lambda: mysql.connector.connect(**kwargs),
+        autocommit=autocommit
+    )
+
+
 class MysqlInsertTaskMixin(OverwriteOutputMixin):
     """
     Parameters for inserting a data set into RDBMS.
@@ -44,6 +85,13 @@ class MysqlInsertTaskMixin(OverwriteOutputMixin):
         significant=False,
         description='The number of rows to insert at a time.',
     )
+    use_load_data_local = luigi.BooleanParameter(
+        default=False,
+        significant=False,
+        config_path={'section': 'database-export', 'name': 'use_load_data_local'},
+        description='Write the rows to a local file and load it using LOAD DATA LOCAL INFILE instead of executing '
+        'INSERT statements. The rows are inserted if the server does not allow LOCAL loads.',
+    )
 
 
 class MysqlInsertTask(MysqlInsertTaskMixin, luigi.Task):
@@ -152,7 +200,7 @@ class MysqlInsertTask(MysqlInsertTaskMixin, luigi.Task):
 
         # The default behavior of MysqlTarget is to connect to a specific database, which will fail since the database
         # doesn't exist yet, so we make our own connection here that is not attached to a specific database.
-        connection = mysql.connector.connect(
+        connection = connect_to_mysql(
             user=output_target.user,
             password=output_target.password,
             host=output_target.host,
@@ -289,6 +337,15 @@ class MysqlInsertTask(MysqlInsertTaskMixin, luigi.Task):
                             '(column string, type string) tuples (was %r ...)'
                             % (self.columns[0],))
 
+        if self.use_load_data_local and self.is_load_data_local_enabled(cursor):
+            try:
+                self.load_rows(cursor, column_names)
+                return
+            except mysql.connector.Error as excp:
+                if excp.errno != errorcode.ER_NOT_ALLOWED_COMMAND:
+                    raise
+                log.warning('LOAD DATA LOCAL INFILE is not allowed, inserting rows into %s instead.', self.table)
+
         value_list = []
         row_count = 0
         for row_count, row in enumerate(self.rows(), start=1):
@@ -298,12 +355,70 @@ class MysqlInsertTask(MysqlInsertTaskMixin, luigi.Task):
                 self._execute_insert_query(cursor, value_list, column_names)
                 value_list = []
 
-        if self.overwrite and not self.allow_empty_insert and row_count == 0:
-            raise Exception('Cannot overwrite a table with an empty result set.')
+        self._check_row_count(row_count)
 
         if len(value_list) > 0:
             self._execute_insert_query(cursor, value_list, column_names)
 
+    def _check_row_count(self, row_count):
+        """Refuse to replace the contents of the table with nothing, unless that is explicitly allowed."""
+        if self.overwrite and not self.allow_empty_insert and row_count == 0:
+            raise Exception('Cannot overwrite a table with an empty result set.')
+
+    def is_load_data_local_enabled(self, cursor):
+        """Returns True if the server accepts LOAD DATA LOCAL INFILE statements."""
+        cursor.execute("SHOW VARIABLES LIKE 'local_infile'")
+        result = cursor.fetchone()
+        if result is None or str(result[1]).upper() not in ('ON', '1'):
+            log.warning(
+                'The local_infile option is disabled on the server, inserting rows into %s instead.', self.table
+            )
+            return False
+        return True
+
+    def load_rows(self, cursor, column_names):
+        """
+        Loads row values from source into database table using LOAD DATA LOCAL INFILE.
+
+        The rows are streamed into a temporary tab-separated file on local disk, which the client then sends to the
+        server in a single statement.  The statement is executed using the same cursor, and therefore in the same
+        transaction, as the INSERT statements would be.
+        """
+        num_cols = len(self.columns)
+        row_count = 0
+        with tempfile.NamedTemporaryFile(prefix='{0}_'.format(self.table), suffix='.tsv') as load_file:
+            for row_count, row in enumerate(self.rows(), start=1):
+                if len(row) != num_cols:
+                    raise Exception("Misaligned data in mysql_load: "
+                                    "row '{row}' does not match columns '{columns}'".format(
+                                        row=row, columns=column_names
+                                    ))
+                load_file.write('\t'.join([encode_for_load_data(elem) for elem in row]))
+                load_file.write('\n')
+            load_file.flush()
+
+            self._check_row_count(row_count)
+            if row_count == 0:
+                return
+
+            query = (
+                "LOAD DATA LOCAL INFILE '{path}' INTO TABLE {table} CHARACTER SET utf8 "
+                "FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' ({column_names})"
+            ).format(
+                path=load_file.name.replace('\\', '\\\\').replace("'", "\\'"),
+                table=self.table,
+                column_names=column_names,
+            )
+            log.debug(query)
+            cursor.execute(query)
+
+        # With LOCAL, rows that duplicate an existing unique key are skipped instead of causing an error.
+        if cursor.rowcount != row_count:
+            raise Exception('Loaded {loaded} of {total} rows into table {table}'.format(
+                loaded=cursor.rowcount, total=row_count, table=self.table
+            ))
+        log.debug("Loaded %d rows into table %s", row_count, self.table)
+
     def run(self):
         """
         Inserts data generated by rows() into target table.
@@ -318,7 +433,10 @@ class MysqlInsertTask(MysqlInsertTaskMixin, luigi.Task):
         # create databases using a separate connection which is not database specific
         self.create_database()
 
-        connection = self.output().connect()
+        if self.use_load_data_local:
+            connection = self.output().connect(allow_local_infile=True)
+        else:
+            connection = self.output().connect()
         try:
             # create table only if necessary:
             self.create_table(connection)
@@ -366,6 +484,39 @@ def coerce_for_mysql_connect(input):
     return input
 
 
+LOAD_DATA_ESCAPES = {
+    '\\': '\\\\',
+    '\t': '\\t',
+    '\n': '\\n',
+    '\r': '\\r',
+    '\0': '\\0',
+}
+LOAD_DATA_ESCAPE_PATTERN = re.compile(r'[\\\t\n\r\0]')
+
+
+def encode_for_load_data(input):
+    """
+    Given an input which could be any python type, encode it as a field of a file read by LOAD DATA INFILE.
+
+    The input is coerced in the same way as values that are inserted, and then escaped according to the default rules
+    of LOAD DATA INFILE, so NULL values are written as \\N.
+    """
+    value = coerce_for_mysql_connect(input)
+    if value is None:
+        return '\\N'
+    elif isinstance(value, unicode):
+        value = value.encode('utf-8')
+    elif isinstance(value, bool):
+        value = '1' if value else '0'
+    elif isinstance(value, float):
+        value = repr(value)
+    elif isinstance(value, datetime.datetime):
+        value = value.strftime('%Y-%m-%d %H:%M:%S.%f' if value.microsecond else '%Y-%m-%d %H:%M:%S')
+    else:
+        value = str(value)
+    return LOAD_DATA_ESCAPE_PATTERN.sub(lambda match: LOAD_DATA_ESCAPES[match.group(0)], value)
+
+
 def get_mysql_query_results(credentials, database, query):
     """
     Executes a mysql query on the provided database and returns the results.
@@ -376,11 +527,11 @@ def get_mysql_query_results(credentials, database, query):
     with credentials_target.open('r') as credentials_file:
         cred = json.load(credentials_file)
 
-    connection = mysql.connector.connect(user=cred.get('username'),
-                                         password=cred.get('password'),
-                                         host=cred.get('host'),
-                                         port=cred.get('port'),
-                                         database=database)
+    connection = connect_to_mysql(user=cred.get('username'),
+                                  password=cred.get('password'),
+                                  host=cred.get('host'),
+                                  port=cred.get('port'),
+                                  database=database)
 
     try:
         cursor = connection.cursor()
@@ -419,12 +570,66 @@ class CredentialFileMysqlTarget(MySqlTarget):
                 update_id=update_id
             )
 
+    def connect(self, autocommit=False, allow_local_infile=False):
+        """Connect to the database, optionally allowing the client to send local files for LOAD DATA LOCAL INFILE."""
+        return connect_to_mysql(
+            user=self.user,
+            password=self.password,
+            host=self.host,
+            port=self.port,
+            database=self.database,
+            autocommit=autocommit,
+            allow_local_infile=allow_local_infile,
+        )
+
     def exists(self, connection=None):
         # The parent class fails if the database does not exist. This override tolerates that error.
+        # It also closes the connection the parent class would open and leave open, so that it can be reused.
+        close_connection = False
         try:
+            if connection is None:
+                connection = self.connect(autocommit=True)
+                close_connection = True
             return super(CredentialFileMysqlTarget, self).exists(connection=connection)
         except ProgrammingError:
             return False
+        finally:
+            if close_connection:
+                connection.close()
+
+    def marker_table_location(self):
+        """Identifies the database and marker table that this target is recorded in."""
+        return (self.host, self.port, self.user, self.database, self.marker_table)
+
+    def get_existing_update_ids(self, update_ids):
+        """
+        Returns the subset of `update_ids` that are recorded in this target's marker table.
+
+        This checks whether many targets that share a marker table exist using a single query.
+        """
+        if not update_ids:
+            return set()
+
+        # As in exists(), a missing database or marker table means that nothing has been recorded yet.
+        try:
+            connection = self.connect(autocommit=True)
+        except ProgrammingError:
+            return set()
+
+        try:
+            cursor = connection.cursor()
+            cursor.execute(
+                "SELECT update_id FROM {marker_table} WHERE update_id IN ({placeholders})".format(
+                    marker_table=self.marker_table,
+                    placeholders=', '.join(['%s'] * len(update_ids))
+                ),
+                tuple(update_ids)
+            )
+            return set(row[0] for row in cursor.fetchall())
+        except ProgrammingError:
+            return set()
+        finally:
+            connection.close()
 
     def create_marker_table(self):
         """
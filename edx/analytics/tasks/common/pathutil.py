@@ -8,9 +8,15 @@ Supports outputs to HDFS, S3, and local FS.
 
 import datetime
 import fnmatch
+import json
 import logging
 import os
 import re
+import sre_constants
+import sre_parse
+import threading
+import urlparse
+from multiprocessing.pool import ThreadPool
 
 import boto
 import luigi
@@ -18,6 +24,7 @@ import luigi.hdfs
 import luigi.format
 import luigi.task
 
+from boto.s3.prefix import Prefix
 from luigi.date_interval import DateInterval
 
 from edx.analytics.tasks.util import eventlog
@@ -141,6 +148,192 @@ class EventLogSelectionDownstreamMixin(object):
     )
 
 
+# Steps of a listing plan, see get_listing_steps().
+LISTING_LITERAL = 'literal'
+LISTING_SEGMENT = 'segment'
+LISTING_DATE = 'date'
+
+
+def get_listing_steps(pattern):
+    """
+    Translate the beginning of a URL pattern into steps that generate the prefixes of all URLs it can match.
+
+    Each step is a tuple of a step type and an argument:
+
+    * (LISTING_LITERAL, text) appends the text to each prefix.
+    * (LISTING_SEGMENT, None) replaces each prefix with the "directories" found under it, this corresponds to a single
+      path segment followed by a slash, for example "[^/]+/".
+    * (LISTING_DATE, None) appends each of the dates that may be captured by the "date" group to each prefix.
+
+    Translation stops at the first construct that cannot be expressed as a prefix, so a pattern like ".*tracking.log"
+    produces no steps at all.
+    """
+    parsed = sre_parse.parse(pattern)
+    if parsed.pattern.flags & sre_constants.SRE_FLAG_IGNORECASE:
+        return []
+
+    date_group = parsed.pattern.groupdict.get('date')
+    slash = ord('/')
+    items = list(parsed)
+
+    steps = []
+    literal = []
+    index = 0
+    while index < len(items):
+        opcode, argument = items[index]
+        if opcode == sre_constants.LITERAL and argument < 128:
+            literal.append(chr(argument))
+            index += 1
+            continue
+
+        if literal:
+            steps.append((LISTING_LITERAL, ''.join(literal)))
+            literal = []
+
+        if (
+            opcode in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and
+            list(argument[2]) == [(sre_constants.NOT_LITERAL, slash)] and
+            index + 1 < len(items) and items[index + 1] == (sre_constants.LITERAL, slash)
+        ):
+            steps.append((LISTING_SEGMENT, None))
+            index += 2
+        elif opcode == sre_constants.SUBPATTERN and date_group is not None and argument[0] == date_group:
+            steps.append((LISTING_DATE, None))
+            break
+        else:
+            break
+
+    if literal:
+        steps.append((LISTING_LITERAL, ''.join(literal)))
+
+    return steps
+
+
+# Widths of the strptime() directives that get_date_string_parser() can parse by slicing the date string.
+FIXED_WIDTH_DATE_DIRECTIVES = {
+    'Y': 4,
+    'm': 2,
+    'd': 2,
+}
+
+
+def get_date_string_parser(date_pattern):
+    """
+    Returns a function that converts a string formatted using `date_pattern` into a date.
+
+    Formats that only contain %Y, %m, %d and literal characters are parsed by slicing the string, which is much faster
+    than strptime().  Strings that don't have exactly the expected layout, and all other formats, are parsed using
+    strptime().
+    """
+    def parse_with_strptime(date_string):
+        """Parse the date string using strptime()."""
+        parsed_datetime = datetime.datetime.strptime(date_string, date_pattern)
+        return datetime.date(parsed_datetime.year, parsed_datetime.month, parsed_datetime.day)
+
+    slices = {}
+    literals = []
+    position = 0
+    for directive, literal in re.findall(r'%(.)|([^%]+)', date_pattern):
+        if literal:
+            literals.append((position, literal))
+            position += len(literal)
+        elif directive in FIXED_WIDTH_DATE_DIRECTIVES and directive not in slices:
+            width = FIXED_WIDTH_DATE_DIRECTIVES[directive]
+            slices[directive] = slice(position, position + width)
+            position += width
+        else:
+            return parse_with_strptime
+
+    if len(slices) != len(FIXED_WIDTH_DATE_DIRECTIVES):
+        return parse_with_strptime
+
+    expected_length = position
+    year_slice, month_slice, day_slice = slices['Y'], slices['m'], slices['d']
+
+    def parse_fixed_width(date_string):
+        """Parse the date string by slicing it, falling back to strptime() if it has an unexpected layout."""
+        if len(date_string) == expected_length and all(
+            date_string.startswith(literal, literal_position) for literal_position, literal in literals
+        ):
+            year, month, day = date_string[year_slice], date_string[month_slice], date_string[day_slice]
+            if year.isdigit() and month.isdigit() and day.isdigit():
+                try:
+                    return datetime.date(int(year), int(month), int(day))
+                except ValueError:
+                    pass
+        return parse_with_strptime(date_string)
+
+    return parse_fixed_width
+
+
+class UrlIntervalFilter(object):
+    """
+    Selects URLs that match one of several patterns and that contain a date within an interval.
+
+    If a pattern contains a "date" group, the captured string is parsed using `date_pattern`.  If it contains a
+    "timestamp" group instead, the captured string is treated as a Unix timestamp.  URLs matched by patterns that
+    contain neither group are always selected.
+
+    Patterns are only compiled once, and the outcome is remembered for each captured string, since many files usually
+    share the same date.
+    """
+
+    def __init__(self, patterns, interval, date_pattern='%Y%m%d'):
+        self.patterns = []
+        for pattern in patterns:
+            compiled_pattern = re.compile(pattern)
+            if 'date' in compiled_pattern.groupindex:
+                group_name = 'date'
+            elif 'timestamp' in compiled_pattern.groupindex:
+                group_name = 'timestamp'
+            else:
+                group_name = None
+            self.patterns.append((compiled_pattern.match, group_name))
+
+        self.interval = interval
+        self.parse_date_string = get_date_string_parser(date_pattern)
+        self.included = {
+            'date': {},
+            'timestamp': {},
+        }
+
+    def should_include_url(self, url):
+        """Returns True if the URL matches one of the patterns and its date is within the interval."""
+        # Find the first pattern (if any) that matches the URL.
+        for match_pattern, group_name in self.patterns:
+            match = match_pattern(url)
+            if match:
+                break
+        else:
+            return False
+
+        if group_name is None:
+            return True
+
+        captured = match.group(group_name)
+        included = self.included[group_name]
+        try:
+            return included[captured]
+        except KeyError:
+            if group_name == 'date':
+                parsed_date = self.parse_date_string(captured)
+            else:
+                parsed_datetime = datetime.datetime.utcfromtimestamp(int(captured))
+                parsed_date = datetime.date(parsed_datetime.year, parsed_datetime.month, parsed_datetime.day)
+            included[captured] = parsed_date in self.interval
+            return included[captured]
+
+    def filter_urls(self, urls):
+        """Returns a list of the URLs that should be included, in their original order."""
+        should_include_url = self.should_include_url
+        return [url for url in urls if should_include_url(url)]
+
+
+def filter_urls_by_interval(urls, patterns, interval, date_pattern='%Y%m%d'):
+    """Returns the URLs that match one of the patterns and contain a date within the interval, see UrlIntervalFilter."""
+    return UrlIntervalFilter(patterns, interval, date_pattern).filter_urls(urls)
+
+
 class PathSelectionByDateIntervalTask(EventLogSelectionDownstreamMixin, luigi.WrapperTask):
     """
     Select all relevant event log input files from a directory.
@@ -149,8 +342,37 @@ class PathSelectionByDateIntervalTask(EventLogSelectionDownstreamMixin, luigi.Wr
     that a pattern can be used to find them. Filenames are expected to contain a date which represents an approximation
     of the date found in the events themselves.
 
+    S3 sources are not listed in their entirety when every pattern starts with the URL of the files it matches, for
+    example "s3://bucket/logs/[^/]+/tracking\\.log-(?P<date>\\d{8}).*".  Only the prefixes that can contain files for
+    dates within the interval are listed, several of them at a time.  If a listing cache is configured, the listings
+    of prefixes that only contain dates that are old enough are stored there and reused by later runs.
+
     """
 
+    # Formatted dates are shortened until there are no more than this many distinct prefixes to list.
+    MAX_DATE_PREFIXES = 100
+
+    listing_threads = luigi.IntParameter(
+        config_path={'section': 'event-logs', 'name': 'listing_threads'},
+        default=8,
+        significant=False,
+        description='The number of S3 prefixes to list concurrently.',
+    )
+    listing_cache = luigi.Parameter(
+        config_path={'section': 'event-logs', 'name': 'listing_cache'},
+        default=None,
+        significant=False,
+        description='A URL to a file that stores the listings of S3 prefixes that only contain past dates. These '
+        'prefixes are not listed again by subsequent runs.',
+    )
+    listing_cache_min_age_days = luigi.IntParameter(
+        config_path={'section': 'event-logs', 'name': 'listing_cache_min_age_days'},
+        default=3,
+        significant=False,
+        description='A prefix is only cached if all of the dates it contains are at least this many days old, since '
+        'files for recent dates may still be uploaded.',
+    )
+
     def __init__(self, *args, **kwargs):
         super(PathSelectionByDateIntervalTask, self).__init__(*args, **kwargs)
         self.interval = DateInterval(
@@ -158,6 +380,10 @@ class PathSelectionByDateIntervalTask(EventLogSelectionDownstreamMixin, luigi.Wr
             self.interval.date_b + self.expand_interval
         )
         self.requirements = None
+        self.url_filter = UrlIntervalFilter(self.pattern, self.interval, self.date_pattern)
+        self.listing_cache_entries = None
+        self.listing_cache_modified = False
+        self.thread_state = threading.local()
 
     def requires(self):
         # This method gets called several times. Avoid making multiple round trips to S3 by caching the first result.
@@ -189,17 +415,166 @@ class PathSelectionByDateIntervalTask(EventLogSelectionDownstreamMixin, luigi.Wr
             'Date interval: %s <= date < %s', self.interval.date_a.isoformat(), self.interval.date_b.isoformat()
         )
 
-        return [UncheckedExternalURL(url) for url_gen in url_gens for url in url_gen if self.should_include_url(url)]
+        urls = [url for url_gen in url_gens for url in url_gen]
+        return [UncheckedExternalURL(url) for url in self.url_filter.filter_urls(urls)]
 
     def _get_s3_urls(self, source):
-        """Recursively list all files inside the source URL directory."""
-        s3_conn = boto.connect_s3()
+        """Recursively list all files inside the source URL directory that may match one of the patterns."""
         bucket_name, root = get_s3_bucket_key_names(source)
+        # Make sure that the listing is done on a "folder" boundary, since list() just looks for matching prefixes.
+        root_with_slash = root if len(root) == 0 or root.endswith('/') else root + '/'
+
+        self._load_listing_cache()
+        pool = ThreadPool(self.listing_threads)
+        try:
+            keys = self._list_s3_keys(pool, urlparse.urlparse(source).scheme, bucket_name, root_with_slash)
+        finally:
+            pool.close()
+            pool.join()
+        self._save_listing_cache()
+
+        for key in keys:
+            yield url_path_join(source, key[len(root_with_slash):].lstrip('/'))
+
+    def _list_s3_keys(self, pool, scheme, bucket_name, root):
+        """
+        Returns the names of the non-empty keys under the root that may match one of the patterns.
+
+        The patterns are compared with URLs that use the same scheme as the source, such as "s3n" or "s3+https".
+        """
+        bucket_url = '{0}://{1}/'.format(scheme, bucket_name)
+        root_url = bucket_url + root
+
+        prefixes = []
+        for pattern in self.pattern:
+            steps = get_listing_steps(pattern)
+            literal = steps[0][1] if steps and steps[0][0] == LISTING_LITERAL else ''
+            if literal.startswith(root_url):
+                steps[0] = (LISTING_LITERAL, literal[len(bucket_url):])
+                prefixes.extend(self._get_s3_prefixes(pool, bucket_name, steps))
+            elif root_url.startswith(literal):
+                log.debug('Pattern "%s" requires a complete listing of %s', pattern, root_url)
+                prefixes = None
+                break
+            else:
+                log.debug('Pattern "%s" cannot match any URL in %s', pattern, root_url)
+
+        if prefixes is None:
+            # List each of the top level "directories" separately, so that they can be listed in parallel.
+            keys, directories = self._list_s3_prefix(bucket_name, root, delimiter='/')
+            prefixes = [(directory, False) for directory in directories]
+        else:
+            keys = []
+            prefixes = sorted(set(prefixes))
+
+        log.debug('Listing %d prefixes in %s', len(prefixes), root_url)
+        listings = pool.map(
+            lambda prefix_and_cacheable: self._list_s3_prefix_with_cache(bucket_name, *prefix_and_cacheable),
+            prefixes
+        )
+
+        # The same key may be found under several prefixes.
+        unique_keys = []
+        seen_keys = set()
+        for key in keys + [key for listing in listings for key in listing]:
+            if key not in seen_keys:
+                seen_keys.add(key)
+                unique_keys.append(key)
+        return unique_keys
+
+    def _get_s3_prefixes(self, pool, bucket_name, steps):
+        """Returns (prefix, cacheable) tuples for the prefixes generated by the steps of a listing plan."""
+        prefixes = ['']
+        for step_type, argument in steps:
+            if step_type == LISTING_LITERAL:
+                prefixes = [prefix + argument for prefix in prefixes]
+            elif step_type == LISTING_SEGMENT:
+                listings = pool.map(lambda prefix: self._list_s3_prefix(bucket_name, prefix, delimiter='/'), prefixes)
+                prefixes = [directory for _keys, directories in listings for directory in directories]
+            elif step_type == LISTING_DATE:
+                return [
+                    (prefix + date_prefix, immutable)
+                    for prefix in prefixes
+                    for date_prefix, immutable in self._get_date_prefixes()
+                ]
+
+        return [(prefix, False) for prefix in prefixes]
+
+    def _get_date_prefixes(self):
+        """
+        Returns (date prefix, immutable) tuples that cover each of the formatted dates within the interval.
+
+        A prefix is immutable if none of the dates that may still receive new files start with it.
+        """
+        date_prefixes = set(date.strftime(self.date_pattern) for date in self.interval.dates())
+        while len(date_prefixes) > self.MAX_DATE_PREFIXES:
+            date_prefixes = set(date_prefix[:-1] for date_prefix in date_prefixes)
+
+        today = datetime.date.today()
+        first_mutable_date = today - datetime.timedelta(days=self.listing_cache_min_age_days)
+        last_mutable_date = max(today, self.interval.date_b)
+        mutable_dates = DateInterval(first_mutable_date, last_mutable_date + datetime.timedelta(days=1))
+        mutable_date_strings = [date.strftime(self.date_pattern) for date in mutable_dates.dates()]
+
+        return [
+            (date_prefix, not any(date_string.startswith(date_prefix) for date_string in mutable_date_strings))
+            for date_prefix in sorted(date_prefixes)
+        ]
+
+    def _list_s3_prefix_with_cache(self, bucket_name, prefix, cacheable):
+        """
+        Returns the names of the non-empty keys under a prefix.
+
+        The listing cache is used if the prefix is cacheable.
+        """
+        prefix_url = 's3://{0}/{1}'.format(bucket_name, prefix)
+        if cacheable and prefix_url in self.listing_cache_entries:
+            return self.listing_cache_entries[prefix_url]
+
+        keys, _directories = self._list_s3_prefix(bucket_name, prefix)
+        if cacheable and self.listing_cache is not None:
+            self.listing_cache_entries[prefix_url] = keys
+            self.listing_cache_modified = True
+        return keys
+
+    def _list_s3_prefix(self, bucket_name, prefix, delimiter=''):
+        """Returns the names of the non-empty keys and the common prefixes found by listing a prefix."""
+        # Boto connections must not be shared between threads.
+        s3_conn = getattr(self.thread_state, 's3_conn', None)
+        if s3_conn is None:
+            s3_conn = self.thread_state.s3_conn = boto.connect_s3()
         bucket = s3_conn.get_bucket(bucket_name)
-        for key_metadata in bucket.list(root):
-            if key_metadata.size > 0:
-                key_path = key_metadata.key[len(root):].lstrip('/')
-                yield url_path_join(source, key_path)
+
+        keys = []
+        directories = []
+        for key_metadata in bucket.list(prefix, delimiter=delimiter):
+            if isinstance(key_metadata, Prefix):
+                directories.append(key_metadata.name)
+            elif key_metadata.size > 0:
+                keys.append(key_metadata.key)
+        return keys, directories
+
+    def _load_listing_cache(self):
+        """Read the listing cache, if there is one."""
+        if self.listing_cache_entries is not None:
+            return
+
+        self.listing_cache_entries = {}
+        if self.listing_cache is not None:
+            cache_target = get_target_from_url(self.listing_cache)
+            if cache_target.exists():
+                with cache_target.open('r') as cache_file:
+                    self.listing_cache_entries = json.load(cache_file)
+                log.debug('Loaded %d cached listings from %s', len(self.listing_cache_entries), self.listing_cache)
+
+    def _save_listing_cache(self):
+        """Write the listing cache if any listings were added to it."""
+        if not self.listing_cache_modified:
+            return
+
+        with get_target_from_url(self.listing_cache).open('w') as cache_file:
+            json.dump(self.listing_cache_entries, cache_file, sort_keys=True)
+        self.listing_cache_modified = False
 
     def _get_hdfs_urls(self, source):
         """Recursively list all files inside the source directory on the hdfs filesystem."""
@@ -220,31 +595,7 @@ class PathSelectionByDateIntervalTask(EventLogSelectionDownstreamMixin, luigi.Wr
 
         Presently filters first on pattern match and then on the datestamp extracted from the file name.
         """
-        # Find the first pattern (if any) that matches the URL.
-        match = None
-        for pattern in self.pattern:
-            match = re.match(pattern, url)
-            if match:
-                break
-
-        if not match:
-            return False
-
-        # If the pattern contains a date group, use that to check if within the requested interval.
-        # If instead the pattern contains a timestamp group, use that instead to check if within the requested interval.
-        # If it doesn't contain either such group, then assume that it should be included.
-        should_include = True
-        if 'date' in match.groupdict():
-            parsed_datetime = datetime.datetime.strptime(match.group('date'), self.date_pattern)
-            parsed_date = datetime.date(parsed_datetime.year, parsed_datetime.month, parsed_datetime.day)
-            should_include = parsed_date in self.interval
-        elif 'timestamp' in match.groupdict():
-            timestamp = int(match.group('timestamp'))
-            parsed_datetime = datetime.datetime.utcfromtimestamp(timestamp)
-            parsed_date = datetime.date(parsed_datetime.year, parsed_datetime.month, parsed_datetime.day)
-            should_include = parsed_date in self.interval
-
-        return should_include
+        return self.url_filter.should_include_url(url)
 
     def output(self):
         return [task.output() for task in self.requires()]
@@ -254,8 +605,21 @@ class EventLogSelectionMixin(EventLogSelectionDownstreamMixin):
     """
     Extract events corresponding to a specified time interval and outputs them from a mapper.
 
+    Lines are checked cheaply before they are decoded, so that most irrelevant lines never reach the JSON parser.
+    By default lines whose "time" is outside of the interval are rejected this way.  Tasks that override
+    get_event_time() to use some other field must set `prefilter_event_time` to False.  Tasks that are only
+    interested in a fixed set of event types can declare them in `prefilter_event_types`; lines for other event
+    types are then rejected before decoding as well.  The mapper must still check the event_type of the decoded
+    event, since the pre-filter only rejects lines that certainly do not match.
+
     """
 
+    prefilter_event_time = True
+    prefilter_event_types = None
+
+    # Lines rejected before decoding are very common, so only report them to Hadoop in batches.
+    PREFILTER_COUNTER_THRESHOLD = 10000
+
     def requires(self):
         """Use PathSelectionByDateIntervalTask to define inputs."""
         return PathSelectionByDateIntervalTask(
@@ -270,9 +634,26 @@ class EventLogSelectionMixin(EventLogSelectionDownstreamMixin):
         super(EventLogSelectionMixin, self).init_local()
         self.lower_bound_date_string = self.interval.date_a.strftime('%Y-%m-%d')  # pylint: disable=no-member
         self.upper_bound_date_string = self.interval.date_b.strftime('%Y-%m-%d')  # pylint: disable=no-member
+        if self.prefilter_event_types is not None:
+            self.prefilter_event_types = frozenset(self.prefilter_event_types)
+
+    def should_decode_line(self, line):
+        """Returns False if the line can be rejected without decoding it, based on the declared pre-filters."""
+        if self.prefilter_event_types is not None:
+            if not eventlog.line_may_have_event_type(line, self.prefilter_event_types):
+                return False
+        if self.prefilter_event_time:
+            if not eventlog.line_may_be_within_interval(
+                    line, self.lower_bound_date_string, self.upper_bound_date_string):
+                return False
+        return True
 
     def get_event_and_date_string(self, line):
         """Default mapper implementation, that always outputs the log line, but with a configurable key."""
+        if not self.should_decode_line(line):
+            self.incr_counter('Event', 'Discard Before Decoding', 1, threshold=self.PREFILTER_COUNTER_THRESHOLD)
+            return None
+
         event = eventlog.parse_json_event(line)
         if event is None:
             self.incr_counter('Event', 'Discard Unparseable Event', 1)
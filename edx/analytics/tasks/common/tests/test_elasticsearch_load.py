@@ -4,12 +4,14 @@ import datetime
 import unittest
 
 import ddt
-from elasticsearch import TransportError
+from elasticsearch import NotFoundError, TransportError
 import luigi.hdfs
 from mock import patch, call
 from freezegun import freeze_time
 
-from edx.analytics.tasks.common.elasticsearch_load import ElasticsearchIndexTask, AwsHttpConnection, IndexingError
+from edx.analytics.tasks.common.elasticsearch_load import (
+    ElasticsearchIndexTask, AwsHttpConnection, IndexingError, BulkBatchSizer
+)
 from edx.analytics.tasks.common.tests.map_reduce_mixins import MapperTestMixin, ReducerTestMixin
 
 
@@ -126,6 +128,27 @@ class ElasticsearchIndexTaskMapTest(BaseIndexTest, MapperTestMixin, unittest.Tes
         self.task.init_local()
         self.assertItemsEqual([], self.task.indexes_for_alias)
 
+    def test_update_live_index(self):
+        self.mock_es.indices.get_aliases.return_value = {
+            'foo_alias_old': {
+                'aliases': {
+                    'foo_alias': {}
+                }
+            }
+        }
+        with patch.object(self.task, 'should_update_live_index', return_value=True):
+            self.task.init_local()
+        self.assertEqual(self.task.index, 'foo_alias_old')
+        self.assertItemsEqual([], self.task.indexes_for_alias)
+        self.assertFalse(self.mock_es.indices.create.called)
+        self.assertFalse(self.mock_es.indices.delete.called)
+
+    def test_update_live_index_missing(self):
+        self.mock_es.indices.get_aliases.return_value = {}
+        with patch.object(self.task, 'should_update_live_index', return_value=True):
+            with self.assertRaisesRegexp(RuntimeError, 'Unable to update alias foo_alias in place'):
+                self.task.init_local()
+
     def test_index_creation_settings(self):
         self.task.init_local()
         self.mock_es.indices.create.assert_called_once_with(
@@ -315,6 +338,34 @@ class ElasticsearchIndexTaskReduceTest(BaseIndexTest, ReducerTestMixin, unittest
             ]
         }
 
+    def test_delete_missing_document(self):
+        self.mock_es.bulk.return_value = {
+            'items': [
+                {'delete': {'_index': self.task.index, '_type': 'raw_text', '_id': 'a', 'status': 404}},
+            ]
+        }
+        with patch.object(RawIndexTask, 'document_generator', return_value=iter([{'_op_type': 'delete', '_id': 'a'}])):
+            self.assertItemsEqual([('', '')], self._get_reducer_output(['a']))
+
+        self.mock_es.bulk.assert_called_once_with(
+            [{'delete': {'_id': 'a'}}],
+            index=self.task.index,
+            doc_type='raw_text'
+        )
+
+    def test_records_indexed_with_deletes(self):
+        self.mock_es.bulk.return_value = self.get_bulk_api_response(3)
+        documents = [
+            {'_op_type': 'delete', '_id': 'a'},
+            {'_op_type': 'delete', '_id': 'b'},
+            {'_id': 'c', 'all_text': 'c'},
+        ]
+        with patch.object(RawIndexTask, 'document_generator', return_value=iter(documents)):
+            with patch.object(self.task, 'incr_counter') as mock_incr_counter:
+                self._get_reducer_output(['a'])
+
+        mock_incr_counter.assert_any_call('Elasticsearch', 'Records Indexed', 3)
+
     def test_too_many_rejected_batches(self):
         self.create_task(max_attempts=3)
         self.mock_es.bulk.side_effect = TransportError(429, 'Rejected bulk request', 'Queue is full')
@@ -336,6 +387,87 @@ class ElasticsearchIndexTaskReduceTest(BaseIndexTest, ReducerTestMixin, unittest
                 'first batch 2',
             ])
 
+    def test_concurrent_requests(self):
+        self.create_task(batch_size=1, max_concurrent_requests=3)
+        self.mock_es.bulk.side_effect = lambda *_args, **_kwargs: self.get_bulk_api_response(1)
+
+        with patch.object(self.task, 'incr_counter') as mock_incr_counter:
+            self._get_reducer_output(['batch {0}'.format(i) for i in range(10)])
+
+        self.assertItemsEqual(
+            self.mock_es.bulk.mock_calls,
+            [self.bulk_call([{'index': {}}, {'all_text': 'batch {0}'.format(i)}]) for i in range(10)]
+        )
+        self.assertEqual(mock_incr_counter.mock_calls.count(call('Elasticsearch', 'Records Indexed', 1)), 10)
+
+    def test_concurrent_request_failure(self):
+        self.create_task(batch_size=1, max_concurrent_requests=2)
+
+        def fail_second_batch(actions, **_kwargs):
+            """Reject a single batch of records with an unexpected error."""
+            if actions[1]['all_text'] == 'batch 1':
+                raise TransportError(404, 'Not found', 'More detail')
+            return self.get_bulk_api_response(1)
+
+        self.mock_es.bulk.side_effect = fail_second_batch
+        with self.assertRaises(TransportError):
+            self._get_reducer_output(['batch {0}'.format(i) for i in range(5)])
+
+    def test_adaptive_batch_size(self):
+        self.create_task(batch_size=4, target_batch_latency=10)
+        self.mock_es.bulk.return_value = {'items': []}
+        with patch('edx.analytics.tasks.common.elasticsearch_load.BulkBatchSizer') as mock_sizer_class:
+            mock_sizer_class.return_value.batch_size = 2
+            self._get_reducer_output(['record {0}'.format(i) for i in range(4)])
+
+        mock_sizer_class.assert_called_once_with(4, 4, 10)
+        self.assertEqual([len(bulk_call[1][0]) / 2 for bulk_call in self.mock_es.bulk.mock_calls], [2, 2])
+        self.assertEqual(len(mock_sizer_class.return_value.record_response.mock_calls), 2)
+
+    def test_rejection_reported_to_batch_sizer(self):
+        self.create_task(max_attempts=10)
+        self.mock_es.bulk.side_effect = [
+            TransportError(429, 'Rejected bulk request', 'Queue is full'),
+            self.get_bulk_api_response(1),
+        ]
+        batch_sizer = BulkBatchSizer(100, 100, target_latency=10)
+
+        self.assertTrue(
+            self.task.send_bulk_action_batch(
+                self.mock_es, [{'index': {}}, {'all_text': 'a'}], batch_sizer=batch_sizer
+            )
+        )
+        self.assertEqual(batch_sizer.batch_size, 60)
+
+
+class BulkBatchSizerTest(unittest.TestCase):
+    """Test the adjustment of the number of records sent in each bulk request."""
+
+    def setUp(self):
+        self.sizer = BulkBatchSizer(100, 200, target_latency=2)
+
+    def test_fast_responses(self):
+        self.sizer.record_response(0.5)
+        self.assertEqual(self.sizer.batch_size, 120)
+        for _ in range(10):
+            self.sizer.record_response(0.5)
+        self.assertEqual(self.sizer.batch_size, 200)
+
+    def test_acceptable_response(self):
+        self.sizer.record_response(1.5)
+        self.assertEqual(self.sizer.batch_size, 100)
+
+    def test_slow_response(self):
+        self.sizer.record_response(3)
+        self.assertEqual(self.sizer.batch_size, 75)
+
+    def test_rejections(self):
+        self.sizer.record_rejection()
+        self.assertEqual(self.sizer.batch_size, 50)
+        for _ in range(10):
+            self.sizer.record_rejection()
+        self.assertEqual(self.sizer.batch_size, 1)
+
 
 @freeze_time('2016-03-25')
 @patch.object(luigi.hdfs.HdfsTarget, '__del__', return_value=None)
@@ -365,7 +497,8 @@ class ElasticsearchIndexTaskCommitTest(BaseIndexTest, ReducerTestMixin, unittest
                 'date': datetime.datetime(2016, 3, 25, 0, 0, 0, 0),
                 'target_doc_type': 'raw_text',
                 'update_id': self.task.update_id(),
-                'target_index': 'foo_alias'
+                'target_index': 'foo_alias',
+                'written_index': self.task.index
             },
             doc_type='marker',
             id=self.task.output().marker_index_document_id(),
@@ -422,3 +555,31 @@ class ElasticsearchIndexTaskCommitTest(BaseIndexTest, ReducerTestMixin, unittest
                 call.indices.delete(index='foo_alias_old'),
             ]
         )
+
+    @patch.object(RawIndexTask, 'should_update_live_index', return_value=True)
+    def test_commit_live_index(self, _mock_should_update, _mock_del):
+        self.mock_es.indices.exists.return_value = True
+        self.task.commit()
+
+        self.assertEqual(
+            self.mock_es.mock_calls,
+            [
+                call.indices.refresh(index=self.task.index),
+                call.indices.exists(index='index_updates'),
+                self.get_expected_index_call(),
+                call.indices.flush(index='index_updates'),
+            ]
+        )
+
+    @patch.object(RawIndexTask, 'should_update_live_index', return_value=True)
+    def test_rollback_live_index(self, _mock_should_update, _mock_del):
+        self.task.rollback()
+        self.assertEqual(self.mock_es.mock_calls, [])
+
+    def test_get_marker(self, _mock_del):
+        self.mock_es.get.return_value = {'_source': {'written_index': 'foo_alias_old'}}
+        self.assertEqual(self.task.output().get_marker(), {'written_index': 'foo_alias_old'})
+
+    def test_get_missing_marker(self, _mock_del):
+        self.mock_es.get.side_effect = NotFoundError(404, 'Not found')
+        self.assertIsNone(self.task.output().get_marker())
@@ -11,7 +11,11 @@ import luigi
 import luigi.hdfs
 from mock import patch, call
 
-from edx.analytics.tasks.common.mapreduce import MultiOutputMapReduceJobTask, MapReduceJobTask
+from edx.analytics.tasks.common.mapreduce import (
+    MultiOutputMapReduceJobTask, MapReduceJobTask, EmulatedMapReduceJobRunner, LocalParallelMapReduceJobRunner,
+    PartitionedMapOutput, combine_sorted_runs, merge_sorted_map_output
+)
+from edx.analytics.tasks.util.tests.config import with_luigi_config
 
 
 class MapReduceJobTaskTest(unittest.TestCase):
@@ -177,3 +181,208 @@ class TestJobTask(MultiOutputMapReduceJobTask):
     def multi_output_reducer(self, _key, values, output_file):
         for value in values:
             output_file.write(value + '\n')
+
+
+class WordCountJob(MapReduceJobTask):
+    """Count the words in a set of files, using a configurable map reduce engine."""
+
+    input_path = luigi.Parameter()
+    output_path = luigi.Parameter()
+
+    def input_hadoop(self):
+        return [luigi.LocalTarget(path) for path in self.input_path]
+
+    def output(self):
+        return luigi.LocalTarget(self.output_path)
+
+    def mapper(self, line):
+        for word in line.split():
+            yield word, 1
+
+    def reducer(self, key, values):
+        yield key, sum(values)
+
+
+class AggregatingWordCountJob(WordCountJob):
+    """Count the words in a set of files, combining the counts in the mapper."""
+
+    enable_map_side_aggregation = True
+    map_side_aggregation_max_keys = 5
+
+
+class CompactWordCountJob(WordCountJob):
+    """Count the words in a set of files, using the compact encoding for map output."""
+
+    enable_compact_map_output = True
+
+
+class MapSideAggregationTest(unittest.TestCase):
+    """Tests for combining mapper output before it is written."""
+
+    def setUp(self):
+        self.task = AggregatingWordCountJob(
+            mapreduce_engine='local',
+            input_path=[],
+            output_path='/any/path',
+        )
+
+    def test_aggregation(self):
+        outputs = list(self.task._map_input(['foo bar foo', 'bar foo baz']))  # pylint: disable=protected-access
+        self.assertItemsEqual(outputs, [('foo', 3), ('bar', 2), ('baz', 1)])
+
+    def test_flush_when_too_many_keys(self):
+        lines = ['a b c d e', 'f a', 'a']
+        outputs = list(self.task._map_input(lines))  # pylint: disable=protected-access
+        self.assertItemsEqual(outputs, [('a', 1), ('b', 1), ('c', 1), ('d', 1), ('e', 1), ('f', 1), ('a', 2)])
+
+    def test_disabled(self):
+        task = WordCountJob(
+            mapreduce_engine='local',
+            input_path=[],
+            output_path='/any/path',
+        )
+        outputs = list(task._map_input(['foo bar foo']))  # pylint: disable=protected-access
+        self.assertEquals(outputs, [('foo', 1), ('bar', 1), ('foo', 1)])
+
+
+class LocalParallelMapReduceJobRunnerTest(unittest.TestCase):
+    """Tests for LocalParallelMapReduceJobRunner."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.job_class = WordCountJob
+
+        self.input_paths = []
+        input_dir = os.path.join(self.temp_dir, 'input')
+        os.mkdir(input_dir)
+        for file_index in range(3):
+            path = os.path.join(input_dir, 'input-{0}'.format(file_index))
+            with open(path, 'w') as input_file:
+                for line_index in range(50):
+                    input_file.write('foo bar{0} baz{1}\n'.format(line_index % 7, (file_index * line_index) % 11))
+            self.input_paths.append(path)
+
+    def run_job(self, runner, **kwargs):
+        """Run the word count job using the given runner and return the lines of output."""
+        output_path = os.path.join(self.temp_dir, runner.__class__.__name__)
+        job = self.job_class(
+            mapreduce_engine='local',
+            input_path=self.input_paths,
+            output_path=output_path,
+            **kwargs
+        )
+        job.init_local()
+        runner.run_job(job)
+        with open(output_path, 'r') as output_file:
+            return output_file.readlines()
+
+    @with_luigi_config('map-reduce', 'local_parallel_processes', '2')
+    def test_same_output_as_emulated_runner(self):
+        expected = self.run_job(EmulatedMapReduceJobRunner())
+        actual = self.run_job(LocalParallelMapReduceJobRunner(), n_reduce_tasks=4)
+
+        self.assertEquals(len(expected), 19)
+        self.assertItemsEqual(actual, expected)
+
+    @with_luigi_config('map-reduce', 'local_parallel_processes', '2')
+    def test_same_output_with_map_side_aggregation(self):
+        expected = self.run_job(EmulatedMapReduceJobRunner())
+        self.job_class = AggregatingWordCountJob
+        actual = self.run_job(LocalParallelMapReduceJobRunner(), n_reduce_tasks=4)
+
+        self.assertItemsEqual(actual, expected)
+
+    def test_compact_map_output(self):
+        expected = self.run_job(EmulatedMapReduceJobRunner())
+        self.job_class = CompactWordCountJob
+        actual = self.run_job(EmulatedMapReduceJobRunner())
+
+        self.assertItemsEqual(actual, expected)
+
+    @with_luigi_config('map-reduce', 'local_memory_budget_mb', '0')
+    def test_emulated_runner_with_spilled_runs(self):
+        expected = self.run_job(LocalParallelMapReduceJobRunner(), n_reduce_tasks=1)
+        actual = self.run_job(EmulatedMapReduceJobRunner())
+
+        self.assertEquals(actual, expected)
+
+    @with_luigi_config(
+        ('map-reduce', 'local_memory_budget_mb', '0'),
+        ('map-reduce', 'local_max_merge_fan_in', '3'),
+    )
+    def test_bounded_merge_fan_in(self):
+        expected = self.run_job(EmulatedMapReduceJobRunner())
+        actual = self.run_job(LocalParallelMapReduceJobRunner(), n_reduce_tasks=2)
+
+        self.assertItemsEqual(actual, expected)
+
+    @with_luigi_config('map-reduce', 'local_parallel_processes', '2')
+    def test_single_partition_is_sorted(self):
+        expected = self.run_job(EmulatedMapReduceJobRunner())
+        actual = self.run_job(LocalParallelMapReduceJobRunner(), n_reduce_tasks=1)
+
+        self.assertEquals(actual, expected)
+
+
+class PartitionedMapOutputTest(unittest.TestCase):
+    """Tests for splitting map output into sorted partitions."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.path_template = os.path.join(self.temp_dir, 'part-{partition}-run-{run}')
+
+    def test_partitions_are_sorted_and_disjoint(self):
+        map_output = PartitionedMapOutput(self.path_template, 3)
+        for index in range(30):
+            # Lines are written in pieces, just like print() does.
+            map_output.write("'key{0}'\t{1}".format(index % 10, index))
+            map_output.write('\n')
+        map_output.close()
+
+        paths = sorted(os.listdir(self.temp_dir))
+        keys_by_partition = []
+        for path in paths:
+            with open(os.path.join(self.temp_dir, path), 'r') as partition_file:
+                keys = [line.split('\t')[0] for line in partition_file]
+            self.assertEquals(keys, sorted(keys))
+            keys_by_partition.append(set(keys))
+
+        all_keys = set.union(*keys_by_partition)
+        self.assertEquals(len(all_keys), 10)
+        self.assertEquals(sum(len(keys) for keys in keys_by_partition), 10)
+
+    def test_values_keep_their_order(self):
+        map_output = PartitionedMapOutput(self.path_template, 1)
+        map_output.write("'b'\t1\n'a'\t2\n'b'\t3\n'a'\t4\n")
+        map_output.close()
+
+        lines = list(merge_sorted_map_output(map_output.run_paths[0]))
+        self.assertEquals(lines, ["'a'\t2\n", "'a'\t4\n", "'b'\t1\n", "'b'\t3\n"])
+
+    def test_spill_when_over_memory_budget(self):
+        # Each line takes up the same amount of memory, and the output is spilled after every third line.
+        entry_size = PartitionedMapOutput.get_entry_size((["'key0'"], "'key0'\t0\n"))
+        self.assertGreater(entry_size, 3 * len("'key0'\t0\n"))
+        map_output = PartitionedMapOutput(self.path_template, 1, memory_budget=3 * entry_size)
+        for index in range(10):
+            map_output.write("'key{0}'\t{1}\n".format(index % 3, index))
+        map_output.close()
+
+        self.assertEquals(len(map_output.run_paths[0]), 4)
+        lines = list(merge_sorted_map_output(map_output.run_paths[0]))
+        self.assertEquals([line.split('\t')[0] for line in lines], ["'key0'"] * 4 + ["'key1'"] * 3 + ["'key2'"] * 3)
+        self.assertEquals([line.split('\t')[1] for line in lines[:4]], ['0\n', '3\n', '6\n', '9\n'])
+
+    def test_combine_sorted_runs(self):
+        map_output = PartitionedMapOutput(self.path_template, 1, memory_budget=1)
+        for index in range(10):
+            map_output.write("'key{0}'\t{1}\n".format(index % 3, index))
+        map_output.close()
+
+        expected = list(merge_sorted_map_output(map_output.run_paths[0]))
+        paths = combine_sorted_runs(map_output.run_paths[0], os.path.join(self.temp_dir, 'merge'), 3)
+        self.assertEquals(len(paths), 2)
+        self.assertEquals(list(merge_sorted_map_output(paths)), expected)
+        self.assertEquals(len(os.listdir(self.temp_dir)), 2)
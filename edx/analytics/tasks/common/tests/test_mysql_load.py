@@ -3,6 +3,7 @@ Ensure we can write to MySQL data sources.
 """
 from __future__ import absolute_import
 
+import datetime
 import textwrap
 import unittest
 
@@ -13,8 +14,9 @@ from mock import call
 from mock import MagicMock
 from mock import patch
 from mock import sentinel
+from mysql.connector.errors import Error as MysqlError
 
-from edx.analytics.tasks.common.mysql_load import MysqlInsertTask, coerce_for_mysql_connect
+from edx.analytics.tasks.common.mysql_load import MysqlInsertTask, coerce_for_mysql_connect, encode_for_load_data
 from edx.analytics.tasks.util.tests.target import FakeTarget
 from edx.analytics.tasks.util.tests.config import with_luigi_config
 
@@ -71,7 +73,8 @@ class MysqlInsertTaskTestCase(unittest.TestCase):
         self.mock_mysql_connector = patcher.start()
         self.addCleanup(patcher.stop)
 
-    def create_task(self, credentials=None, source=None, insert_chunk_size=100, overwrite=False, cls=InsertToMysqlDummyTable):
+    def create_task(self, credentials=None, source=None, insert_chunk_size=100, overwrite=False,
+                    cls=InsertToMysqlDummyTable, use_load_data_local=False):
         """
          Emulate execution of a generic MysqlTask.
         """
@@ -81,7 +84,8 @@ class MysqlInsertTaskTestCase(unittest.TestCase):
         task = cls(
             credentials=sentinel.ignored,
             insert_chunk_size=insert_chunk_size,
-            overwrite=overwrite
+            overwrite=overwrite,
+            use_load_data_local=use_load_data_local,
         )
 
         if not credentials:
@@ -266,6 +270,84 @@ class MysqlInsertTaskTestCase(unittest.TestCase):
         with self.assertRaisesRegexp(Exception, 'Cannot overwrite a table with an empty result set.'):
             task.insert_rows(MagicMock())
 
+    def _create_load_data_cursor(self, local_infile='ON', num_rows=1):
+        """Returns a cursor that captures the contents of the file sent with LOAD DATA LOCAL INFILE."""
+        cursor = MagicMock()
+        cursor.fetchone.return_value = ('local_infile', local_infile)
+        cursor.rowcount = num_rows
+        cursor.loaded_data = []
+
+        def capture_load_data(query, *_args):
+            """Reads the local file while it still exists."""
+            if query.startswith('LOAD DATA LOCAL INFILE'):
+                path = query.split("'")[1]
+                with open(path, 'r') as load_file:
+                    cursor.loaded_data.append(load_file.read())
+
+        cursor.execute.side_effect = capture_load_data
+        return cursor
+
+    def test_load_data_local(self):
+        task = self.create_task(source=self._get_source_string(2), use_load_data_local=True)
+        cursor = self._create_load_data_cursor(num_rows=2)
+        task.insert_rows(cursor)
+        execute_calls = cursor.execute.mock_calls
+        self.assertEquals(len(execute_calls), 2)
+        self.assertEquals(execute_calls[0][1][0], "SHOW VARIABLES LIKE 'local_infile'")
+        self.assertRegexpMatches(
+            execute_calls[1][1][0],
+            r"^LOAD DATA LOCAL INFILE '[^']+\.tsv' INTO TABLE dummy_table CHARACTER SET utf8 "
+            r"FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' "
+            r"\(course_id,interval_start,interval_end,label,count\)$"
+        )
+        self.assertEquals(cursor.loaded_data, [self._get_source_string(2)])
+
+    def test_load_data_local_with_missing_rows(self):
+        task = self.create_task(source=self._get_source_string(2), use_load_data_local=True)
+        cursor = self._create_load_data_cursor(num_rows=1)
+        with self.assertRaisesRegexp(Exception, 'Loaded 1 of 2 rows'):
+            task.insert_rows(cursor)
+
+    def test_load_data_local_not_square(self):
+        source = self._get_source_string(4).replace('ACTIVE', 'AC\tTIVE', 1)
+        task = self.create_task(source=source, use_load_data_local=True)
+        with self.assertRaisesRegexp(Exception, 'Misaligned data'):
+            task.insert_rows(self._create_load_data_cursor(num_rows=4))
+
+    def test_load_data_local_overwrite_with_empty_results(self):
+        task = self.create_task(source='   ', overwrite=True, use_load_data_local=True)
+        with self.assertRaisesRegexp(Exception, 'Cannot overwrite a table with an empty result set.'):
+            task.insert_rows(self._create_load_data_cursor(num_rows=0))
+
+    def test_load_data_local_disabled_on_server(self):
+        task = self.create_task(source=self._get_source_string(1), use_load_data_local=True)
+        cursor = self._create_load_data_cursor(local_infile='OFF')
+        task.insert_rows(cursor)
+        self.assertEquals(cursor.loaded_data, [])
+        self.assertEquals(cursor.execute.call_args[0][0], self._get_expected_query(1))
+        self.assertEquals(cursor.execute.call_args[0][1], self._get_expected_query_args(1))
+
+    def test_load_data_local_not_allowed(self):
+        self.mock_mysql_connector.Error = MysqlError
+        task = self.create_task(source=self._get_source_string(1), use_load_data_local=True)
+        cursor = self._create_load_data_cursor()
+
+        def reject_load_data(query, *_args):
+            """Fails in the same way as a client that does not allow LOCAL loads."""
+            if query.startswith('LOAD DATA'):
+                raise MysqlError(errno=1148)
+
+        cursor.execute.side_effect = reject_load_data
+        task.insert_rows(cursor)
+        self.assertEquals(cursor.execute.call_args[0][0], self._get_expected_query(1))
+        self.assertEquals(cursor.execute.call_args[0][1], self._get_expected_query_args(1))
+
+    def test_run_with_load_data_local(self):
+        self.create_task(use_load_data_local=True).run()
+        connect_kwargs = [kwargs for _args, kwargs in self.mock_mysql_connector.connect.call_args_list]
+        self.assertTrue(any('client_flags' in kwargs for kwargs in connect_kwargs))
+        self.assertTrue(self.mock_mysql_connector.connect().commit.called)
+
 
 class MySQLLoadHelperFuncTests(unittest.TestCase):
     """
@@ -281,6 +363,26 @@ class MySQLLoadHelperFuncTests(unittest.TestCase):
         (u'\u5305\u5b50', u'\u5305\u5b50'),
     ]
 
+    LOAD_DATA_TEST_CASES = [
+        (None, '\\N'),
+        ('None', '\\N'),
+        ('\\N', '\\N'),
+        (1, '1'),
+        (1.5, '1.5'),
+        (True, '1'),
+        ('abc', 'abc'),
+        ('\xe5\x8c\x85\xe5\xad\x90', '\xe5\x8c\x85\xe5\xad\x90'),
+        (u'\u5305\u5b50', '\xe5\x8c\x85\xe5\xad\x90'),
+        ('a\tb\nc\rd\\e\0f', 'a\\tb\\nc\\rd\\\\e\\0f'),
+        (datetime.datetime(2014, 5, 1, 2, 3, 4), '2014-05-01 02:03:04'),
+        (datetime.datetime(2014, 5, 1, 2, 3, 4, 5), '2014-05-01 02:03:04.000005'),
+        (datetime.date(2014, 5, 1), '2014-05-01'),
+    ]
+
     def test_coerce_for_mysql_connect(self):
         for input, output in self.COERCE_TEST_CASES:
             self.assertEqual(coerce_for_mysql_connect(input), output)
+
+    def test_encode_for_load_data(self):
+        for input, output in self.LOAD_DATA_TEST_CASES:
+            self.assertEqual(encode_for_load_data(input), output)
@@ -1,13 +1,24 @@
 """Test selection of event log files."""
 
 import datetime
+import json
+import os
+import re
+import shutil
+import tempfile
 import unittest
 
-from mock import patch
+from boto.s3.prefix import Prefix
+from ddt import ddt, data, unpack
+from mock import patch, Mock
 
+import luigi
 from luigi.date_interval import Month
 
-from edx.analytics.tasks.common.pathutil import PathSelectionByDateIntervalTask
+from edx.analytics.tasks.common.pathutil import (
+    PathSelectionByDateIntervalTask, EventLogSelectionMixin, get_listing_steps, LISTING_LITERAL, LISTING_SEGMENT,
+    LISTING_DATE, get_date_string_parser, filter_urls_by_interval
+)
 from edx.analytics.tasks.util.url import UncheckedExternalURL
 from edx.analytics.tasks.util.tests.config import with_luigi_config
 
@@ -62,16 +73,7 @@ class PathSelectionByDateIntervalTaskTest(unittest.TestCase):
 
     @patch('edx.analytics.tasks.common.pathutil.boto.connect_s3')
     def test_requires(self, connect_s3_mock):
-        s3_conn_mock = connect_s3_mock.return_value
-        bucket_mock = s3_conn_mock.get_bucket.return_value
-
-        class FakeKey(object):
-            """A test double of the structure returned by boto when listing keys in an S3 bucket."""
-            def __init__(self, path):
-                self.key = path
-                self.size = 10
-
-        bucket_mock.list.return_value = [FakeKey(path) for path in self.SAMPLE_KEY_PATHS]
+        connect_s3_mock.return_value.get_bucket.return_value = FakeBucket(self.SAMPLE_KEY_PATHS)
 
         task = PathSelectionByDateIntervalTask(
             source=self.SOURCE,
@@ -207,3 +209,320 @@ class PathSelectionByDateIntervalTaskTest(unittest.TestCase):
             pattern=['baz']
         )
         self.assertEquals(task.pattern, ('baz',))
+
+
+@ddt
+class DateStringParserTest(unittest.TestCase):
+    """Test parsing of the dates found in file names."""
+
+    @data(
+        ('%Y%m%d', '20140318', datetime.date(2014, 3, 18)),
+        ('%Y-%m-%d', '2014-03-18', datetime.date(2014, 3, 18)),
+        ('%d.%m.%Y', '18.03.2014', datetime.date(2014, 3, 18)),
+        ('%Y%m%d', '2014318', datetime.date(2014, 3, 18)),
+        ('%Y-%m-%d', '2014-3-8', datetime.date(2014, 3, 8)),
+        ('%Y%j', '2014077', datetime.date(2014, 3, 18)),
+        ('%b %d %Y', 'Mar 18 2014', datetime.date(2014, 3, 18)),
+    )
+    @unpack
+    def test_parse(self, date_pattern, date_string, expected_date):
+        self.assertEquals(get_date_string_parser(date_pattern)(date_string), expected_date)
+
+    @data(
+        ('%Y%m%d', '20140230'),
+        ('%Y%m%d', '2014031x'),
+        ('%Y-%m-%d', '2014/03/18'),
+        ('%Y%m%d', '+2014031'),
+    )
+    @unpack
+    def test_invalid(self, date_pattern, date_string):
+        with self.assertRaises(ValueError):
+            get_date_string_parser(date_pattern)(date_string)
+
+
+class FilterUrlsByIntervalTest(unittest.TestCase):
+    """Test selection of a list of URLs."""
+
+    URLS = [
+        's3://bucket/FakeServerGroup/tracking.log-20140228.gz',
+        's3://bucket/FakeServerGroup/tracking.log-20140318.gz',
+        's3://bucket/FakeServerGroup/tracking.log-20140318',
+        's3://bucket/FakeServerGroup/tracking.log-20140319-1395256622.gz',
+        's3://bucket/FakeWorkerServerGroup/tracking.log-20140319.gz',
+        's3://bucket/FakeServerGroup/tracking.log-20140401-1396379384.gz',
+        's3://bucket/FakeOldServerGroup3/tracking_14602.log.gz',
+    ]
+
+    def test_date_patterns(self):
+        self.assertEquals(
+            filter_urls_by_interval(
+                self.URLS,
+                [r'.*?FakeServerGroup/tracking.log-(?P<date>\d{8}).*\.gz', r'.*tracking_\d{3,5}\.log\.gz$'],
+                Month.parse('2014-03'),
+            ),
+            [
+                's3://bucket/FakeServerGroup/tracking.log-20140318.gz',
+                's3://bucket/FakeServerGroup/tracking.log-20140319-1395256622.gz',
+                's3://bucket/FakeOldServerGroup3/tracking_14602.log.gz',
+            ]
+        )
+
+    def test_timestamp_pattern(self):
+        self.assertEquals(
+            filter_urls_by_interval(
+                self.URLS,
+                [r'.*?tracking.log-.*-(?P<timestamp>\d{10})\.gz'],
+                Month.parse('2014-04'),
+            ),
+            ['s3://bucket/FakeServerGroup/tracking.log-20140401-1396379384.gz']
+        )
+
+    def test_date_format(self):
+        self.assertEquals(
+            filter_urls_by_interval(
+                ['s3://bucket/2014-03-18/file.gz', 's3://bucket/2014-04-18/file.gz'],
+                [r's3://bucket/(?P<date>[\d-]+)/'],
+                Month.parse('2014-03'),
+                date_pattern='%Y-%m-%d',
+            ),
+            ['s3://bucket/2014-03-18/file.gz']
+        )
+
+
+class FakeKey(object):
+    """A test double of the structure returned by boto when listing keys in an S3 bucket."""
+
+    def __init__(self, path):
+        self.key = path
+        self.size = 10
+
+
+class FakeBucket(object):
+    """A test double of a boto bucket that lists keys the way S3 does."""
+
+    def __init__(self, paths):
+        self.paths = sorted(paths)
+        self.listed_prefixes = []
+
+    def list(self, prefix='', delimiter=''):
+        """Yield the keys that start with the prefix, grouping them into "directories" if a delimiter is given."""
+        self.listed_prefixes.append((prefix, delimiter))
+        directories = set()
+        for path in self.paths:
+            if not path.startswith(prefix):
+                continue
+            if delimiter and delimiter in path[len(prefix):]:
+                directory = path[:path.index(delimiter, len(prefix)) + 1]
+                if directory not in directories:
+                    directories.add(directory)
+                    yield Prefix(name=directory)
+            else:
+                yield FakeKey(path)
+
+
+class ListingStepsTest(unittest.TestCase):
+    """Test translation of URL patterns into listing steps."""
+
+    def test_no_literal_prefix(self):
+        self.assertEquals(get_listing_steps(r'.*tracking.log-(?P<date>\d{8}).*\.gz'), [])
+
+    def test_literal_prefix(self):
+        self.assertEquals(
+            get_listing_steps(r's3://bucket/logs/.*\.gz'),
+            [(LISTING_LITERAL, 's3://bucket/logs/')]
+        )
+
+    def test_segments_and_date(self):
+        self.assertEquals(
+            get_listing_steps(r's3://bucket/logs/[^/]+/tracking\.log-(?P<date>\d{8}).*\.gz'),
+            [
+                (LISTING_LITERAL, 's3://bucket/logs/'),
+                (LISTING_SEGMENT, None),
+                (LISTING_LITERAL, 'tracking.log-'),
+                (LISTING_DATE, None),
+            ]
+        )
+
+    def test_unescaped_dot(self):
+        self.assertEquals(
+            get_listing_steps(r's3://bucket/logs/tracking.log-(?P<date>\d{8})'),
+            [(LISTING_LITERAL, 's3://bucket/logs/tracking')]
+        )
+
+    def test_segment_without_slash(self):
+        self.assertEquals(
+            get_listing_steps(r's3://bucket/logs/[^/]+\.gz'),
+            [(LISTING_LITERAL, 's3://bucket/logs/')]
+        )
+
+    def test_other_group(self):
+        self.assertEquals(
+            get_listing_steps(r's3://bucket/(?P<host>\w+)/(?P<date>\d{8})'),
+            [(LISTING_LITERAL, 's3://bucket/')]
+        )
+
+    def test_ignore_case(self):
+        self.assertEquals(get_listing_steps(r'(?i)s3://bucket/logs/'), [])
+
+
+@ddt
+@patch('edx.analytics.tasks.common.pathutil.boto.connect_s3')
+class PrunedListingTest(unittest.TestCase):
+    """Test listing of only the S3 prefixes that may contain files for the interval."""
+
+    SOURCE = 's3://collection-bucket2/'
+    PATTERN = r's3://collection-bucket2/[^/]+/tracking\.log-(?P<date>\d{8}).*\.gz'
+
+    def setUp(self):
+        luigi.task.Register.clear_instance_cache()
+        self.bucket = FakeBucket(PathSelectionByDateIntervalTaskTest.SAMPLE_KEY_PATHS_2)
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.temp_dir, 'listing_cache.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def create_task(self, **kwargs):
+        """Returns a task selecting files for March 2014."""
+        params = {
+            'source': [self.SOURCE],
+            'interval': Month.parse('2014-03'),
+            'pattern': [self.PATTERN],
+            'expand_interval': datetime.timedelta(0),
+        }
+        params.update(kwargs)
+        return PathSelectionByDateIntervalTask(**params)
+
+    def assert_selected(self, task):
+        """Assert that the task selects the files for March 2014."""
+        self.assertItemsEqual(
+            [requirement.url for requirement in task.requires()],
+            [
+                self.SOURCE + 'FakeServerGroup/tracking.log-20140318.gz',
+                self.SOURCE + 'FakeServerGroup/tracking.log-20140319-1395256622.gz',
+            ]
+        )
+
+    def test_pruned_listing(self, connect_s3_mock):
+        connect_s3_mock.return_value.get_bucket.return_value = self.bucket
+        self.assert_selected(self.create_task())
+
+        self.assertIn(('', '/'), self.bucket.listed_prefixes)
+        self.assertIn(('FakeServerGroup/tracking.log-20140318', ''), self.bucket.listed_prefixes)
+        self.assertIn(('FakeWorkerServerGroup/tracking.log-20140331', ''), self.bucket.listed_prefixes)
+        self.assertNotIn(('', ''), self.bucket.listed_prefixes)
+        self.assertNotIn(('FakeServerGroup/tracking.log-20140401', ''), self.bucket.listed_prefixes)
+
+    def test_long_interval(self, connect_s3_mock):
+        connect_s3_mock.return_value.get_bucket.return_value = self.bucket
+        task = self.create_task(interval=Month.parse('2014-03'), expand_interval=datetime.timedelta(days=365))
+        task.requires()
+
+        date_prefixes = [prefix for prefix, _delimiter in self.bucket.listed_prefixes if prefix.startswith('test/')]
+        self.assertLessEqual(len(date_prefixes), task.MAX_DATE_PREFIXES)
+        self.assertIn('test/tracking.log-2014031', date_prefixes)
+
+    @data('s3n', 's3+https')
+    def test_source_with_other_scheme(self, scheme, connect_s3_mock):
+        connect_s3_mock.return_value.get_bucket.return_value = self.bucket
+        self.SOURCE = scheme + '://collection-bucket2/'
+        self.assert_selected(self.create_task(pattern=[self.PATTERN.replace('s3', re.escape(scheme), 1)]))
+        self.assertNotIn(('', ''), self.bucket.listed_prefixes)
+
+    def test_pattern_for_other_source(self, connect_s3_mock):
+        connect_s3_mock.return_value.get_bucket.return_value = self.bucket
+        task = self.create_task(pattern=[r's3://collection-bucket/[^/]+/tracking\.log-(?P<date>\d{8}).*\.gz'])
+        self.assertEquals(task.requires(), [])
+        self.assertEquals(self.bucket.listed_prefixes, [])
+
+    def test_listing_cache(self, connect_s3_mock):
+        connect_s3_mock.return_value.get_bucket.return_value = self.bucket
+        self.assert_selected(self.create_task(listing_cache=self.cache_path))
+        with open(self.cache_path, 'r') as cache_file:
+            cache = json.load(cache_file)
+        self.assertItemsEqual(
+            cache['s3://collection-bucket2/FakeServerGroup/tracking.log-20140318'],
+            ['FakeServerGroup/tracking.log-20140318', 'FakeServerGroup/tracking.log-20140318.gz'],
+        )
+
+        luigi.task.Register.clear_instance_cache()
+        empty_bucket = FakeBucket(['FakeServerGroup/', 'FakeWorkerServerGroup/', 'test/'])
+        connect_s3_mock.return_value.get_bucket.return_value = empty_bucket
+        self.assert_selected(self.create_task(listing_cache=self.cache_path))
+        self.assertEquals(empty_bucket.listed_prefixes, [('', '/')])
+
+    def test_recent_dates_not_cached(self, connect_s3_mock):
+        connect_s3_mock.return_value.get_bucket.return_value = self.bucket
+        task = self.create_task(
+            interval=Month.parse('2014-03'),
+            listing_cache=self.cache_path,
+            listing_cache_min_age_days=(datetime.date.today() - datetime.date(2014, 3, 20)).days,
+        )
+        self.assert_selected(task)
+        with open(self.cache_path, 'r') as cache_file:
+            cache = json.load(cache_file)
+        self.assertIn('s3://collection-bucket2/FakeServerGroup/tracking.log-20140319', cache)
+        self.assertNotIn('s3://collection-bucket2/FakeServerGroup/tracking.log-20140320', cache)
+        self.assertNotIn('s3://collection-bucket2/FakeServerGroup/tracking.log-20140331', cache)
+
+
+class LocalInitTask(luigi.Task):
+    """A task that provides the init_local() hook normally provided by map reduce jobs."""
+
+    def init_local(self):
+        pass
+
+
+class EventLogSelectionTask(EventLogSelectionMixin, LocalInitTask):
+    """A minimal task for testing the event log selection mixin."""
+    pass
+
+
+class EventLogSelectionMixinTest(unittest.TestCase):
+    """Test the pre-filtering of event log lines."""
+
+    def setUp(self):
+        self.task = EventLogSelectionTask(interval=luigi.DateIntervalParameter().parse('2013-12-17'))
+        self.task.init_local()
+        self.task.incr_counter = Mock()
+
+    def create_line(self, **kwargs):
+        """Create an event log line with test values."""
+        event = {
+            'event_type': 'play_video',
+            'time': '2013-12-17T15:38:32.805444+00:00',
+            'username': 'test_user',
+        }
+        event.update(kwargs)
+        return json.dumps(event)
+
+    def assert_prefiltered(self, line):
+        """Assert that the line is discarded before decoding it."""
+        with patch('edx.analytics.tasks.util.eventlog.parse_json_event') as mock_parse:
+            self.assertIsNone(self.task.get_event_and_date_string(line))
+            self.assertFalse(mock_parse.called)
+        self.task.incr_counter.assert_called_once_with(
+            'Event', 'Discard Before Decoding', 1, threshold=EventLogSelectionMixin.PREFILTER_COUNTER_THRESHOLD
+        )
+
+    def test_within_interval(self):
+        event, date_string = self.task.get_event_and_date_string(self.create_line())
+        self.assertEquals(event['username'], 'test_user')
+        self.assertEquals(date_string, '2013-12-17')
+
+    def test_outside_interval(self):
+        self.assert_prefiltered(self.create_line(time='2013-12-18T15:38:32.805444+00:00'))
+
+    def test_outside_interval_without_prefilter(self):
+        self.task.prefilter_event_time = False
+        self.assertIsNone(self.task.get_event_and_date_string(self.create_line(time='2013-12-18T00:00:00')))
+        self.assertFalse(self.task.incr_counter.called)
+
+    def test_event_type_prefilter(self):
+        self.task.prefilter_event_types = frozenset(['pause_video'])
+        self.assert_prefiltered(self.create_line())
+
+    def test_matching_event_type_prefilter(self):
+        self.task.prefilter_event_types = frozenset(['play_video'])
+        event, _date_string = self.task.get_event_and_date_string(self.create_line())
+        self.assertEquals(event['event_type'], 'play_video')
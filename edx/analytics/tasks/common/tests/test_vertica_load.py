@@ -3,6 +3,9 @@ Ensure we can write to Vertica data sources.
 """
 from __future__ import absolute_import
 
+import os
+import shutil
+import tempfile
 import textwrap
 import unittest
 
@@ -12,7 +15,7 @@ import luigi.task
 from mock import call, MagicMock, patch, sentinel
 
 from edx.analytics.tasks.common.vertica_load import (
-    VerticaCopyTask, VerticaProjection, PROJECTION_TYPE_NORMAL, PROJECTION_TYPE_AGGREGATE
+    IncrementalVerticaCopyTask, VerticaCopyTask, VerticaProjection, PROJECTION_TYPE_NORMAL, PROJECTION_TYPE_AGGREGATE
 )
 from edx.analytics.tasks.util.tests.config import with_luigi_config
 from edx.analytics.tasks.util.tests.target import FakeTarget
@@ -87,6 +90,16 @@ class CopyToVerticaDummyTableWithProjections(CopyToVerticaDummyTable):
         ]
 
 
+class IncrementalCopyToVerticaDummyTable(IncrementalVerticaCopyTask, CopyToVerticaDummyTable):
+    """
+    Define table for testing incremental loads.
+    """
+
+    @property
+    def record_filter(self):
+        return "course_id='course1'"
+
+
 class VerticaCopyTaskTest(unittest.TestCase):
     """
     Ensure we can connect to and write data to Vertica data sources.
@@ -97,7 +110,8 @@ class VerticaCopyTaskTest(unittest.TestCase):
         self.mock_vertica_connector = patcher.start()
         self.addCleanup(patcher.stop)
 
-    def create_task(self, credentials=None, source=None, overwrite=False, cls=CopyToVerticaDummyTable):
+    def create_task(self, credentials=None, source=None, overwrite=False, cls=CopyToVerticaDummyTable, copy_streams=1,
+                    overwrite_with_swap=False):
         """
          Emulate execution of a generic VerticaCopyTask.
         """
@@ -106,7 +120,9 @@ class VerticaCopyTaskTest(unittest.TestCase):
         luigi.task.Register.clear_instance_cache()
         task = cls(
             credentials=sentinel.ignored,
-            overwrite=overwrite
+            overwrite=overwrite,
+            copy_streams=copy_streams,
+            overwrite_with_swap=overwrite_with_swap,
         )
 
         if not credentials:
@@ -353,3 +369,208 @@ class VerticaCopyTaskTest(unittest.TestCase):
             call('SELECT start_refresh();'),
         ]
         self.assertEquals(expected, mock_cursor.execute.mock_calls)
+
+    def create_streaming_task(self):
+        """Create a task that copies a directory of part files using three streams."""
+        self.source_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.source_dir)
+        for index in range(4):
+            with open(os.path.join(self.source_dir, 'part-0000{0}'.format(index)), 'w') as source_file:
+                source_file.write(self._get_source_string(index + 1))
+        open(os.path.join(self.source_dir, '_SUCCESS'), 'w').close()
+
+        task = self.create_task(copy_streams=3)
+        task.input()['insert_source'] = luigi.LocalTarget(self.source_dir)
+        return task
+
+    def test_get_insert_source_targets(self):
+        task = self.create_streaming_task()
+        self.assertEquals(
+            [target.path for target in task.get_insert_source_targets()],
+            [os.path.join(self.source_dir, 'part-0000{0}'.format(index)) for index in range(4)]
+        )
+
+    def test_get_insert_source_targets_for_file(self):
+        task = self.create_task()
+        self.assertEquals(task.get_insert_source_targets(), [task.input()['insert_source']])
+
+    @with_luigi_config(('vertica-export', 'schema', 'foobar'))
+    def test_run_with_copy_streams(self):
+        task = self.create_streaming_task()
+        copied = []
+        mock_cursor = self.mock_vertica_connector.connect.return_value.cursor.return_value
+        mock_cursor.copy.side_effect = lambda query, source_file: copied.append((query, source_file.read()))
+        task.run()
+
+        staging_table = task.staging_table
+        self.assertTrue(staging_table.startswith('dummy_table_staging_'))
+        self.assertItemsEqual(
+            [source for _query, source in copied],
+            [self._get_source_string(index + 1) for index in range(4)]
+        )
+        self.assertEquals(set(query for query, _source in copied), set([
+            "COPY foobar.{0} (course_id,interval_start,interval_end,label,count) "
+            "FROM STDIN ENCLOSED BY '' DELIMITER AS E'\t' NULL AS '\\N' DIRECT ABORT ON ERROR NO COMMIT;".format(
+                staging_table
+            )
+        ]))
+
+        executed = [args[0][0] for args in mock_cursor.execute.call_args_list]
+        insert_query = (
+            "INSERT /*+ DIRECT */ INTO foobar.dummy_table (course_id,interval_start,interval_end,label,count) "
+            "SELECT course_id,interval_start,interval_end,label,count FROM foobar.{0};".format(staging_table)
+        )
+        create_query = "CREATE TABLE foobar.{0} LIKE foobar.dummy_table".format(staging_table)
+        drop_query = "DROP TABLE IF EXISTS foobar.{0} CASCADE".format(staging_table)
+        self.assertLess(executed.index(create_query), executed.index(insert_query))
+        self.assertEquals(executed[-1], drop_query)
+        mock_conn = self.mock_vertica_connector.connect()
+        self.assertFalse(mock_conn.rollback.called)
+        self.assertTrue(mock_conn.commit.called)
+
+    def test_run_with_failed_copy_stream(self):
+        task = self.create_streaming_task()
+        mock_cursor = self.mock_vertica_connector.connect.return_value.cursor.return_value
+        mock_cursor.copy.side_effect = Exception('Failed to copy')
+        with self.assertRaisesRegexp(Exception, 'Failed to copy'):
+            task.run()
+
+        executed = [args[0][0] for args in mock_cursor.execute.call_args_list]
+        self.assertFalse(any(query.startswith('INSERT') for query in executed))
+        self.assertTrue(executed[-1].startswith('DROP TABLE IF EXISTS'))
+        mock_conn = self.mock_vertica_connector.connect()
+        self.assertTrue(mock_conn.rollback.called)
+        self.assertFalse(mock_conn.commit.called)
+        self.assertFalse(task.output().touch.called)
+
+    def test_run_with_single_file(self):
+        task = self.create_task(copy_streams=3)
+        task.run()
+        mock_cursor = self.mock_vertica_connector.connect.return_value.cursor.return_value
+        self.assertEquals(mock_cursor.copy.call_count, 1)
+        executed = [args[0][0] for args in mock_cursor.execute.call_args_list]
+        self.assertFalse(any('staging' in query for query in executed))
+
+    @with_luigi_config(('vertica-export', 'schema', 'foobar'))
+    def test_overwrite_with_swap(self):
+        task = self.create_task(cls=CopyToVerticaDummyTableWithProjections, overwrite=True, overwrite_with_swap=True)
+        task.run()
+
+        staging_table = task.staging_table
+        replaced_table = task.replaced_table
+        mock_cursor = self.mock_vertica_connector.connect.return_value.cursor.return_value
+        expected = [
+            call("CREATE SCHEMA IF NOT EXISTS foobar"),
+            call(
+                "CREATE TABLE IF NOT EXISTS foobar.dummy_table "
+                "(id AUTO_INCREMENT,course_id VARCHAR(255),"
+                "interval_start DATETIME,interval_end DATETIME,label VARCHAR(255),"
+                "count INT,created TIMESTAMP DEFAULT NOW(),PRIMARY KEY (id))"
+            ),
+            call("DROP TABLE IF EXISTS foobar.{0} CASCADE".format(staging_table)),
+            call("DROP TABLE IF EXISTS foobar.{0} CASCADE".format(replaced_table)),
+            call("CREATE TABLE foobar.{0} LIKE foobar.dummy_table".format(staging_table)),
+            call('CREATE PROJECTION IF NOT EXISTS foobar.{0}_projection_1 DEFINITION_1 on foobar.{0};'.format(
+                staging_table
+            )),
+            call('CREATE PROJECTION IF NOT EXISTS foobar.{0}_projection_3 DEFINITION_3 on foobar.{0};'.format(
+                staging_table
+            )),
+            call("SET TIMEZONE TO 'GMT';"),
+            call('CREATE PROJECTION IF NOT EXISTS foobar.{0}_projection_2 DEFINITION_2 on foobar.{0};'.format(
+                staging_table
+            )),
+            call('SELECT start_refresh();'),
+            call("GRANT SELECT ON foobar.{0} TO data_engineering_team;".format(staging_table)),
+            call("ALTER TABLE foobar.dummy_table, foobar.{0} RENAME TO {1}, dummy_table".format(
+                staging_table, replaced_table
+            )),
+            call("DROP TABLE IF EXISTS foobar.{0} CASCADE".format(replaced_table)),
+            call("ALTER PROJECTION foobar.{0}_projection_1 RENAME TO dummy_table_projection_1;".format(staging_table)),
+            call("ALTER PROJECTION foobar.{0}_projection_2 RENAME TO dummy_table_projection_2;".format(staging_table)),
+            call("ALTER PROJECTION foobar.{0}_projection_3 RENAME TO dummy_table_projection_3;".format(staging_table)),
+            call("DELETE FROM name_of_marker_schema.name_of_marker_table where target_table='foobar.dummy_table';"),
+            call("DROP TABLE IF EXISTS foobar.{0} CASCADE".format(staging_table)),
+        ]
+        self.assertEquals(expected, mock_cursor.execute.mock_calls)
+        self.assertIn(staging_table, mock_cursor.copy.call_args[0][0])
+        self.assertTrue(task.output().touch.called)
+        self.assertTrue(task.attempted_removal)
+
+    @with_luigi_config(('vertica-export', 'schema', 'foobar'))
+    def test_repeated_swaps_create_projections_once(self):
+        mock_cursor = self.mock_vertica_connector.connect.return_value.cursor.return_value
+        for _run in range(2):
+            mock_cursor.execute.reset_mock()
+            task = self.create_task(
+                cls=CopyToVerticaDummyTableWithProjections, overwrite=True, overwrite_with_swap=True
+            )
+            task.run()
+
+            executed = [args[0][0] for args in mock_cursor.execute.call_args_list]
+            created = [query for query in executed if query.startswith('CREATE PROJECTION')]
+            self.assertEquals(len(created), 3)
+            self.assertEquals(len(set(created)), 3)
+            self.assertFalse(any('on foobar.dummy_table;' in query for query in created))
+            renamed = [query for query in executed if query.startswith('ALTER PROJECTION')]
+            self.assertEquals(
+                [query.split(' RENAME TO ')[1] for query in renamed],
+                ['dummy_table_projection_1;', 'dummy_table_projection_2;', 'dummy_table_projection_3;']
+            )
+
+    def test_overwrite_with_swap_creates_access_policies_before_swap(self):
+        task = self.create_task(overwrite=True, overwrite_with_swap=True)
+        with patch.object(task.__class__, 'restricted_columns', ['label']):
+            task.run()
+
+        mock_cursor = self.mock_vertica_connector.connect.return_value.cursor.return_value
+        executed = [args[0][0] for args in mock_cursor.execute.call_args_list]
+        policies = [index for index, query in enumerate(executed) if 'CREATE ACCESS POLICY' in query]
+        swap = [index for index, query in enumerate(executed) if query.startswith('ALTER TABLE')]
+        self.assertEquals(len(policies), 1)
+        self.assertIn('ON {0}.{1} FOR COLUMN label'.format(task.schema, task.staging_table), executed[policies[0]])
+        self.assertLess(policies[0], swap[0])
+
+    def test_overwrite_with_swap_and_failed_grant(self):
+        task = self.create_task(overwrite=True, overwrite_with_swap=True)
+        mock_cursor = self.mock_vertica_connector.connect.return_value.cursor.return_value
+        mock_cursor.execute.side_effect = lambda query: self._raise_if_grant(query)
+        with self.assertRaisesRegexp(Exception, 'Failed to grant'):
+            task.run()
+
+        executed = [args[0][0] for args in mock_cursor.execute.call_args_list]
+        self.assertFalse(any(query.startswith('ALTER TABLE') for query in executed))
+        self.assertFalse(task.output().touch.called)
+
+    @staticmethod
+    def _raise_if_grant(query):
+        """Fails any GRANT statement."""
+        if query.startswith('GRANT'):
+            raise Exception('Failed to grant')
+
+    def test_overwrite_with_swap_and_failed_copy(self):
+        task = self.create_task(overwrite=True, overwrite_with_swap=True)
+        mock_cursor = self.mock_vertica_connector.connect.return_value.cursor.return_value
+        mock_cursor.copy.side_effect = Exception('Failed to copy')
+        with self.assertRaisesRegexp(Exception, 'Failed to copy'):
+            task.run()
+
+        executed = [args[0][0] for args in mock_cursor.execute.call_args_list]
+        self.assertFalse(any(query.startswith('ALTER TABLE') for query in executed))
+        self.assertFalse(task.output().touch.called)
+        self.assertTrue(executed[-1].startswith('DROP TABLE IF EXISTS'))
+
+    def test_swap_ignored_without_overwrite(self):
+        task = self.create_task(overwrite_with_swap=True)
+        task.run()
+        mock_cursor = self.mock_vertica_connector.connect.return_value.cursor.return_value
+        executed = [args[0][0] for args in mock_cursor.execute.call_args_list]
+        self.assertFalse(any('staging' in query for query in executed))
+
+    def test_swap_not_supported_by_incremental_copy(self):
+        task = self.create_task(cls=IncrementalCopyToVerticaDummyTable, overwrite=True, overwrite_with_swap=True)
+        task.run()
+        mock_cursor = self.mock_vertica_connector.connect.return_value.cursor.return_value
+        executed = [args[0][0] for args in mock_cursor.execute.call_args_list]
+        self.assertIn("DELETE FROM {0}.dummy_table where course_id='course1'".format(task.schema), executed)
+        self.assertFalse(any('staging' in query for query in executed))
@@ -3,10 +3,15 @@ Support for loading data into an HP Vertica database.
 """
 
 from collections import namedtuple
+import hashlib
 import logging
+import os
+import sys
+import threading
 
 import luigi
 import luigi.configuration
+import luigi.hdfs
 
 from edx.analytics.tasks.util.overwrite import OverwriteOutputMixin
 from edx.analytics.tasks.util.url import ExternalURL
@@ -57,6 +62,22 @@ class VerticaCopyTaskMixin(OverwriteOutputMixin):
         default='experimental',
         config_path={'section': 'vertica-export', 'name': 'persistent_schema'}
     )
+    overwrite_with_swap = luigi.BooleanParameter(
+        default=False,
+        significant=False,
+        config_path={'section': 'vertica-export', 'name': 'overwrite_with_swap'},
+        description='When overwriting, copy the data into a staging table and then swap it with the table, instead of '
+        'deleting the contents of the table and copying into it.  Queries against the table are not blocked while '
+        'the data is loaded, and no deleted records need to be purged afterwards.',
+    )
+    copy_streams = luigi.IntParameter(
+        default=1,
+        significant=False,
+        config_path={'section': 'vertica-export', 'name': 'copy_streams'},
+        description='The maximum number of COPY statements to run concurrently when the insert source is a directory '
+        'of several files.  When greater than one, the files are copied into a staging table over separate '
+        'connections and then inserted into the table in the same transaction that updates the marker table.',
+    )
 
 
 class VerticaCopyTask(VerticaCopyTaskMixin, luigi.Task):
@@ -71,9 +92,15 @@ class VerticaCopyTask(VerticaCopyTaskMixin, luigi.Task):
 
     Overwrite init_copy and init_touch if you want a different overwrite behavior in a
     subclass.
+
+    If overwrite_with_swap is also true, the data is instead copied into a staging table
+    which then replaces the table being written to.  Only tasks that overwrite the entire
+    table can do this, so subclasses that overwrite part of the table disable it by
+    setting supports_table_swap to False.
     """
     required_tasks = None
     output_target = None
+    supports_table_swap = True
 
     def requires(self):
         if self.required_tasks is None:
@@ -209,25 +236,27 @@ class VerticaCopyTask(VerticaCopyTaskMixin, luigi.Task):
         log.debug(query)
         connection.cursor().execute(query)
 
-    def _get_aggregate_projections(self):
-        """Get projections that are aggregates, and fill in values."""
+    def _get_aggregate_projections(self, table=None):
+        """Get projections that are aggregates, and fill in values for the given table, or the table being loaded."""
+        table = table or self.table
         return [
             VerticaProjection
             (
-                template.name.format(schema=self.schema, table=self.table),
+                template.name.format(schema=self.schema, table=table),
                 template.type,
-                template.definition.format(schema=self.schema, table=self.table),
+                template.definition.format(schema=self.schema, table=table),
             ) for template in self.projections if template.type == PROJECTION_TYPE_AGGREGATE
         ]
 
-    def _get_nonaggregate_projections(self):
-        """Get projections that are not aggregates, and fill in values."""
+    def _get_nonaggregate_projections(self, table=None):
+        """Get projections that are not aggregates, and fill in values for the given table, or the one being loaded."""
+        table = table or self.table
         return [
             VerticaProjection
             (
-                template.name.format(schema=self.schema, table=self.table),
+                template.name.format(schema=self.schema, table=table),
                 template.type,
-                template.definition.format(schema=self.schema, table=self.table),
+                template.definition.format(schema=self.schema, table=table),
             ) for template in self.projections if template.type != PROJECTION_TYPE_AGGREGATE
         ]
 
@@ -242,11 +271,11 @@ class VerticaCopyTask(VerticaCopyTaskMixin, luigi.Task):
             log.debug(query)
             connection.cursor().execute(query)
 
-    def create_aggregate_projections(self, connection):
+    def create_aggregate_projections(self, connection, table=None):
         """
-        Define all aggregate projections on table.
+        Define all aggregate projections on table, which defaults to the table being loaded.
         """
-        projections = self._get_aggregate_projections()
+        projections = self._get_aggregate_projections(table)
         for projection in projections:
             query = "CREATE PROJECTION IF NOT EXISTS {name} {definition};".format(
                 name=projection.name, definition=projection.definition
@@ -260,11 +289,11 @@ class VerticaCopyTask(VerticaCopyTaskMixin, luigi.Task):
             log.debug(query)
             connection.cursor().execute(query)
 
-    def create_nonaggregate_projections(self, connection):
+    def create_nonaggregate_projections(self, connection, table=None):
         """
-        Define all projections on table.
+        Define all projections on table, which defaults to the table being loaded.
         """
-        for projection in self._get_nonaggregate_projections():
+        for projection in self._get_nonaggregate_projections(table):
             query = "CREATE PROJECTION IF NOT EXISTS {name} {definition};".format(
                 name=projection.name, definition=projection.definition
             )
@@ -404,23 +433,31 @@ class VerticaCopyTask(VerticaCopyTaskMixin, luigi.Task):
         """The field's enclosing character. Default is empty string."""
         return "''"
 
-    def copy_data_table_from_target(self, cursor):
-        """Performs the copy query from the insert source."""
+    @property
+    def copy_column_names(self):
+        """The comma-separated list of the columns to be copied."""
         if isinstance(self.columns[0], basestring):
-            column_names = ','.join([name for name in self.columns])
+            return ','.join([name for name in self.columns])
         elif len(self.columns[0]) == 2:
-            column_names = ','.join([name for name, _type in self.columns])
+            return ','.join([name for name, _type in self.columns])
         else:
             raise Exception('columns must consist of column strings or '
                             '(column string, type string) tuples (was %r ...)'
                             % (self.columns[0],))
 
-        with self.input()['insert_source'].open('r') as insert_source_file:
+    def copy_data_table_from_target(self, cursor):
+        """Performs the copy query from the insert source."""
+        self.copy_from_target(cursor, self.input()['insert_source'], self.table)
+
+    def copy_from_target(self, cursor, source_target, table):
+        """Copies the contents of a single target into the table."""
+        column_names = self.copy_column_names
+        with source_target.open('r') as insert_source_file:
             log.debug("Running stream copy from source file")
             cursor.copy(
                 "COPY {schema}.{table} ({cols}) FROM STDIN ENCLOSED BY {enclosed_by} DELIMITER AS {delim} NULL AS {null} DIRECT ABORT ON ERROR NO COMMIT;".format(
                     schema=self.schema,
-                    table=self.table,
+                    table=table,
                     cols=column_names,
                     delim=self.copy_delimiter,
                     null=self.copy_null_sequence,
@@ -429,11 +466,183 @@ class VerticaCopyTask(VerticaCopyTaskMixin, luigi.Task):
                 insert_source_file
             )
 
+    def get_insert_source_targets(self):
+        """
+        Returns a target for each file that makes up the insert source.
+
+        Directories, which are usually Hive partitions or other Hadoop output, are replaced by the files they contain.
+        Hidden files such as the "_SUCCESS" marker are skipped, as Hive does.
+        """
+        insert_source = self.input()['insert_source']
+        if isinstance(insert_source, luigi.LocalTarget):
+            if not os.path.isdir(insert_source.path):
+                return [insert_source]
+            paths = [os.path.join(insert_source.path, filename) for filename in os.listdir(insert_source.path)]
+        elif isinstance(insert_source, luigi.hdfs.HdfsTarget):
+            # Listing a file returns just that file.
+            paths = list(luigi.hdfs.listdir(insert_source.path, ignore_directories=True))
+        else:
+            return [insert_source]
+
+        return [
+            insert_source.__class__(path)
+            for path in sorted(paths)
+            if not os.path.basename(path).startswith(('_', '.'))
+        ]
+
+    @property
+    def staging_table(self):
+        """The name of the table that parallel copies are loaded into, which is unique to this update."""
+        return '{table}_staging_{hash}'.format(table=self.table, hash=hashlib.md5(self.update_id()).hexdigest()[:12])
+
+    @property
+    def replaced_table(self):
+        """The name that the table is given when it is replaced by the staging table, before it is dropped."""
+        return '{table}_replaced_{hash}'.format(table=self.table, hash=hashlib.md5(self.update_id()).hexdigest()[:12])
+
+    def create_staging_table(self, connection):
+        """
+        Creates an empty staging table with the same columns and partitioning as the table being loaded.
+
+        Any tables left behind by an earlier attempt are removed first.  Projections, access policies and grants are
+        not copied, so if the staging table is going to replace the table being loaded, they must be created on it.
+        """
+        for table in (self.staging_table, self.replaced_table):
+            query = "DROP TABLE IF EXISTS {schema}.{table} CASCADE".format(schema=self.schema, table=table)
+            log.debug(query)
+            connection.cursor().execute(query)
+        query = "CREATE TABLE {schema}.{staging_table} LIKE {schema}.{table}".format(
+            schema=self.schema, staging_table=self.staging_table, table=self.table
+        )
+        log.debug(query)
+        connection.cursor().execute(query)
+
+    def copy_to_staging_table(self, source_targets):
+        """
+        Copies the source targets into the staging table, using up to `copy_streams` concurrent connections.
+
+        Each stream commits its own transaction, so the data only becomes visible in the table being loaded when it is
+        inserted from, or swapped with, the staging table.
+        """
+        num_streams = max(min(self.copy_streams, len(source_targets)), 1)
+        log.info('Copying %d files into %s using %d streams', len(source_targets), self.staging_table, num_streams)
+        errors = []
+        threads = []
+        for stream_index in range(num_streams):
+            thread = threading.Thread(
+                target=self._run_copy_stream,
+                args=(source_targets[stream_index::num_streams], errors)
+            )
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            exc_info = errors[0]
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+    def _run_copy_stream(self, source_targets, errors):
+        """Copy each of the targets into the staging table using a separate connection."""
+        try:
+            connection = self.output().connect()
+            try:
+                connection.cursor().execute("SET TIMEZONE TO 'GMT';")
+                cursor = connection.cursor()
+                for source_target in source_targets:
+                    if errors:
+                        # Another stream failed, so the load is going to be rolled back anyway.
+                        connection.rollback()
+                        return
+                    self.copy_from_target(cursor, source_target, self.staging_table)
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+            finally:
+                connection.close()
+        except Exception:  # pylint: disable=broad-except
+            log.exception('Failed to copy into %s', self.staging_table)
+            errors.append(sys.exc_info())
+
+    def insert_from_staging_table(self, connection):
+        """Inserts the contents of the staging table into the table being loaded."""
+        query = (
+            "INSERT /*+ DIRECT */ INTO {schema}.{table} ({cols}) SELECT {cols} FROM {schema}.{staging_table};"
+        ).format(
+            schema=self.schema,
+            table=self.table,
+            staging_table=self.staging_table,
+            cols=self.copy_column_names,
+        )
+        log.debug(query)
+        connection.cursor().execute(query)
+
+    def swap_staging_table(self, connection):
+        """
+        Replaces the table being loaded with the staging table, and drops the table that was replaced.
+
+        Both tables are renamed by a single statement, so queries see either the old or the new contents of the table.
+        The staging table must already have the projections, access policies and grants of the table it replaces.  Its
+        projections are then given the names they would have on the table being loaded, which are free once the table
+        that was replaced is dropped, so that the next load can create them on its own staging table again.
+        """
+        query = "ALTER TABLE {schema}.{table}, {schema}.{staging_table} RENAME TO {replaced_table}, {table}".format(
+            schema=self.schema,
+            table=self.table,
+            staging_table=self.staging_table,
+            replaced_table=self.replaced_table,
+        )
+        log.debug(query)
+        connection.cursor().execute(query)
+
+        query = "DROP TABLE IF EXISTS {schema}.{replaced_table} CASCADE".format(
+            schema=self.schema, replaced_table=self.replaced_table
+        )
+        log.debug(query)
+        connection.cursor().execute(query)
+
+        for template in self.projections:
+            staging_name = template.name.format(schema=self.schema, table=self.staging_table)
+            name = template.name.format(schema=self.schema, table=self.table)
+            if staging_name != name:
+                query = "ALTER PROJECTION {staging_name} RENAME TO {name};".format(
+                    staging_name=staging_name, name=name.split('.')[-1]
+                )
+                log.debug(query)
+                connection.cursor().execute(query)
+
+    def grant_privileges(self, connection, table=None):
+        """Grants the standard roles read access to the table, which defaults to the table being loaded."""
+        roles_param = luigi.Parameter(
+            is_list=True, config_path={'section': 'vertica-export', 'name': 'standard_roles'}, default=[]
+        )
+        roles = list(roles_param.value)
+        if not roles:
+            return
+        query = "GRANT SELECT ON {schema}.{table} TO {roles};".format(
+            schema=self.schema, table=table or self.table, roles=','.join(roles)
+        )
+        log.debug(query)
+        connection.cursor().execute(query)
+
+    def drop_staging_table(self, connection):
+        """Removes the staging table, if it exists."""
+        query = "DROP TABLE IF EXISTS {schema}.{staging_table} CASCADE".format(
+            schema=self.schema, staging_table=self.staging_table
+        )
+        log.debug(query)
+        try:
+            connection.cursor().execute(query)
+        except vertica_python.errors.Error:
+            log.exception('Unable to remove the staging table %s', self.staging_table)
+
     @property
     def restricted_columns(self):
         return []
 
-    def create_access_policies(self, connection):
+    def create_access_policies(self, connection, table=None):
+        table = table or self.table
         cursor = connection.cursor()
         for column in self.restricted_columns:
             restricted_roles_param = luigi.Parameter(is_list=True, config_path={'section': 'vertica-export', 'name': 'restricted_roles'}, default=[])
@@ -444,7 +653,7 @@ CREATE ACCESS POLICY ON {schema}.{table} FOR COLUMN {column}
 CASE WHEN {expression} THEN {column}
 ELSE 'Restricted'
 END
-ENABLE;""".format(schema=self.schema, table=self.table, column=column, expression=expression)
+ENABLE;""".format(schema=self.schema, table=table, column=column, expression=expression)
             log.debug(statement)
             try:
                 cursor.execute(statement)
@@ -452,7 +661,7 @@ ENABLE;""".format(schema=self.schema, table=self.table, column=column, expressio
                 # This is expected to fail if the access policy already exists.
                 expected_error = 'Access policy for COLUMN "{column}" already exists on "{table}"'.format(
                     column=column,
-                    table=self.table
+                    table=table
                 )
                 if query_error.error_response.message == expected_error:
                     log.debug('An access policy already exists, so this statement was ignored: {0}'.format(statement))
@@ -471,6 +680,15 @@ ENABLE;""".format(schema=self.schema, table=self.table, column=column, expressio
 
         self.check_vertica_availability()
 
+        if self.overwrite and self.overwrite_with_swap and self.supports_table_swap:
+            self.run_with_table_swap()
+            return
+
+        source_targets = None
+        if self.copy_streams > 1:
+            source_targets = self.get_insert_source_targets()
+        use_staging_table = source_targets is not None and len(source_targets) > 1
+
         connection = self.output().connect()
         try:
             # create schema and table only if necessary:
@@ -478,14 +696,22 @@ ENABLE;""".format(schema=self.schema, table=self.table, column=column, expressio
             self.create_table(connection)
             self.create_nonaggregate_projections(connection)
 
+            if use_staging_table:
+                # Creating the staging table commits, so it must be loaded before the transaction starts.
+                self.create_staging_table(connection)
+                self.copy_to_staging_table(source_targets)
+
             # we should do nothing between initialization and copying
             # that would commit the transaction.
             self.init_copy(connection)
 
             connection.cursor().execute("SET TIMEZONE TO 'GMT';")
 
-            cursor = connection.cursor()
-            self.copy_data_table_from_target(cursor)
+            if use_staging_table:
+                self.insert_from_staging_table(connection)
+            else:
+                cursor = connection.cursor()
+                self.copy_data_table_from_target(cursor)
 
             # mark as complete in same transaction
             self.init_touch(connection)
@@ -513,6 +739,50 @@ ENABLE;""".format(schema=self.schema, table=self.table, column=column, expressio
             connection.rollback()
             raise
         finally:
+            if use_staging_table:
+                self.drop_staging_table(connection)
+            connection.close()
+
+    def run_with_table_swap(self):
+        """
+        Overwrites the table by loading a staging table and swapping it with the table.
+
+        Queries against the table are not blocked while the data is copied.  The staging table is given the projections,
+        access policies and grants of the table before the swap, and the marker table is only updated once the new data
+        has been swapped in, so an interrupted load is repeated by the next run.
+        """
+        if self.copy_streams > 1:
+            source_targets = self.get_insert_source_targets()
+        else:
+            source_targets = [self.input()['insert_source']]
+
+        connection = self.output().connect()
+        try:
+            self.create_schema(connection)
+            self.create_table(connection)
+            self.create_staging_table(connection)
+            self.create_nonaggregate_projections(connection, self.staging_table)
+            self.copy_to_staging_table(source_targets)
+
+            # As in run(), the aggregate projections and access policies are only created once the data is copied.
+            self.create_aggregate_projections(connection, self.staging_table)
+            self.create_access_policies(connection, self.staging_table)
+            self.grant_privileges(connection, self.staging_table)
+
+            self.attempted_removal = True
+            self.swap_staging_table(connection)
+
+            self.init_touch(connection)
+            self.output().touch(connection)
+            connection.commit()
+            log.debug("Committed transaction.")
+
+        except Exception as exc:
+            log.exception("Rolled back the transaction; exception raised: %s", str(exc))
+            connection.rollback()
+            raise
+        finally:
+            self.drop_staging_table(connection)
             connection.close()
 
     def check_vertica_availability(self):
@@ -529,6 +799,8 @@ class IncrementalVerticaCopyTask(VerticaCopyTask):
     and only deletes table_updates row with the same update_id.
     """
 
+    supports_table_swap = False
+
     def init_copy(self, connection):
         self.attempted_removal = True
         if self.overwrite:
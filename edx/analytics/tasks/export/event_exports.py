@@ -11,7 +11,7 @@ import yaml
 
 from edx.analytics.tasks.common.mapreduce import MultiOutputMapReduceJobTask
 from edx.analytics.tasks.common.pathutil import EventLogSelectionMixin
-from edx.analytics.tasks.util.encrypt import make_encrypted_file
+from edx.analytics.tasks.util.encrypt import make_encrypted_file, make_pipelined_encrypted_file
 from edx.analytics.tasks.util import eventlog
 import edx.analytics.tasks.util.opaque_key_util as opaque_key_util
 from edx.analytics.tasks.util.url import url_path_join, ExternalURL, get_target_from_url
@@ -25,6 +25,9 @@ class EventExportTask(EventLogSelectionMixin, MultiOutputMapReduceJobTask):
 
     """
 
+    # The date used is not always the top-level "time" field, see get_event_time().
+    prefilter_event_time = False
+
     output_root = luigi.Parameter(
         config_path={'section': 'event-export', 'name': 'output_root'},
         description='Directory to store the output in.',
@@ -52,6 +55,16 @@ class EventExportTask(EventLogSelectionMixin, MultiOutputMapReduceJobTask):
     required_path_text = luigi.Parameter(
         config_path={'section': 'event-export', 'name': 'required_path_text'},
     )
+    pipeline_encryption = luigi.BooleanParameter(
+        config_path={'section': 'event-export', 'name': 'pipeline_encryption'},
+        default=False,
+        significant=False,
+        description='If True, compress and encrypt the output in threads that run while the events are written, '
+        'instead of encrypting a temporary file after all of the events have been written.',
+    )
+
+    # Number of bytes of events to combine into a single write.
+    WRITE_BATCH_SIZE = 256 * 1024
 
     def requires_local(self):
         return ExternalURL(url=self.config)
@@ -176,17 +189,40 @@ class EventExportTask(EventLogSelectionMixin, MultiOutputMapReduceJobTask):
             self.incr_counter('Event Export', 'Bytes Written to Output', num_bytes)
 
         key_file_targets = [get_target_from_url(url_path_join(self.gpg_key_dir, recipient)) for recipient in recipients]
-        with make_encrypted_file(output_file, key_file_targets, progress=report_progress) as encrypted_output_file:
-            outfile = gzip.GzipFile(mode='wb', fileobj=encrypted_output_file)
-            try:
-                for value in values:
-                    outfile.write(value.strip())
-                    outfile.write('\n')
-                    # WARNING: This line ensures that Hadoop knows that our process is not sitting in an infinite loop.
-                    # Do not remove it.
-                    self.incr_counter('Event Export', 'Raw Bytes Written', len(value) + 1)
-            finally:
-                outfile.close()
+        if self.pipeline_encryption:
+            with make_pipelined_encrypted_file(
+                output_file, key_file_targets, progress=report_progress, compress=True
+            ) as encrypted_output_file:
+                self.write_values(values, encrypted_output_file)
+        else:
+            with make_encrypted_file(output_file, key_file_targets, progress=report_progress) as encrypted_output_file:
+                outfile = gzip.GzipFile(mode='wb', fileobj=encrypted_output_file)
+                try:
+                    self.write_values(values, outfile)
+                finally:
+                    outfile.close()
+
+    def write_values(self, values, outfile):
+        """Write each value to the file on its own line, combining many lines into each write."""
+        lines = []
+        num_bytes = 0
+        for value in values:
+            lines.append(value.strip())
+            num_bytes += len(value) + 1
+            if num_bytes >= self.WRITE_BATCH_SIZE:
+                self._write_lines(lines, num_bytes, outfile)
+                lines = []
+                num_bytes = 0
+        if lines:
+            self._write_lines(lines, num_bytes, outfile)
+
+    def _write_lines(self, lines, num_bytes, outfile):
+        """Write a batch of lines and count them."""
+        outfile.write('\n'.join(lines))
+        outfile.write('\n')
+        # WARNING: This line ensures that Hadoop knows that our process is not sitting in an infinite loop.
+        # Do not remove it.
+        self.incr_counter('Event Export', 'Raw Bytes Written', num_bytes)
 
     def get_org_id(self, event):
         """
@@ -20,6 +20,9 @@ class EventExportByCourseTask(EventLogSelectionMixin, MultiOutputMapReduceJobTas
     Group events by course and export them for research purposes.
     """
 
+    # The date used is not always the top-level "time" field, see get_event_time().
+    prefilter_event_time = False
+
     output_root = luigi.Parameter(
         config_path={'section': 'event-export-course', 'name': 'output_root'}
     )
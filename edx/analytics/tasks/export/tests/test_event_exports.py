@@ -4,6 +4,7 @@ Tests for event export tasks
 
 import datetime
 import json
+import StringIO
 from collections import defaultdict
 from itertools import chain
 from unittest import TestCase
@@ -383,6 +384,20 @@ class EventExportTestCase(EventExportTestCaseBase):
         self.task.init_local()
         self.assertItemsEqual([output for output in self.task.mapper(self.EXAMPLE_EVENT) if output is not None], [])
 
+    def test_write_values_in_batches(self):
+        self.task.WRITE_BATCH_SIZE = 10
+        self.task.incr_counter = MagicMock()
+        output_file = StringIO.StringIO()
+        values = ['first\n', 'second\n', 'third\n']
+
+        self.task.write_values(values, output_file)
+
+        self.assertEquals(output_file.getvalue(), 'first\nsecond\nthird\n')
+        self.assertEquals(
+            [call_args[0][2] for call_args in self.task.incr_counter.call_args_list],
+            [len('first\n') + len('second\n') + 2, len('third\n') + 1]
+        )
+
 
 class TestEvent():
     DATE = '2014-05-20'
@@ -637,6 +637,9 @@ class ProblemCheckEvent(
         BaseAnswerDistributionTask):
     """Identifies first and last problem_check events for a user on a problem in a course, given raw event log input."""
 
+    # The values contain the full JSON of the event, which is much larger when encoded using repr().
+    enable_compact_map_output = True
+
     def requires(self):
         return PathSetTask(self.src, self.include, self.manifest)
 
@@ -20,6 +20,7 @@ from edx.analytics.tasks.common.pathutil import (
 )
 from edx.analytics.tasks.util import eventlog, opaque_key_util
 from edx.analytics.tasks.util.decorators import workflow_entry_point
+from edx.analytics.tasks.util.file_util import copy_url
 from edx.analytics.tasks.util.hive import (
     BareHiveTableTask,
     HivePartition,
@@ -39,6 +40,8 @@ ACTIVATED = 'edx.course.enrollment.activated'
 MODE_CHANGED = 'edx.course.enrollment.mode_changed'
 ENROLLED = 1
 UNENROLLED = 0
+# Marks mapper output values that are records read from the enrollment history, rather than events.
+HISTORY_RECORD = 'history'
 
 
 class CourseEnrollmentEventsTask(
@@ -60,6 +63,8 @@ class CourseEnrollmentEventsTask(
 
     counter_category_name = 'Enrollment Events'
 
+    prefilter_event_types = (DEACTIVATED, ACTIVATED, MODE_CHANGED)
+
     def mapper(self, line):
         value = self.get_event_and_date_string(line)
         if value is None:
@@ -205,10 +210,60 @@ class CourseEnrollmentDownstreamMixin(WarehouseMixin, EventLogSelectionDownstrea
             self.interval = luigi.date_interval.Custom(self.interval_start, self.interval_end)
 
 
-class CourseEnrollmentTask(CourseEnrollmentDownstreamMixin, MapReduceJobTask):
-    """Produce a data set that shows which days each user was enrolled in each course."""
+class CourseEnrollmentHistoryMixin(object):
+    """
+    Locates the enrollment history, which is used to compute course enrollments incrementally.
+
+    The history holds a copy of the records produced by CourseEnrollmentTask for each date, once the events for that
+    date are no longer overwritten.  The records for a date describe the state of each enrollment at the end of that
+    day, so they also serve as a snapshot from which the records for later dates can be computed.
+    """
+
+    @property
+    def history_end_date(self):
+        """The last date whose events are extracted for the final time by this run."""
+        return self.interval.date_b - datetime.timedelta(days=self.overwrite_n_days)
+
+    def history_file_name(self, date_string):
+        """Returns the name of the file that holds the records for the given date."""
+        return 'course_enrollment_history_{date}'.format(date=date_string)
+
+    def history_path_for_date(self, date_string):
+        """Returns the URL of the file that holds the records for the given date."""
+        return url_path_join(
+            self.hive_partition_path('course_enrollment_history', date_string),
+            self.history_file_name(date_string),
+        )
+
+    def history_marker_url(self, date_string):
+        """Returns the URL of the file that indicates that the history is complete up to and including the date."""
+        return url_path_join(self.hive_partition_path('course_enrollment_history', date_string), '_SUCCESS')
+
+    def is_history_complete(self, date):
+        """Returns True if the history has been written for every date in the interval up to and including `date`."""
+        return get_target_from_url(self.history_marker_url(date.isoformat())).exists()
+
+
+class CourseEnrollmentTask(CourseEnrollmentHistoryMixin, CourseEnrollmentDownstreamMixin, MapReduceJobTask):
+    """
+    Produce a data set that shows which days each user was enrolled in each course.
+
+    If `incremental` is set and the enrollment history has been written for the day before the events that are
+    overwritten, only those events are read.  The records for the most recent days are computed from the state of each
+    enrollment as of that day, and the records for earlier days are copied from the history.  The output is the same as
+    when computing the records from all of the events in the interval, provided that `interval_start` does not change
+    between runs.
+    """
 
     output_root = luigi.Parameter()
+    incremental = luigi.BooleanParameter(
+        config_path={'section': 'enrollments', 'name': 'incremental'},
+        default=False,
+        significant=False,
+        description='Whether to compute the most recent records from the enrollment history written by '
+        'CourseEnrollmentHistoryTask, instead of from all enrollment events since `interval_start`.  Has no effect '
+        'unless `overwrite_n_days` is positive.',
+    )
 
     enable_direct_output = True
 
@@ -238,11 +293,36 @@ class CourseEnrollmentTask(CourseEnrollmentDownstreamMixin, MapReduceJobTask):
             overwrite=True,
         )
 
+    def resumes_from_history(self):
+        """Returns True if the records are computed from the enrollment history rather than from all events."""
+        if not self.incremental or self.overwrite_n_days <= 0:
+            return False
+
+        history_date = self.overwrite_from_date - datetime.timedelta(days=1)
+        if history_date < self.interval.date_a:
+            return False
+
+        if not self.is_history_complete(history_date):
+            log.warning(
+                'Enrollment history is not available for %s, computing enrollments from all events.', history_date
+            )
+            return False
+
+        return True
+
     def requires_hadoop(self):
         # We want to pass in the historical data as well as the output of CourseEnrollmentEventsTask to the hadoop job.
         # CourseEnrollmentEventsTask returns the marker as output, so we need custom logic to pass the output
         # of CourseEnrollmentEventsTask as actual hadoop input to this job.
 
+        if self.resumes_from_history():
+            # The records for the day before the overwritten events take the place of all of the older events.
+            history_date = self.overwrite_from_date - datetime.timedelta(days=1)
+            return {
+                'history': ExternalURL(self.history_path_for_date(history_date.isoformat())),
+                'downstream_input_tasks': self.requires_local().downstream_input_tasks(),
+            }
+
         path_selection_interval = DateIntervalParameter().parse('{}-{}'.format(
             self.interval.date_a,
             self.overwrite_from_date,
@@ -266,13 +346,21 @@ class CourseEnrollmentTask(CourseEnrollmentDownstreamMixin, MapReduceJobTask):
         return requirements
 
     def mapper(self, line):
+        split_line = line.split('\t')
+        if len(split_line) == 6:
+            # A record from the enrollment history, giving the state of the enrollment before the events.
+            datestamp, course_id, user_id, enrolled_at_end, _change_since_last_day, mode_at_end = split_line
+            self.incr_counter(self.counter_category_name, 'Total History Records Input', 1)
+            yield ((course_id, user_id), (HISTORY_RECORD, datestamp, int(enrolled_at_end), mode_at_end))
+            return
+
         (
             course_id,
             user_id,
             timestamp,
             event_type,
             mode
-        ) = line.split('\t')
+        ) = split_line
         self.incr_counter(self.counter_category_name, 'Total Events Input', 1)
         yield ((course_id, user_id), (timestamp, event_type, mode))
 
@@ -283,7 +371,17 @@ class CourseEnrollmentTask(CourseEnrollmentDownstreamMixin, MapReduceJobTask):
         increment_counter = lambda counter_name: self.incr_counter(self.counter_category_name, counter_name, 1)
         increment_counter("Total Users_Courses")
 
-        event_stream_processor = DaysEnrolledForEvents(course_id, user_id, self.interval, values, increment_counter)
+        events = []
+        last_record = None
+        for value in values:
+            if value[0] == HISTORY_RECORD:
+                last_record = value[1:]
+            else:
+                events.append(value)
+
+        event_stream_processor = DaysEnrolledForEvents(
+            course_id, user_id, self.interval, events, increment_counter, last_record=last_record
+        )
         for day_enrolled_record in event_stream_processor.days_enrolled():
             yield day_enrolled_record
             self.incr_counter(self.counter_category_name, 'Total Days Output', 1)
@@ -299,8 +397,109 @@ class CourseEnrollmentTask(CourseEnrollmentDownstreamMixin, MapReduceJobTask):
         if not self.complete() and output_target.exists():
             output_target.remove()
 
+        resumes_from_history = self.resumes_from_history()
+
         super(CourseEnrollmentTask, self).run()
 
+        if resumes_from_history:
+            self.copy_history_to_output()
+
+    def copy_history_to_output(self):
+        """Copy the records for the dates before the overwritten events from the history into the output."""
+        # The output is not complete until all of the records are in place.
+        success_target = get_target_from_url(url_path_join(self.output_root, '_SUCCESS'))
+        success_target.remove()
+
+        for date in luigi.date_interval.Custom(self.interval.date_a, self.overwrite_from_date):
+            date_string = date.isoformat()
+            copy_url(
+                self.history_path_for_date(date_string),
+                url_path_join(self.output_root, self.history_file_name(date_string))
+            )
+
+        success_target.open('w').close()
+
+
+class CourseEnrollmentHistoryTask(
+        CourseEnrollmentHistoryMixin,
+        CourseEnrollmentDownstreamMixin,
+        MultiOutputMapReduceJobTask):
+    """
+    Copies the records produced by CourseEnrollmentTask into the enrollment history.
+
+    Records are copied for each date whose events will not be overwritten by later runs, which is the first date whose
+    events are overwritten by this run and every date before it.  If the history is complete up to the day before that
+    date, only the records for that date are copied.
+    """
+
+    enrollment_root = luigi.Parameter(
+        description='A URL location of the records produced by CourseEnrollmentTask.',
+    )
+
+    # We use warehouse_path to generate the output path, so we make this a non-param.
+    output_root = None
+
+    counter_category_name = 'Course Enrollment History'
+
+    # The first date whose records are copied, which is determined when the task is run.
+    history_start_date = None
+
+    def requires(self):
+        return CourseEnrollmentTask(
+            mapreduce_engine=self.mapreduce_engine,
+            warehouse_path=self.warehouse_path,
+            n_reduce_tasks=self.n_reduce_tasks,
+            source=self.source,
+            interval=self.interval,
+            pattern=self.pattern,
+            output_root=self.enrollment_root,
+            overwrite_n_days=self.overwrite_n_days,
+        )
+
+    def mapper(self, line):
+        datestamp = line.split('\t', 1)[0]
+        if self.history_start_date.isoformat() <= datestamp <= self.history_end_date.isoformat():
+            yield datestamp, line
+
+    def multi_output_reducer(self, _date_string, values, output_file):
+        self.incr_counter(self.counter_category_name, 'Output Dates', 1)
+        for value in values:
+            output_file.write(value)
+            output_file.write('\n')
+
+    def output_path_for_key(self, key):
+        return self.history_path_for_date(key)
+
+    def run(self):
+        previous_date = self.history_end_date - datetime.timedelta(days=1)
+        if previous_date >= self.interval.date_a and self.is_history_complete(previous_date):
+            self.history_start_date = self.history_end_date
+        else:
+            self.history_start_date = self.interval.date_a
+        history_interval = luigi.date_interval.Custom(
+            self.history_start_date, self.history_end_date + datetime.timedelta(days=1)
+        )
+
+        # Remove the output files before running, in case output is to HDFS.  (On HDFS, files cannot be renamed to an
+        # already-existing file.)
+        marker_target = get_target_from_url(self.history_marker_url(self.history_end_date.isoformat()))
+        if marker_target.exists():
+            marker_target.remove()
+        for date in history_interval:
+            target = get_target_from_url(self.history_path_for_date(date.isoformat()))
+            if target.exists():
+                target.remove()
+
+        super(CourseEnrollmentHistoryTask, self).run()
+
+        # Dates with no records still need a file, since CourseEnrollmentTask copies the file for every date.
+        for date in history_interval:
+            target = get_target_from_url(self.history_path_for_date(date.isoformat()))
+            if not target.exists():
+                target.open('w').close()  # touch the file
+
+        marker_target.open('w').close()
+
 
 class EnrollmentEvent(object):
     """The critical information necessary to process the event in the event stream."""
@@ -366,12 +565,15 @@ class DaysEnrolledForEvents(object):
         interval (luigi.date_interval.DateInterval): The interval of time in which these enrollment events took place.
         events (iterable): The enrollment events as produced by the map tasks. This is expected to be an iterable
             structure whose elements are tuples consisting of a timestamp and an event type.
+        last_record (tuple): The datestamp, enrolled_at_end and mode_at_end of the last record produced for the user in
+            the course before these events, if any. Records are then produced from the day after that record, as if the
+            events that led to it had been processed.
 
     """
 
     MODE_UNKNOWN = 'unknown'
 
-    def __init__(self, course_id, user_id, interval, events, increment_counter=None):
+    def __init__(self, course_id, user_id, interval, events, increment_counter=None, last_record=None):
         self.course_id = course_id
         self.user_id = user_id
         self.interval = interval
@@ -388,6 +590,16 @@ class DaysEnrolledForEvents(object):
         # no events on or after date_b are included in the analyzed data set.
         self.sorted_events.append(EnrollmentEvent(self.interval.date_b.isoformat(), None, None))  # pylint: disable=no-member
 
+        if last_record is not None:
+            # Pick up where the last record left off. A placeholder event on the following day produces records for
+            # each day until the next event, just as the events that led to the last record would have.
+            last_datestamp, enrolled_at_end, mode_at_end = last_record
+            resume_date = self.parse_date_string(last_datestamp) + datetime.timedelta(days=1)
+            self.sorted_events.insert(0, EnrollmentEvent(resume_date.isoformat(), None, mode_at_end))
+            self.state = self.previous_state = enrolled_at_end
+            self.mode = mode_at_end
+            return
+
         self.first_event = self.sorted_events[0]
 
         # track the previous state in order to easily detect state changes between days.
@@ -419,7 +631,9 @@ class DaysEnrolledForEvents(object):
             self.event = self.sorted_events[index]
             self.next_event = self.sorted_events[index + 1]
 
-            self.change_state()
+            # The placeholder event that resumes from the last record does not change the state.
+            if self.event.event_type is not None:
+                self.change_state()
 
             if self.event.datestamp != self.next_event.datestamp:
                 change_since_last_day = self.state - self.previous_state
@@ -515,7 +729,7 @@ class CourseEnrollmentTableTask(CourseEnrollmentDownstreamMixin, HiveTableTask):
         return HivePartition('dt', self.interval.date_b.isoformat())  # pylint: disable=no-member
 
     def requires(self):
-        return CourseEnrollmentTask(
+        enrollment_task = CourseEnrollmentTask(
             mapreduce_engine=self.mapreduce_engine,
             warehouse_path=self.warehouse_path,
             n_reduce_tasks=self.n_reduce_tasks,
@@ -525,6 +739,20 @@ class CourseEnrollmentTableTask(CourseEnrollmentDownstreamMixin, HiveTableTask):
             output_root=self.partition_location,
             overwrite_n_days=self.overwrite_n_days,
         )
+        yield enrollment_task
+
+        if enrollment_task.incremental and self.overwrite_n_days > 0:
+            # Keep the history up to date, so that the next run can compute the enrollments incrementally.
+            yield CourseEnrollmentHistoryTask(
+                mapreduce_engine=self.mapreduce_engine,
+                warehouse_path=self.warehouse_path,
+                n_reduce_tasks=self.n_reduce_tasks,
+                source=self.source,
+                interval=self.interval,
+                pattern=self.pattern,
+                enrollment_root=self.partition_location,
+                overwrite_n_days=self.overwrite_n_days,
+            )
 
 
 class ExternalCourseEnrollmentTableTask(CourseEnrollmentTableTask):
@@ -568,6 +796,10 @@ class CourseEnrollmentSummaryTask(CourseEnrollmentTask):
 
     counter_category_name = 'Enrollment Summary'
 
+    # The summary needs every event in the interval, such as the first enrollment, so it is never computed from the
+    # enrollment history.
+    incremental = False
+
     def reducer(self, key, values):
         """Emit one record per user course enrollment, summarizing their enrollment activity."""
         course_id, user_id = key
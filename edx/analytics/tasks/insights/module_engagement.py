@@ -6,6 +6,7 @@ See ModuleEngagementWorkflowTask for more extensive documentation.
 
 from collections import defaultdict
 import datetime
+import hashlib
 import logging
 import random
 
@@ -31,7 +32,9 @@ from edx.analytics.tasks.util.hive import (
     WarehouseMixin, BareHiveTableTask, HivePartitionTask, hive_database_name
 )
 from edx.analytics.tasks.util.overwrite import OverwriteOutputMixin
-from edx.analytics.tasks.util.record import Record, StringField, IntegerField, DateField, FloatField
+from edx.analytics.tasks.util.record import (
+    Record, StringField, IntegerField, DateField, FloatField, DelimitedStringField
+)
 from edx.analytics.tasks.util.url import get_target_from_url, url_path_join
 
 log = logging.getLogger(__name__)
@@ -144,7 +147,7 @@ class ModuleEngagementDataTask(EventLogSelectionMixin, OverwriteOutputMixin, Map
             return
 
         for action in user_actions:
-            record = ModuleEngagementRecord(
+            record = ModuleEngagementRecord.get_fast_class()(
                 course_id=course_id,
                 username=username,
                 date=DateField().deserialize_from_string(date_string),
@@ -395,6 +398,24 @@ class ModuleEngagementSummaryRecord(Record):
                 yield field_name, getattr(self, field_name)
 
 
+class ModuleEngagementDailySummaryRecord(Record):
+    """
+    A partial summary of a user's engagement with a particular course on a single day.
+
+    The sets of entities are stored explicitly so that the partial summaries of several days can be merged to produce
+    the summary of the whole period.
+    """
+
+    course_id = StringField(description='Course the learner interacted with.')
+    username = StringField(description='Learner\'s username.')
+    date = DateField(description='The learner interacted with the course on this date.')
+    problem_attempts = IntegerField(description='Number of times the learner attempted any problem in the course.')
+    problems_attempted = DelimitedStringField(description='IDs of the problems the learner attempted.')
+    problems_completed = DelimitedStringField(description='IDs of the problems the learner completed correctly.')
+    videos_viewed = DelimitedStringField(description='IDs of the videos the learner watched any part of.')
+    discussion_contributions = IntegerField(description='Number of posts, responses and comments the learner made.')
+
+
 class ModuleEngagementSummaryRecordBuilder(object):
     """Gather the data needed to emit a sparse weekly course engagement record"""
 
@@ -430,6 +451,51 @@ class ModuleEngagementSummaryRecordBuilder(object):
         else:
             log.warn('Unrecognized entity type: %s', record.entity_type)
 
+    def add_daily_summary_record(self, record):
+        """
+        Merges the metrics of a partial summary of a single day into the metrics gathered so far.
+
+        Arguments:
+            record (ModuleEngagementDailySummaryRecord): The partial summary to aggregate.
+        """
+        self.days_active.add(record.date)
+
+        self.problem_attempts += int(record.problem_attempts)
+        self.problems_attempted.update(record.problems_attempted or ())
+        self.problems_completed.update(record.problems_completed or ())
+        self.videos_viewed.update(record.videos_viewed or ())
+        self.discussion_contributions += int(record.discussion_contributions)
+
+    def get_daily_summary_record(self, course_id, username, date):
+        """
+        Given all of the records that have been added for a single day, generate a partial summary that can be merged.
+
+        Arguments:
+            course_id (string):
+            username (string):
+            date (datetime.date):
+
+        Returns:
+            ModuleEngagementDailySummaryRecord: Representing the learner's activity on that day.
+        """
+        return ModuleEngagementDailySummaryRecord.get_fast_class()(
+            course_id,
+            username,
+            date,
+            self.problem_attempts,
+            self._get_sorted_ids(self.problems_attempted),
+            self._get_sorted_ids(self.problems_completed),
+            self._get_sorted_ids(self.videos_viewed),
+            self.discussion_contributions
+        )
+
+    @staticmethod
+    def _get_sorted_ids(entity_ids):
+        """Returns a set of entity IDs as a tuple that can be stored in a partial summary, or None if it is empty."""
+        if not entity_ids:
+            return None
+        return tuple(sorted(entity_ids))
+
     def get_summary_record(self, course_id, username, interval):
         """
         Given all of the records that have been added, generate a summarizing record.
@@ -447,7 +513,7 @@ class ModuleEngagementSummaryRecordBuilder(object):
             len(self.problems_completed)
         )
 
-        return ModuleEngagementSummaryRecord(
+        return ModuleEngagementSummaryRecord.get_fast_class()(
             course_id,
             username,
             interval.date_a,
@@ -489,6 +555,89 @@ class WeekIntervalMixin(object):
         self.interval = date_interval.Custom(start_date, self.date)
 
 
+class ModuleEngagementDailySummaryDataTask(ModuleEngagementDownstreamMixin, OverwriteOutputMixin, MapReduceJobTask):
+    """
+    Store a partial summary of each user's engagement with their courses on a single day.
+
+    The weekly summaries merge the partial summaries of each day in the week, so each day of raw engagement data only
+    needs to be read and aggregated once, instead of once for every week that includes it.
+    """
+
+    output_root = luigi.Parameter()
+
+    def requires(self):
+        partition_task = ModuleEngagementPartitionTask(
+            date=self.date,
+            n_reduce_tasks=self.n_reduce_tasks,
+            warehouse_path=self.warehouse_path,
+            overwrite=self.overwrite,
+        )
+        return partition_task.data_task
+
+    def mapper(self, line):
+        # These records were validated when they were written.
+        record = ModuleEngagementRecord.get_fast_class(validate=False).from_tsv(line)
+        yield ((record.course_id, record.username), line.rstrip('\r\n'))
+
+    def reducer(self, key, lines):
+        """Aggregate all of the interactions of a user with a course on the day."""
+        course_id, username = key
+
+        output_record_builder = ModuleEngagementSummaryRecordBuilder()
+        for record in ModuleEngagementRecord.get_fast_class(validate=False).from_tsv_lines(lines):
+            output_record_builder.add_record(record)
+
+        yield output_record_builder.get_daily_summary_record(course_id, username, self.date).to_string_tuple()
+
+    def output(self):
+        return get_target_from_url(self.output_root)
+
+    def run(self):
+        self.remove_output_on_overwrite()
+        return super(ModuleEngagementDailySummaryDataTask, self).run()
+
+
+class ModuleEngagementDailySummaryTableTask(BareHiveTableTask):
+    """The hive table for the partial summaries of each day of engagement data."""
+
+    @property
+    def partition_by(self):
+        return 'dt'
+
+    @property
+    def table(self):
+        return 'module_engagement_daily_summary'
+
+    @property
+    def columns(self):
+        return ModuleEngagementDailySummaryRecord.get_hive_schema()
+
+
+class ModuleEngagementDailySummaryPartitionTask(ModuleEngagementDownstreamMixin, HivePartitionTask):
+    """The hive partition for the partial summary of a day of engagement data."""
+
+    @property
+    def partition_value(self):
+        """Use a dynamic partition value based on the date parameter."""
+        return self.date.isoformat()  # pylint: disable=no-member
+
+    @property
+    def hive_table_task(self):
+        return ModuleEngagementDailySummaryTableTask(
+            warehouse_path=self.warehouse_path,
+        )
+
+    @property
+    def data_task(self):
+        return ModuleEngagementDailySummaryDataTask(
+            date=self.date,
+            n_reduce_tasks=self.n_reduce_tasks,
+            warehouse_path=self.warehouse_path,
+            output_root=self.partition_location,
+            overwrite=self.overwrite,
+        )
+
+
 class ModuleEngagementSummaryDataTask(WeekIntervalMixin, ModuleEngagementDownstreamMixin, OverwriteOutputMixin,
                                       MapReduceJobTask):
     """
@@ -514,22 +663,30 @@ class ModuleEngagementSummaryDataTask(WeekIntervalMixin, ModuleEngagementDownstr
         )
 
     def requires_hadoop(self):
-        # The hadoop task only wants to read the raw Hive partitions, so only use them as input to the job.
-        return list(self.requires_local().get_raw_data_tasks())
+        # The hadoop task only reads the partial summaries of each day in the week, which are much smaller than the raw
+        # Hive partitions and are only computed once for each day.
+        return [
+            ModuleEngagementDailySummaryPartitionTask(
+                date=date,
+                n_reduce_tasks=self.n_reduce_tasks,
+                warehouse_path=self.warehouse_path,
+                overwrite=(date >= self.overwrite_from_date),
+            ).data_task
+            for date in self.interval  # pylint: disable=not-an-iterable
+        ]
 
     def mapper(self, line):
-        record = ModuleEngagementRecord.from_tsv(line)
+        # These records were validated when they were written.
+        record = ModuleEngagementDailySummaryRecord.get_fast_class(validate=False).from_tsv(line)
         yield ((record.course_id, record.username), line.rstrip('\r\n'))
 
     def reducer(self, key, lines):
-        """Calculate counts for events corresponding to user and course in a given time period."""
+        """Merge the partial summaries of each day for a user and course in a given time period."""
         course_id, username = key
 
         output_record_builder = ModuleEngagementSummaryRecordBuilder()
-        for line in lines:
-            record = ModuleEngagementRecord.from_tsv(line)
-
-            output_record_builder.add_record(record)
+        for record in ModuleEngagementDailySummaryRecord.get_fast_class(validate=False).from_tsv_lines(lines):
+            output_record_builder.add_daily_summary_record(record)
 
         yield output_record_builder.get_summary_record(course_id, username, self.interval).to_string_tuple()
 
@@ -632,7 +789,7 @@ class ModuleEngagementSummaryMetricRangesDataTask(ModuleEngagementDownstreamMixi
         return partition_task.data_task
 
     def mapper(self, line):
-        record = ModuleEngagementSummaryRecord.from_tsv(line)
+        record = ModuleEngagementSummaryRecord.get_fast_class(validate=False).from_tsv(line)
         yield record.course_id, line.rstrip('\n')
 
     def reducer(self, course_id, lines):
@@ -645,8 +802,7 @@ class ModuleEngagementSummaryMetricRangesDataTask(ModuleEngagementDownstreamMixi
 
         unprocessed_metrics = set()
         first_record = None
-        for line in lines:
-            record = ModuleEngagementSummaryRecord.from_tsv(line)
+        for record in ModuleEngagementSummaryRecord.get_fast_class(validate=False).from_tsv_lines(lines):
             if first_record is None:
                 # There is some information we need to copy out of the summary records, so just grab one of them. There
                 # will be at least one, or else the reduce function would have never been called.
@@ -865,14 +1021,14 @@ class ModuleEngagementUserSegmentDataTask(ModuleEngagementDownstreamMixin, Overw
                     self.high_metric_ranges[range_record.course_id][range_record.metric] = range_record
 
     def mapper(self, line):
-        record = ModuleEngagementSummaryRecord.from_tsv(line)
+        record = ModuleEngagementSummaryRecord.get_fast_class(validate=False).from_tsv(line)
         yield (record.course_id, record.username), line.rstrip('\n')
 
     def reducer(self, key, lines):
         """Given a particular user in a particular course, look at their summary and assign appropriate segments."""
         course_id, username = key
 
-        records = [ModuleEngagementSummaryRecord.from_tsv(line) for line in lines]
+        records = list(ModuleEngagementSummaryRecord.get_fast_class(validate=False).from_tsv_lines(lines))
 
         if len(records) > 1:
             raise RuntimeError('There should be exactly one summary record per user per course.')
@@ -1222,6 +1378,68 @@ class ModuleEngagementRosterPartitionTask(WeekIntervalMixin, ModuleEngagementDow
         )
 
 
+ROSTER_DELTA_INDEX = 'index'
+ROSTER_DELTA_DELETE = 'delete'
+
+
+class ModuleEngagementRosterDeltaTask(ModuleEngagementDownstreamMixin, MapReduceJobTask):
+    """
+    Find the roster records that have changed since the previous day.
+
+    Each output record is either "index" followed by a roster record that is new or has changed, or "delete" followed by
+    the course and username of a roster record that no longer exists. Records are compared using a hash of their
+    contents. The analysis window moves forward every day, so the start and end dates are not included in the hash.
+    """
+
+    output_root = luigi.Parameter()
+
+    def requires(self):
+        return self.get_partition_task(self.date)
+
+    def get_partition_task(self, date):
+        """Returns the roster partition for a particular date."""
+        return ModuleEngagementRosterPartitionTask(
+            mapreduce_engine=self.mapreduce_engine,
+            n_reduce_tasks=self.n_reduce_tasks,
+            date=date,
+            overwrite_from_date=self.overwrite_from_date,
+        )
+
+    def input_hadoop(self):
+        # The previous partition was indexed by the previous run, so it isn't required.
+        previous_partition_task = self.get_partition_task(self.date - datetime.timedelta(days=1))
+        return [
+            get_target_from_url(self.requires().partition_location),
+            get_target_from_url(previous_partition_task.partition_location),
+        ]
+
+    def mapper(self, line):
+        fields = line.rstrip('\r\n').split('\t')
+        course_id, username, _start_date, end_date = fields[:4]
+        content_hash = hashlib.md5('\t'.join(fields[:2] + fields[4:])).hexdigest()
+        if end_date == self.date.isoformat():  # pylint: disable=no-member
+            yield (course_id, username), (content_hash, '\t'.join(fields))
+        else:
+            yield (course_id, username), (content_hash, None)
+
+    def reducer(self, key, values):
+        """Compare the current roster record of a learner in a course with their record from the previous day."""
+        current_hash = current_line = previous_hash = None
+        for content_hash, line in values:
+            if line is None:
+                previous_hash = content_hash
+            else:
+                current_hash, current_line = content_hash, line
+
+        if current_line is None:
+            yield (ROSTER_DELTA_DELETE,) + tuple(key)
+        elif current_hash != previous_hash:
+            yield ROSTER_DELTA_INDEX, current_line
+
+    def output(self):
+        return get_target_from_url(self.output_root)
+
+
 class ModuleEngagementRosterIndexDownstreamMixin(object):
     """Indexing parameters that can be specified at the workflow level."""
 
@@ -1255,6 +1473,24 @@ class ModuleEngagementRosterIndexTask(ModuleEngagementDownstreamMixin, ModuleEng
         config_path={'section': 'module-engagement', 'name': 'number_of_shards'},
         description=ElasticsearchIndexTask.number_of_shards.description
     )
+    delta_indexing = luigi.BooleanParameter(
+        config_path={'section': 'module-engagement', 'name': 'delta_indexing'},
+        default=False,
+        significant=False,
+        description='Only index the roster records that have changed since the previous day, and delete the records'
+                    ' that no longer exist, in the live index. This is only done if the roster of the previous day was'
+                    ' indexed successfully with delta indexing enabled, into the index the alias still points at,'
+                    ' otherwise the whole index is rebuilt. The start and end dates of the'
+                    ' analysis window move every day, so they are left out of the indexed documents.'
+    )
+    full_rebuild_interval = luigi.IntParameter(
+        config_path={'section': 'module-engagement', 'name': 'full_rebuild_interval'},
+        default=7,
+        significant=False,
+        description='When delta indexing, rebuild the whole index once every this many days anyway.'
+    )
+
+    update_live_index = None
 
     @property
     def partition_task(self):
@@ -1267,10 +1503,72 @@ class ModuleEngagementRosterIndexTask(ModuleEngagementDownstreamMixin, ModuleEng
             overwrite_from_date=self.overwrite_from_date,
         )
 
+    @property
+    def delta_task(self):
+        """The changes to the roster since the previous day are indexed when updating the live index."""
+        return ModuleEngagementRosterDeltaTask(
+            mapreduce_engine=self.mapreduce_engine,
+            n_reduce_tasks=self.other_reduce_tasks,
+            date=self.date,
+            overwrite_from_date=self.overwrite_from_date,
+            output_root=url_path_join(
+                self.warehouse_path,
+                'module_engagement_roster_delta',
+                'dt=' + self.date.isoformat() + '/'  # pylint: disable=no-member
+            ),
+        )
+
+    def should_update_live_index(self):
+        if self.update_live_index is None:
+            self.update_live_index = self.can_index_delta()
+        return self.update_live_index
+
+    def can_index_delta(self):
+        """Returns True if the live index contains the roster of the previous day, and doesn't need to be rebuilt."""
+        if not self.delta_indexing or self.overwrite:
+            return False
+
+        if self.full_rebuild_interval <= 1 or self.date.toordinal() % self.full_rebuild_interval == 0:
+            log.info('Rebuilding the whole roster index for %s', self.date)
+            return False
+
+        previous_task = self.clone(date=self.date - datetime.timedelta(days=1))
+        marker = previous_task.output().get_marker()
+        if marker is None:
+            log.info('Rebuilding the whole roster index since the roster for %s was not indexed', previous_task.date)
+            return False
+
+        # Documents indexed without delta indexing still contain the analysis window, which would never be updated.
+        if not marker.get('delta_indexing'):
+            log.info(
+                'Rebuilding the whole roster index since the roster for %s was not indexed in delta mode',
+                previous_task.date
+            )
+            return False
+
+        if marker.get('written_index') not in self.get_alias_indexes(self.create_elasticsearch_client()):
+            log.info(
+                'Rebuilding the whole roster index since alias %s no longer points at the index written for %s',
+                self.alias,
+                previous_task.date
+            )
+            return False
+
+        return True
+
+    def marker_fields(self):
+        fields = super(ModuleEngagementRosterIndexTask, self).marker_fields()
+        fields['delta_indexing'] = self.delta_indexing
+        return fields
+
     def requires_local(self):
+        if self.should_update_live_index():
+            return [self.partition_task, self.delta_task]
         return self.partition_task
 
     def input_hadoop(self):
+        if self.should_update_live_index():
+            return self.delta_task.output()
         return get_target_from_url(self.partition_task.partition_location)
 
     @property
@@ -1283,9 +1581,39 @@ class ModuleEngagementRosterIndexTask(ModuleEngagementDownstreamMixin, ModuleEng
         return 'roster_entry'
 
     def document_generator(self, lines):
-        for line in lines:
-            record = ModuleEngagementRosterRecord.from_tsv(line)
+        if not self.should_update_live_index():
+            for document in self.generate_roster_documents(lines):
+                yield document
+            return
 
+        for line in lines:
+            action, record_line = line.rstrip('\r\n').split('\t', 1)
+            if action == ROSTER_DELTA_DELETE:
+                course_id, username = record_line.split('\t')
+                for document_id in self.get_document_ids(course_id, username):
+                    yield {
+                        '_op_type': 'delete',
+                        '_id': document_id,
+                    }
+            else:
+                for document in self.generate_roster_documents([record_line]):
+                    yield document
+
+    def get_document_ids(self, course_id, username):
+        """Generates the IDs of all of the documents that are indexed for a learner in a course."""
+        original_id = '|'.join([course_id, username])
+        yield original_id
+        for i in range(1, self.scale_factor):
+            yield original_id + '|' + str(i)
+
+    def generate_roster_documents(self, lines):
+        """Generates the documents to index for each roster record."""
+        excluded_fields = ('name', 'email')
+        if self.delta_indexing:
+            # Documents are only reindexed when the rest of their contents change, so they would keep a stale window.
+            excluded_fields += ('start_date', 'end_date')
+
+        for record in ModuleEngagementRosterRecord.get_fast_class(validate=False).from_tsv_lines(lines):
             if self.obfuscate:
                 email = '{0}@example.com'.format(record.username)
                 name = ' '.join([x.capitalize() for x in [random.choice(NAMES), random.choice(SURNAMES)]])
@@ -1294,7 +1622,6 @@ class ModuleEngagementRosterIndexTask(ModuleEngagementDownstreamMixin, ModuleEng
                 name = record.name
 
             document = {
-                '_id': '|'.join([record.course_id, record.username]),
                 '_source': {
                     'name': name,
                     'email': email
@@ -1302,7 +1629,7 @@ class ModuleEngagementRosterIndexTask(ModuleEngagementDownstreamMixin, ModuleEng
             }
 
             for maybe_null_field in ModuleEngagementRosterRecord.get_fields():
-                if maybe_null_field in ('name', 'email'):
+                if maybe_null_field in excluded_fields:
                     continue
                 maybe_null_value = getattr(record, maybe_null_field)
                 if maybe_null_value is not None and maybe_null_value != float('inf'):
@@ -1310,11 +1637,10 @@ class ModuleEngagementRosterIndexTask(ModuleEngagementDownstreamMixin, ModuleEng
                         maybe_null_value = maybe_null_value.split(',')
                     document['_source'][maybe_null_field] = maybe_null_value
 
-            original_id = document['_id']
-            for i in range(self.scale_factor):
+            for i, document_id in enumerate(self.get_document_ids(record.course_id, record.username)):
                 if i > 0:
                     document = document.copy()
-                    document['_id'] = original_id + '|' + str(i)
+                document['_id'] = document_id
                 yield document
 
 
@@ -1343,6 +1669,11 @@ class ModuleEngagementWorkflowTask(ModuleEngagementDownstreamMixin, ModuleEngage
 
     For more information about this strategy see `Index Aliases and Zero Downtime`_.
 
+    Alternatively, if `delta_indexing` is enabled in the [module-engagement] section of the configuration, only the
+    records that changed since the previous day are written to the live index, and the whole index is only rebuilt
+    every `full_rebuild_interval` days. Instructors may briefly see a mix of old and new records while it is updated.
+    The records in the index then leave out the start and end dates of the analysis window, which change every day.
+
     We organize the data in a single index that contains the data for all courses. We rely on the default
     elasticsearch sharding strategy instead of manually attempting to shard the data by course (or some other
     dimension). This choice was made largely because it is simpler to implement and manage.
@@ -2,21 +2,29 @@
 
 from datetime import datetime
 import json
+import os
+import shutil
+import tempfile
 from unittest import TestCase
 
 import luigi
+from mock import patch
 
+from edx.analytics.tasks.common.mapreduce import EmulatedMapReduceJobRunner
 from edx.analytics.tasks.common.tests.map_reduce_mixins import MapperTestMixin, ReducerTestMixin
 from edx.analytics.tasks.insights.enrollments import (
     ACTIVATED,
     DEACTIVATED,
+    HISTORY_RECORD,
     MODE_CHANGED,
+    CourseEnrollmentHistoryTask,
     CourseEnrollmentSummaryTask,
     CourseEnrollmentTask,
     CourseEnrollmentEventsTask,
     ImportCourseSummaryEnrollmentsIntoMysql,
 )
 from edx.analytics.tasks.util.tests.opaque_key_mixins import InitializeOpaqueKeysMixin, InitializeLegacyKeysMixin
+from edx.analytics.tasks.util.url import get_target_from_url, url_path_join
 
 
 class CourseEnrollmentTaskMapTest(MapperTestMixin, InitializeOpaqueKeysMixin, TestCase):
@@ -384,6 +392,184 @@ class CourseEnrollmentTaskReducerTest(ReducerTestMixin, TestCase):
         )
         self._check_output_complete_tuple(inputs, expected)
 
+    def assert_resumes_from_history(self, inputs, history_date):
+        """Assert that resuming from the record for `history_date` produces the same records for the later dates."""
+        all_records = self._get_reducer_output(inputs)
+        history_inputs = [
+            (HISTORY_RECORD, datestamp, enrolled_at_end, mode_at_end)
+            for datestamp, _course_id, _user_id, enrolled_at_end, _change, mode_at_end in all_records
+            if datestamp == history_date
+        ]
+        new_inputs = [event for event in inputs if event[0][:10] > history_date]
+        expected = tuple(record for record in all_records if record[0] > history_date)
+        self._check_output_complete_tuple(history_inputs + new_inputs, expected)
+
+    def test_resume_from_history(self):
+        self.create_enrollment_task('2012-12-30-2013-01-09')
+        inputs = [
+            ('2013-01-01T00:00:01', ACTIVATED, 'honor'),
+            ('2013-01-03T00:00:01', MODE_CHANGED, 'verified'),
+            ('2013-01-04T00:00:01', DEACTIVATED, 'verified'),
+            ('2013-01-06T00:00:01', ACTIVATED, 'honor'),
+            ('2013-01-06T00:00:02', DEACTIVATED, 'honor'),
+            ('2013-01-07T00:00:01', ACTIVATED, 'audit'),
+        ]
+        for day in range(1, 8):
+            self.assert_resumes_from_history(inputs, '2013-01-0{}'.format(day))
+
+    def test_resume_from_history_without_events(self):
+        self.create_enrollment_task('2012-12-30-2013-01-04')
+        inputs = [(HISTORY_RECORD, '2013-01-01', 1, 'honor')]
+        expected = (
+            ('2013-01-02', self.course_id, self.user_id, 1, 0, 'honor'),
+            ('2013-01-03', self.course_id, self.user_id, 1, 0, 'honor'),
+        )
+        self._check_output_complete_tuple(inputs, expected)
+
+    def test_map_history_record(self):
+        line = '\t'.join(['2013-01-01', self.course_id, '0', '1', '1', 'honor'])
+        self.assertEquals(
+            tuple(self.task.mapper(line)),
+            (((self.course_id, '0'), (HISTORY_RECORD, '2013-01-01', 1, 'honor')),)
+        )
+
+
+class DirectoryOutputJobRunner(EmulatedMapReduceJobRunner):
+    """Runs a job in process, writing its output into the output directory and marking it complete like hadoop."""
+
+    def run_job(self, job):
+        output_root = job.output().path
+        with patch.object(job, 'output', return_value=get_target_from_url(url_path_join(output_root, 'part-00000'))):
+            super(DirectoryOutputJobRunner, self).run_job(job)
+        get_target_from_url(url_path_join(output_root, '_SUCCESS')).open('w').close()
+
+
+class CourseEnrollmentHistoryTest(TestCase):
+    """
+    Tests that the records computed from the enrollment history match the records computed from all of the events.
+    """
+
+    COURSE_ID = 'foo/bar/baz'
+    EVENTS = [
+        ('1', '2013-01-02T10:00:00', ACTIVATED, 'honor'),
+        ('1', '2013-01-07T10:00:00', MODE_CHANGED, 'verified'),
+        ('2', '2013-01-01T10:00:00', ACTIVATED, 'audit'),
+        ('2', '2013-01-04T10:00:00', DEACTIVATED, 'audit'),
+        ('3', '2013-01-08T10:00:00', ACTIVATED, 'honor'),
+        ('4', '2013-01-03T10:00:00', ACTIVATED, 'honor'),
+        ('4', '2013-01-06T10:00:00', DEACTIVATED, 'honor'),
+        ('4', '2013-01-08T10:00:00', ACTIVATED, 'verified'),
+    ]
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.warehouse_path = os.path.join(self.temp_dir, 'warehouse')
+
+        # Write the output of CourseEnrollmentEventsTask, which has a file for every date.
+        for day in range(1, 9):
+            date_string = '2013-01-0{}'.format(day)
+            events_path = url_path_join(
+                self.warehouse_path,
+                'course_enrollment_events',
+                'dt=' + date_string,
+                'course_enrollment_events_' + date_string
+            )
+            with get_target_from_url(events_path).open('w') as events_file:
+                for user_id, timestamp, event_type, mode in self.EVENTS:
+                    if timestamp.startswith(date_string):
+                        events_file.write('\t'.join([self.COURSE_ID, user_id, timestamp, event_type, mode]) + '\n')
+
+    def run_enrollment_task(self, interval, output_name, incremental=False):
+        """Compute the enrollment records for the interval, returning the task."""
+        task = CourseEnrollmentTask(
+            interval=luigi.DateIntervalParameter().parse(interval),
+            warehouse_path=self.warehouse_path,
+            output_root=os.path.join(self.temp_dir, output_name),
+            overwrite_n_days=2,
+            incremental=incremental,
+        )
+        with patch.object(CourseEnrollmentTask, 'job_runner', return_value=DirectoryOutputJobRunner()):
+            task.run()
+        return task
+
+    def run_history_task(self, interval, enrollment_name):
+        """Copy the enrollment records computed for the interval into the history, returning the task."""
+        task = CourseEnrollmentHistoryTask(
+            interval=luigi.DateIntervalParameter().parse(interval),
+            warehouse_path=self.warehouse_path,
+            enrollment_root=os.path.join(self.temp_dir, enrollment_name),
+            overwrite_n_days=2,
+            marker=os.path.join(self.temp_dir, 'marker'),
+        )
+        with patch.object(CourseEnrollmentHistoryTask, 'job_runner', return_value=EmulatedMapReduceJobRunner()):
+            task.run()
+        return task
+
+    def read_records(self, output_name):
+        """Returns the sorted records in every file of the output, along with the names of those files."""
+        output_root = os.path.join(self.temp_dir, output_name)
+        file_names = sorted(os.listdir(output_root))
+        records = []
+        for file_name in file_names:
+            with open(os.path.join(output_root, file_name), 'r') as output_file:
+                records.extend(line.rstrip('\n').split('\t') for line in output_file)
+        return sorted(records), file_names
+
+    def read_history(self, task, date_string):
+        """Returns the sorted records in the history for the date."""
+        with get_target_from_url(task.history_path_for_date(date_string)).open('r') as history_file:
+            return sorted(line.rstrip('\n').split('\t') for line in history_file)
+
+    def test_resume_from_history(self):
+        self.run_enrollment_task('2013-01-01-2013-01-08', 'previous')
+        self.run_history_task('2013-01-01-2013-01-08', 'previous')
+
+        task = self.run_enrollment_task('2013-01-01-2013-01-09', 'resumed', incremental=True)
+        self.assertTrue(task.resumes_from_history())
+        self.run_enrollment_task('2013-01-01-2013-01-09', 'full')
+
+        resumed_records, resumed_file_names = self.read_records('resumed')
+        full_records, _file_names = self.read_records('full')
+        self.assertEqual(resumed_records, full_records)
+        self.assertIn(['2013-01-08', self.COURSE_ID, '3', '1', '1', 'honor'], full_records)
+        self.assertIn(['2013-01-08', self.COURSE_ID, '4', '1', '1', 'verified'], full_records)
+
+        # The records for the dates before the overwritten events are copied from the history.
+        self.assertEqual(
+            resumed_file_names,
+            ['_SUCCESS'] + ['course_enrollment_history_2013-01-0{}'.format(day) for day in range(1, 7)] + ['part-00000']
+        )
+
+    def test_history_resumes_from_previous_history(self):
+        self.run_enrollment_task('2013-01-01-2013-01-08', 'previous')
+        previous_history_task = self.run_history_task('2013-01-01-2013-01-08', 'previous')
+        self.assertEqual(previous_history_task.history_start_date.isoformat(), '2013-01-01')
+
+        self.run_enrollment_task('2013-01-01-2013-01-09', 'resumed', incremental=True)
+        history_task = self.run_history_task('2013-01-01-2013-01-09', 'resumed')
+        self.assertEqual(history_task.history_start_date.isoformat(), '2013-01-07')
+        self.assertTrue(history_task.is_history_complete(history_task.history_end_date))
+
+        self.run_enrollment_task('2013-01-01-2013-01-09', 'full')
+        full_records, _file_names = self.read_records('full')
+        for day in range(1, 8):
+            date_string = '2013-01-0{}'.format(day)
+            self.assertEqual(
+                self.read_history(history_task, date_string),
+                [record for record in full_records if record[0] == date_string]
+            )
+
+    def test_no_previous_history(self):
+        task = self.run_enrollment_task('2013-01-01-2013-01-09', 'resumed', incremental=True)
+        self.assertFalse(task.resumes_from_history())
+        self.run_enrollment_task('2013-01-01-2013-01-09', 'full')
+
+        resumed_records, resumed_file_names = self.read_records('resumed')
+        full_records, _file_names = self.read_records('full')
+        self.assertEqual(resumed_records, full_records)
+        self.assertEqual(resumed_file_names, ['_SUCCESS', 'part-00000'])
+
 
 class CourseEnrollmentSummaryTaskReducerTest(ReducerTestMixin, TestCase):
     """
@@ -2,18 +2,21 @@
 
 import json
 import datetime
+from collections import defaultdict
 from unittest import TestCase
 
 import luigi
 from luigi import date_interval
 from ddt import ddt, data, unpack
-from mock import MagicMock
+from mock import MagicMock, patch
 
 from edx.analytics.tasks.common.tests.map_reduce_mixins import MapperTestMixin, ReducerTestMixin
 from edx.analytics.tasks.insights.module_engagement import ModuleEngagementDataTask, ModuleEngagementSummaryDataTask, \
     ModuleEngagementRecord, ModuleEngagementSummaryRecord, ModuleEngagementSummaryMetricRangesDataTask, \
+    ModuleEngagementDailySummaryDataTask, ModuleEngagementDailySummaryRecord, \
     ModuleEngagementSummaryMetricRangeRecord, ModuleEngagementUserSegmentDataTask, ModuleEngagementUserSegmentRecord, \
-    ModuleEngagementRosterIndexTask, ModuleEngagementRosterRecord, ModuleEngagementRosterPartitionTask
+    ModuleEngagementRosterIndexTask, ModuleEngagementRosterRecord, ModuleEngagementRosterPartitionTask, \
+    ModuleEngagementRosterDeltaTask
 from edx.analytics.tasks.util.tests.opaque_key_mixins import InitializeOpaqueKeysMixin, InitializeLegacyKeysMixin
 from edx.analytics.tasks.util.tests.target import FakeTarget
 
@@ -208,14 +211,15 @@ class ModuleEngagementSummaryDataTaskMapTest(MapperTestMixin, TestCase):
 
     task_class = ModuleEngagementSummaryDataTask
 
-    input_record = ModuleEngagementRecord(
+    input_record = ModuleEngagementDailySummaryRecord(
         course_id='foo/bar/baz',
         username='foouser',
         date=datetime.date(2015, 11, 1),
-        entity_type='problem',
-        entity_id='problem-id',
-        event='attempted',
-        count=1
+        problem_attempts=1,
+        problems_attempted=('problem-id',),
+        problems_completed=None,
+        videos_viewed=None,
+        discussion_contributions=0
     )
 
     def test_invalid_input_types(self):
@@ -238,6 +242,58 @@ class ModuleEngagementSummaryDataTaskMapTest(MapperTestMixin, TestCase):
         )
 
 
+class ModuleEngagementDailySummaryDataTaskReducerTest(ReducerTestMixin, TestCase):
+    """Test computing the partial summary of a single day of student engagement"""
+
+    task_class = ModuleEngagementDailySummaryDataTask
+    output_record_type = ModuleEngagementDailySummaryRecord
+
+    input_record = ModuleEngagementRecord(
+        course_id='foo/bar/baz',
+        username='test_user',
+        date=datetime.date(2014, 03, 26),
+        entity_type='problem',
+        entity_id='problem-id',
+        event='attempted',
+        count=2
+    )
+
+    def setUp(self):
+        super(ModuleEngagementDailySummaryDataTaskReducerTest, self).setUp()
+
+        self.reduce_key = (self.COURSE_ID, 'test_user')
+
+    def test_output_format(self):
+        self._check_output_complete_tuple(
+            [
+                self.input_record.to_separated_values(),
+                self.input_record.replace(entity_id='a-problem-id', count=1).to_separated_values(),
+                self.input_record.replace(event='completed', count=1).to_separated_values(),
+                self.input_record.replace(entity_type='discussion', entity_id='forum0', event='contributed')
+                .to_separated_values(),
+            ],
+            (
+                (
+                    'foo/bar/baz',
+                    'test_user',
+                    '2014-04-01',
+                    '3',
+                    'a-problem-id\0problem-id',
+                    'problem-id',
+                    '\\N',
+                    '2',
+                ),
+            )
+        )
+
+    def test_round_trip(self):
+        output = self._get_reducer_output([self.input_record.to_separated_values()])
+        record = ModuleEngagementDailySummaryRecord.from_tsv('\t'.join(output[0]))
+        self.assertEquals(record.problems_attempted, ('problem-id',))
+        self.assertIsNone(record.problems_completed)
+        self.assertIsNone(record.videos_viewed)
+
+
 @ddt
 class ModuleEngagementSummaryDataTaskReducerTest(ReducerTestMixin, TestCase):
     """Base class for test analysis of student engagement summaries"""
@@ -271,6 +327,21 @@ class ModuleEngagementSummaryDataTaskReducerTest(ReducerTestMixin, TestCase):
             event='contributed'
         )
 
+    def _get_reducer_output(self, inputs):
+        """Summarize the raw engagement records of each day, and then merge the partial summaries of each day."""
+        lines_by_date = defaultdict(list)
+        for line in inputs:
+            record = ModuleEngagementRecord.from_tsv(line)
+            lines_by_date[record.date].append(line)
+
+        daily_summary_lines = []
+        for date, lines in sorted(lines_by_date.iteritems()):
+            daily_task = ModuleEngagementDailySummaryDataTask(date=date, output_root='/fake/output')
+            for output_tuple in daily_task.reducer(self.reduce_key, lines):
+                daily_summary_lines.append('\t'.join(output_tuple))
+
+        return super(ModuleEngagementSummaryDataTaskReducerTest, self)._get_reducer_output(daily_summary_lines)
+
     def test_output_format(self):
         self._check_output_complete_tuple(
             [self.input_record.to_separated_values()],
@@ -1018,6 +1089,172 @@ class ModuleEngagementRosterIndexTaskTest(ReducerTestMixin, TestCase):
         self.assertEqual(documents[0]['_id'], 'foo/bar/baz|test_user')
         self.assertEqual(documents[1]['_id'], 'foo/bar/baz|test_user|1')
 
+    def test_delta_documents(self):
+        self.create_task(scale_factor=2)
+        record = self.create_roster_record()
+        expected_documents = self.get_documents(record)
+
+        self.task.update_live_index = True
+        documents = list(self.task.document_generator([
+            'index\t' + record.to_separated_values() + '\n',
+            'delete\tfoo/bar/baz\tother_user\n',
+        ]))
+        self.assertEqual(documents[:2], expected_documents)
+        self.assertEqual(
+            [document['_id'] for document in documents],
+            ['foo/bar/baz|test_user', 'foo/bar/baz|test_user|1', 'foo/bar/baz|other_user', 'foo/bar/baz|other_user|1']
+        )
+        self.assertEqual(documents[2], {'_op_type': 'delete', '_id': 'foo/bar/baz|other_user'})
+
+    def test_delta_documents_without_window(self):
+        self.create_task(delta_indexing=True)
+        document = self.get_document(self.create_roster_record())
+        self.assertNotIn('start_date', document['_source'])
+        self.assertNotIn('end_date', document['_source'])
+
+    def test_delta_matches_full_rebuild(self):
+        self.create_task(delta_indexing=True)
+        previous_window = {'start_date': datetime.date(2014, 3, 24), 'end_date': datetime.date(2014, 3, 31)}
+        previous_lines = [
+            self.create_roster_record(username=username, **previous_window).to_separated_values() + '\n'
+            for username in ('unchanged', 'changed', 'removed')
+        ]
+        current_lines = [
+            self.create_roster_record(username='unchanged').to_separated_values() + '\n',
+            self.create_roster_record(username='changed', problem_attempts=5).to_separated_values() + '\n',
+            self.create_roster_record(username='new').to_separated_values() + '\n',
+        ]
+
+        index = self.apply_documents({}, previous_lines)
+        full_rebuild = self.apply_documents({}, current_lines)
+
+        delta_task = self.task.delta_task
+        map_output = defaultdict(list)
+        for line in previous_lines + current_lines:
+            for key, value in delta_task.mapper(str(line)):
+                map_output[key].append(value)
+        delta_lines = [
+            '\t'.join(output) + '\n'
+            for key, values in sorted(map_output.iteritems())
+            for output in delta_task.reducer(key, values)
+        ]
+        self.assertEqual(len(delta_lines), 3)
+
+        self.task.update_live_index = True
+        self.assertEqual(self.apply_documents(index, delta_lines), full_rebuild)
+
+    def test_marker_records_delta_mode(self):
+        self.create_task(delta_indexing=True)
+        self.assertEqual(self.task.marker_fields(), {'delta_indexing': True, 'written_index': self.task.index})
+
+    def apply_documents(self, index, lines):
+        """Applies the documents generated for the lines to a dict that stands in for the index, and returns it."""
+        for document in self.task.document_generator(lines):
+            if document.get('_op_type') == 'delete':
+                del index[document['_id']]
+            else:
+                index[document['_id']] = document['_source']
+        return index
+
+    DELTA_MARKER = {'delta_indexing': True, 'written_index': 'roster_live'}
+
+    @data(
+        ({'delta_indexing': False}, DELTA_MARKER, False),
+        ({'delta_indexing': True}, DELTA_MARKER, True),
+        ({'delta_indexing': True}, None, False),
+        ({'delta_indexing': True}, {'written_index': 'roster_live'}, False),
+        ({'delta_indexing': True}, {'delta_indexing': False, 'written_index': 'roster_live'}, False),
+        ({'delta_indexing': True}, {'delta_indexing': True, 'written_index': 'roster_other'}, False),
+        ({'delta_indexing': True, 'overwrite': True}, DELTA_MARKER, False),
+        ({'delta_indexing': True, 'full_rebuild_interval': 2}, DELTA_MARKER, False),
+        ({'delta_indexing': True, 'full_rebuild_interval': 0}, DELTA_MARKER, False),
+    )
+    @unpack
+    def test_update_live_index(self, kwargs, previous_marker, expected):
+        self.create_task(**kwargs)
+        with patch.object(ModuleEngagementRosterIndexTask, 'output') as mock_output, \
+                patch.object(ModuleEngagementRosterIndexTask, 'create_elasticsearch_client') as mock_client:
+            mock_output.return_value.get_marker.return_value = previous_marker
+            mock_client.return_value.indices.get_aliases.return_value = {
+                'roster_live': {'aliases': {'roster': {}}}
+            }
+            self.assertEqual(self.task.should_update_live_index(), expected)
+
+        if expected:
+            self.assertEqual(self.task.requires_local(), [self.task.partition_task, self.task.delta_task])
+            self.assertEqual(
+                self.task.input_hadoop().path,
+                's3://fake/warehouse/module_engagement_roster_delta/dt=2014-04-01'
+            )
+        else:
+            self.assertEqual(self.task.requires_local(), self.task.partition_task)
+
+
+class ModuleEngagementRosterDeltaTaskTest(ReducerTestMixin, TestCase):
+    """Test finding the roster records that changed since the previous day."""
+
+    task_class = ModuleEngagementRosterDeltaTask
+
+    def setUp(self):
+        super(ModuleEngagementRosterDeltaTaskTest, self).setUp()
+
+        self.reduce_key = (self.COURSE_ID, self.USERNAME)
+
+    def get_map_output(self, end_date, **kwargs):
+        """Map a roster record that ends on `end_date`, returning the key and value."""
+        field_values = {field_name: None for field_name in ModuleEngagementRosterRecord.get_fields()}
+        field_values.update({
+            'course_id': self.COURSE_ID,
+            'username': self.USERNAME,
+            'start_date': end_date - datetime.timedelta(weeks=1),
+            'end_date': end_date,
+            'problem_attempts': 4,
+        })
+        field_values.update(kwargs)
+        line = ModuleEngagementRosterRecord(**field_values).to_separated_values() + '\n'
+        return list(self.task.mapper(str(line)))[0]
+
+    def get_current_map_output(self, **kwargs):
+        """Map a roster record of the day being indexed."""
+        return self.get_map_output(datetime.date(2014, 4, 1), **kwargs)
+
+    def get_previous_map_output(self, **kwargs):
+        """Map a roster record of the previous day."""
+        return self.get_map_output(datetime.date(2014, 3, 31), **kwargs)
+
+    def test_map(self):
+        key, (current_hash, line) = self.get_current_map_output()
+        self.assertEqual(key, self.reduce_key)
+        self.assertEqual(line.split('\t')[:5], [self.COURSE_ID, self.USERNAME, '2014-03-25', '2014-04-01', '\\N'])
+
+        previous_key, (previous_hash, previous_line) = self.get_previous_map_output()
+        self.assertEqual(previous_key, self.reduce_key)
+        self.assertIsNone(previous_line)
+        self.assertEqual(previous_hash, current_hash)
+
+        _key, (changed_hash, _line) = self.get_previous_map_output(problem_attempts=5)
+        self.assertNotEqual(changed_hash, current_hash)
+
+    def test_unchanged(self):
+        self.assert_no_output([self.get_previous_map_output()[1], self.get_current_map_output()[1]])
+
+    def test_changed(self):
+        _key, (_hash, line) = self.get_current_map_output()
+        self._check_output_complete_tuple(
+            [self.get_previous_map_output(problem_attempts=5)[1], self.get_current_map_output()[1]],
+            (('index', line),)
+        )
+
+    def test_new(self):
+        _key, (_hash, line) = self.get_current_map_output()
+        self._check_output_complete_tuple([self.get_current_map_output()[1]], (('index', line),))
+
+    def test_removed(self):
+        self._check_output_complete_tuple(
+            [self.get_previous_map_output()[1]],
+            (('delete', self.COURSE_ID, self.USERNAME),)
+        )
+
 
 class ModuleEngagementRosterPartitionTaskTest(ReducerTestMixin, TestCase):
     """Test the logic that maps end dates to complete weeks."""
@@ -1,16 +1,27 @@
 """Test student engagement metrics"""
 
+import BaseHTTPServer
 import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import urlparse
 from unittest import TestCase
 
+import luigi
+
+import httpretty
 from ddt import ddt, data, unpack
 from mock import patch, MagicMock, sentinel
 
 from edx.analytics.tasks.insights.video import (
     VIDEO_CODES, VIDEO_UNKNOWN_DURATION, VIDEO_VIEWING_SECONDS_PER_SEGMENT, UserVideoViewingTask, VideoUsageTask, 
-    VideoSegmentDetailRecord,
+    VideoSegmentDetailRecord, VideoDurationStoreTask, fetch_youtube_durations,
 )
 from edx.analytics.tasks.common.tests.map_reduce_mixins import MapperTestMixin, ReducerTestMixin
+from edx.analytics.tasks.util.tests.config import with_luigi_config
 from edx.analytics.tasks.util.tests.opaque_key_mixins import InitializeOpaqueKeysMixin, InitializeLegacyKeysMixin
 
 
@@ -712,6 +723,195 @@ class UserVideoViewingTaskReducerTest(ReducerTestMixin, TestCase):
             ViewingColumns.REASON: 'pause_video'
         })
 
+    def test_duration_from_store(self):
+        store_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, store_dir)
+        store_task = VideoDurationStoreTask(interval=self.task.interval, duration_store=store_dir)
+        with store_task.output().open('w') as store_file:
+            store_file.write('9bZkp7q19f0\t62\n')
+        self.create_task(video_duration_store=store_dir)
+        self.task.api_key = 'foobar'
+
+        inputs = [
+            ('2013-12-17T00:00:00.00000Z', 'play_video', 0, None, '9bZkp7q19f0'),
+            ('2013-12-17T00:00:03.00000Z', 'pause_video', 3, None, None),
+        ]
+        self._check_output_by_key(inputs, {
+            ViewingColumns.VIDEO_DURATION: 62,
+        })
+        self.assertFalse(self.mock_urllib.urlopen.called)
+
+    def test_unknown_duration_from_store(self):
+        store_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, store_dir)
+        store_task = VideoDurationStoreTask(interval=self.task.interval, duration_store=store_dir)
+        with store_task.output().open('w') as store_file:
+            store_file.write('9bZkp7q19f0\t-1\t2013-12-17\n')
+        self.create_task(video_duration_store=store_dir)
+        self.task.api_key = 'foobar'
+
+        inputs = [
+            ('2013-12-17T00:00:00.00000Z', 'play_video', 0, None, '9bZkp7q19f0'),
+            ('2013-12-17T00:00:03.00000Z', 'pause_video', 3, None, None),
+        ]
+        self._check_output_by_key(inputs, {
+            ViewingColumns.VIDEO_DURATION: VIDEO_UNKNOWN_DURATION,
+        })
+        self.assertFalse(self.mock_urllib.urlopen.called)
+
+
+class FakeYoutubeApiHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Responds to requests for video durations like the YouTube API does."""
+
+    durations = {'a': 'PT1M2S', 'b': 'PT4S', 'c': 'foobar'}
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Return the durations of the requested videos that are known, or an error if "error" is requested."""
+        query = urlparse.parse_qs(urlparse.urlparse(self.path).query)
+        self.server.requested_ids.append(query['id'][0].split(','))
+        if 'error' in query['id'][0].split(','):
+            self.send_response(403)
+            self.end_headers()
+            self.wfile.write(json.dumps({'error': {'code': 403, 'message': 'Quota exceeded'}}))
+            return
+        items = [
+            {'id': youtube_id, 'contentDetails': {'duration': self.durations[youtube_id]}}
+            for youtube_id in query['id'][0].split(',')
+            if youtube_id in self.durations
+        ]
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(json.dumps({'items': items}))
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+class FetchYoutubeDurationsTest(TestCase):
+    """Test requesting video durations from a local stand-in for the YouTube API."""
+
+    def setUp(self):
+        # Some tests leave httpretty intercepting connections, which would keep requests from reaching the server.
+        if httpretty.is_enabled():
+            httpretty.disable()
+            self.addCleanup(httpretty.enable)
+
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), FakeYoutubeApiHandler)
+        self.server.requested_ids = []
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.api_url = 'http://127.0.0.1:{0}/youtube/v3/videos'.format(self.server.server_port)
+
+    @patch('edx.analytics.tasks.insights.video.YOUTUBE_API_MAX_IDS_PER_REQUEST', 2)
+    def test_batched_requests(self):
+        durations, failed_ids = fetch_youtube_durations(['a', 'b', 'c', 'missing'], 'foobar', api_url=self.api_url)
+        self.assertEquals(durations, {'a': 62, 'b': 4})
+        self.assertEquals(failed_ids, set())
+        self.assertEquals(self.server.requested_ids, [['a', 'b'], ['c', 'missing']])
+
+    @patch('edx.analytics.tasks.insights.video.YOUTUBE_API_MAX_IDS_PER_REQUEST', 2)
+    def test_failed_batch(self):
+        durations, failed_ids = fetch_youtube_durations(['a', 'error', 'b', 'missing'], 'foobar', api_url=self.api_url)
+        self.assertEquals(durations, {'b': 4})
+        self.assertEquals(failed_ids, set(['a', 'error']))
+
+    def test_no_ids(self):
+        self.assertEquals(fetch_youtube_durations([], 'foobar', api_url=self.api_url), ({}, set()))
+        self.assertEquals(self.server.requested_ids, [])
+
+
+class VideoDurationStoreTaskTest(TestCase):
+    """Test refreshing the stored video durations."""
+
+    def setUp(self):
+        self.store_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.store_dir)
+        self.task = VideoDurationStoreTask(
+            interval=luigi.DateIntervalParameter().parse('2016-01-01-2016-01-05'),
+            duration_store=self.store_dir,
+        )
+
+    def write_file(self, path, content):
+        """Create a file in the store."""
+        path = os.path.join(self.store_dir, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as output_file:
+            output_file.write(content)
+
+    def test_search_all_events_without_snapshot(self):
+        self.assertEquals(self.task.requires().interval, self.task.interval)
+
+    def test_search_events_since_snapshot(self):
+        self.write_file('video_durations_2016-01-02.tsv', '')
+        self.write_file('video_durations_2016-01-03.tsv', '')
+        self.write_file('video_durations_2016-01-05.tsv', '')
+        self.assertEquals(self.task.requires().interval.date_a.isoformat(), '2016-01-03')
+
+    def read_snapshot(self):
+        """Returns the contents of the snapshot written by the task."""
+        with self.task.output().open('r') as snapshot_file:
+            return snapshot_file.read()
+
+    @with_luigi_config('google', 'api_key', 'foobar')
+    @patch('edx.analytics.tasks.insights.video.fetch_youtube_durations')
+    def test_refresh_new_videos(self, mock_fetch_youtube_durations):
+        mock_fetch_youtube_durations.return_value = ({'c': 30}, set())
+        self.write_file('video_durations_2016-01-03.tsv', 'a\t10\nb\t20\n')
+        self.write_file('youtube_ids/2016-01-05/part-00000', 'b\nc\nd\n')
+        self.write_file('youtube_ids/2016-01-05/_SUCCESS', '')
+
+        self.task.run()
+
+        mock_fetch_youtube_durations.assert_called_once_with(['c', 'd'], 'foobar')
+        self.assertEquals(self.read_snapshot(), 'a\t10\nb\t20\nc\t30\nd\t-1\t2016-01-05\n')
+
+    @with_luigi_config('google', 'api_key', 'foobar')
+    @patch('edx.analytics.tasks.insights.video.fetch_youtube_durations')
+    def test_retry_unknown_durations(self, mock_fetch_youtube_durations):
+        mock_fetch_youtube_durations.return_value = ({'b': 20}, set())
+        self.write_file(
+            'video_durations_2016-01-03.tsv',
+            'a\t10\nb\t-1\t2015-12-29\nc\t-1\t2015-12-28\nd\t-1\t2015-12-30\n'
+        )
+        self.write_file('youtube_ids/2016-01-05/part-00000', 'a\nd\n')
+        self.write_file('youtube_ids/2016-01-05/_SUCCESS', '')
+
+        self.task.run()
+
+        mock_fetch_youtube_durations.assert_called_once_with(['b', 'c'], 'foobar')
+        self.assertEquals(
+            self.read_snapshot(),
+            'a\t10\nb\t20\nc\t-1\t2016-01-05\nd\t-1\t2015-12-30\n'
+        )
+
+    @with_luigi_config('google', 'api_key', 'foobar')
+    @patch('edx.analytics.tasks.insights.video.fetch_youtube_durations')
+    def test_failed_requests_retried_next_run(self, mock_fetch_youtube_durations):
+        mock_fetch_youtube_durations.return_value = ({'c': 30}, set(['b', 'd']))
+        self.write_file('video_durations_2016-01-03.tsv', 'a\t10\nb\t-1\t2015-12-01\n')
+        self.write_file('youtube_ids/2016-01-05/part-00000', 'c\nd\ne\n')
+        self.write_file('youtube_ids/2016-01-05/_SUCCESS', '')
+
+        self.task.run()
+
+        mock_fetch_youtube_durations.assert_called_once_with(['b', 'c', 'd', 'e'], 'foobar')
+        self.assertEquals(self.read_snapshot(), 'a\t10\nb\t-1\t2015-12-01\nc\t30\ne\t-1\t2016-01-05\n')
+
+    @patch('edx.analytics.tasks.insights.video.fetch_youtube_durations')
+    def test_refresh_without_api_key(self, mock_fetch_youtube_durations):
+        self.write_file('video_durations_2016-01-03.tsv', 'a\t10\nb\t-1\t2015-12-01\n')
+        self.write_file('youtube_ids/2016-01-05/part-00000', 'a\nc\n')
+        self.write_file('youtube_ids/2016-01-05/_SUCCESS', '')
+
+        self.task.run()
+
+        self.assertFalse(mock_fetch_youtube_durations.called)
+        self.assertEquals(self.read_snapshot(), 'a\t10\nb\t-1\t2015-12-01\n')
+
 
 class VideoUsageTaskMapTest(MapperTestMixin, TestCase):
     """Test video usage mapper"""
@@ -1075,6 +1275,61 @@ class VideoUsageTaskReducerTest(ReducerTestMixin, TestCase):
             },
         ])
 
+    def get_output_by_segment_sets(self, viewings):
+        """Returns the records the reducer produced when it tracked the set of users for each segment."""
+        video_duration = 0
+        usage_map = {}
+        for username, start_offset, end_offset, duration in viewings:
+            duration = float(duration)
+            if video_duration == VIDEO_UNKNOWN_DURATION:
+                pass
+            elif duration == VIDEO_UNKNOWN_DURATION:
+                video_duration = VIDEO_UNKNOWN_DURATION
+            elif duration > video_duration:
+                video_duration = duration
+            first_segment = self.task.snap_to_last_segment_boundary(float(start_offset))
+            last_segment = self.task.snap_to_last_segment_boundary(float(end_offset))
+            for segment in xrange(first_segment, last_segment + 1):
+                stats = usage_map.setdefault(segment, {'users': set(), 'views': 0})
+                stats['users'].add(username)
+                stats['views'] += 1
+
+        users_per_segment = {segment: len(stats['users']) for segment, stats in usage_map.iteritems()}
+        if video_duration == VIDEO_UNKNOWN_DURATION:
+            final_segment = self.task.get_final_segment(users_per_segment)
+            video_duration = ((final_segment + 1) * VIDEO_VIEWING_SECONDS_PER_SEGMENT) - 1
+        else:
+            final_segment = self.task.snap_to_last_segment_boundary(float(video_duration))
+
+        records = []
+        for segment in sorted(usage_map.keys()):
+            records.append(VideoSegmentDetailRecord(
+                pipeline_video_id='{0}|{1}'.format(self.COURSE_ID, self.VIDEO_MODULE_ID),
+                course_id=self.COURSE_ID,
+                encoded_module_id=self.VIDEO_MODULE_ID,
+                duration=int(video_duration),
+                segment_length=VIDEO_VIEWING_SECONDS_PER_SEGMENT,
+                users_at_start=users_per_segment.get(0, 0),
+                users_at_end=users_per_segment.get(self.task.complete_end_segment(video_duration), 0),
+                segment=segment,
+                num_users=users_per_segment[segment],
+                num_views=usage_map[segment]['views'],
+            ).to_string_tuple())
+            if segment == final_segment:
+                break
+        return tuple(records)
+
+    @data('600', '-1')
+    def test_same_as_segment_sets(self, duration):
+        generator = random.Random(0)
+        viewings = []
+        for _ in range(500):
+            start_offset = generator.uniform(0, 590)
+            end_offset = min(start_offset + generator.expovariate(1 / 60.0), 600)
+            viewings.append(('user{}'.format(generator.randint(0, 50)), str(start_offset), str(end_offset), duration))
+
+        self.assertEquals(self._get_reducer_output(viewings), self.get_output_by_segment_sets(viewings))
+
 
 @ddt
 class GetFinalSegmentTest(TestCase):
@@ -1084,15 +1339,12 @@ class GetFinalSegmentTest(TestCase):
         self.task = VideoUsageTask(interval=sentinel.ignored, output_root=sentinel.ignored)
         self.usage_map = self.generate_usage_map(20)
 
-    def generate_segment(self, num_users, num_views):
+    def generate_segment(self, num_users, _num_views):
         """Constructs an entry for a video segment."""
-        return {
-            'users': ['user{}'.format(i) for i in range(num_users)],
-            'views': num_views
-        }
+        return num_users
 
     def generate_usage_map(self, num_segments):
-        """Constructs a default usage_map, with constant users and views."""
+        """Constructs a default usage_map, with constant users."""
         usage_map = {}
         for i in range(num_segments):
             usage_map[i] = self.generate_segment(20, 20)
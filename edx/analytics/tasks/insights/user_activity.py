@@ -41,6 +41,9 @@ class UserActivityTask(EventLogSelectionMixin, MapReduceJobTask):
         description='String path to store the output in.',
     )
 
+    # Every event is counted, so combine the counts before they are shuffled to the reducers.
+    enable_map_side_aggregation = True
+
     def mapper(self, line):
         value = self.get_event_and_date_string(line)
         if value is None:
@@ -1,16 +1,23 @@
 """Tasks for aggregating statistics about video viewing."""
 from collections import namedtuple
+import datetime
 import json
 import logging
 import math
+import os
 import re
 import textwrap
 import urllib
 
 import ciso8601
 import luigi
+import luigi.hdfs
 from luigi import configuration
 from luigi.hive import HiveQueryTask
+try:
+    import numpy
+except ImportError:
+    numpy = None  # pylint: disable=invalid-name
 
 from edx.analytics.tasks.common.mapreduce import MapReduceJobTask, MapReduceJobTaskMixin
 from edx.analytics.tasks.common.mysql_load import MysqlInsertTask
@@ -48,6 +55,10 @@ VIDEO_UNKNOWN_DURATION = -1
 VIDEO_VIEWING_SECONDS_PER_SEGMENT = 5
 VIDEO_VIEWING_MINIMUM_LENGTH = 0.25  # seconds
 
+YOUTUBE_API_URL = 'https://www.googleapis.com/youtube/v3/videos'
+# The YouTube API returns at most this many videos for each request.
+YOUTUBE_API_MAX_IDS_PER_REQUEST = 50
+
 VideoViewing = namedtuple('VideoViewing', [   # pylint: disable=invalid-name
     'start_timestamp', 'course_id', 'encoded_module_id', 'start_offset', 'video_duration'])
 
@@ -135,10 +146,280 @@ class VideoSegmentDetailRecord(Record):
                                          'who was watching it.')
 
 
+def get_youtube_id(event_type, event_data):
+    """Returns the YouTube id of the video played by a video event, or None if it was not a YouTube video."""
+    if event_type == VIDEO_PLAYED:
+        code = event_data.get('code')
+        if code not in VIDEO_CODES:
+            return code
+    return None
+
+
+def parse_youtube_duration(duration_str):
+    """Returns the number of seconds in an ISO 8601 duration returned by the YouTube API, or None if it is invalid."""
+    matcher = re.match(r'PT(?:(?P<hours>\d+)H)?(?:(?P<minutes>\d+)M)?(?:(?P<seconds>\d+)S)?', duration_str)
+    if not matcher:
+        return None
+    duration_secs = int(matcher.group('hours') or 0) * 3600
+    duration_secs += int(matcher.group('minutes') or 0) * 60
+    duration_secs += int(matcher.group('seconds') or 0)
+    return duration_secs
+
+
+def fetch_youtube_durations(youtube_ids, api_key, api_url=YOUTUBE_API_URL):
+    """
+    Queries the YouTube API for the durations of videos, requesting as many videos at a time as the API allows.
+
+    Returns a tuple of a dict mapping YouTube ids to durations in seconds, and the set of YouTube ids that were not
+    answered because a request failed.  Videos that are missing from a successful response, or whose duration cannot be
+    parsed, are in neither.
+    """
+    durations = {}
+    failed_ids = set()
+    youtube_ids = list(youtube_ids)
+    for batch_start in range(0, len(youtube_ids), YOUTUBE_API_MAX_IDS_PER_REQUEST):
+        batch = youtube_ids[batch_start:batch_start + YOUTUBE_API_MAX_IDS_PER_REQUEST]
+        video_file = None
+        try:
+            video_url = "{0}?id={1}&part=contentDetails&key={2}".format(api_url, ','.join(batch), api_key)
+            video_file = urllib.urlopen(video_url)
+            if video_file.code != 200:
+                raise IOError('YouTube API responded with status {0}'.format(video_file.code))
+            content = json.load(video_file)
+            if 'items' not in content:
+                raise ValueError('YouTube API response has no items')
+            items = content['items']
+            if len(items) == 0:
+                log.error('Unable to find items in response to duration request for youtube videos: %s', batch)
+            for item in items:
+                youtube_id = item.get('id')
+                duration_str = item.get(
+                    'contentDetails', {'duration': 'MISSING_CONTENTDETAILS'}
+                ).get('duration', 'MISSING_DURATION')
+                duration = parse_youtube_duration(duration_str)
+                if duration is None:
+                    log.error('Unable to parse duration returned for video %s: %s', youtube_id, duration_str)
+                else:
+                    durations[youtube_id] = duration
+        except Exception:  # pylint: disable=broad-except
+            log.exception("Unrecognized response from Youtube API")
+            failed_ids.update(youtube_id for youtube_id in batch if youtube_id not in durations)
+        finally:
+            if video_file is not None:
+                video_file.close()
+
+    return durations, failed_ids
+
+
+class YoutubeVideoIdsTask(EventLogSelectionMixin, MapReduceJobTask):
+    """Finds the ids of the YouTube videos that were played during the interval."""
+
+    output_root = luigi.Parameter()
+
+    prefilter_event_types = (VIDEO_PLAYED,)
+
+    def mapper(self, line):
+        value = self.get_event_and_date_string(line)
+        if value is None:
+            return
+        event, _date_string = value
+
+        event_data = eventlog.get_event_data(event)
+        if event_data is None:
+            return
+
+        youtube_id = get_youtube_id(event.get('event_type'), event_data)
+        if youtube_id:
+            yield youtube_id.encode('utf8'), 1
+
+    def combiner(self, youtube_id, _values):
+        yield youtube_id, 1
+
+    def reducer(self, youtube_id, _values):
+        yield (youtube_id,)
+
+    def output(self):
+        return get_target_from_url(self.output_root)
+
+
+class VideoDurationStoreTask(EventLogSelectionDownstreamMixin, MapReduceJobTaskMixin, luigi.Task):
+    """
+    Stores the durations of the YouTube videos played up to the end of the interval.
+
+    Each run writes a new snapshot of the store, named for the end of the interval.  Only the events since the latest
+    earlier snapshot are searched for videos, and only the durations of videos that are not in that snapshot are
+    requested from the YouTube API.  Videos whose duration cannot be found are stored with an unknown duration and the
+    date of the snapshot in which they were requested, and are requested again once `unknown_duration_retry_days`
+    have passed.  Videos whose request failed are requested again by the next run.  Nothing is requested if no
+    [google] api_key is configured.
+    """
+
+    duration_store = luigi.Parameter(
+        description='A URL location of a directory that holds the snapshots of the video durations.',
+    )
+    unknown_duration_retry_days = luigi.IntParameter(
+        config_path={'section': 'videos', 'name': 'unknown_duration_retry_days'},
+        default=7,
+        significant=False,
+        description='The number of days to wait before requesting the duration of a video again, when it could not '
+        'be found before.',
+    )
+
+    SNAPSHOT_FILENAME_PATTERN = re.compile(r'^video_durations_(?P<date>\d{4}-\d{2}-\d{2})\.tsv$')
+
+    def snapshot_url(self, date):
+        """Returns the URL of the snapshot of the durations of videos played before the given date."""
+        return url_path_join(self.duration_store, 'video_durations_{date}.tsv'.format(date=date.isoformat()))
+
+    def get_previous_snapshot_date(self):
+        """Returns the date of the latest snapshot before the end of the interval, or None if there is none."""
+        store_target = get_target_from_url(self.duration_store)
+        if isinstance(store_target, luigi.LocalTarget):
+            paths = os.listdir(store_target.path) if os.path.isdir(store_target.path) else []
+        elif store_target.exists():
+            paths = luigi.hdfs.listdir(store_target.path)
+        else:
+            paths = []
+
+        snapshot_dates = []
+        for path in paths:
+            match = self.SNAPSHOT_FILENAME_PATTERN.match(os.path.basename(path.rstrip('/')))
+            if match:
+                snapshot_date = ciso8601.parse_datetime(match.group('date')).date()
+                if snapshot_date < self.interval.date_b:  # pylint: disable=no-member
+                    snapshot_dates.append(snapshot_date)
+
+        return max(snapshot_dates) if snapshot_dates else None
+
+    def requires(self):
+        previous_snapshot_date = self.get_previous_snapshot_date()
+        if previous_snapshot_date is None or previous_snapshot_date < self.interval.date_a:  # pylint: disable=no-member
+            search_interval = self.interval
+        else:
+            search_interval = luigi.date_interval.Custom(
+                previous_snapshot_date, self.interval.date_b  # pylint: disable=no-member
+            )
+
+        return YoutubeVideoIdsTask(
+            mapreduce_engine=self.mapreduce_engine,
+            n_reduce_tasks=self.n_reduce_tasks,
+            source=self.source,
+            interval=search_interval,
+            pattern=self.pattern,
+            output_root=url_path_join(
+                self.duration_store, 'youtube_ids', self.interval.date_b.isoformat()  # pylint: disable=no-member
+            ) + '/',
+        )
+
+    def output(self):
+        return get_target_from_url(self.snapshot_url(self.interval.date_b))  # pylint: disable=no-member
+
+    def get_video_ids(self):
+        """Returns the set of YouTube ids found by YoutubeVideoIdsTask."""
+        ids_target = self.input()
+        if isinstance(ids_target, luigi.LocalTarget):
+            part_targets = [
+                luigi.LocalTarget(os.path.join(ids_target.path, filename))
+                for filename in os.listdir(ids_target.path)
+                if not filename.startswith(('_', '.'))
+            ]
+        else:
+            part_targets = [ids_target]
+
+        video_ids = set()
+        for part_target in part_targets:
+            with part_target.open('r') as part_file:
+                for line in part_file:
+                    video_ids.add(line.rstrip('\r\n').split('\t')[0])
+        video_ids.discard('')
+        return video_ids
+
+    def get_retry_video_ids(self, entries):
+        """Returns the set of YouTube ids whose duration could not be found, and is due to be requested again."""
+        snapshot_date = self.interval.date_b  # pylint: disable=no-member
+        retry_date = (snapshot_date - datetime.timedelta(days=self.unknown_duration_retry_days)).isoformat()
+        return set(
+            youtube_id for youtube_id, (duration, attempt_date) in entries.iteritems()
+            if duration == VIDEO_UNKNOWN_DURATION and (attempt_date is None or attempt_date <= retry_date)
+        )
+
+    def run(self):
+        entries = {}
+        previous_snapshot_date = self.get_previous_snapshot_date()
+        if previous_snapshot_date is not None:
+            entries = read_video_duration_entries(get_target_from_url(self.snapshot_url(previous_snapshot_date)))
+
+        new_video_ids = self.get_video_ids() - set(entries)
+        retry_video_ids = self.get_retry_video_ids(entries)
+        api_key = configuration.get_config().get('google', 'api_key', None)
+        if api_key is None:
+            log.warning(
+                'No YouTube API key is configured, so the durations of %d new YouTube videos were not requested',
+                len(new_video_ids)
+            )
+        else:
+            requested_video_ids = sorted(new_video_ids | retry_video_ids)
+            log.info(
+                'Requesting the durations of %d new YouTube videos and retrying %d videos',
+                len(new_video_ids), len(retry_video_ids)
+            )
+            durations, failed_ids = fetch_youtube_durations(requested_video_ids, api_key)
+            attempt_date = self.interval.date_b.isoformat()  # pylint: disable=no-member
+            for youtube_id in requested_video_ids:
+                if youtube_id in durations:
+                    entries[youtube_id] = (durations[youtube_id], None)
+                elif youtube_id not in failed_ids:
+                    entries[youtube_id] = (VIDEO_UNKNOWN_DURATION, attempt_date)
+            if failed_ids:
+                # Their previous entries are kept, if any, so that they are requested again by the next run.
+                log.warning('Unable to request the durations of %d YouTube videos', len(failed_ids))
+
+        with self.output().open('w') as output_file:
+            for youtube_id, (duration, attempt_date) in sorted(entries.iteritems()):
+                fields = [youtube_id, str(duration)]
+                if attempt_date is not None:
+                    fields.append(attempt_date)
+                output_file.write('\t'.join(fields) + '\n')
+
+
+def read_video_duration_entries(target):
+    """
+    Reads a snapshot written by VideoDurationStoreTask.
+
+    Returns a dict mapping YouTube ids to tuples of the duration in seconds and the date on which the duration was last
+    requested.  The date is only recorded for videos whose duration could not be found, and is None otherwise.
+    """
+    entries = {}
+    with target.open('r') as durations_file:
+        for line in durations_file:
+            fields = line.rstrip('\r\n').split('\t')
+            attempt_date = fields[2] if len(fields) > 2 else None
+            entries[fields[0]] = (int(fields[1]), attempt_date)
+    return entries
+
+
+def read_video_durations(target):
+    """
+    Returns a dict mapping YouTube ids to durations in seconds, read from a snapshot written by VideoDurationStoreTask.
+
+    Videos whose duration could not be found have an unknown duration.
+    """
+    return {youtube_id: duration for youtube_id, (duration, _date) in read_video_duration_entries(target).iteritems()}
+
+
 class UserVideoViewingTask(EventLogSelectionMixin, MapReduceJobTask):
     """Validates video-related events and identifies start-stop event pairs."""
 
     output_root = luigi.Parameter()
+    video_duration_store = luigi.Parameter(
+        config_path={'section': 'videos', 'name': 'duration_store'},
+        default=None,
+        significant=False,
+        description='A URL location of a directory where the durations of YouTube videos are stored between runs.  '
+        'If specified, the durations are looked up before the reducers run, and only videos that are missing from the '
+        'store are requested by the reducers.  Videos that the store could not find the duration of are not '
+        'requested again by the reducers.',
+    )
 
     # Cache for storing duration values fetched from Youtube.
     # Persist this across calls to the reducer.
@@ -146,12 +427,31 @@ class UserVideoViewingTask(EventLogSelectionMixin, MapReduceJobTask):
 
     counter_category_name = 'Video Events'
 
+    prefilter_event_types = VIDEO_EVENT_TYPES
+    enable_compact_map_output = True
+
+    def requires_local(self):
+        if self.video_duration_store is None:
+            return []
+
+        return VideoDurationStoreTask(
+            mapreduce_engine=self.mapreduce_engine,
+            n_reduce_tasks=self.n_reduce_tasks,
+            source=self.source,
+            interval=self.interval,
+            pattern=self.pattern,
+            duration_store=self.video_duration_store,
+        )
+
     def init_local(self):
         super(UserVideoViewingTask, self).init_local()
         # Providing an api_key is optional.
         self.api_key = configuration.get_config().get('google', 'api_key', None)
         # Reset this (mostly for the sake of tests).
         self.video_durations = {}
+        if self.video_duration_store is not None:
+            # The durations are sent to the reducers along with the rest of the task.
+            self.video_durations = read_video_durations(self.input_local())
 
     def mapper(self, line):
         # Add a filter here to permit quicker rejection of unrelated events.
@@ -213,11 +513,8 @@ class UserVideoViewingTask(EventLogSelectionMixin, MapReduceJobTask):
 
         current_time = None
         old_time = None
-        youtube_id = None
+        youtube_id = get_youtube_id(event_type, event_data)
         if event_type == VIDEO_PLAYED:
-            code = event_data.get('code')
-            if code not in VIDEO_CODES:
-                youtube_id = code
             current_time = self._check_time_offset(event_data.get('currentTime'), line)
             if current_time is None:
                 ## self.incr_counter(self.counter_category_name, 'Discard Video Missing Something', 1)
@@ -337,7 +634,8 @@ class UserVideoViewingTask(EventLogSelectionMixin, MapReduceJobTask):
                 if youtube_id:
                     # self.incr_counter(self.counter_category_name, 'Viewing Start with Video Id', 1)
                     video_duration = self.video_durations.get(youtube_id)
-                    if not video_duration:
+                    # The store records videos whose duration could not be found, which need not be requested again.
+                    if video_duration is None:
                         video_duration = self.get_video_duration(youtube_id)
                         # Duration might still be unknown, but just store it.
                         self.video_durations[youtube_id] = video_duration
@@ -454,44 +752,12 @@ class UserVideoViewingTask(EventLogSelectionMixin, MapReduceJobTask):
 
         This returns an "unknown" duration flag if no API key has been defined, or if the query fails.
         """
-        duration = VIDEO_UNKNOWN_DURATION
         if self.api_key is None:
-            return duration
+            return VIDEO_UNKNOWN_DURATION
 
         ## self.incr_counter(self.counter_category_name, 'Subset Calls to Youtube API', 1)
-        video_file = None
-        try:
-            video_url = "https://www.googleapis.com/youtube/v3/videos?id={0}&part=contentDetails&key={1}".format(
-                youtube_id, self.api_key
-            )
-            video_file = urllib.urlopen(video_url)
-            content = json.load(video_file)
-            items = content.get('items', [])
-            if len(items) > 0:
-                duration_str = items[0].get(
-                    'contentDetails', {'duration': 'MISSING_CONTENTDETAILS'}
-                ).get('duration', 'MISSING_DURATION')
-                matcher = re.match(r'PT(?:(?P<hours>\d+)H)?(?:(?P<minutes>\d+)M)?(?:(?P<seconds>\d+)S)?', duration_str)
-                if not matcher:
-                    log.error('Unable to parse duration returned for video %s: %s', youtube_id, duration_str)
-                    ## self.incr_counter(self.counter_category_name, 'Quality Unparseable Response From Youtube API', 1)
-                else:
-                    duration_secs = int(matcher.group('hours') or 0) * 3600
-                    duration_secs += int(matcher.group('minutes') or 0) * 60
-                    duration_secs += int(matcher.group('seconds') or 0)
-                    duration = duration_secs
-                    ## self.incr_counter(self.counter_category_name, 'Subset Calls to Youtube API Succeeding', 1)
-            else:
-                log.error('Unable to find items in response to duration request for youtube video: %s', youtube_id)
-                ## self.incr_counter(self.counter_category_name, 'Quality No Items In Response From Youtube API', 1)
-        except Exception:  # pylint: disable=broad-except
-            log.exception("Unrecognized response from Youtube API")
-            ## self.incr_counter(self.counter_category_name, 'Quality Unrecognized Response From Youtube API', 1)
-        finally:
-            if video_file is not None:
-                video_file.close()
-
-        return duration
+        durations, _failed_ids = fetch_youtube_durations([youtube_id], self.api_key)
+        return durations.get(youtube_id, VIDEO_UNKNOWN_DURATION)
 
 
 class VideoTableDownstreamMixin(WarehouseMixin, EventLogSelectionDownstreamMixin, MapReduceJobTaskMixin):
@@ -552,7 +818,7 @@ class VideoUsageTask(VideoTableDownstreamMixin, MapReduceJobTask):
         """
         course_id, encoded_module_id = key
         pipeline_video_id = '{0}|{1}'.format(course_id, encoded_module_id)
-        usage_map = {}
+        segment_ranges_by_user = {}
 
         video_duration = 0
         for viewing in viewings:
@@ -570,25 +836,39 @@ class VideoUsageTask(VideoTableDownstreamMixin, MapReduceJobTask):
 
             first_segment = self.snap_to_last_segment_boundary(float(start_offset))
             last_segment = self.snap_to_last_segment_boundary(float(end_offset))
-            for segment in xrange(first_segment, last_segment + 1):
-                stats = usage_map.setdefault(segment, {})
-                users = stats.setdefault('users', set())
-                users.add(username)
-                stats['views'] = stats.get('views', 0) + 1
+            if first_segment <= last_segment:
+                segment_ranges_by_user.setdefault(username, []).append((first_segment, last_segment))
+
+        if not segment_ranges_by_user:
+            return
+
+        # Each viewing counts once towards the views of every segment it covers.  Each user counts once towards the
+        # users of every segment covered by any of their viewings, so their overlapping viewings are merged first.
+        view_ranges = []
+        user_ranges = []
+        for segment_ranges in segment_ranges_by_user.itervalues():
+            view_ranges.extend(segment_ranges)
+            user_ranges.extend(self.merge_segment_ranges(segment_ranges))
+        num_segments = max(last_segment for _first_segment, last_segment in view_ranges) + 1
+        views_per_segment = self.count_ranges_per_segment(view_ranges, num_segments)
+        users_per_segment = self.count_ranges_per_segment(user_ranges, num_segments)
+        watched_segments = [segment for segment, num_views in enumerate(views_per_segment) if num_views > 0]
 
         # If we don't know the duration of the video, just use the final segment that was
         # actually viewed to determine users_at_end.
         if video_duration == VIDEO_UNKNOWN_DURATION:
-            final_segment = self.get_final_segment(usage_map)
+            final_segment = self.get_final_segment(
+                {segment: users_per_segment[segment] for segment in watched_segments}
+            )
             video_duration = ((final_segment + 1) * VIDEO_VIEWING_SECONDS_PER_SEGMENT) - 1
         else:
             final_segment = self.snap_to_last_segment_boundary(float(video_duration))
 
         # Output stats.
-        users_at_start = len(usage_map.get(0, {}).get('users', []))
-        users_at_end = len(usage_map.get(self.complete_end_segment(video_duration), {}).get('users', []))
-        for segment in sorted(usage_map.keys()):
-            stats = usage_map[segment]
+        users_at_start = users_per_segment[0]
+        complete_end_segment = self.complete_end_segment(video_duration)
+        users_at_end = users_per_segment[complete_end_segment] if 0 <= complete_end_segment < num_segments else 0
+        for segment in watched_segments:
             yield VideoSegmentDetailRecord(
                 pipeline_video_id=pipeline_video_id,
                 course_id=course_id,
@@ -598,12 +878,40 @@ class VideoUsageTask(VideoTableDownstreamMixin, MapReduceJobTask):
                 users_at_start=users_at_start,
                 users_at_end=users_at_end,
                 segment=segment,
-                num_users=len(stats.get('users', [])),
-                num_views=stats.get('views', 0)
+                num_users=users_per_segment[segment],
+                num_views=views_per_segment[segment]
             ).to_string_tuple()
             if segment == final_segment:
                 break
 
+    @staticmethod
+    def merge_segment_ranges(segment_ranges):
+        """Returns the (first_segment, last_segment) ranges that cover the same segments without overlapping."""
+        merged_ranges = []
+        for first_segment, last_segment in sorted(segment_ranges):
+            if merged_ranges and first_segment <= merged_ranges[-1][1] + 1:
+                if last_segment > merged_ranges[-1][1]:
+                    merged_ranges[-1] = (merged_ranges[-1][0], last_segment)
+            else:
+                merged_ranges.append((first_segment, last_segment))
+        return merged_ranges
+
+    @staticmethod
+    def count_ranges_per_segment(segment_ranges, num_segments):
+        """
+        Returns a list of the number of (first_segment, last_segment) ranges that include each segment.
+
+        Each range increments a running count at its first segment and decrements it after its last segment, so the
+        cost depends on the number of ranges rather than their length.
+        """
+        first_segments = numpy.array([first_segment for first_segment, _last_segment in segment_ranges])
+        end_segments = numpy.array([last_segment + 1 for _first_segment, last_segment in segment_ranges])
+        changes = (
+            numpy.bincount(first_segments, minlength=num_segments + 1) -
+            numpy.bincount(end_segments, minlength=num_segments + 1)
+        )
+        return numpy.cumsum(changes)[:num_segments].tolist()
+
     def complete_end_segment(self, duration):
         """
         Calculates a complete end segment(if the user has watched till this segment,
@@ -613,16 +921,17 @@ class VideoUsageTask(VideoTableDownstreamMixin, MapReduceJobTask):
         complete_end_time = max(duration - 30, duration * 0.95)
         return self.snap_to_last_segment_boundary(complete_end_time)
 
-    def get_final_segment(self, usage_map):
+    def get_final_segment(self, users_per_segment):
         """
         Identifies the final segment by looking for a sharp drop in number of users per segment.
         Needed as some events appear after the actual end of videos.
+
+        `users_per_segment` maps each segment that was watched to the number of users that watched it.
         """
-        final_segment = last_segment = max(usage_map.keys())
-        last_segment_num_users = len(usage_map[last_segment]['users'])
-        for segment in sorted(usage_map.keys(), reverse=True)[1:]:
-            stats = usage_map[segment]
-            current_segment_num_users = len(stats.get('users', []))
+        final_segment = last_segment = max(users_per_segment.keys())
+        last_segment_num_users = users_per_segment[last_segment]
+        for segment in sorted(users_per_segment.keys(), reverse=True)[1:]:
+            current_segment_num_users = users_per_segment[segment]
             if last_segment_num_users <= current_segment_num_users * self.dropoff_threshold:
                 final_segment = segment
                 break
@@ -637,6 +946,9 @@ class VideoUsageTask(VideoTableDownstreamMixin, MapReduceJobTask):
     def output(self):
         return get_target_from_url(self.output_root)
 
+    def extra_modules(self):
+        return [numpy]
+
 
 class VideoUsageTableTask(VideoTableDownstreamMixin, HiveTableTask):
     """Imports data about video usage into a Hive table."""
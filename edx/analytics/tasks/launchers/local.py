@@ -13,21 +13,10 @@ import logging
 import os
 import sys
 
-import boto
-import filechunkio
-import cjson
-import ciso8601
-import opaque_keys
-import bson
-import pyinstrument
-import stevedore
-import requests
-
 import luigi
 import luigi.configuration
-import luigi.hadoop
 
-import edx.analytics.tasks
+from edx.analytics.tasks.launchers.task_modules import load_task_modules
 
 # Tell urllib3 to switch the ssl backend to PyOpenSSL.
 # see https://urllib3.readthedocs.org/en/latest/security.html#pyopenssl
@@ -53,9 +42,8 @@ def main():
     # In order to see errors during extension loading, you can uncomment the next line.
     logging.basicConfig(level=logging.DEBUG)
 
-    # Load tasks configured using entry_points
-    # TODO: launch tasks by their entry_point name
-    stevedore.ExtensionManager('edx.analytics.tasks')
+    # Load the modules that define the requested tasks, as configured using entry_points.
+    load_task_modules(cmdline_args)
 
     # Load the override configuration if it's specified/exists.
     configuration = luigi.configuration.get_config()
@@ -74,28 +62,23 @@ def main():
             else:
                 log.debug('Configuration file \'%s\' does not exist!', additional_config)
 
-
-    # Tell luigi what dependencies to pass to the Hadoop nodes
-    # - edx.analytics.tasks is used to load the pipeline code, since we cannot trust all will be loaded automatically.
-    # - boto is used for all direct interactions with s3.
-    # - cjson is used for all parsing event logs.
-    # - filechunkio is used for multipart uploads of large files to s3.
-    # - opaque_keys is used to interpret serialized course_ids
-    #   - opaque_keys extensions:  ccx_keys
-    #   - dependencies of opaque_keys:  bson, stevedore
-    luigi.hadoop.attach(edx.analytics.tasks)
-    luigi.hadoop.attach(boto, cjson, filechunkio, opaque_keys, bson, stevedore, ciso8601, requests)
-
-    if configuration.getboolean('ccx', 'enabled', default=False):
-        import ccx_keys
-        luigi.hadoop.attach(ccx_keys)
+    # The dependencies to pass to the Hadoop nodes are attached by MapReduceJobRunner when a Hadoop job is run.
 
     # TODO: setup logging for tasks or configured logging mechanism
 
+    # Check whether tasks are complete in batches, rather than one at a time, if requested.
+    worker_scheduler_factory = None
+    if configuration.getboolean('scheduling', 'batch_completeness_checks', False):
+        from edx.analytics.tasks.util.completeness import BatchCompletenessWorkerSchedulerFactory
+        worker_scheduler_factory = BatchCompletenessWorkerSchedulerFactory(
+            num_threads=configuration.getint('scheduling', 'completeness_check_threads', 16)
+        )
+
     # Launch Luigi using the default builder
 
     with profile_if_necessary(os.getenv('WORKFLOW_PROFILER', ''), os.getenv('WORKFLOW_PROFILER_PATH', '')):
-        luigi.run(cmdline_args)
+        with instrument_if_necessary(os.getenv('WORKFLOW_INSTRUMENTATION_PATH', '')):
+            luigi.run(cmdline_args, worker_scheduler_factory=worker_scheduler_factory)
 
 
 def get_cleaned_command_line_args():
@@ -117,6 +100,7 @@ def get_cleaned_command_line_args():
 @contextmanager
 def profile_if_necessary(profiler_name, file_path):
     if profiler_name == 'pyinstrument':
+        import pyinstrument
         profiler = pyinstrument.Profiler(use_signal=False)
         profiler.start()
 
@@ -128,5 +112,18 @@ def profile_if_necessary(profiler_name, file_path):
             profiler.save(filename=os.path.join(file_path, 'launch-task.trace'))
 
 
+@contextmanager
+def instrument_if_necessary(file_path):
+    if file_path:
+        from edx.analytics.tasks.util import instrumentation
+        instrumentation.enable(file_path)
+
+    try:
+        yield
+    finally:
+        if file_path:
+            instrumentation.disable()
+
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,72 @@
+"""
+Import only the task modules needed to run the tasks named on the command line.
+
+Importing every module registered in the edx.analytics.tasks entry point namespace takes far longer than running many
+small tasks, since together they depend on nearly every client library the pipeline uses.
+"""
+
+import importlib
+import logging
+import pkgutil
+import re
+
+import pkg_resources
+
+from edx.analytics.tasks import EXTENSION_NAMESPACE
+
+log = logging.getLogger(__name__)
+
+
+def load_task_modules(cmdline_args):
+    """
+    Import only the task modules that define the tasks named on the command line.
+
+    Each entry point names a module and a task class.  The module of an entry point is imported if its class is named
+    on the command line, or otherwise if the module's source defines a class with one of the names.  Every module is
+    imported if none of them appear to define the requested task, as it may be defined in some module that they import.
+    """
+    names = set(arg for arg in cmdline_args if not arg.startswith('-'))
+    entry_points = list(pkg_resources.iter_entry_points(EXTENSION_NAMESPACE))
+
+    selected = [entry_point for entry_point in entry_points if entry_point.attrs and entry_point.attrs[0] in names]
+    if not selected:
+        class_pattern = get_class_definition_pattern(names)
+        selected = [
+            entry_point for entry_point in entry_points
+            if class_pattern is not None and module_source_matches(entry_point.module_name, class_pattern)
+        ]
+
+    if not selected:
+        log.debug('Unable to find the module that defines %s, loading all task modules.', ' '.join(sorted(names)))
+        import stevedore
+        stevedore.ExtensionManager(EXTENSION_NAMESPACE)
+        return
+
+    for module_name in sorted(set(entry_point.module_name for entry_point in selected)):
+        log.debug('Loading task module %s', module_name)
+        importlib.import_module(module_name)
+
+
+def get_class_definition_pattern(names):
+    """Returns a regular expression that matches the definition of a class with any of the given names."""
+    identifiers = sorted(name for name in names if re.match(r'^[A-Za-z_]\w*$', name))
+    if not identifiers:
+        return None
+    return re.compile(r'^class\s+(?:{0})\s*[(:]'.format('|'.join(identifiers)), re.MULTILINE)
+
+
+def module_source_matches(module_name, pattern):
+    """
+    Returns True if the source of a module, read without importing it, matches the pattern.
+
+    Also returns True if the source is not available, since the module must then be imported to find out.
+    """
+    try:
+        loader = pkgutil.get_loader(module_name)
+        source = loader.get_source(module_name) if loader is not None else None
+    except Exception:  # pylint: disable=broad-except
+        source = None
+
+    if source is None:
+        return True
+    return pattern.search(source) is not None
@@ -0,0 +1,48 @@
+"""Tests of loading only the task modules needed to run a task."""
+
+from unittest import TestCase
+
+import pkg_resources
+from mock import patch
+
+from edx.analytics.tasks.launchers.task_modules import load_task_modules
+
+ENTRY_POINTS = [
+    'engagement = edx.analytics.tasks.insights.module_engagement:ModuleEngagementDataTask',
+    'export-events = edx.analytics.tasks.export.event_exports:EventExportTask',
+    'noop = edx.analytics.tasks.monitor.performance:ParseEventLogPerformanceTask',
+]
+
+
+class LoadTaskModulesTest(TestCase):
+    """Test selecting the modules to import for the task named on the command line."""
+
+    def setUp(self):
+        patcher = patch('edx.analytics.tasks.launchers.task_modules.pkg_resources.iter_entry_points')
+        mock_iter_entry_points = patcher.start()
+        self.addCleanup(patcher.stop)
+        mock_iter_entry_points.side_effect = lambda namespace: [
+            pkg_resources.EntryPoint.parse(definition) for definition in ENTRY_POINTS
+        ]
+
+        patcher = patch('edx.analytics.tasks.launchers.task_modules.importlib.import_module')
+        self.mock_import_module = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_imported_modules(self):
+        """Returns the names of the modules imported."""
+        return [args[0] for args, _kwargs in self.mock_import_module.call_args_list]
+
+    def test_entry_point_task(self):
+        load_task_modules(['--local-scheduler', 'EventExportTask', '--interval', '2016-01-01'])
+        self.assertEquals(self.get_imported_modules(), ['edx.analytics.tasks.export.event_exports'])
+
+    def test_task_defined_in_entry_point_module(self):
+        load_task_modules(['ModuleEngagementWorkflowTask', '--date', '2016-01-01'])
+        self.assertEquals(self.get_imported_modules(), ['edx.analytics.tasks.insights.module_engagement'])
+
+    @patch('stevedore.ExtensionManager')
+    def test_unknown_task(self, mock_extension_manager):
+        load_task_modules(['SomeOtherTask'])
+        self.assertEquals(self.get_imported_modules(), [])
+        mock_extension_manager.assert_called_once_with('edx.analytics.tasks')
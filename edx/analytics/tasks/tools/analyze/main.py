@@ -1,8 +1,9 @@
 """Analyze log files produced by launch-task"""
 
 import argparse
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 import datetime
+import json
 import re
 import sys
 
@@ -48,6 +49,10 @@ def analyze():
         '-t', '--trace',
         help='Path to an execution trace of the launch-task process captured by pyinstrument and saved as JSON.'
     )
+    group_ex.add_argument(
+        '-j', '--instrumentation',
+        help='Path to the JSON lines written by launch-task when WORKFLOW_INSTRUMENTATION_PATH is set.'
+    )
 
     args = arg_parser.parse_args()
 
@@ -55,6 +60,8 @@ def analyze():
         root = Measurement.from_json(args.input)
     elif args.trace:
         root = Measurement.from_pyinstrument_trace(args.trace)
+    elif args.instrumentation:
+        root = analyze_instrumentation_file(args.instrumentation)
     else:
         root = analyze_log_file(args.log)
 
@@ -79,6 +86,43 @@ def analyze_log_file(filename):
             raise
 
 
+def analyze_instrumentation_file(filename):
+    with open(filename, 'rb') as instrumentation_file:
+        return analyze_instrumentation(json.loads(line) for line in instrumentation_file if line.strip())
+
+
+def analyze_instrumentation(events):
+    """Build measurements from the events recorded by edx.analytics.tasks.util.instrumentation."""
+    scheduling_seconds = OrderedDict()
+    execution = []
+    for event in events:
+        if event['event'] in ('complete', 'requires'):
+            task_id = event['task_id']
+            scheduling_seconds[task_id] = scheduling_seconds.get(task_id, 0) + event['duration']
+        elif event['event'] == 'run':
+            execution.append(event)
+
+    root = Measurement('Luigi Worker')
+    all_scheduling = Measurement('Scheduling Tasks')
+    for task_id, seconds in scheduling_seconds.iteritems():
+        task = LuigiTaskDescription.from_string(task_id)
+        if not task.name == 'UncheckedExternalURL':
+            all_scheduling.add_child(
+                Measurement('Scheduling {}'.format(task), datetime.timedelta(seconds=seconds))
+            )
+    root.add_child(all_scheduling)
+
+    all_execution = Measurement('Executing Tasks')
+    for event in execution:
+        task = LuigiTaskDescription.from_string(event['task_id'])
+        description = 'Executing {}'.format(task)
+        if event.get('status') == 'failure':
+            description += ' (failed)'
+        all_execution.add_child(Measurement(description, datetime.timedelta(seconds=event['duration'])))
+    root.add_child(all_execution)
+    return root
+
+
 def create_log_message(matched_groups):
     timestamp_str = matched_groups['timestamp']
     matched_groups['timestamp'] = datetime.datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S,%f')
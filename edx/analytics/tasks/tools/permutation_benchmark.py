@@ -0,0 +1,62 @@
+"""
+Micro-benchmark for the permutation of user ids.
+
+Generates random user ids and times permuting them using the original matrix multiplication, using the byte lookup
+tables of PermutationGenerator one id at a time, and using the lookup tables on an array of ids.
+
+    python -m edx.analytics.tasks.tools.permutation_benchmark --ids 1000000
+"""
+
+import argparse
+import random
+import timeit
+
+import numpy as np
+
+from edx.analytics.tasks.util.id_codec import PermutationGenerator
+
+
+def legacy_permute(permutation_generator, int_value):
+    """The permutation that PermutationGenerator performed before it used lookup tables."""
+    vec = permutation_generator.int_to_binvec(int_value)
+    permuted = vec.dot(permutation_generator.permutation_matrix)
+    return permutation_generator.binvec_to_int(permuted)
+
+
+def main():
+    """Time each implementation and print the results."""
+    arg_parser = argparse.ArgumentParser(description='Benchmark the permutation of user ids.')
+    arg_parser.add_argument('--ids', type=int, default=100000, help='Number of ids to permute.')
+    arg_parser.add_argument('--seed', type=int, default=42, help='Seed of the permutation.')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='Number of times to time each implementation.')
+    args = arg_parser.parse_args()
+
+    permutation_generator = PermutationGenerator(args.seed, 32, 32)
+    rng = random.Random(args.seed)
+    id_values = [rng.randrange(2 ** 32) for _ in range(args.ids)]
+    id_array = np.array(id_values, dtype=np.int64)
+
+    def run_legacy():
+        """Multiply a vector of bits by the permutation matrix for each id."""
+        return [legacy_permute(permutation_generator, id_value) for id_value in id_values]
+
+    def run_tables():
+        """Permute each id using the lookup tables."""
+        permute = permutation_generator.permute
+        return [permute(id_value) for id_value in id_values]
+
+    def run_array():
+        """Permute all of the ids in a single call."""
+        return permutation_generator.permute_array(id_array)
+
+    if not run_legacy() == run_tables() == run_array().tolist():
+        raise RuntimeError('The implementations permuted the ids differently.')
+
+    print 'Permuting {0} ids'.format(args.ids)
+    for name, function in (('matrix', run_legacy), ('lookup tables', run_tables), ('array', run_array)):
+        best_time = min(timeit.repeat(function, repeat=args.repeat, number=1))
+        print '{0:>20}: {1:8.3f} s {2:12.0f} ids/s'.format(name, best_time, args.ids / best_time)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark for the time launch-task takes to load the modules that define a task.
+
+Each measurement starts a new interpreter, so that modules imported by earlier measurements are not reused.  Loading
+only the modules that define the task is compared with loading every module registered as an entry point, as
+launch-task used to.  The benchmark fails if loading the task takes longer than --max-seconds, or imports any of the
+modules named using --forbid-module, so that it can be used to detect regressions.
+
+    python -m edx.analytics.tasks.tools.startup_benchmark ParseEventLogPerformanceTask --max-seconds 1.5 \
+        --forbid-module vertica_python --forbid-module gnupg
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+# Run in a new interpreter to load the task modules, printing the time taken and the modules that were imported.
+MEASUREMENT_SCRIPT = """
+import json
+import sys
+import time
+
+start_time = time.time()
+if sys.argv[1] == 'all':
+    import stevedore
+    from edx.analytics.tasks import EXTENSION_NAMESPACE
+    stevedore.ExtensionManager(EXTENSION_NAMESPACE)
+else:
+    from edx.analytics.tasks.launchers.task_modules import load_task_modules
+    load_task_modules(sys.argv[2:])
+elapsed = time.time() - start_time
+print(json.dumps({'seconds': elapsed, 'modules': sorted(sys.modules)}))
+"""
+
+
+def measure(mode, task_args):
+    """Returns the seconds taken to load modules in a new interpreter, and the names of the modules imported."""
+    output = subprocess.check_output([sys.executable, '-c', MEASUREMENT_SCRIPT, mode] + task_args)
+    result = json.loads(output.strip().splitlines()[-1])
+    return result['seconds'], set(result['modules'])
+
+
+def main():
+    """Time loading the task's modules and loading all modules, and print the results."""
+    arg_parser = argparse.ArgumentParser(description='Benchmark loading the modules that define a task.')
+    arg_parser.add_argument('task_args', nargs='+', help='The task name and arguments passed to launch-task.')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='Number of times to time each approach.')
+    arg_parser.add_argument('--max-seconds', type=float, default=None,
+                            help='Fail if loading the task takes longer than this.')
+    arg_parser.add_argument('--forbid-module', action='append', default=[],
+                            help='Fail if loading the task imports this module.')
+    args = arg_parser.parse_args()
+
+    results = {}
+    for mode in ('task', 'all'):
+        measurements = [measure(mode, args.task_args) for _ in range(args.repeat)]
+        results[mode] = (min(seconds for seconds, _modules in measurements), measurements[0][1])
+
+    print 'Loading the modules for {0}'.format(' '.join(args.task_args))
+    for name, mode in (('task modules', 'task'), ('all modules', 'all')):
+        seconds, modules = results[mode]
+        print '{0:>20}: {1:8.3f} s {2:8d} modules'.format(name, seconds, len(modules))
+
+    failures = []
+    task_seconds, task_modules = results['task']
+    if args.max_seconds is not None and task_seconds > args.max_seconds:
+        failures.append('took {0:.3f} s, more than the maximum of {1:.3f} s'.format(task_seconds, args.max_seconds))
+    for module_name in args.forbid_module:
+        if module_name in task_modules:
+            failures.append('imported {0}'.format(module_name))
+
+    if failures:
+        print 'FAILED: loading the task ' + ', '.join(failures)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Micro-benchmark for the selection of event log files by date.
+
+Generates a synthetic listing that resembles a bucket of tracking logs, with one file per server per day, and times
+selecting the files for an interval using the original per-URL implementation and using UrlIntervalFilter.
+
+    python -m edx.analytics.tasks.tools.url_filter_benchmark --days 1095 --servers 100
+"""
+
+import argparse
+import datetime
+import re
+import timeit
+
+from luigi.date_interval import Custom
+
+from edx.analytics.tasks.common.pathutil import UrlIntervalFilter
+
+DEFAULT_PATTERNS = [
+    r'.*tracking.log-(?P<date>\d{8}).*\.gz',
+    r'.*tracking.notalog-(?P<date>\d{8}).*\.gz',
+]
+
+
+def generate_urls(num_days, num_servers):
+    """Returns URLs of tracking logs for each server and each of the last `num_days` days."""
+    first_date = datetime.date.today() - datetime.timedelta(days=num_days)
+    urls = []
+    for day in range(num_days):
+        date_string = (first_date + datetime.timedelta(days=day)).strftime('%Y%m%d')
+        for server in range(num_servers):
+            urls.append(
+                's3://bucket/logs/tracking/server-{0}/tracking.log-{1}-{2}.gz'.format(server, date_string, day)
+            )
+    return urls
+
+
+def legacy_should_include_url(url, patterns, interval, date_pattern):
+    """The selection logic that PathSelectionByDateIntervalTask used before UrlIntervalFilter existed."""
+    match = None
+    for pattern in patterns:
+        match = re.match(pattern, url)
+        if match:
+            break
+
+    if not match:
+        return False
+
+    should_include = True
+    if 'date' in match.groupdict():
+        parsed_datetime = datetime.datetime.strptime(match.group('date'), date_pattern)
+        parsed_date = datetime.date(parsed_datetime.year, parsed_datetime.month, parsed_datetime.day)
+        should_include = parsed_date in interval
+    return should_include
+
+
+def main():
+    """Time both implementations and print the results."""
+    arg_parser = argparse.ArgumentParser(description='Benchmark the selection of event log files by date.')
+    arg_parser.add_argument('--days', type=int, default=365, help='Number of days of logs in the listing.')
+    arg_parser.add_argument('--servers', type=int, default=50, help='Number of servers that upload logs each day.')
+    arg_parser.add_argument('--interval-days', type=int, default=30, help='Number of days to select.')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='Number of times to time each implementation.')
+    args = arg_parser.parse_args()
+
+    urls = generate_urls(args.days, args.servers)
+    date_b = datetime.date.today()
+    interval = Custom(date_b - datetime.timedelta(days=args.interval_days), date_b)
+
+    def run_legacy():
+        """Select the URLs one at a time using re.match() and strptime()."""
+        return [url for url in urls if legacy_should_include_url(url, DEFAULT_PATTERNS, interval, '%Y%m%d')]
+
+    def run_filter():
+        """Select the URLs using UrlIntervalFilter."""
+        return UrlIntervalFilter(DEFAULT_PATTERNS, interval).filter_urls(urls)
+
+    if run_legacy() != run_filter():
+        raise RuntimeError('The implementations selected different URLs.')
+
+    print 'Selecting {0} days out of {1} URLs'.format(args.interval_days, len(urls))
+    for name, function in (('legacy', run_legacy), ('UrlIntervalFilter', run_filter)):
+        best_time = min(timeit.repeat(function, repeat=args.repeat, number=1))
+        print '{0:>20}: {1:8.3f} s {2:10.0f} URLs/s'.format(name, best_time, len(urls) / best_time)
+
+
+if __name__ == '__main__':
+    main()
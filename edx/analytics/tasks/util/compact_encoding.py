@@ -0,0 +1,141 @@
+"""
+A compact text encoding for the keys and values that are passed from mappers to reducers.
+
+Luigi serializes each part of the map output using repr() and parses it again using eval(), which is both verbose and
+slow. This encoding tags each scalar with a single character that identifies its type, and separates the elements of
+tuples with a control character instead of quotes and commas. Strings that appear more than once in the same line of
+output are only written once, later occurrences refer back to the first one. Course IDs, for example, often appear in
+both the key and the value.
+
+Each field remains free of tabs and newlines, so lines can still be split into keys and values and sorted by Hadoop.
+Values of types that are not supported natively are encoded using repr() and decoded using eval(), just like luigi.
+"""
+
+import re
+
+ELEMENT_SEPARATOR = '\x1f'
+TUPLE_MARKER = '('
+REFERENCE_TAG = '@'
+
+# Only strings of at least this length are stored in the dictionary of previously seen values, a reference to a shorter
+# string would not be any shorter than the string itself.
+MINIMUM_REFERENCE_LENGTH = 4
+
+ESCAPES = {
+    '\\': '\\\\',
+    '\t': '\\t',
+    '\n': '\\n',
+    '\r': '\\r',
+    ELEMENT_SEPARATOR: '\\s',
+}
+UNESCAPES = dict((escaped, raw) for raw, escaped in ESCAPES.iteritems())
+ESCAPE_PATTERN = re.compile('[\\\\\t\n\r' + ELEMENT_SEPARATOR + ']')
+UNESCAPE_PATTERN = re.compile(r'\\.')
+
+
+def escape(value):
+    """Escape the characters that separate lines, fields and elements."""
+    return ESCAPE_PATTERN.sub(lambda match: ESCAPES[match.group(0)], value)
+
+
+def unescape(value):
+    """Reverse escape()."""
+    if '\\' not in value:
+        return value
+    return UNESCAPE_PATTERN.sub(lambda match: UNESCAPES[match.group(0)], value)
+
+
+class MapOutputEncoder(object):
+    """Encodes the fields of a single line of map output, keeping track of the strings seen so far in the line."""
+
+    def __init__(self):
+        self.num_elements = 0
+        self.references = {}
+
+    def encode_field(self, field):
+        """Returns the encoded form of a key or a value."""
+        if isinstance(field, tuple):
+            return TUPLE_MARKER + ELEMENT_SEPARATOR.join(self.encode_element(element) for element in field)
+        else:
+            return self.encode_element(field)
+
+    def encode_element(self, element):
+        """Returns the encoded form of a single scalar."""
+        index = self.num_elements
+        self.num_elements += 1
+
+        element_type = type(element)
+        if element_type is str or element_type is unicode:
+            if len(element) >= MINIMUM_REFERENCE_LENGTH:
+                reference_key = (element_type, element)
+                reference = self.references.get(reference_key)
+                if reference is not None:
+                    return REFERENCE_TAG + reference
+                self.references[reference_key] = str(index)
+            if element_type is str:
+                return 's' + escape(element)
+            else:
+                return 'u' + escape(element.encode('utf8'))
+        elif element_type is int or element_type is long:
+            return 'i' + str(element)
+        elif element_type is float:
+            return 'f' + repr(element)
+        elif element_type is bool:
+            return 'b1' if element else 'b0'
+        elif element is None:
+            return 'n'
+        else:
+            return 'r' + escape(repr(element))
+
+
+class MapOutputDecoder(object):
+    """Decodes the fields of a single line of map output, keeping track of the elements decoded so far in the line."""
+
+    def __init__(self):
+        self.elements = []
+
+    def decode_field(self, encoded_field):
+        """Returns the key or value represented by `encoded_field`."""
+        if encoded_field.startswith(TUPLE_MARKER):
+            if len(encoded_field) == 1:
+                return tuple()
+            return tuple(self.decode_element(element) for element in encoded_field[1:].split(ELEMENT_SEPARATOR))
+        else:
+            return self.decode_element(encoded_field)
+
+    def decode_element(self, encoded_element):
+        """Returns the scalar represented by `encoded_element`."""
+        tag = encoded_element[0]
+        data = encoded_element[1:]
+        if tag == 's':
+            element = unescape(data)
+        elif tag == 'u':
+            element = unescape(data).decode('utf8')
+        elif tag == REFERENCE_TAG:
+            element = self.elements[int(data)]
+        elif tag == 'i':
+            element = int(data)
+        elif tag == 'f':
+            element = float(data)
+        elif tag == 'b':
+            element = data == '1'
+        elif tag == 'n':
+            element = None
+        elif tag == 'r':
+            element = eval(unescape(data))  # pylint: disable=eval-used
+        else:
+            raise ValueError('Unknown element type in map output: {0!r}'.format(encoded_element))
+        self.elements.append(element)
+        return element
+
+
+def encode_map_output(output):
+    """Returns a line of text (without the newline) that represents a tuple of map output fields."""
+    encoder = MapOutputEncoder()
+    return '\t'.join(encoder.encode_field(field) for field in output)
+
+
+def decode_map_output(line):
+    """Returns the list of map output fields represented by a line of text created by encode_map_output()."""
+    decoder = MapOutputDecoder()
+    return [decoder.decode_field(encoded_field) for encoded_field in line.split('\t')]
@@ -0,0 +1,302 @@
+"""
+Check whether many luigi tasks are complete at once while a workflow is scheduled.
+
+luigi's worker calls complete() on each task it schedules, one after another, and most tasks are complete if all of
+their outputs exist.  Large workflows have thousands of outputs, and checking each one costs an S3 request, a call to
+the Hadoop client or a query of a marker table.  The worker defined here checks all of the tasks discovered at each
+level of the dependency graph together instead:
+
+* S3 targets that share a parent "directory" are resolved using a single listing of that directory.
+* Marker-table targets that share a marker table (CredentialFileMysqlTarget and VerticaTarget) are resolved using a
+  single query for all of their update ids.
+* The remaining targets, and tasks that implement complete() themselves, are checked from a pool of threads.
+
+launch-task uses this worker when batch_completeness_checks is set in the [scheduling] section of the configuration.
+"""
+
+import logging
+import traceback
+from collections import defaultdict
+from multiprocessing.pool import ThreadPool
+
+from boto.s3.prefix import Prefix
+import luigi
+import luigi.interface
+import luigi.s3
+import luigi.worker
+from luigi.event import Event
+from luigi.hdfs import HdfsTarget
+from luigi.task import flatten
+from luigi.worker import DequeQueue, TaskException, TracebackWrapper
+
+from edx.analytics.tasks.util.overwrite import OverwriteOutputMixin
+from edx.analytics.tasks.util.s3_util import S3HdfsTarget, ScalableS3Client, get_s3_bucket_key_names
+
+log = logging.getLogger(__name__)
+
+# Listing a directory is only worthwhile if it replaces requests for several targets.
+MIN_TARGETS_PER_LISTING = 2
+
+# Limit the size of the IN (...) clause of a single marker table query.
+MAX_UPDATE_IDS_PER_QUERY = 1000
+
+# Keys with this suffix are used by Hadoop to mark empty directories in S3.
+S3_DIRECTORY_MARKER_SUFFIX = '_$folder$'
+
+
+def get_existence_outputs(task):
+    """
+    Returns the outputs that must exist for `task` to be complete.
+
+    Returns None if the completeness of the task cannot be determined from its outputs alone, in which case its
+    complete() method must be called.
+    """
+    for cls in type(task).__mro__:
+        if 'complete' not in cls.__dict__:
+            continue
+
+        if cls is OverwriteOutputMixin:
+            if task.overwrite and not task.attempted_removal:
+                return None
+            # Otherwise the mixin defers to the implementation of its parent class.
+        elif cls is luigi.Task:
+            outputs = flatten(task.output())
+            return outputs if outputs else None
+        else:
+            return None
+
+    return None
+
+
+def is_listable_s3_target(target):
+    """Returns True if the existence of `target` is equivalent to its path appearing in a listing of its parent."""
+    target_class = type(target)
+    if isinstance(target, luigi.s3.S3Target):
+        return target_class.exists == luigi.s3.S3Target.exists
+    if isinstance(target, S3HdfsTarget):
+        return target_class.exists == HdfsTarget.exists and target.path.startswith('s3')
+    return False
+
+
+def is_marker_table_target(target):
+    """Returns True if `target` is recorded in a marker table that can be queried for many targets at once."""
+    return hasattr(target, 'get_existing_update_ids') and hasattr(target, 'marker_table_location')
+
+
+def _check_complete(task):
+    """Returns the result of task.complete(), or a TracebackWrapper if it raised an exception."""
+    # Use luigi's implementation so that failures are reported the same way and any instrumentation is applied.
+    queue = DequeQueue()
+    luigi.worker.check_complete(task, queue)
+    _task, is_complete = queue.get()
+    return is_complete
+
+
+class CompletenessChecker(object):
+    """
+    Checks whether a set of tasks are complete, using as few requests as possible.
+
+    Arguments:
+        num_threads (int): The number of requests that are made concurrently.
+    """
+
+    def __init__(self, num_threads=16):
+        self.num_threads = num_threads
+
+    def check_tasks(self, tasks):
+        """
+        Returns a dict mapping the task_id of each task to whether or not it is complete.
+
+        The value is a TracebackWrapper instead if the task's completeness could not be determined, just like the
+        values luigi.worker.check_complete() produces.
+        """
+        results = {}
+        outputs_by_task_id = {}
+        unbatched_tasks = []
+        for task in tasks:
+            outputs = get_existence_outputs(task)
+            if outputs is None:
+                unbatched_tasks.append(task)
+            else:
+                log.debug("Checking if %s is complete", task)
+                outputs_by_task_id[task.task_id] = outputs
+
+        targets = []
+        for outputs in outputs_by_task_id.itervalues():
+            targets.extend(outputs)
+
+        pool = ThreadPool(processes=max(1, self.num_threads))
+        try:
+            task_results = pool.map_async(_check_complete, unbatched_tasks)
+            target_results = self.check_targets(targets, pool)
+            for task, is_complete in zip(unbatched_tasks, task_results.get()):
+                results[task.task_id] = is_complete
+        finally:
+            pool.close()
+            pool.join()
+
+        for task_id, outputs in outputs_by_task_id.iteritems():
+            is_complete = True
+            for target in outputs:
+                target_exists = target_results[id(target)]
+                if isinstance(target_exists, TracebackWrapper):
+                    is_complete = target_exists
+                    break
+                elif not target_exists:
+                    is_complete = False
+            results[task_id] = is_complete
+
+        return results
+
+    def check_targets(self, targets, pool):
+        """
+        Returns a dict mapping the id() of each target to whether or not it exists, using the threads in `pool`.
+
+        The value is a TracebackWrapper if the request that checked the target failed.
+        """
+        s3_targets_by_directory = defaultdict(list)
+        marker_targets_by_table = defaultdict(list)
+        other_targets = []
+        for target in targets:
+            if is_listable_s3_target(target):
+                bucket_name, key_name = get_s3_bucket_key_names(target.path)
+                parent_prefix = key_name.rpartition('/')[0]
+                if parent_prefix:
+                    parent_prefix += '/'
+                s3_targets_by_directory[(bucket_name, parent_prefix)].append(target)
+            elif is_marker_table_target(target):
+                marker_targets_by_table[(type(target),) + tuple(target.marker_table_location())].append(target)
+            else:
+                other_targets.append(target)
+
+        jobs = []
+        for (bucket_name, prefix), s3_targets in s3_targets_by_directory.iteritems():
+            if len(s3_targets) >= MIN_TARGETS_PER_LISTING:
+                jobs.append((self._check_s3_targets, (bucket_name, prefix, s3_targets)))
+            else:
+                other_targets.extend(s3_targets)
+
+        for marker_targets in marker_targets_by_table.itervalues():
+            for start in range(0, len(marker_targets), MAX_UPDATE_IDS_PER_QUERY):
+                jobs.append((self._check_marker_targets, (marker_targets[start:start + MAX_UPDATE_IDS_PER_QUERY],)))
+
+        for target in other_targets:
+            jobs.append((self._check_target, (target,)))
+
+        pending = [(pool.apply_async(_call_with_traceback, (func, args)), args[-1]) for func, args in jobs]
+        results = {}
+        for async_result, job_targets in pending:
+            job_result = async_result.get()
+            if isinstance(job_result, TracebackWrapper):
+                for target in _as_list(job_targets):
+                    results[id(target)] = job_result
+            else:
+                results.update(job_result)
+        return results
+
+    def _check_target(self, target):
+        """Checks a single target using its exists() method."""
+        return {id(target): target.exists()}
+
+    def _check_s3_targets(self, bucket_name, prefix, targets):
+        """Checks targets that share the same parent prefix in an S3 bucket using a single listing."""
+        # Boto connections are not safe to share between threads, so each listing uses its own client.
+        bucket = ScalableS3Client().s3.get_bucket(bucket_name, validate=False)
+        key_names = set()
+        directory_prefixes = set()
+        for item in bucket.list(prefix=prefix, delimiter='/'):
+            if isinstance(item, Prefix):
+                directory_prefixes.add(item.name)
+            else:
+                key_names.add(item.name)
+
+        results = {}
+        for target in targets:
+            key_name = get_s3_bucket_key_names(target.path)[1]
+            results[id(target)] = (
+                key_name in key_names or
+                key_name + '/' in directory_prefixes or
+                key_name + S3_DIRECTORY_MARKER_SUFFIX in key_names
+            )
+        return results
+
+    def _check_marker_targets(self, targets):
+        """Checks targets that share the same marker table using a single query."""
+        existing_update_ids = targets[0].get_existing_update_ids([target.update_id for target in targets])
+        return {id(target): target.update_id in existing_update_ids for target in targets}
+
+
+def _call_with_traceback(func, args):
+    """Returns the result of calling `func`, or a TracebackWrapper if it raises an exception."""
+    try:
+        return func(*args)
+    except BaseException:
+        return TracebackWrapper(traceback.format_exc())
+
+
+def _as_list(targets):
+    """Returns `targets` as a list, whether it was a single target or a list of them."""
+    return targets if isinstance(targets, list) else [targets]
+
+
+class BatchCompletenessWorker(luigi.worker.Worker):
+    """
+    A worker that checks whether all of the tasks found at each level of the dependency graph are complete together.
+
+    The tasks are scheduled exactly as luigi.worker.Worker would schedule them, only the order in which they are
+    checked differs.
+    """
+
+    def __init__(self, completeness_checker=None, **kwargs):
+        super(BatchCompletenessWorker, self).__init__(**kwargs)
+        self.completeness_checker = completeness_checker or CompletenessChecker()
+
+    def add(self, task, multiprocess=False):
+        """
+        Add a Task for the worker to check and possibly schedule and run.
+
+        Returns True if task and its dependencies were successfully scheduled or completed before.  The `multiprocess`
+        argument is ignored, since completeness is checked by a pool of threads instead.
+        """
+        if self._first_task is None and hasattr(task, 'task_id'):
+            self._first_task = task.task_id
+        self.add_succeeded = True
+        self._validate_task(task)
+
+        try:
+            seen = set([task.task_id])
+            level = [task]
+            while level:
+                results = self.completeness_checker.check_tasks(level)
+                next_level = []
+                for item in level:
+                    for dependency in self._add(item, results[item.task_id]):
+                        if dependency.task_id not in seen:
+                            self._validate_task(dependency)
+                            seen.add(dependency.task_id)
+                            next_level.append(dependency)
+                level = next_level
+        except (KeyboardInterrupt, TaskException):
+            raise
+        except Exception as ex:
+            self.add_succeeded = False
+            formatted_traceback = traceback.format_exc()
+            self._log_unexpected_error(task)
+            task.trigger_event(Event.BROKEN_TASK, task, ex)
+            self._email_unexpected_error(task, formatted_traceback)
+        return self.add_succeeded
+
+
+class BatchCompletenessWorkerSchedulerFactory(luigi.interface.WorkerSchedulerFactory):
+    """Creates workers that check the completeness of tasks in batches."""
+
+    def __init__(self, num_threads=16):
+        self.num_threads = num_threads
+
+    def create_worker(self, scheduler, worker_processes, assistant=False):
+        return BatchCompletenessWorker(
+            scheduler=scheduler,
+            worker_processes=worker_processes,
+            assistant=assistant,
+            completeness_checker=CompletenessChecker(num_threads=self.num_threads),
+        )
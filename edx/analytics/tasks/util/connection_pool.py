@@ -0,0 +1,220 @@
+"""
+Reuse database connections across the tasks that a worker process runs.
+
+Workflows that load many tables run dozens of tasks that each connect to the same MySQL or Vertica database, and every
+new connection pays for a TLS handshake and authentication.  When pooling is enabled, connections that are closed are
+kept open in a pool instead, and are handed out again to the next caller that connects with the same credentials.
+
+Pooling is configured in the [database-connection-pool] section:
+
+    enabled: whether to reuse connections at all.  Defaults to False.
+    max_idle_connections: the number of idle connections kept open for each set of credentials.  Defaults to 2.
+    max_idle_seconds: connections that have been idle for longer than this are closed instead of reused.  Defaults
+        to 300.
+
+Connections are returned to the pool in a clean state: any open transaction is rolled back, just as it would be if the
+connection were really closed, and connections that fail to reset or fail a health check when they are checked out are
+closed and discarded.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+import luigi.configuration
+
+log = logging.getLogger(__name__)
+
+CONFIGURATION_SECTION = 'database-connection-pool'
+
+# All of the pools that have been created, by name.
+_pools = {}  # pylint: disable=invalid-name
+
+
+def is_pooling_enabled():
+    """Returns True if connections should be reused."""
+    return luigi.configuration.get_config().getboolean(CONFIGURATION_SECTION, 'enabled', False)
+
+
+def get_metrics():
+    """Returns a dict mapping the name of each pool to a dict of its hits, misses and discarded connections."""
+    return {name: pool.get_metrics() for name, pool in _pools.iteritems()}
+
+
+class ConnectionPool(object):
+    """
+    A pool of idle connections to a type of database, keyed by the credentials used to open them.
+
+    Subclasses define how connections to their database are checked and reset.
+
+    Arguments:
+        name (str): Identifies the pool in metrics and logs.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._idle_connections = defaultdict(list)
+        self._pid = os.getpid()
+        self.hits = 0
+        self.misses = 0
+        self.discarded = 0
+        _pools[name] = self
+
+    def connect(self, key, create_connection, autocommit=False):
+        """
+        Returns a connection to the database identified by `key`.
+
+        Arguments:
+            key (tuple): Everything that affects the connection created, including the credentials.
+            create_connection (callable): Called with no arguments to open a new connection if there is no idle
+                connection to reuse.
+            autocommit (bool): Whether the connection should automatically commit.
+
+        If pooling is disabled, this simply returns a new connection.  Otherwise, the connection returned will be put
+        back into the pool when it is closed.
+        """
+        if not is_pooling_enabled():
+            return create_connection()
+
+        connection = self._checkout(key)
+        if connection is None:
+            with self._lock:
+                self.misses += 1
+            log.debug('Opening a new connection for the %s connection pool', self.name)
+            connection = create_connection()
+        else:
+            with self._lock:
+                self.hits += 1
+            self.set_autocommit(connection, autocommit)
+        return PooledConnection(self, key, connection)
+
+    def checkin(self, key, connection, pid):
+        """Put a connection that was closed by its user back into the pool, or close it if it cannot be reused."""
+        if pid != os.getpid():
+            # The connection was checked out by a parent process, which may still be using it.
+            return
+
+        try:
+            self.reset(connection)
+        except Exception:  # pylint: disable=broad-except
+            log.debug('Unable to reset a connection from the %s connection pool', self.name, exc_info=True)
+            self._discard(connection)
+            return
+
+        max_idle_connections = luigi.configuration.get_config().getint(
+            CONFIGURATION_SECTION, 'max_idle_connections', 2
+        )
+        with self._lock:
+            self._forget_inherited_connections()
+            idle_connections = self._idle_connections[key]
+            if len(idle_connections) < max_idle_connections:
+                idle_connections.append((connection, time.time()))
+                return
+        self._close(connection)
+
+    def get_metrics(self):
+        """Returns a dict of the number of connections that were reused, opened and discarded."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'discarded': self.discarded,
+            }
+
+    def clear(self):
+        """Close all idle connections."""
+        with self._lock:
+            self._forget_inherited_connections()
+            idle_connections = self._idle_connections
+            self._idle_connections = defaultdict(list)
+        for connections in idle_connections.itervalues():
+            for connection, _returned_at in connections:
+                self._close(connection)
+
+    def is_healthy(self, connection):
+        """Returns True if an idle connection can still be used."""
+        raise NotImplementedError
+
+    def reset(self, connection):
+        """Undo anything that the previous user of the connection left uncommitted."""
+        raise NotImplementedError
+
+    def set_autocommit(self, connection, autocommit):
+        """Configure a reused connection the same way a new connection would have been."""
+        connection.autocommit = autocommit
+
+    def _checkout(self, key):
+        """Returns the most recently used healthy idle connection for `key`, or None if there are none."""
+        max_idle_seconds = luigi.configuration.get_config().getint(CONFIGURATION_SECTION, 'max_idle_seconds', 300)
+        while True:
+            with self._lock:
+                self._forget_inherited_connections()
+                idle_connections = self._idle_connections[key]
+                if not idle_connections:
+                    return None
+                connection, returned_at = idle_connections.pop()
+
+            if time.time() - returned_at > max_idle_seconds:
+                self._discard(connection)
+                continue
+
+            try:
+                healthy = self.is_healthy(connection)
+            except Exception:  # pylint: disable=broad-except
+                healthy = False
+            if healthy:
+                return connection
+            log.debug('Discarding a broken connection from the %s connection pool', self.name)
+            self._discard(connection)
+
+    def _forget_inherited_connections(self):
+        """Drop connections that were opened by a parent process, since their sockets are shared with it."""
+        if self._pid != os.getpid():
+            self._idle_connections = defaultdict(list)
+            self._pid = os.getpid()
+
+    def _discard(self, connection):
+        """Close a connection that will not be reused."""
+        with self._lock:
+            self.discarded += 1
+        self._close(connection)
+
+    def _close(self, connection):
+        """Close a connection, ignoring any errors."""
+        try:
+            connection.close()
+        except Exception:  # pylint: disable=broad-except
+            pass
+
+
+class PooledConnection(object):
+    """
+    Wraps a connection, returning it to its pool instead of closing it.
+
+    All other attributes are those of the underlying connection.
+    """
+
+    def __init__(self, pool, key, connection):
+        object.__setattr__(self, '_pool', pool)
+        object.__setattr__(self, '_key', key)
+        object.__setattr__(self, '_connection', connection)
+        object.__setattr__(self, '_pid', os.getpid())
+
+    def close(self):
+        """Return the connection to the pool.  The connection must not be used after this."""
+        connection = self._connection
+        if connection is None:
+            return
+        object.__setattr__(self, '_connection', None)
+        self._pool.checkin(self._key, connection, self._pid)
+
+    def __getattr__(self, name):
+        if self._connection is None:
+            raise AttributeError('Connection has been closed')
+        return getattr(self._connection, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._connection, name, value)
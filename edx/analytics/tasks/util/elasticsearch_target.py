@@ -27,9 +27,10 @@ class ElasticsearchTarget(luigi.hdfs.HdfsTarget):
             index (str): Name of the index that is populated.
             doc_type (str): The doc_type that is written in the index.
             update_id (str): A unique identifier that is used to determine if an indexing task should be re-run.
+            marker_fields (dict): Additional fields to record in the marker document when the task completes.
     """
 
-    def __init__(self, client, index, doc_type, update_id):
+    def __init__(self, client, index, doc_type, update_id, marker_fields=None):
         super(ElasticsearchTarget, self).__init__(is_tmp=True)
 
         self.marker_index = luigi.configuration.get_config().get(
@@ -45,6 +46,7 @@ class ElasticsearchTarget(luigi.hdfs.HdfsTarget):
         self.index = index
         self.doc_type = doc_type
         self.update_id = update_id
+        self.marker_fields = marker_fields or {}
 
         self.elasticsearch_client = client
 
@@ -59,16 +61,18 @@ class ElasticsearchTarget(luigi.hdfs.HdfsTarget):
         if not self.elasticsearch_client.indices.exists(index=self.marker_index):
             self.elasticsearch_client.indices.create(index=self.marker_index)
 
+        body = dict(self.marker_fields)
+        body.update({
+            'update_id': self.update_id,
+            'target_index': self.index,
+            'target_doc_type': self.doc_type,
+            'date': datetime.datetime.utcnow()
+        })
         self.elasticsearch_client.index(
             index=self.marker_index,
             doc_type=self.marker_doc_type,
             id=self.marker_index_document_id(),
-            body={
-                'update_id': self.update_id,
-                'target_index': self.index,
-                'target_doc_type': self.doc_type,
-                'date': datetime.datetime.utcnow()
-            }
+            body=body
         )
         self.elasticsearch_client.indices.flush(index=self.marker_index)
 
@@ -86,3 +90,18 @@ class ElasticsearchTarget(luigi.hdfs.HdfsTarget):
         except elasticsearch.ElasticsearchException as err:
             log.warn(err)
         return False
+
+    def get_marker(self):
+        """Returns the fields recorded in the marker document, or None if this task has not run successfully."""
+        try:
+            marker = self.elasticsearch_client.get(
+                index=self.marker_index,
+                doc_type=self.marker_doc_type,
+                id=self.marker_index_document_id()
+            )
+            return marker['_source']
+        except elasticsearch.NotFoundError:
+            log.debug('Marker document not found.')
+        except elasticsearch.ElasticsearchException as err:
+            log.warn(err)
+        return None
@@ -2,8 +2,13 @@
 Tasks for performing encryption on export files.
 """
 from contextlib import contextmanager
+import gzip
 import logging
+import Queue
+import subprocess
+import sys
 import tempfile
+import threading
 
 import gnupg
 
@@ -67,6 +72,185 @@ def make_encrypted_file(output_file, key_file_targets, recipients=None, progress
             copy_file_to_file(temp_encrypted_file, output_file, progress)
 
 
+@contextmanager
+def make_pipelined_encrypted_file(output_file, key_file_targets, recipients=None, progress=None, dir=None,
+                                  compress=False, max_buffered_chunks=16):
+    """
+    Creates a file object to be written to, whose contents are encrypted and written to the output while writing.
+
+    Unlike make_encrypted_file(), nothing is written to temporary files.  The data is passed through a bounded queue to
+    a thread that optionally gzips it and feeds it to a gpg process, and another thread copies the encrypted data
+    from gpg to the output file.  Writing, compression, encryption and output therefore all overlap.
+
+    Parameters:
+        output_file:  a file object, opened for writing.
+        key_file_targets: a list of luigi.Target objects defining the gpg public key files to be loaded.
+        recipients:  an optional list of recipients to be loaded.  If not specified, uses all loaded keys.
+        progress:  a function that is called periodically with the number of encrypted bytes written to the output.
+            It is only called from the thread writing to the file object.
+        compress:  if True, the data is gzipped before it is encrypted.
+        max_buffered_chunks:  the number of writes that can be waiting to be compressed and encrypted.
+    """
+    with make_temp_directory(prefix="encrypt", dir=dir) as temp_dir:
+        # Use temp directory to hold gpg keys.
+        gpg = gnupg.GPG(gnupghome=temp_dir)
+        gpg.encoding = 'utf-8'
+        _import_key_files(gpg, key_file_targets)
+        if recipients is None:
+            recipients = [key['keyid'] for key in gpg.list_keys()]
+
+        command = [gpg.gpgbinary, '--no-tty', '--batch', '--homedir', temp_dir, '--always-trust', '--encrypt']
+        for recipient in recipients:
+            command.extend(['--recipient', recipient])
+        log.info('Streaming encrypted data to output.')
+        gpg_process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+        pipeline = EncryptionPipeline(gpg_process, output_file, progress, compress, max_buffered_chunks)
+        try:
+            yield pipeline
+        except:
+            pipeline.abort()
+            raise
+        else:
+            pipeline.close()
+        log.info('Encryption complete.')
+
+
+class EncryptionPipeline(object):
+    """
+    A file-like object that passes the data written to it through a gpg process and on to an output file.
+
+    Data is compressed (optionally) and written to gpg by one thread, and read from gpg and written to the output file
+    by another thread, so neither blocks the thread calling write() unless the queue of pending writes is full.
+    """
+
+    # Writes smaller than this are combined before they are queued.
+    CHUNK_SIZE = 64 * 1024
+
+    # Number of seconds to wait for space in the queue before checking that the pipeline is still running.
+    QUEUE_TIMEOUT = 1
+
+    def __init__(self, gpg_process, output_file, progress, compress, max_buffered_chunks):
+        self.gpg_process = gpg_process
+        self.output_file = output_file
+        self.progress = progress
+        self.compress = compress
+        self.queue = Queue.Queue(maxsize=max_buffered_chunks)
+        self.pending = []
+        self.pending_size = 0
+        self.bytes_written = 0
+        self.bytes_reported = 0
+        self.exc_info = None
+        self.input_thread = self._start_thread(self._write_input)
+        self.output_thread = self._start_thread(self._read_output)
+
+    def _start_thread(self, target):
+        """Start a daemon thread, recording the exception if it fails."""
+        def run():
+            """Run the target, keeping the first exception raised by either thread."""
+            try:
+                target()
+            except Exception:  # pylint: disable=broad-except
+                if self.exc_info is None:
+                    self.exc_info = sys.exc_info()
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def _write_input(self):
+        """Feed the queued chunks to gpg, compressing them first if requested."""
+        gpg_input = self.gpg_process.stdin
+        if self.compress:
+            # Don't include the name of the pipe in the gzip header.
+            gpg_input = gzip.GzipFile(filename='', mode='wb', fileobj=self.gpg_process.stdin)
+        try:
+            while True:
+                chunk = self.queue.get()
+                if chunk is None:
+                    break
+                gpg_input.write(chunk)
+        finally:
+            try:
+                gpg_input.close()
+            finally:
+                self.gpg_process.stdin.close()
+
+    def _read_output(self):
+        """Copy the encrypted data from gpg to the output file."""
+        while True:
+            transfer_buffer = self.gpg_process.stdout.read(self.CHUNK_SIZE)
+            if not transfer_buffer:
+                break
+            self.output_file.write(transfer_buffer)
+            self.bytes_written += len(transfer_buffer)
+
+    def _check_for_errors(self):
+        """Re-raise any exception raised by the threads of the pipeline."""
+        if self.exc_info is not None:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+
+    def _report_progress(self):
+        """Tell the caller about output written since the last report."""
+        bytes_written = self.bytes_written
+        if self.progress and bytes_written > self.bytes_reported:
+            try:
+                self.progress(bytes_written - self.bytes_reported)
+            except:  # pylint: disable=bare-except
+                pass
+        self.bytes_reported = bytes_written
+
+    def _enqueue(self, chunk):
+        """Add a chunk to the queue, waiting for space as long as the pipeline is running."""
+        while True:
+            self._check_for_errors()
+            try:
+                self.queue.put(chunk, timeout=self.QUEUE_TIMEOUT)
+                return
+            except Queue.Full:
+                pass
+
+    def write(self, data):
+        """Queue data to be encrypted."""
+        self.pending.append(data)
+        self.pending_size += len(data)
+        if self.pending_size >= self.CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Queue any data that has been written but not queued yet."""
+        if self.pending:
+            self._enqueue(''.join(self.pending))
+            self.pending = []
+            self.pending_size = 0
+        self._report_progress()
+
+    def close(self):
+        """Wait for all of the data to be encrypted and written to the output."""
+        self.flush()
+        self._enqueue(None)
+        self.input_thread.join()
+        self.output_thread.join()
+        return_code = self.gpg_process.wait()
+        self._check_for_errors()
+        if return_code != 0:
+            raise IOError('gpg exited with status {0} while encrypting'.format(return_code))
+        self._report_progress()
+
+    def abort(self):
+        """Stop the pipeline, discarding any data that has not been written."""
+        try:
+            self.gpg_process.kill()
+        except OSError:
+            pass
+        try:
+            self.queue.put_nowait(None)
+        except Queue.Full:
+            pass
+        self.gpg_process.wait()
+
+
 def _import_key_files(gpg_instance, key_file_targets):
     """
     Load key-file targets into the GPG instance.
@@ -12,6 +12,11 @@ log = logging.getLogger(__name__)
 
 PATTERN_JSON = re.compile(r'^.*?(\{.*\})\s*$')
 
+# Patterns used to inspect raw lines before they are decoded.  These only look for values that are plain JSON
+# strings, so anything unusual (escaped characters, missing fields) is left for the full decode to deal with.
+PATTERN_TIME_DATE = re.compile(r'"time"\s*:\s*"([^"T]*)')
+PATTERN_EVENT_TYPE = re.compile(r'"event_type"\s*:\s*"([^"\\]*)(["\\])')
+
 
 def decode_json(line):
     """Wrapper to decode JSON string in an implementation-independent way."""
@@ -58,6 +63,48 @@ def parse_json_event(line, nested=False):
     return parsed
 
 
+def line_may_be_within_interval(line, lower_bound_date_string, upper_bound_date_string):
+    """
+    Cheaply check if a tracking log line may contain an event within a date interval, without decoding it.
+
+    Arguments:
+        line:  the eventlog text
+        lower_bound_date_string: inclusive lower bound, as an ISO-formatted date string.
+        upper_bound_date_string: exclusive upper bound, as an ISO-formatted date string.
+
+    Returns False only if every "time" value found in the line falls outside of the interval.  Nested
+    fields may also be named "time", so a single value within the interval is enough to keep the line.
+    If no "time" value can be found, the line is kept so that the caller can decide after decoding it.
+    """
+    found = False
+    for match in PATTERN_TIME_DATE.finditer(line):
+        found = True
+        date_string = match.group(1)
+        if lower_bound_date_string <= date_string < upper_bound_date_string:
+            return True
+    return not found
+
+
+def line_may_have_event_type(line, event_types):
+    """
+    Cheaply check if a tracking log line may contain an event with one of the given event types, without decoding it.
+
+    Arguments:
+        line:  the eventlog text
+        event_types: a set of event_type values of interest.
+
+    Returns False only if every "event_type" value found in the line is a plain string that is not one of
+    the requested event types.  If no such value can be found, or if a value contains escaped characters,
+    the line is kept so that the caller can decide after decoding it.
+    """
+    found = False
+    for match in PATTERN_EVENT_TYPE.finditer(line):
+        found = True
+        if match.group(2) != '"' or match.group(1) in event_types:
+            return True
+    return not found
+
+
 def parse_json_server_event(line, requested_event_type):
     """
     Parse a tracking log input line as JSON to create a dict representation.
@@ -3,10 +3,12 @@ Utility methods interact with files.
 """
 import logging
 import os
+import urlparse
 from contextlib import contextmanager
 
 import sys
 
+from edx.analytics.tasks.util.s3_util import ScalableS3Client
 from edx.analytics.tasks.util.url import get_target_from_url
 
 TRANSFER_BUFFER_SIZE = 1024 * 1024  # 1 MB
@@ -32,6 +34,18 @@ def copy_file_to_file(src_file, output_file, progress=None):
     log.info('Copy to output complete')
 
 
+def copy_url(src_url, output_url):
+    """Copies the file at one URL to another.  Files are copied within S3 when both URLs refer to S3."""
+    s3_schemes = ('s3', 's3n', 's3+https')
+    if urlparse.urlparse(src_url).scheme in s3_schemes and urlparse.urlparse(output_url).scheme in s3_schemes:
+        ScalableS3Client().copy_file(src_url, output_url)
+        return
+
+    with get_target_from_url(src_url).open('r') as src_file:
+        with get_target_from_url(output_url).open('w') as output_file:
+            copy_file_to_file(src_file, output_file)
+
+
 @contextmanager
 def read_config_file(filename):
     """Read a config file from either an external source (S3, HDFS etc) or the "share" directory of this repo."""
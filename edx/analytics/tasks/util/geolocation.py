@@ -1,6 +1,11 @@
 """Utility classes for providing geolocation functionality."""
 
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
 import logging
+import socket
+import struct
 import tempfile
 
 import luigi
@@ -18,6 +23,128 @@ UNKNOWN_CODE = "UNKNOWN"
 
 log = logging.getLogger(__name__)
 
+# Constants describing the layout of legacy GeoIP databases, see pygeoip.const.
+GEOIP_COUNTRY_EDITION = 1
+GEOIP_COUNTRY_BEGIN = 16776960
+GEOIP_RECORD_LENGTH = 3
+GEOIP_STRUCTURE_INFO_MAX_SIZE = 20
+GEOIP_STRUCTURE_INFO_DELIMITER = '\xff\xff\xff'
+
+
+def get_geoip_database_edition(data):
+    """Returns the edition of a legacy GeoIP database, given its contents, in the same way pygeoip determines it."""
+    for offset in range(GEOIP_STRUCTURE_INFO_MAX_SIZE):
+        position = len(data) - 3 - offset
+        if position < 0:
+            break
+        if data[position:position + 3] == GEOIP_STRUCTURE_INFO_DELIMITER:
+            edition = ord(data[position + 3:position + 4] or '\x00')
+            # Compatibility with databases from April 2003 and earlier
+            if edition >= 106:
+                edition -= 105
+            return edition
+    return GEOIP_COUNTRY_EDITION
+
+
+class LruCache(object):
+    """A mapping that holds at most `max_size` entries, discarding the least recently used entries first."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+
+    def get(self, key, default=None):
+        """Returns the value stored for `key`, marking it as the most recently used entry."""
+        try:
+            value = self.entries.pop(key)
+        except KeyError:
+            return default
+        self.entries[key] = value
+        return value
+
+    def put(self, key, value):
+        """Stores a value for `key`, discarding the least recently used entry if the cache is full."""
+        self.entries.pop(key, None)
+        self.entries[key] = value
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class CountryRangeIndex(object):
+    """
+    An in-memory index of the IPv4 address ranges assigned to each country.
+
+    The binary tree stored in a legacy GeoIP country database is flattened once into two sorted arrays: the first
+    address of each range, and the ID of the country the range is assigned to.  Adjacent ranges that are assigned to
+    the same country are merged.  Addresses are then located using a binary search instead of walking the tree on
+    disk, and the country IDs of the most recently used addresses are cached.
+
+    Implements the subset of the pygeoip.GeoIP interface used by GeolocationMixin.
+    """
+
+    def __init__(self, data, cache_size=100000):
+        edition = get_geoip_database_edition(data)
+        if edition != GEOIP_COUNTRY_EDITION:
+            raise ValueError('Unsupported GeoIP database edition {0}, expected an IPv4 country database.'.format(
+                edition
+            ))
+
+        self.range_starts = array('I')
+        self.country_ids = array('H')
+        self._load_ranges(bytearray(data))
+        self.cache = LruCache(cache_size)
+
+    def _load_ranges(self, data):
+        """Walks the search tree in the database in address order, recording the range covered by each leaf."""
+        record_length = GEOIP_RECORD_LENGTH
+        range_starts = self.range_starts
+        country_ids = self.country_ids
+
+        # Each entry is a record that refers either to a node of the tree or to a country, the index of the most
+        # significant bit of the address that has not been examined yet, and the first address covered by the record.
+        stack = [(0, 31, 0)]
+        while stack:
+            record, bit, network = stack.pop()
+            if record >= GEOIP_COUNTRY_BEGIN:
+                country_id = record - GEOIP_COUNTRY_BEGIN
+                if not country_ids or country_ids[-1] != country_id:
+                    range_starts.append(network)
+                    country_ids.append(country_id)
+                continue
+
+            if bit < 0:
+                raise ValueError('Corrupt GeoIP database, the search tree is more than 32 levels deep.')
+
+            offset = 2 * record_length * record
+            if offset + 2 * record_length > len(data):
+                raise ValueError('Corrupt GeoIP database, node {0} is beyond the end of the file.'.format(record))
+            left = data[offset] | (data[offset + 1] << 8) | (data[offset + 2] << 16)
+            right = data[offset + 3] | (data[offset + 4] << 8) | (data[offset + 5] << 16)
+
+            # Push the upper half first so that the lower half is visited first.
+            stack.append((right, bit - 1, network | (1 << bit)))
+            stack.append((left, bit - 1, network))
+
+    def country_id_by_addr(self, ip_address):
+        """Returns the index into pygeoip.const.COUNTRY_CODES of the country an IPv4 address is assigned to."""
+        country_id = self.cache.get(ip_address)
+        if country_id is None:
+            ip_number = struct.unpack('!I', socket.inet_aton(ip_address))[0]
+            country_id = self.country_ids[bisect_right(self.range_starts, ip_number) - 1]
+            self.cache.put(ip_address, country_id)
+        return country_id
+
+    def country_code_by_addr(self, ip_address):
+        """Returns the 2-letter code of the country an IPv4 address is assigned to."""
+        return pygeoip.const.COUNTRY_CODES[self.country_id_by_addr(ip_address)]
+
+    def country_name_by_addr(self, ip_address):
+        """Returns the name of the country an IPv4 address is assigned to."""
+        return pygeoip.const.COUNTRY_NAMES[self.country_id_by_addr(ip_address)]
+
 
 class GeolocationDownstreamMixin(object):
     """
@@ -33,7 +160,15 @@ class GeolocationDownstreamMixin(object):
 class GeolocationMixin(GeolocationDownstreamMixin):
     """Provides support for initializing a geolocation object."""
 
+    geolocation_cache_size = luigi.IntParameter(
+        config_path={'section': 'geolocation', 'name': 'cache_size'},
+        default=100000,
+        significant=False,
+        description='Number of IP addresses for which the country is remembered by each reducer.',
+    )
+
     geoip = None
+    temporary_data_file = None
 
     def requires_local(self):
         """Adds geolocation_data as a local requirement."""
@@ -52,25 +187,27 @@ class GeolocationMixin(GeolocationDownstreamMixin):
     def init_reducer(self):
         """Initialize the geolocation object for use by a reducer."""
         super(GeolocationMixin, self).init_reducer()
-        # Copy the remote version of the geolocation data file to a local file.
-        # This is required by the GeoIP call, which assumes that the data file is located
-        # on a local file system.
-        self.temporary_data_file = tempfile.NamedTemporaryFile(prefix='geolocation_data')
         with self.geolocation_data_target().open() as geolocation_data_input:
-            while True:
-                transfer_buffer = geolocation_data_input.read(1024)
-                if transfer_buffer:
-                    self.temporary_data_file.write(transfer_buffer)
-                else:
-                    break
-        self.temporary_data_file.seek(0)
+            geolocation_data = geolocation_data_input.read()
 
-        self.geoip = pygeoip.GeoIP(self.temporary_data_file.name, pygeoip.STANDARD)
+        try:
+            self.geoip = CountryRangeIndex(geolocation_data, cache_size=self.geolocation_cache_size)
+            return
+        except ValueError:
+            log.warning('Unable to index the geolocation data, falling back to pygeoip.', exc_info=True)
+
+        # The GeoIP call assumes that the data file is located on a local file system.
+        self.temporary_data_file = tempfile.NamedTemporaryFile(prefix='geolocation_data')
+        self.temporary_data_file.write(geolocation_data)
+        self.temporary_data_file.flush()
+
+        self.geoip = pygeoip.GeoIP(self.temporary_data_file.name, pygeoip.MEMORY_CACHE)
 
     def final_reducer(self):
         """Clean up after the reducer is done."""
         del self.geoip
-        self.temporary_data_file.close()
+        if self.temporary_data_file is not None:
+            self.temporary_data_file.close()
 
         return tuple()
 
@@ -127,3 +264,16 @@ class GeolocationMixin(GeolocationDownstreamMixin):
             code = UNKNOWN_CODE
 
         return code
+
+    def get_countries(self, ip_addresses, debug_message=None):
+        """
+        Find the country name and code for each of a sequence of IP addresses.
+
+        Returns a list of (country name, country code) tuples, in the same order as the addresses. Either value is
+        UNKNOWN_COUNTRY or UNKNOWN_CODE if it cannot be determined.
+
+        """
+        return [
+            (self.get_country_name(ip_address, debug_message), self.get_country_code(ip_address, debug_message))
+            for ip_address in ip_addresses
+        ]
@@ -24,12 +24,27 @@ def decode_id(encoded_id):
 
 
 class PermutationGenerator(object):
-    """Class to calculate reversible 1-1 mapping using a permutation matrix."""
+    """
+    Class to calculate reversible 1-1 mapping using a permutation matrix.
+
+    Rather than multiplying a vector of bits by the matrix, ids are permuted using lookup tables that map each possible
+    value of each byte of an id to the bits that byte contributes to the permuted id.  The result is the same.
+    """
 
     def __init__(self, seed, matrix_dim, bits):
+        if matrix_dim != bits:
+            raise ValueError("Permutation matrix dimension {} does not match {} bits".format(matrix_dim, bits))
         self.bits = bits
         self.permutation_matrix = self.random_permutation_matrix(seed, matrix_dim)
 
+        # Row i of the matrix has a single 1, in the column that bit i of the vector is moved to.
+        mapping = [int(column) for column in self.permutation_matrix.argmax(axis=1)]
+        inverse_mapping = [0] * matrix_dim
+        for source, destination in enumerate(mapping):
+            inverse_mapping[destination] = source
+        self.permute_tables = self.byte_lookup_tables(mapping)
+        self.unpermute_tables = self.byte_lookup_tables(inverse_mapping)
+
     def int_to_binvec(self, int_value):
         """Convert int_value, which must be less than 2**bits, to an np vector of bits 0/1 bits."""
         if int_value < 0 or int_value >= 2 ** self.bits:
@@ -55,17 +70,65 @@ class PermutationGenerator(object):
             permutation[i, mapping[i]] = 1
         return permutation
 
+    def byte_lookup_tables(self, mapping):
+        """
+        Return a list of tables, one per byte of an id starting with the least significant one.
+
+        Each table has 256 entries, the bits of the permuted value contributed by each value of the byte.  The mapping
+        gives the destination of each bit, where bit 0 is the most significant, as in the vectors of bits.
+        """
+        # The bit of the permuted value that each bit of the id is moved to, indexed by the weight of the bit.
+        destination_masks = [1 << (self.bits - 1 - mapping[self.bits - 1 - weight]) for weight in range(self.bits)]
+
+        tables = []
+        for first_weight in range(0, self.bits, 8):
+            table = [0] * 256
+            for byte_value in range(1, 256):
+                lowest_bit = byte_value & -byte_value
+                weight = first_weight + lowest_bit.bit_length() - 1
+                lowest_bit_mask = destination_masks[weight] if weight < self.bits else 0
+                table[byte_value] = table[byte_value & (byte_value - 1)] | lowest_bit_mask
+            tables.append(table)
+        return tables
+
+    def _apply_tables(self, tables, int_value):
+        """Given int `int_value`, combine the permuted bits of each of its bytes."""
+        if int_value < 0 or int_value >= 2 ** self.bits:
+            raise ValueError("{} out of range [0, 2**{}]".format(int_value, self.bits))
+
+        result = 0
+        for table in tables:
+            result |= table[int_value & 0xff]
+            int_value >>= 8
+        return result
+
+    def _apply_tables_to_array(self, tables, int_values):
+        """Given a sequence of ints, return an np array of the values with the bits of each of their bytes combined."""
+        int_values = np.asarray(int_values, dtype=np.int64)
+        if int_values.size and (int_values.min() < 0 or int_values.max() >= 2 ** self.bits):
+            raise ValueError("Values out of range [0, 2**{}]".format(self.bits))
+
+        result = np.zeros(int_values.shape, dtype=np.int64)
+        for byte_index, table in enumerate(tables):
+            byte_values = (int_values >> (8 * byte_index)) & 0xff
+            result |= np.array(table, dtype=np.int64)[byte_values]
+        return result
+
     def permute(self, int_value):
         """Given int `int_value` with bits `bits`, permute it using the specified bits-by-bits permutation."""
-        vec = self.int_to_binvec(int_value)
-        permuted = vec.dot(self.permutation_matrix)
-        return self.binvec_to_int(permuted)
+        return self._apply_tables(self.permute_tables, int_value)
 
     def unpermute(self, int_value):
         """Given int `int_value` with bits `bits`, unpermute it using the specified bits-by-bits permutation."""
-        vec = self.int_to_binvec(int_value)
-        permuted = vec.dot(self.permutation_matrix.T)
-        return self.binvec_to_int(permuted)
+        return self._apply_tables(self.unpermute_tables, int_value)
+
+    def permute_array(self, int_values):
+        """Given a sequence of ints with bits `bits`, return an np array of the permuted values."""
+        return self._apply_tables_to_array(self.permute_tables, int_values)
+
+    def unpermute_array(self, int_values):
+        """Given a sequence of ints with bits `bits`, return an np array of the unpermuted values."""
+        return self._apply_tables_to_array(self.unpermute_tables, int_values)
 
 
 class UserIdRemapperMixin(object):
@@ -87,6 +150,10 @@ class UserIdRemapperMixin(object):
         "Returns a reversible mapping of input id."
         return self.permutation_generator.permute(int(id_value))
 
+    def remap_ids(self, id_values):
+        "Returns an np array of the reversible mappings of a sequence of input ids."
+        return self.permutation_generator.permute_array(id_values)
+
     def generate_obfuscated_username_from_user_id(self, user_id):
         """Returns a username to use in obfuscation, based on remapped user_id."""
         return "username_{0}".format(self.remap_id(user_id))
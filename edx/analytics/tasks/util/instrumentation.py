@@ -0,0 +1,335 @@
+"""
+Record how much time and resources luigi tasks use, as lines of JSON.
+
+When enabled, the time each task spends in complete() and requires() while it is scheduled is recorded, as well as the
+wall and CPU time, peak memory usage, bytes read and written through targets, Hadoop counters and database connections
+opened and reused by each task that is run.  Every measurement is appended to a file as a JSON object on its own line,
+which can be read by the analyze-log tool using its --instrumentation option.
+
+launch-task enables this when the WORKFLOW_INSTRUMENTATION_PATH environment variable names the file to write.
+
+Each line has the following fields, in addition to those specific to the type of event:
+
+    event: "complete", "requires" or "run".
+    task_id: the id of the task that was measured.
+    task_family: the name of the class of the task.
+    timestamp: the time the measurement started, in seconds since the epoch.
+    duration: the number of seconds measured.
+    pid: the id of the process that made the measurement.
+"""
+
+import json
+import logging
+import os
+import re
+import resource
+import time
+
+import luigi
+import luigi.worker
+
+from edx.analytics.tasks.util import connection_pool
+from edx.analytics.tasks.util.url import URL_SCHEME_TO_MARKER_TARGET_CLASS, URL_SCHEME_TO_TARGET_CLASS
+
+log = logging.getLogger(__name__)
+
+# Lines written to stderr by the Hadoop client have a log4j prefix like "16/05/02 18:48:13 INFO mapreduce.Job: ".
+LOG4J_PREFIX_PATTERN = re.compile(r'^\d{2}/\d{2}/\d{2} \d{2}:\d{2}:\d{2} \w+ [\w.$]+:\s*')
+HADOOP_COUNTER_PATTERN = re.compile(r'^(?P<name>[^=]+?)=(?P<value>-?\d+)$')
+
+# The active TaskInstrumentation, if any.
+_instrumentation = None  # pylint: disable=invalid-name
+
+
+def enable(output_path):
+    """Start recording measurements of all tasks to the file at `output_path`."""
+    global _instrumentation  # pylint: disable=global-statement,invalid-name
+    if _instrumentation is not None:
+        disable()
+    _instrumentation = TaskInstrumentation(output_path)
+    _instrumentation.install()
+    return _instrumentation
+
+
+def disable():
+    """Stop recording measurements."""
+    global _instrumentation  # pylint: disable=global-statement,invalid-name
+    if _instrumentation is not None:
+        _instrumentation.uninstall()
+        _instrumentation = None
+
+
+def _timed_check_complete(task, out_queue):
+    """
+    Replacement for luigi.worker.check_complete() that measures the time spent in complete().
+
+    This is a module-level function so that it can be pickled when luigi checks tasks using a pool of processes.
+    """
+    instrumentation = _instrumentation
+    start_time = time.time()
+    try:
+        instrumentation.original_check_complete(task, out_queue)
+    finally:
+        instrumentation.write_event('complete', task, start_time, time.time() - start_time)
+
+
+def _timed_deps(task):
+    """Replacement for luigi.Task.deps() that measures the time spent in requires()."""
+    instrumentation = _instrumentation
+    start_time = time.time()
+    dependencies = instrumentation.original_deps(task)
+    instrumentation.write_event(
+        'requires', task, start_time, time.time() - start_time, num_dependencies=len(dependencies)
+    )
+    return dependencies
+
+
+def _get_cpu_times():
+    """Returns the CPU time used by this process and by its children that have exited."""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    child_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (usage.ru_utime + usage.ru_stime, child_usage.ru_utime + child_usage.ru_stime)
+
+
+class TaskInstrumentation(object):
+    """Hooks into luigi to measure tasks and writes the measurements to a file."""
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.original_check_complete = None
+        self.original_deps = None
+        self.original_open_methods = {}
+        self.counter_parser = HadoopCounterParser()
+        self.log_handler = HadoopCounterLogHandler(self)
+
+        # Measurements of the task that is running in this process.
+        self.running_task = None
+        self.run_start_time = None
+        self.run_start_cpu_times = None
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.run_start_pool_metrics = {}
+
+    def install(self):
+        """Register the event handlers and replace the luigi functions that are timed."""
+        luigi.Task.event_handler(luigi.Event.START)(self.on_start)
+        luigi.Task.event_handler(luigi.Event.SUCCESS)(self.on_success)
+        luigi.Task.event_handler(luigi.Event.FAILURE)(self.on_failure)
+
+        self.original_check_complete = luigi.worker.check_complete
+        luigi.worker.check_complete = _timed_check_complete
+        self.original_deps = luigi.Task.__dict__['deps']
+        luigi.Task.deps = _timed_deps
+
+        target_classes = set(URL_SCHEME_TO_TARGET_CLASS.values()) | set(URL_SCHEME_TO_MARKER_TARGET_CLASS.values())
+        for target_class in target_classes:
+            if 'open' in target_class.__dict__:
+                self.original_open_methods[target_class] = target_class.__dict__['open']
+                target_class.open = self.create_counting_open(target_class.__dict__['open'])
+
+        logging.getLogger('luigi-interface').addHandler(self.log_handler)
+
+    def uninstall(self):
+        """Restore luigi to the way it was before install() was called."""
+        callbacks = luigi.Task._event_callbacks.get(luigi.Task, {})  # pylint: disable=protected-access
+        for event, callback in ((luigi.Event.START, self.on_start), (luigi.Event.SUCCESS, self.on_success),
+                                (luigi.Event.FAILURE, self.on_failure)):
+            callbacks.get(event, set()).discard(callback)
+
+        luigi.worker.check_complete = self.original_check_complete
+        luigi.Task.deps = self.original_deps
+        for target_class, original_open in self.original_open_methods.iteritems():
+            target_class.open = original_open
+        self.original_open_methods = {}
+
+        logging.getLogger('luigi-interface').removeHandler(self.log_handler)
+
+    def create_counting_open(self, original_open):
+        """Returns a version of a target's open() method that counts the bytes read from and written to the file."""
+        instrumentation = self
+
+        def counting_open(target, mode='r'):
+            """Open the target, wrapping the file to count the bytes read and written."""
+            file_object = original_open(target, mode)
+            if isinstance(file_object, CountingFile):
+                # Subclasses call the open() method of their parent class, which has already been wrapped.
+                return file_object
+            return CountingFile(file_object, instrumentation)
+
+        return counting_open
+
+    def on_start(self, task):
+        """Start measuring a task as it starts to run."""
+        self.running_task = task
+        self.run_start_time = time.time()
+        self.run_start_cpu_times = _get_cpu_times()
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.run_start_pool_metrics = connection_pool.get_metrics()
+        self.counter_parser.reset()
+
+    def on_success(self, task):
+        """Record the measurements of a task that has run successfully."""
+        self.record_run(task, 'success')
+
+    def on_failure(self, task, _exception):
+        """Record the measurements of a task that failed."""
+        self.record_run(task, 'failure')
+
+    def record_run(self, task, status):
+        """Write the measurements of the task that just ran."""
+        if self.running_task is not task:
+            return
+
+        cpu_seconds, child_cpu_seconds = _get_cpu_times()
+        start_cpu_seconds, start_child_cpu_seconds = self.run_start_cpu_times
+        self.write_event(
+            'run',
+            task,
+            self.run_start_time,
+            time.time() - self.run_start_time,
+            status=status,
+            cpu_seconds=cpu_seconds - start_cpu_seconds,
+            child_cpu_seconds=child_cpu_seconds - start_child_cpu_seconds,
+            peak_rss_kb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            bytes_read=self.bytes_read,
+            bytes_written=self.bytes_written,
+            hadoop_counters=self.counter_parser.counters,
+            connection_pools=self.get_pool_metrics_since_start(),
+        )
+        self.running_task = None
+
+    def get_pool_metrics_since_start(self):
+        """Returns the connections reused and opened by each connection pool since the running task started."""
+        pool_metrics = {}
+        for name, metrics in connection_pool.get_metrics().iteritems():
+            start_metrics = self.run_start_pool_metrics.get(name, {})
+            pool_metrics[name] = {key: value - start_metrics.get(key, 0) for key, value in metrics.iteritems()}
+        return pool_metrics
+
+    def write_event(self, event, task, start_time, duration, **fields):
+        """Append a measurement to the output file."""
+        record = {
+            'event': event,
+            'task_id': task.task_id,
+            'task_family': task.task_family,
+            'timestamp': start_time,
+            'duration': duration,
+            'pid': os.getpid(),
+        }
+        record.update(fields)
+        try:
+            # Each line is written in a single call to a file opened for appending, so that lines written by several
+            # worker processes are not interleaved.
+            with open(self.output_path, 'a') as output_file:
+                output_file.write(json.dumps(record) + '\n')
+        except IOError:
+            log.exception('Unable to write instrumentation to %s', self.output_path)
+
+
+class CountingFile(object):
+    """Wraps a file object, counting the bytes read from and written to it."""
+
+    def __init__(self, file_object, instrumentation):
+        self.file_object = file_object
+        self.instrumentation = instrumentation
+
+    def read(self, *args):
+        data = self.file_object.read(*args)
+        self.instrumentation.bytes_read += len(data)
+        return data
+
+    def readline(self, *args):
+        line = self.file_object.readline(*args)
+        self.instrumentation.bytes_read += len(line)
+        return line
+
+    def readlines(self, *args):
+        lines = self.file_object.readlines(*args)
+        self.instrumentation.bytes_read += sum(len(line) for line in lines)
+        return lines
+
+    def __iter__(self):
+        for line in self.file_object:
+            self.instrumentation.bytes_read += len(line)
+            yield line
+
+    def write(self, data):
+        self.instrumentation.bytes_written += len(data)
+        return self.file_object.write(data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def __enter__(self):
+        if hasattr(self.file_object, '__enter__'):
+            self.file_object.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        if hasattr(self.file_object, '__exit__'):
+            return self.file_object.__exit__(*exc_info)
+        self.file_object.close()
+        return False
+
+    def __getattr__(self, name):
+        return getattr(self.file_object, name)
+
+
+class HadoopCounterParser(object):
+    """
+    Extracts the counters from the output of the Hadoop client.
+
+    The client prints a line like "Counters: 49" when a job completes, followed by the name of each group of counters
+    and a "name=value" line for each counter in the group.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.in_counters = False
+        self.group = None
+
+    def reset(self):
+        """Forget the counters of any earlier job."""
+        self.counters = {}
+        self.in_counters = False
+        self.group = None
+
+    def parse_line(self, line):
+        """Parse a single line of output."""
+        content = LOG4J_PREFIX_PATTERN.sub('', line.strip(), count=1)
+        if content.startswith('Counters: '):
+            self.in_counters = True
+            self.group = None
+            return
+
+        if not self.in_counters:
+            return
+
+        counter_match = HADOOP_COUNTER_PATTERN.match(content)
+        if counter_match:
+            if self.group is not None:
+                name = counter_match.group('name').strip()
+                group_counters = self.counters.setdefault(self.group, {})
+                group_counters[name] = group_counters.get(name, 0) + int(counter_match.group('value'))
+        elif content and ':' not in content:
+            self.group = content
+        else:
+            self.in_counters = False
+
+
+class HadoopCounterLogHandler(logging.Handler):
+    """Passes the output of the Hadoop client that luigi logs to the parser of the running task's counters."""
+
+    def __init__(self, instrumentation):
+        super(HadoopCounterLogHandler, self).__init__()
+        self.instrumentation = instrumentation
+
+    def emit(self, record):
+        if self.instrumentation.running_task is None:
+            return
+        try:
+            self.instrumentation.counter_parser.parse_line(record.getMessage())
+        except Exception:  # pylint: disable=broad-except
+            pass
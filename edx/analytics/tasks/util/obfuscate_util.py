@@ -264,10 +264,18 @@ INTL_PHONE_PATTERN = r'\+(?:\d[\- ]?){6,14}\d'
 PHONE_PATTERN = r'((?:' + US_PHONE_PATTERN + r'|' + INTL_PHONE_PATTERN + r'))\b'
 COMPILED_PHONE_PATTERN = re.compile(PHONE_PATTERN, re.VERBOSE)
 
+# Every match of PHONE_PATTERN contains a match of this much simpler pattern: either the start of an international
+# number, or the 7-digit part of a US number.
+PHONE_PREFILTER_PATTERN = re.compile(r'\+\d|\d{3}\s*[\- ]\s*\d{4}')
+
 
 def find_phone_numbers(text, log_context=DEFAULT_LOG_CONTEXT):
     """Replaces substrings in text that look like phone numbers."""
-    return find_all_matches(COMPILED_PHONE_PATTERN, text, "PHONE_NUMBER", log_context)
+    # Optimization: the full pattern is expensive to search for, and most text contains nothing like a phone number.
+    if PHONE_PREFILTER_PATTERN.search(text):
+        return find_all_matches(COMPILED_PHONE_PATTERN, text, "PHONE_NUMBER", log_context)
+    else:
+        return text
 
 
 #####################
@@ -292,18 +300,57 @@ def find_emails(text, log_context=DEFAULT_LOG_CONTEXT):
         return text
 
 
+#####################
+# Per-user patterns
+#####################
+
+# The same users' values are searched for in every string of a record, and often in many records, so the patterns
+# built from them are compiled once and kept.  The cache is simply emptied when it fills up.
+USER_PATTERN_CACHE_SIZE = 10000
+_USER_PATTERNS = {}
+
+
+def _get_user_pattern(kind, value, build_pattern):
+    """Returns the compiled pattern of the given kind for a user's value, building it only if it isn't cached."""
+    key = (kind, value)
+    try:
+        return _USER_PATTERNS[key]
+    except KeyError:
+        pattern = build_pattern(value)
+        if len(_USER_PATTERNS) >= USER_PATTERN_CACHE_SIZE:
+            _USER_PATTERNS.clear()
+        _USER_PATTERNS[key] = pattern
+        return pattern
+
+
 #####################
 # username
 #####################
 
 
-def find_username(text, username, log_context=DEFAULT_LOG_CONTEXT):
-    """Replaces the provided username value as it appears in text."""
-    username_pattern = re.compile(
+def build_username_pattern(username):
+    """Returns a compiled pattern matching the provided username value."""
+    return re.compile(
         r'\b({})\b'.format(re.escape(username)),
         re.IGNORECASE,
     )
-    return find_all_matches(username_pattern, text, "USERNAME", log_context)
+
+
+def get_username_pattern(username):
+    """Returns a compiled pattern matching the provided username value, reusing it across calls."""
+    return _get_user_pattern('username', username, build_username_pattern)
+
+
+def find_username(text, username, log_context=DEFAULT_LOG_CONTEXT):
+    """Replaces the provided username value as it appears in text."""
+    # Optimization: the username can only match, ignoring case, if the text contains it.
+    try:
+        if username.lower() not in text.lower():
+            return text
+    except UnicodeDecodeError:
+        # A non-ASCII str cannot be compared with unicode, so leave it to the pattern to decide.
+        pass
+    return find_all_matches(get_username_pattern(username), text, "USERNAME", log_context)
 
 
 #####################
@@ -311,13 +358,25 @@ def find_username(text, username, log_context=DEFAULT_LOG_CONTEXT):
 #####################
 
 
-def find_userid(text, user_id, log_context=DEFAULT_LOG_CONTEXT):
-    """Replaces the provided user_id value as it appears in text."""
-    userid_pattern = re.compile(
+def build_userid_pattern(user_id):
+    """Returns a compiled pattern matching the provided user_id value."""
+    return re.compile(
         r'\b({})\b'.format(user_id),
         re.IGNORECASE,
     )
-    return find_all_matches(userid_pattern, text, "USER_ID", log_context)
+
+
+def get_userid_pattern(user_id):
+    """Returns a compiled pattern matching the provided user_id value, reusing it across calls."""
+    return _get_user_pattern('userid', user_id, build_userid_pattern)
+
+
+def find_userid(text, user_id, log_context=DEFAULT_LOG_CONTEXT):
+    """Replaces the provided user_id value as it appears in text."""
+    # Optimization: an integer user_id can only match if the text contains its digits.
+    if isinstance(user_id, (int, long)) and str(user_id) not in text:
+        return text
+    return find_all_matches(get_userid_pattern(user_id), text, "USER_ID", log_context)
 
 
 #####################
@@ -339,11 +398,11 @@ REJECTED_NAMES = set()
 STOPWORDS = ['the', 'and', 'can']
 
 
-def find_user_fullname(text, fullname, log_context=DEFAULT_LOG_CONTEXT):
-    """Culls 'fullnames' originally from auth_userprofile.name and replaces them in text."""
+def build_fullname_pattern(fullname):
+    """Returns a compiled pattern matching a fullname or its parts, or None if the fullname cannot be handled."""
 
     if fullname in REJECTED_NAMES:
-        return text
+        return None
 
     # Indian names use special abbreviations for "son of"/"daughter of".
     # For the purposes of finding matches, just strip these out.
@@ -362,7 +421,7 @@ def find_user_fullname(text, fullname, log_context=DEFAULT_LOG_CONTEXT):
     if not LEGAL_NAME_PATTERN.match(fullname2):
         log.error(u"Fullname '%r' contains unexpected characters.", fullname)
         REJECTED_NAMES.add(fullname)
-        return text
+        return None
 
     # Strip parentheses and commas and the like, and escape the characters that are
     # legal in names but may have different meanings in regexps (i.e. apostrophe and period).
@@ -383,7 +442,7 @@ def find_user_fullname(text, fullname, log_context=DEFAULT_LOG_CONTEXT):
     if len(names) == 0:
         log.error(u"Fullname '%r' contains only whitespace characters.", fullname)
         REJECTED_NAMES.add(fullname)
-        return text
+        return None
 
     patterns = []
     # add the whole, then add each individual part if it's long enough.
@@ -394,10 +453,24 @@ def find_user_fullname(text, fullname, log_context=DEFAULT_LOG_CONTEXT):
 
     # Because we're operating with unicode instead of raw strings, make sure that
     # the slashes are escaped.
-    fullname_pattern = re.compile(
+    return re.compile(
         u'\\b({})\\b'.format(u"|".join(patterns)),
         re.IGNORECASE + re.UNICODE,
     )
+
+
+def get_fullname_pattern(fullname):
+    """Returns a compiled pattern matching a fullname, reusing it across calls, or None if it was rejected."""
+    if fullname in REJECTED_NAMES:
+        return None
+    return _get_user_pattern('fullname', fullname, build_fullname_pattern)
+
+
+def find_user_fullname(text, fullname, log_context=DEFAULT_LOG_CONTEXT):
+    """Culls 'fullnames' originally from auth_userprofile.name and replaces them in text."""
+    fullname_pattern = get_fullname_pattern(fullname)
+    if fullname_pattern is None:
+        return text
     return find_all_matches(fullname_pattern, text, "FULLNAME", log_context)
 
 
@@ -4,9 +4,19 @@ from collections import OrderedDict
 import re
 import datetime
 import itertools
+from operator import attrgetter
 
 
 DEFAULT_NULL_VALUE = '\\N'  # This is the default string used by Hive to represent a NULL value.
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+# The source of the __init__ method of the classes generated by Record.get_fast_class().
+FAST_INIT_TEMPLATE = """
+def __init__({arguments}):
+    {validation}
+    {assignments}
+    _set_initialized(_self, True)
+"""
 
 
 class Record(object):
@@ -141,16 +151,8 @@ class Record(object):
             value (object): The value to assign to the field.
 
         """
-        field_obj = self.get_fields()[field_name]
-        validation_errors = field_obj.validate(value)
-        if len(validation_errors) > 0:
-            raise ValueError('Unable to assign the value {value} to the field named "{name}": {errors}'.format(
-                value=repr(value),
-                name=field_name,
-                errors=', '.join(validation_errors)
-            ))
-        else:
-            setattr(self, field_name, value)
+        validate_field_value(field_name, self.get_fields()[field_name], value)
+        setattr(self, field_name, value)
 
     def __setattr__(self, key, value):
         if hasattr(self, '_initialized'):
@@ -245,18 +247,12 @@ class Record(object):
             string_encoder : The string encoder to encode the record fields with.
 
         """
-        if string_encoder is None:
-            string_encoder = HiveTsvEncoder()
-
-        field_values = []
-        for field_name, field_obj in self.get_fields().items():
-            val = getattr(self, field_name)
-            if val is not None:
-                val = field_obj.serialize_to_string(val)
+        value_encoders = self.get_value_encoders(string_encoder)
+        return tuple([encode(value) for encode, value in itertools.izip(value_encoders, self.get_values())])
 
-            field_values.append(string_encoder.encode(val, field_obj))
-
-        return tuple(field_values)
+    def get_values(self):
+        """Returns a tuple of the values of the fields in order of declaration."""
+        return self.get_values_getter()(self)
 
     def to_ordered_dict(self):
         """
@@ -297,22 +293,11 @@ class Record(object):
             string_decoder : The string encoder to decode the strings with.
 
         """
-        if string_decoder is None:
-            string_decoder = HiveTsvEncoder()
-
-        fields = cls.get_fields()
-        if len(string_tuple) != len(fields):
+        value_decoders = cls.get_value_decoders(string_decoder)
+        if len(string_tuple) != len(value_decoders):
             raise ValueError('The length of the tuple of strings must exactly match the number of fields in the Record')
-        typed_field_values = []
-        for str_value, field_name in zip(string_tuple, fields):
-            field_obj = fields[field_name]
-            value = string_decoder.decode(str_value, field_obj)
-            if value is not None:
-                value = field_obj.deserialize_from_string(value)
 
-            typed_field_values.append(value)
-
-        return cls(*typed_field_values)
+        return cls(*[decode(str_value) for decode, str_value in itertools.izip(value_decoders, string_tuple)])
 
     @classmethod
     def from_tsv(cls, tsv_str):
@@ -324,6 +309,135 @@ class Record(object):
         """
         return cls.from_string_tuple(tuple(tsv_str.rstrip('\r\n').split('\t')))
 
+    @classmethod
+    def to_string_tuples(cls, records, string_encoder=None):
+        """
+        Convert a batch of records into tuples of UTF-8 encoded byte strings.
+
+        Equivalent to calling to_string_tuple() on each record, but the work that doesn't depend on the values is only
+        done once for the whole batch.
+
+        Arguments:
+            records (iterable): Records of this class, or of a class with the same fields.
+            string_encoder : The string encoder to encode the record fields with.
+
+        Yields: A tuple of strings for each record.
+        """
+        value_encoders = cls.get_value_encoders(string_encoder)
+        get_values = cls.get_values_getter()
+        izip = itertools.izip
+        for record in records:
+            yield tuple([encode(value) for encode, value in izip(value_encoders, get_values(record))])
+
+    @classmethod
+    def to_separated_values_lines(cls, records, sep=u'\t', string_encoder=None):
+        """
+        Convert a batch of records into strings with fields delimited by `sep`, see to_string_tuples().
+
+        Yields: A UTF8 string representation of each record.
+        """
+        utf8sep = sep.encode('utf-8')
+        for string_tuple in cls.to_string_tuples(records, string_encoder=string_encoder):
+            yield utf8sep.join(string_tuple)
+
+    @classmethod
+    def from_tsv_lines(cls, tsv_lines, string_decoder=None):
+        """
+        Construct a record from each of a batch of tab-separated strings.
+
+        Equivalent to calling from_tsv() on each string, but the work that doesn't depend on the values is only done
+        once for the whole batch.
+
+        Yields: A record for each string.
+        """
+        value_decoders = cls.get_value_decoders(string_decoder)
+        num_fields = len(value_decoders)
+        izip = itertools.izip
+        for tsv_str in tsv_lines:
+            string_tuple = tsv_str.rstrip('\r\n').split('\t')
+            if len(string_tuple) != num_fields:
+                raise ValueError(
+                    'The length of the tuple of strings must exactly match the number of fields in the Record'
+                )
+            yield cls(*[decode(str_value) for decode, str_value in izip(value_decoders, string_tuple)])
+
+    @classmethod
+    def get_values_getter(cls):
+        """Returns a function that returns a tuple of the values of the fields of a record, in order of declaration."""
+        class_private_var_name = '_{0}__values_getter'.format(cls.__name__)
+        values_getter = getattr(cls, class_private_var_name, None)
+        if values_getter is None:
+            field_names = cls.get_fields().keys()
+            if len(field_names) > 1:
+                values_getter = attrgetter(*field_names)
+            else:
+                # attrgetter() only returns a tuple when it is given more than one attribute.
+                values_getter = lambda record: tuple(getattr(record, field_name) for field_name in field_names)
+            setattr(cls, class_private_var_name, staticmethod(values_getter))
+            values_getter = getattr(cls, class_private_var_name)
+
+        return values_getter
+
+    @classmethod
+    def get_value_encoders(cls, string_encoder=None):
+        """
+        Returns a list of functions, one per field, that convert a value of the field into an encoded string.
+
+        The functions for the default string encoder are only built once per class.
+        """
+        if string_encoder is not None:
+            return [get_value_encoder(field_obj, string_encoder) for field_obj in cls.get_fields().itervalues()]
+
+        class_private_var_name = '_{0}__default_value_encoders'.format(cls.__name__)
+        value_encoders = getattr(cls, class_private_var_name, None)
+        if value_encoders is None:
+            value_encoders = cls.get_value_encoders(HiveTsvEncoder())
+            setattr(cls, class_private_var_name, value_encoders)
+        return value_encoders
+
+    @classmethod
+    def get_value_decoders(cls, string_decoder=None):
+        """
+        Returns a list of functions, one per field, that convert an encoded string into a value of the field.
+
+        The functions for the default string decoder are only built once per class.
+        """
+        if string_decoder is not None:
+            return [get_value_decoder(field_obj, string_decoder) for field_obj in cls.get_fields().itervalues()]
+
+        class_private_var_name = '_{0}__default_value_decoders'.format(cls.__name__)
+        value_decoders = getattr(cls, class_private_var_name, None)
+        if value_decoders is None:
+            value_decoders = cls.get_value_decoders(HiveTsvEncoder())
+            setattr(cls, class_private_var_name, value_decoders)
+        return value_decoders
+
+    @classmethod
+    def get_fast_class(cls, validate=True):
+        """
+        Returns a subclass of this record that is much cheaper to construct.
+
+        The subclass stores the values of the fields in __slots__ and has an __init__ method that is generated for
+        its fields, so that arguments are mapped to fields by the interpreter and assigned directly. Positional and
+        keyword arguments are accepted just like they are by this class, only the messages of the errors raised for
+        invalid arguments differ. Instances are equal to the equivalent instances of this class.
+
+        Arguments:
+            validate (bool): If False, values are not validated by the fields. Only use this for values that are known
+                to conform to the schema, for example values that were produced by trusted code or that were read from
+                data written by a record of the same class.
+        """
+        class_private_var_name = '_{0}__fast_classes'.format(cls.__name__)
+        fast_classes = getattr(cls, class_private_var_name, None)
+        if fast_classes is None:
+            fast_classes = {}
+            setattr(cls, class_private_var_name, fast_classes)
+
+        fast_class = fast_classes.get(validate)
+        if fast_class is None:
+            fast_class = fast_classes[validate] = create_fast_record_class(cls, validate)
+        return fast_class
+
     @classmethod
     def get_sql_schema(cls):
         """
@@ -406,6 +520,124 @@ class Record(object):
         return '\n'.join(field_doc)
 
 
+def validate_field_value(field_name, field_obj, value):
+    """Raise a ValueError if the value cannot be assigned to the field."""
+    validation_errors = field_obj.validate(value)
+    if len(validation_errors) > 0:
+        raise ValueError('Unable to assign the value {value} to the field named "{name}": {errors}'.format(
+            value=repr(value),
+            name=field_name,
+            errors=', '.join(validation_errors)
+        ))
+
+
+def create_fast_record_class(record_class, validate):
+    """Generate the class returned by Record.get_fast_class()."""
+    fields = record_class.get_fields()
+    field_names = fields.keys()
+
+    fast_class = type(record_class.__name__, (record_class,), {
+        '__slots__': tuple(field_names) + ('_initialized',),
+        '__module__': record_class.__module__,
+        '__reduce__': lambda self: (create_fast_record, (record_class, validate, self.get_values())),
+        # Share the fields of the record class, the slots hide them from get_fields().
+        '_{0}__fields'.format(record_class.__name__): fields,
+    })
+
+    namespace = {
+        '_set_initialized': fast_class.__dict__['_initialized'].__set__,
+    }
+    assignments = []
+    for index, field_name in enumerate(field_names):
+        namespace['_set_{0}'.format(index)] = fast_class.__dict__[field_name].__set__
+        assignments.append('_set_{0}(_self, {1})'.format(index, field_name))
+
+    validation = 'pass'
+    if validate and field_names:
+        field_items = fields.items()
+
+        def validate_values(values):
+            """Raise a ValueError if any of the values cannot be assigned to its field."""
+            for (field_name, field_obj), value in itertools.izip(field_items, values):
+                validate_field_value(field_name, field_obj, value)
+
+        namespace['_validate'] = validate_values
+        validation = '_validate(({0},))'.format(', '.join(field_names))
+
+    if record_class.set_missing_fields_to_none:
+        arguments = ['{0}=None'.format(field_name) for field_name in field_names]
+    else:
+        arguments = list(field_names)
+
+    source = FAST_INIT_TEMPLATE.format(
+        arguments=', '.join(['_self'] + arguments),
+        validation=validation,
+        assignments='\n    '.join(assignments),
+    )
+    exec source in namespace  # pylint: disable=exec-used
+    fast_class.__init__ = namespace['__init__']
+
+    return fast_class
+
+
+def create_fast_record(record_class, validate, values):
+    """Construct an instance of a fast record class, this is used to unpickle them."""
+    return record_class.get_fast_class(validate)(*values)
+
+
+def get_value_encoder(field_obj, string_encoder):
+    """Returns a function that serializes a value of the field and encodes it using the string encoder."""
+    serialize = field_obj.serialize_to_string
+
+    if type(string_encoder) is HiveTsvEncoder:  # pylint: disable=unidiomatic-typecheck
+        # Inline the encoder, a subclass may have overridden its behavior.
+        null_value = string_encoder.null_value
+        if string_encoder.normalize_whitespace or getattr(field_obj, 'normalize_whitespace', False):
+            def encode_normalized(value):
+                """Serialize, normalize whitespace and encode the value."""
+                if value is None:
+                    return null_value
+                return WHITESPACE_PATTERN.sub(' ', serialize(value)).encode('utf8')
+            return encode_normalized
+
+        def encode_value(value):
+            """Serialize and encode the value."""
+            if value is None:
+                return null_value
+            return serialize(value).encode('utf8')
+        return encode_value
+
+    def encode(value):
+        """Serialize the value and encode it using the string encoder."""
+        if value is not None:
+            value = serialize(value)
+        return string_encoder.encode(value, field_obj)
+    return encode
+
+
+def get_value_decoder(field_obj, string_decoder):
+    """Returns a function that decodes a string using the string decoder and deserializes it into a value."""
+    deserialize = field_obj.deserialize_from_string
+
+    if type(string_decoder) is HiveTsvEncoder:  # pylint: disable=unidiomatic-typecheck
+        null_value = string_decoder.null_value
+
+        def decode_value(encoded_string):
+            """Decode and deserialize the string."""
+            if encoded_string == null_value:
+                return None
+            return deserialize(encoded_string.decode('utf8'))
+        return decode_value
+
+    def decode(encoded_string):
+        """Decode the string using the string decoder and deserialize it."""
+        value = string_decoder.decode(encoded_string, field_obj)
+        if value is not None:
+            value = deserialize(value)
+        return value
+    return decode
+
+
 class SparseRecord(Record):
     """
     Represents a Record that can be initialized with a subset of values being defined.
@@ -551,6 +783,9 @@ class StringField(Field):  # pylint: disable=abstract-method
         if self.truncate and len(value) > self.length:
             value = value[:self.length]
 
+        if isinstance(value, unicode):
+            return value
+
         try:
             return unicode(value, encoding=getattr(self, 'encoding', 'utf8'))
         except TypeError:
@@ -211,6 +211,18 @@ class ScalableS3Client(S3Client):
             # indexing of parts is one-based.
             yield chunk_index + 1, chunk_byte_offset, num_bytes
 
+    def copy_file(self, source_path, destination_path):
+        """
+        Copy a single object from one S3 path to another, within S3.
+
+        Like put(), this gets a reference to the destination bucket without validating that it exists, which would
+        require permission to list the keys in the bucket.
+        """
+        (src_bucket, src_key) = self._path_to_bucket_and_key(source_path)
+        (dst_bucket, dst_key) = self._path_to_bucket_and_key(destination_path)
+        s3_bucket = self.s3.get_bucket(dst_bucket, validate=False)
+        s3_bucket.copy_key(dst_key, src_bucket, src_key, headers={'x-amz-acl': DEFAULT_KEY_ACCESS_POLICY})
+
 
 class S3HdfsTarget(HdfsTarget):
     """HDFS target that supports writing and reading files directly in S3."""
@@ -0,0 +1,57 @@
+"""
+Tests for the compact encoding of map output.
+"""
+from unittest import TestCase
+
+from ddt import ddt, data
+
+from edx.analytics.tasks.util.compact_encoding import encode_map_output, decode_map_output
+
+
+@ddt
+class CompactEncodingTest(TestCase):
+    """Test that map output is decoded to exactly what was encoded."""
+
+    @data(
+        ('key', 'value'),
+        (('course-v1:edX+DemoX+Demo_Course', 'user'), 1),
+        ('key', ('2013-12-17T15:38:32.805444', u'play_video', 12.5, None, 'youtube_id')),
+        (u'\u00e9', (u'\ufffd', u'\u00e9'.encode('utf8'))),
+        ('tab\tand\nnewline\r', 'back\\slash and \x1f separator'),
+        (True, (False, 0, -12, 2 ** 70, 0.1)),
+        ((), ('',)),
+        ('key', [1, 2, 3]),
+        ('key', ({'a': 1}, [u'x'], (1, 'nested'))),
+        (('course-v1:edX+DemoX+Demo_Course', 'user'), ('course-v1:edX+DemoX+Demo_Course', 'user', 'user')),
+    )
+    def test_round_trip(self, output):
+        line = encode_map_output(output)
+        self.assertNotIn('\n', line)
+        self.assertEquals(line.count('\t'), len(output) - 1)
+
+        decoded = decode_map_output(line)
+        self.assertEquals(decoded, list(output))
+        for original_field, decoded_field in zip(output, decoded):
+            if isinstance(original_field, tuple):
+                self.assertEquals([type(e) for e in original_field], [type(e) for e in decoded_field])
+            else:
+                self.assertEquals(type(original_field), type(decoded_field))
+
+    def test_repeated_strings(self):
+        course_id = 'course-v1:edX+DemoX+Demo_Course'
+        line = encode_map_output(((course_id, 'username'), (course_id, 'username', u'username')))
+        self.assertEquals(line.count(course_id), 1)
+        self.assertEquals(line.count('username'), 2)
+
+    def test_key_does_not_depend_on_value(self):
+        course_id = 'course-v1:edX+DemoX+Demo_Course'
+        line = encode_map_output((course_id, course_id))
+        other_line = encode_map_output((course_id, 'other'))
+        self.assertEquals(line.split('\t')[0], other_line.split('\t')[0])
+
+    def test_smaller_than_repr(self):
+        output = (
+            ('course-v1:edX+DemoX+Demo_Course', 'username'),
+            ('2013-12-17T15:38:32.805444', 'course-v1:edX+DemoX+Demo_Course', 1.5)
+        )
+        self.assertLess(len(encode_map_output(output)), len('\t'.join(repr(field) for field in output)))
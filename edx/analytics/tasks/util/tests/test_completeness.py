@@ -0,0 +1,239 @@
+"""Tests of checking whether tasks are complete in batches."""
+
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import luigi
+import luigi.worker
+from boto.s3.key import Key
+from boto.s3.prefix import Prefix
+from luigi.worker import TracebackWrapper
+from mock import MagicMock, patch
+
+from edx.analytics.tasks.util.completeness import (
+    BatchCompletenessWorkerSchedulerFactory, CompletenessChecker, get_existence_outputs
+)
+from edx.analytics.tasks.util.overwrite import OverwriteOutputMixin
+from edx.analytics.tasks.util.s3_util import S3HdfsTarget
+
+
+class FakeMarkerTarget(luigi.Target):
+    """A target recorded in a fake marker table."""
+
+    queries = []
+
+    def __init__(self, table, update_id, existing_update_ids):
+        self.table = table
+        self.update_id = update_id
+        self.existing_update_ids = existing_update_ids
+
+    def marker_table_location(self):
+        return (self.table,)
+
+    def get_existing_update_ids(self, update_ids):
+        self.queries.append(list(update_ids))
+        return set(update_ids) & self.existing_update_ids
+
+    def exists(self):
+        raise AssertionError('exists() should not be called on a marker target')
+
+
+class OutputTask(luigi.Task):
+    """A task whose completeness is determined by its outputs."""
+
+    name = luigi.Parameter()
+    targets = luigi.Parameter(significant=False)
+
+    def output(self):
+        return self.targets
+
+
+class OverwriteOutputTask(OverwriteOutputMixin, OutputTask):
+    """A task that can overwrite its outputs."""
+    pass
+
+
+class CustomCompleteTask(luigi.Task):
+    """A task that implements complete() itself."""
+
+    is_complete = luigi.BooleanParameter()
+
+    def complete(self):
+        return self.is_complete
+
+
+class BrokenCompleteTask(luigi.Task):
+    """A task whose complete() method raises an exception."""
+
+    def complete(self):
+        raise RuntimeError('unable to check')
+
+
+class CompletenessCheckerTest(TestCase):
+    """Test checking the completeness of tasks in batches."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        FakeMarkerTarget.queries = []
+
+        self.bucket = MagicMock()
+        patcher = patch('edx.analytics.tasks.util.completeness.ScalableS3Client')
+        client_class = patcher.start()
+        self.addCleanup(patcher.stop)
+        client_class.return_value.s3.get_bucket.return_value = self.bucket
+
+    def create_local_target(self, name, exists=True):
+        """Returns a target for a local file, creating the file if it should exist."""
+        path = os.path.join(self.temp_dir, name)
+        if exists:
+            with open(path, 'w') as output_file:
+                output_file.write('data')
+        return luigi.LocalTarget(path)
+
+    def set_bucket_listing(self, key_names, prefix_names):
+        """Set the keys and prefixes returned by listing the mock bucket."""
+        items = []
+        for key_name in key_names:
+            items.append(Key(name=key_name))
+        for prefix_name in prefix_names:
+            prefix = Prefix()
+            prefix.name = prefix_name
+            items.append(prefix)
+        self.bucket.list.return_value = items
+
+    def test_existence_outputs(self):
+        target = self.create_local_target('a')
+        self.assertEquals(get_existence_outputs(OutputTask(name='a', targets=[target])), [target])
+        self.assertIsNone(get_existence_outputs(OutputTask(name='none', targets=[])))
+        self.assertIsNone(get_existence_outputs(CustomCompleteTask(is_complete=True)))
+
+    def test_overwrite_outputs(self):
+        target = self.create_local_target('a')
+        task = OverwriteOutputTask(name='a', targets=[target], overwrite=True)
+        self.assertIsNone(get_existence_outputs(task))
+        self.assertEquals(CompletenessChecker().check_tasks([task]), {task.task_id: False})
+
+        task.attempted_removal = True
+        self.assertEquals(get_existence_outputs(task), [target])
+        self.assertEquals(CompletenessChecker().check_tasks([task]), {task.task_id: True})
+
+    def test_local_and_custom_tasks(self):
+        tasks = [
+            OutputTask(name='present', targets=[self.create_local_target('a'), self.create_local_target('b')]),
+            OutputTask(name='partial', targets=[self.create_local_target('c'), self.create_local_target('d', False)]),
+            CustomCompleteTask(is_complete=True),
+            CustomCompleteTask(is_complete=False),
+        ]
+        results = CompletenessChecker(num_threads=2).check_tasks(tasks)
+        self.assertEquals(
+            results,
+            {tasks[0].task_id: True, tasks[1].task_id: False, tasks[2].task_id: True, tasks[3].task_id: False}
+        )
+
+    def test_s3_targets_share_listing(self):
+        self.set_bucket_listing(
+            ['output/file', 'output/empty_$folder$', 'output/other'],
+            ['output/directory/']
+        )
+        tasks = [
+            OutputTask(name='file', targets=[S3HdfsTarget('s3://bucket/output/file')]),
+            OutputTask(name='directory', targets=[S3HdfsTarget('s3://bucket/output/directory/')]),
+            OutputTask(name='empty', targets=[S3HdfsTarget('s3://bucket/output/empty')]),
+            OutputTask(name='missing', targets=[S3HdfsTarget('s3://bucket/output/missing')]),
+        ]
+        results = CompletenessChecker().check_tasks(tasks)
+        self.assertEquals([results[task.task_id] for task in tasks], [True, True, True, False])
+        self.bucket.list.assert_called_once_with(prefix='output/', delimiter='/')
+
+    def test_single_s3_target_not_listed(self):
+        target = S3HdfsTarget('s3://bucket/output/file')
+        task = OutputTask(name='file', targets=[target])
+        with patch.object(S3HdfsTarget, 'exists', return_value=True) as mock_exists:
+            self.assertEquals(CompletenessChecker().check_tasks([task]), {task.task_id: True})
+        self.assertTrue(mock_exists.called)
+        self.assertFalse(self.bucket.list.called)
+
+    def test_marker_targets_share_query(self):
+        existing = set(['a', 'c'])
+        tasks = [
+            OutputTask(name=update_id, targets=[FakeMarkerTarget('marker', update_id, existing)])
+            for update_id in ('a', 'b', 'c')
+        ]
+        other_table_task = OutputTask(name='d', targets=[FakeMarkerTarget('other', 'd', existing)])
+        results = CompletenessChecker().check_tasks(tasks + [other_table_task])
+        self.assertEquals([results[task.task_id] for task in tasks], [True, False, True])
+        self.assertFalse(results[other_table_task.task_id])
+        self.assertItemsEqual([sorted(query) for query in FakeMarkerTarget.queries], [['a', 'b', 'c'], ['d']])
+
+    def test_errors(self):
+        self.bucket.list.side_effect = RuntimeError('listing failed')
+        s3_tasks = [
+            OutputTask(name=name, targets=[S3HdfsTarget('s3://bucket/output/' + name)]) for name in ('a', 'b')
+        ]
+        broken_task = BrokenCompleteTask()
+        results = CompletenessChecker().check_tasks(s3_tasks + [broken_task])
+        for task in s3_tasks:
+            self.assertIsInstance(results[task.task_id], TracebackWrapper)
+            self.assertIn('listing failed', results[task.task_id].trace)
+        self.assertIsInstance(results[broken_task.task_id], TracebackWrapper)
+        self.assertIn('unable to check', results[broken_task.task_id].trace)
+
+
+class WriteFileTask(luigi.Task):
+    """A task that writes a file after the file written by its upstream task."""
+
+    output_root = luigi.Parameter()
+    index = luigi.IntParameter()
+
+    def requires(self):
+        if self.index > 0:
+            return [WriteFileTask(output_root=self.output_root, index=self.index - 1)]
+        return []
+
+    def output(self):
+        return luigi.LocalTarget(os.path.join(self.output_root, str(self.index)))
+
+    def run(self):
+        with self.output().open('w') as output_file:
+            output_file.write(str(self.index))
+
+
+class BatchCompletenessWorkerTest(TestCase):
+    """Test scheduling workflows with a worker that checks completeness in batches."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+
+        # luigi.build() would otherwise configure logging to write edx_analytics.log into the working directory.
+        patcher = patch('luigi.interface.setup_interface_logging')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_build(self):
+        with open(os.path.join(self.temp_dir, '0'), 'w') as output_file:
+            output_file.write('existing')
+
+        with patch.object(luigi.worker, 'check_complete', wraps=luigi.worker.check_complete) as mock_check_complete:
+            luigi.build(
+                [WriteFileTask(output_root=self.temp_dir, index=3)],
+                local_scheduler=True,
+                worker_scheduler_factory=BatchCompletenessWorkerSchedulerFactory(num_threads=2)
+            )
+
+        self.assertFalse(mock_check_complete.called)
+        for index in range(1, 4):
+            with open(os.path.join(self.temp_dir, str(index)), 'r') as input_file:
+                self.assertEquals(input_file.read(), str(index))
+        with open(os.path.join(self.temp_dir, '0'), 'r') as input_file:
+            self.assertEquals(input_file.read(), 'existing')
+
+    def test_broken_complete(self):
+        factory = BatchCompletenessWorkerSchedulerFactory()
+        worker = factory.create_worker(factory.create_local_scheduler(), 1)
+        self.addCleanup(worker.stop)
+        self.assertFalse(worker.add(BrokenCompleteTask()))
+        self.assertTrue(worker.add(WriteFileTask(output_root=self.temp_dir, index=1)))
@@ -0,0 +1,154 @@
+"""Tests of reusing database connections."""
+
+from unittest import TestCase
+
+from mock import MagicMock, patch
+
+from edx.analytics.tasks.common.mysql_load import MYSQL_CONNECTION_POOL, CredentialFileMysqlTarget
+from edx.analytics.tasks.util import connection_pool
+from edx.analytics.tasks.util.connection_pool import ConnectionPool
+from edx.analytics.tasks.util.tests.config import with_luigi_config
+from edx.analytics.tasks.util.tests.target import FakeTarget
+
+
+class FakeConnectionPool(ConnectionPool):
+    """A pool of mock connections."""
+
+    def is_healthy(self, connection):
+        return connection.healthy
+
+    def reset(self, connection):
+        connection.rollback()
+
+
+def create_connection():
+    """Returns a new mock connection."""
+    connection = MagicMock()
+    connection.healthy = True
+    return connection
+
+
+class ConnectionPoolTest(TestCase):
+    """Test checking connections out of a pool and back into it."""
+
+    def setUp(self):
+        self.pool = FakeConnectionPool('fake')
+        self.addCleanup(connection_pool._pools.pop, 'fake')  # pylint: disable=protected-access
+
+    @with_luigi_config('database-connection-pool', 'enabled', 'false')
+    def test_disabled(self):
+        first = self.pool.connect('key', create_connection)
+        first.close()
+        second = self.pool.connect('key', create_connection)
+        self.assertIsNot(first, second)
+        self.assertTrue(first.close.called)
+        self.assertEquals(self.pool.get_metrics(), {'hits': 0, 'misses': 0, 'discarded': 0})
+
+    @with_luigi_config('database-connection-pool', 'enabled', 'true')
+    def test_reuse(self):
+        first = self.pool.connect('key', create_connection)
+        first.cursor().execute('SELECT 1')
+        underlying = first._connection  # pylint: disable=protected-access
+        first.close()
+        first.close()
+
+        self.assertTrue(underlying.rollback.called)
+        self.assertFalse(underlying.close.called)
+        with self.assertRaises(AttributeError):
+            first.cursor()
+
+        second = self.pool.connect('key', create_connection, autocommit=True)
+        self.assertIs(second._connection, underlying)  # pylint: disable=protected-access
+        self.assertTrue(underlying.autocommit)
+
+        other = self.pool.connect('other key', create_connection)
+        self.assertIsNot(other._connection, underlying)  # pylint: disable=protected-access
+        self.assertEquals(self.pool.get_metrics(), {'hits': 1, 'misses': 2, 'discarded': 0})
+        self.assertEquals(connection_pool.get_metrics()['fake'], self.pool.get_metrics())
+
+    @with_luigi_config('database-connection-pool', 'enabled', 'true')
+    def test_unhealthy_connection(self):
+        first = self.pool.connect('key', create_connection)
+        underlying = first._connection  # pylint: disable=protected-access
+        first.close()
+        underlying.healthy = False
+
+        second = self.pool.connect('key', create_connection)
+        self.assertIsNot(second._connection, underlying)  # pylint: disable=protected-access
+        self.assertTrue(underlying.close.called)
+        self.assertEquals(self.pool.get_metrics(), {'hits': 0, 'misses': 2, 'discarded': 1})
+
+    @with_luigi_config('database-connection-pool', 'enabled', 'true')
+    def test_failed_reset(self):
+        first = self.pool.connect('key', create_connection)
+        underlying = first._connection  # pylint: disable=protected-access
+        underlying.rollback.side_effect = RuntimeError('connection lost')
+        first.close()
+
+        self.assertTrue(underlying.close.called)
+        second = self.pool.connect('key', create_connection)
+        self.assertIsNot(second._connection, underlying)  # pylint: disable=protected-access
+
+    @with_luigi_config(
+        ('database-connection-pool', 'enabled', 'true'),
+        ('database-connection-pool', 'max_idle_connections', '1'),
+    )
+    def test_max_idle_connections(self):
+        first = self.pool.connect('key', create_connection)
+        second = self.pool.connect('key', create_connection)
+        second_underlying = second._connection  # pylint: disable=protected-access
+        first.close()
+        second.close()
+        self.assertTrue(second_underlying.close.called)
+
+    @with_luigi_config(
+        ('database-connection-pool', 'enabled', 'true'),
+        ('database-connection-pool', 'max_idle_seconds', '-1'),
+    )
+    def test_idle_timeout(self):
+        first = self.pool.connect('key', create_connection)
+        underlying = first._connection  # pylint: disable=protected-access
+        first.close()
+        second = self.pool.connect('key', create_connection)
+        self.assertIsNot(second._connection, underlying)  # pylint: disable=protected-access
+        self.assertTrue(underlying.close.called)
+
+    @with_luigi_config('database-connection-pool', 'enabled', 'true')
+    def test_forked_process(self):
+        first = self.pool.connect('key', create_connection)
+        underlying = first._connection  # pylint: disable=protected-access
+        first.close()
+
+        with patch('edx.analytics.tasks.util.connection_pool.os.getpid', return_value=-1):
+            second = self.pool.connect('key', create_connection)
+        self.assertIsNot(second._connection, underlying)  # pylint: disable=protected-access
+        self.assertFalse(underlying.close.called)
+
+
+class MysqlConnectionPoolTest(TestCase):
+    """Test reusing connections to MySQL."""
+
+    def setUp(self):
+        patcher = patch('edx.analytics.tasks.common.mysql_load.mysql.connector')
+        self.mock_mysql_connector = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_mysql_connector.connect.side_effect = lambda **kwargs: MagicMock()
+        self.addCleanup(MYSQL_CONNECTION_POOL.clear)
+
+    def create_target(self, database='db', update_id='update'):
+        """Returns a marker target for a table in `database`."""
+        credentials = FakeTarget(value='{"host": "db.example.com", "port": 3306, "username": "u", "password": "p"}')
+        return CredentialFileMysqlTarget(credentials, database, 'table', update_id)
+
+    @with_luigi_config('database-connection-pool', 'enabled', 'true')
+    def test_marker_targets_share_connection(self):
+        self.create_target(update_id='a').exists()
+        self.create_target(update_id='b').exists()
+        self.create_target(database='other').exists()
+
+        self.assertEquals(self.mock_mysql_connector.connect.call_count, 2)
+        connection = MYSQL_CONNECTION_POOL.connect(
+            ('db.example.com', 3306, 'u', 'p', 'db', False), create_connection
+        )
+        self.assertTrue(connection.reset_session.called)
+        self.assertFalse(connection._connection.close.called)  # pylint: disable=protected-access
@@ -1,11 +1,13 @@
 """Tests of utilities to encrypt files."""
 
+import gzip
+import StringIO
 import tempfile
 from unittest import TestCase
 
 import gnupg
 
-from edx.analytics.tasks.util.encrypt import make_encrypted_file, _import_key_files
+from edx.analytics.tasks.util.encrypt import make_encrypted_file, make_pipelined_encrypted_file, _import_key_files
 from edx.analytics.tasks.util.tempdir import make_temp_directory
 from edx.analytics.tasks.util.url import get_target_from_url, url_path_join
 
@@ -55,3 +57,51 @@ class MakeEncryptedFileTest(TestCase):
 
             output_file.seek(0)
             self.check_encrypted_data(output_file, values)
+
+
+class MakePipelinedEncryptedFileTest(MakeEncryptedFileTest):
+    """Test make_pipelined_encrypted_file context manager."""
+
+    def write_values(self, values, **kwargs):
+        """Write values using the pipeline and return the output file, positioned at the start."""
+        output_file = tempfile.NamedTemporaryFile()
+        with make_pipelined_encrypted_file(output_file, self.key_file_targets, **kwargs) as encrypted_output_file:
+            for value in values:
+                encrypted_output_file.write(value)
+                encrypted_output_file.write('\n')
+        output_file.flush()
+        output_file.seek(0)
+        return output_file
+
+    def test_make_pipelined_encrypted_file(self):
+        values = ['this', 'is', 'a', 'test']
+        with self.write_values(values, recipients=[self.recipient]) as output_file:
+            self.check_encrypted_data(output_file, values)
+
+    def test_with_implied_recipients(self):
+        values = ['this', 'is', 'a', 'test']
+        with self.write_values(values) as output_file:
+            self.check_encrypted_data(output_file, values)
+
+    def test_compressed_output_spanning_many_chunks(self):
+        values = ['line {0} of the test'.format(i) * 20 for i in range(10000)]
+        progress = []
+        with self.write_values(values, compress=True, progress=progress.append, max_buffered_chunks=2) as output_file:
+            key_file_target = get_target_from_url(url_path_join(self.gpg_key_dir, self.recipient_private_key))
+            decrypted_data = self.get_decrypted_data(output_file, key_file_target)
+            output_file.seek(0, 2)
+            self.assertEquals(sum(progress), output_file.tell())
+
+        uncompressed = gzip.GzipFile(fileobj=StringIO.StringIO(decrypted_data.data)).read()
+        self.assertEquals(uncompressed.strip().split('\n'), values)
+
+    def test_unknown_recipient(self):
+        with self.assertRaises(IOError):
+            self.write_values(['this', 'is', 'a', 'test'], recipients=['unknown@example.com'])
+
+    def test_exception_while_writing(self):
+        with tempfile.NamedTemporaryFile() as output_file:
+            with self.assertRaisesRegexp(RuntimeError, 'failed'):
+                with make_pipelined_encrypted_file(output_file, self.key_file_targets) as encrypted_output_file:
+                    encrypted_output_file.write('partial output')
+                    raise RuntimeError('failed')
@@ -190,3 +190,43 @@ class GetCourseIdTest(TestCase):
             'event_source': 'server'
         }
         self.assertIsNone(eventlog.get_course_id(event))
+
+
+class LinePrefilterTest(TestCase):
+    """Verify the checks that are made on lines before they are decoded."""
+
+    def test_time_within_interval(self):
+        line = '{"event_type": "play_video", "time": "2013-12-17T15:38:32.805444+00:00"}'
+        self.assertTrue(eventlog.line_may_be_within_interval(line, '2013-12-17', '2013-12-18'))
+
+    def test_time_outside_interval(self):
+        line = '{"event_type": "play_video", "time": "2013-12-18T15:38:32.805444+00:00"}'
+        self.assertFalse(eventlog.line_may_be_within_interval(line, '2013-12-17', '2013-12-18'))
+
+    def test_time_without_spaces(self):
+        line = '{"event_type":"play_video","time":"2013-12-16T15:38:32.805444+00:00"}'
+        self.assertFalse(eventlog.line_may_be_within_interval(line, '2013-12-17', '2013-12-18'))
+
+    def test_missing_time(self):
+        line = '{"event_type": "play_video"}'
+        self.assertTrue(eventlog.line_may_be_within_interval(line, '2013-12-17', '2013-12-18'))
+
+    def test_nested_time_within_interval(self):
+        line = '{"event": {"time": "2013-12-17T01:00:00"}, "time": "2013-12-18T15:38:32.805444+00:00"}'
+        self.assertTrue(eventlog.line_may_be_within_interval(line, '2013-12-17', '2013-12-18'))
+
+    def test_event_type_included(self):
+        line = '{"event_type": "play_video", "time": "2013-12-17T15:38:32.805444+00:00"}'
+        self.assertTrue(eventlog.line_may_have_event_type(line, frozenset(['play_video', 'pause_video'])))
+
+    def test_event_type_excluded(self):
+        line = '{"event_type": "page_close", "time": "2013-12-17T15:38:32.805444+00:00"}'
+        self.assertFalse(eventlog.line_may_have_event_type(line, frozenset(['play_video', 'pause_video'])))
+
+    def test_missing_event_type(self):
+        line = '{"time": "2013-12-17T15:38:32.805444+00:00"}'
+        self.assertTrue(eventlog.line_may_have_event_type(line, frozenset(['play_video'])))
+
+    def test_escaped_event_type(self):
+        line = '{"event_type": "play\\u005fvideo", "time": "2013-12-17T15:38:32.805444+00:00"}'
+        self.assertTrue(eventlog.line_may_have_event_type(line, frozenset(['play_video'])))
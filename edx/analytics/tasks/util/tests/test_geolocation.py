@@ -1,15 +1,21 @@
 """
 Tests and test object for geolocation tests.
 """
+import struct
+import tempfile
 from unittest import TestCase
 
-from mock import Mock
+from mock import Mock, patch
+import pygeoip
 
 from edx.analytics.tasks.util.geolocation import (
     UNKNOWN_COUNTRY,
     UNKNOWN_CODE,
+    CountryRangeIndex,
     GeolocationMixin,
+    LruCache,
 )
+from edx.analytics.tasks.util.tests.target import FakeTarget
 
 
 class FakeGeoLocation(object):
@@ -83,3 +89,132 @@ class TestGeolocationTaskTestCase(TestCase):
         self.task.geoip.country_code_by_addr = Mock(return_value="  ")
         code = self.task.get_country_code(FakeGeoLocation.ip_address_1)
         self.assertEquals(code, UNKNOWN_CODE)
+
+    def test_countries(self):
+        self.assertEquals(
+            self.task.get_countries([FakeGeoLocation.ip_address_1, 'unknown', FakeGeoLocation.ip_address_2]),
+            [
+                (FakeGeoLocation.country_name_1, FakeGeoLocation.country_code_1),
+                (UNKNOWN_COUNTRY, UNKNOWN_CODE),
+                (FakeGeoLocation.country_name_2, FakeGeoLocation.country_code_2),
+            ]
+        )
+
+
+def create_country_database(tree):
+    """
+    Returns the contents of a legacy GeoIP country database.
+
+    The tree is a nested pair of (lower half, upper half) of the address space, the leaves are country IDs.
+    """
+    nodes = []
+
+    def add_node(subtree):
+        """Appends the node for a subtree and returns its record."""
+        if not isinstance(subtree, tuple):
+            return pygeoip.const.COUNTRY_BEGIN + subtree
+        index = len(nodes)
+        nodes.append(None)
+        nodes[index] = (add_node(subtree[0]), add_node(subtree[1]))
+        return index
+
+    add_node(tree)
+    return ''.join(
+        struct.pack('<I', left)[:3] + struct.pack('<I', right)[:3] for left, right in nodes
+    )
+
+
+class CountryRangeIndexTestCase(TestCase):
+    """Test the in-memory index of a GeoIP database."""
+
+    # 0.0.0.0/1 is US, both halves of 128.0.0.0/2 are FR, 192.0.0.0/3 is unknown and 224.0.0.0/3 is CA.
+    TREE = (225, ((75, 75), (0, 38)))
+
+    def setUp(self):
+        self.data = create_country_database(self.TREE)
+        self.index = CountryRangeIndex(self.data, cache_size=2)
+
+    def test_merged_ranges(self):
+        self.assertEquals(list(self.index.range_starts), [0, 128 << 24, 192 << 24, 224 << 24])
+        self.assertEquals(list(self.index.country_ids), [225, 75, 0, 38])
+
+    def test_matches_pygeoip(self):
+        with tempfile.NamedTemporaryFile() as database_file:
+            database_file.write(self.data)
+            database_file.flush()
+            geoip = pygeoip.GeoIP(database_file.name, pygeoip.STANDARD, cache=False)
+            for ip_address in ('0.0.0.0', '1.2.3.4', '127.255.255.255', '128.0.0.0', '160.1.1.1', '191.255.255.255',
+                               '192.0.0.0', '200.1.2.3', '224.0.0.0', '255.255.255.255'):
+                self.assertEquals(self.index.country_code_by_addr(ip_address), geoip.country_code_by_addr(ip_address))
+                self.assertEquals(self.index.country_name_by_addr(ip_address), geoip.country_name_by_addr(ip_address))
+
+    def test_cached_lookup(self):
+        self.assertEquals(self.index.country_code_by_addr('1.2.3.4'), 'US')
+        self.index.range_starts = None
+        self.assertEquals(self.index.country_code_by_addr('1.2.3.4'), 'US')
+
+    def test_invalid_address(self):
+        with self.assertRaises(Exception):
+            self.index.country_code_by_addr('2001:db8::1')
+
+    def test_unsupported_edition(self):
+        data = self.data + '\xff\xff\xff' + chr(pygeoip.const.CITY_EDITION_REV1)
+        with self.assertRaisesRegexp(ValueError, 'Unsupported GeoIP database edition'):
+            CountryRangeIndex(data)
+
+    def test_truncated_database(self):
+        with self.assertRaisesRegexp(ValueError, 'Corrupt GeoIP database'):
+            CountryRangeIndex(self.data[:-6])
+
+
+class LruCacheTestCase(TestCase):
+    """Test the bounded cache of lookup results."""
+
+    def test_least_recently_used_discarded(self):
+        cache = LruCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEquals(cache.get('a'), 1)
+        cache.put('c', 3)
+        self.assertEquals(len(cache), 2)
+        self.assertIsNone(cache.get('b'))
+        self.assertEquals(cache.get('a'), 1)
+        self.assertEquals(cache.get('c'), 3)
+
+
+class ReducerTask(object):
+    """Stands in for the job task that GeolocationMixin is combined with."""
+
+    def init_reducer(self):
+        """Nothing to initialize."""
+        pass
+
+
+class GeolocationReducerTask(GeolocationMixin, ReducerTask):
+    """A task that initializes geolocation data in its reducers."""
+    pass
+
+
+class GeolocationReducerInitTestCase(TestCase):
+    """Test loading the geolocation data in a reducer."""
+
+    def setUp(self):
+        self.task = GeolocationReducerTask()
+        self.task.geolocation_cache_size = 10
+
+    def init_reducer(self, data):
+        """Initializes the reducer with the given geolocation data."""
+        with patch.object(self.task, 'geolocation_data_target', return_value=FakeTarget(value=data)):
+            self.task.init_reducer()
+        self.addCleanup(self.task.final_reducer)
+
+    def test_country_database(self):
+        self.init_reducer(create_country_database((225, 38)))
+        self.assertIsInstance(self.task.geoip, CountryRangeIndex)
+        self.assertEquals(self.task.get_country_code('200.1.2.3'), 'CA')
+        self.assertEquals(self.task.get_country_name('2001:db8::1'), UNKNOWN_COUNTRY)
+
+    def test_unsupported_database(self):
+        data = create_country_database((225, 38)) + '\xff\xff\xff' + chr(pygeoip.const.COUNTRY_EDITION_V6)
+        self.init_reducer(data)
+        self.assertIsInstance(self.task.geoip, pygeoip.GeoIP)
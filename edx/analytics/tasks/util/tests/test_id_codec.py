@@ -1,9 +1,11 @@
 """
 Tests for encoding/decoding id values.
 """
+import random
 from unittest import TestCase
 
 from ddt import ddt, data
+import numpy as np
 
 import edx.analytics.tasks.util.id_codec as id_codec
 
@@ -28,6 +30,7 @@ class EncodeDecodeIdTest(TestCase):
         self.assertEquals((SCOPE + suffix, TYPE + suffix, VALUE + suffix), decoded)
 
 
+@ddt
 class PermutationGeneratorTest(TestCase):
     """Test that PermutationGenerator works correctly."""
 
@@ -40,3 +43,50 @@ class PermutationGeneratorTest(TestCase):
 
         unpermuted = permutation_generator.unpermute(permuted)
         self.assertEquals(unpermuted, id_value)
+
+    @data(0, 42, 1234567)
+    def test_matches_permutation_matrix(self, seed):
+        permutation_generator = id_codec.PermutationGenerator(seed, 32, 32)
+        matrix = permutation_generator.permutation_matrix
+        rng = random.Random(seed)
+        id_values = [0, 1, 255, 256, 2 ** 31, 2 ** 32 - 1] + [rng.randrange(2 ** 32) for _ in range(200)]
+        for id_value in id_values:
+            vec = permutation_generator.int_to_binvec(id_value)
+            self.assertEquals(
+                permutation_generator.permute(id_value),
+                permutation_generator.binvec_to_int(vec.dot(matrix))
+            )
+            self.assertEquals(
+                permutation_generator.unpermute(id_value),
+                permutation_generator.binvec_to_int(vec.dot(matrix.T))
+            )
+
+    def test_bits_not_multiple_of_byte(self):
+        permutation_generator = id_codec.PermutationGenerator(42, 12, 12)
+        matrix = permutation_generator.permutation_matrix
+        for id_value in range(2 ** 12):
+            vec = permutation_generator.int_to_binvec(id_value)
+            self.assertEquals(
+                permutation_generator.permute(id_value),
+                permutation_generator.binvec_to_int(vec.dot(matrix))
+            )
+
+    def test_permute_array(self):
+        permutation_generator = id_codec.PermutationGenerator(42, 32, 32)
+        id_values = [123456, 0, 2 ** 32 - 1, 7]
+        permuted = permutation_generator.permute_array(id_values)
+        self.assertEquals(permuted.tolist(), [permutation_generator.permute(id_value) for id_value in id_values])
+        self.assertEquals(permutation_generator.unpermute_array(permuted).tolist(), id_values)
+        self.assertEquals(permutation_generator.permute_array(np.array([], dtype=np.int64)).tolist(), [])
+
+    @data(-1, 2 ** 32)
+    def test_out_of_range(self, id_value):
+        permutation_generator = id_codec.PermutationGenerator(42, 32, 32)
+        with self.assertRaises(ValueError):
+            permutation_generator.permute(id_value)
+        with self.assertRaises(ValueError):
+            permutation_generator.permute_array([1, id_value])
+
+    def test_mismatched_dimensions(self):
+        with self.assertRaises(ValueError):
+            id_codec.PermutationGenerator(42, 16, 32)
@@ -0,0 +1,201 @@
+"""Tests of the instrumentation of luigi tasks."""
+
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import luigi
+import luigi.worker
+from mock import patch
+
+from edx.analytics.tasks.tools.analyze.main import analyze_instrumentation
+from edx.analytics.tasks.util import instrumentation
+from edx.analytics.tasks.util.url import get_target_from_url
+
+
+class UpstreamTask(luigi.Task):
+    """A task that writes a file."""
+
+    output_root = luigi.Parameter()
+
+    def output(self):
+        return get_target_from_url(os.path.join(self.output_root, 'upstream.txt'))
+
+    def run(self):
+        with self.output().open('w') as output_file:
+            output_file.write('0123456789')
+
+
+class DownstreamTask(luigi.Task):
+    """A task that copies the file written by UpstreamTask."""
+
+    output_root = luigi.Parameter()
+
+    def requires(self):
+        return UpstreamTask(output_root=self.output_root)
+
+    def output(self):
+        return get_target_from_url(os.path.join(self.output_root, 'downstream.txt'))
+
+    def run(self):
+        with self.input().open('r') as input_file:
+            data = input_file.read()
+        with self.output().open('w') as output_file:
+            output_file.write(data * 2)
+
+
+class FailingTask(luigi.Task):
+    """A task that fails."""
+
+    def run(self):
+        raise RuntimeError('failed')
+
+
+class TaskInstrumentationTest(TestCase):
+    """Test recording the measurements of tasks."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+
+        # luigi.build() would otherwise configure logging to write edx_analytics.log into the working directory.
+        patcher = patch('luigi.interface.setup_interface_logging')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.output_path = os.path.join(self.temp_dir, 'instrumentation.jsonl')
+        instrumentation.enable(self.output_path)
+        self.addCleanup(instrumentation.disable)
+
+    def read_events(self):
+        """Returns the events written so far."""
+        with open(self.output_path, 'r') as output_file:
+            return [json.loads(line) for line in output_file]
+
+    def test_task_measurements(self):
+        downstream = DownstreamTask(output_root=self.temp_dir)
+        upstream = downstream.requires()
+        luigi.build([downstream], local_scheduler=True)
+
+        events = self.read_events()
+        self.assertItemsEqual(
+            [(event['event'], event['task_id']) for event in events],
+            [
+                ('complete', downstream.task_id),
+                ('requires', downstream.task_id),
+                ('complete', upstream.task_id),
+                ('requires', upstream.task_id),
+                ('requires', upstream.task_id),
+                ('run', upstream.task_id),
+                ('requires', downstream.task_id),
+                ('run', downstream.task_id),
+            ]
+        )
+        runs = {event['task_id']: event for event in events if event['event'] == 'run'}
+        self.assertEquals(runs[upstream.task_id]['bytes_written'], 10)
+        self.assertEquals(runs[upstream.task_id]['bytes_read'], 0)
+        self.assertEquals(runs[downstream.task_id]['bytes_read'], 10)
+        self.assertEquals(runs[downstream.task_id]['bytes_written'], 20)
+        for event in runs.itervalues():
+            self.assertEquals(event['status'], 'success')
+            self.assertEquals(event['task_family'], event['task_id'].split('(')[0])
+            self.assertGreaterEqual(event['duration'], 0)
+            self.assertGreaterEqual(event['cpu_seconds'], 0)
+            self.assertGreater(event['peak_rss_kb'], 0)
+            self.assertEquals(event['hadoop_counters'], {})
+
+        with open(os.path.join(self.temp_dir, 'downstream.txt'), 'r') as output_file:
+            self.assertEquals(output_file.read(), '0123456789' * 2)
+
+    def test_failed_task(self):
+        luigi.build([FailingTask()], local_scheduler=True)
+        runs = [event for event in self.read_events() if event['event'] == 'run']
+        self.assertEquals(len(runs), 1)
+        self.assertEquals(runs[0]['status'], 'failure')
+
+    def test_disable(self):
+        instrumentation.disable()
+        self.assertEquals(luigi.worker.check_complete.__module__, 'luigi.worker')
+        event_callbacks = luigi.Task._event_callbacks.get(luigi.Task, {})  # pylint: disable=protected-access
+        self.assertFalse(any(
+            'instrumentation' in callback.__module__
+            for callbacks in event_callbacks.itervalues()
+            for callback in callbacks
+        ))
+
+        luigi.build([UpstreamTask(output_root=self.temp_dir)], local_scheduler=True)
+        self.assertFalse(os.path.exists(self.output_path))
+        with get_target_from_url(os.path.join(self.temp_dir, 'upstream.txt')).open('r') as input_file:
+            self.assertNotIsInstance(input_file, instrumentation.CountingFile)
+
+    def test_analyze_instrumentation(self):
+        downstream = DownstreamTask(output_root=self.temp_dir)
+        luigi.build([downstream], local_scheduler=True)
+
+        root = analyze_instrumentation(self.read_events())
+        scheduling, execution = root.children
+        self.assertEquals(
+            [child.description for child in scheduling.children],
+            ['Scheduling DownstreamTask', 'Scheduling UpstreamTask']
+        )
+        self.assertEquals(
+            [child.description for child in execution.children],
+            ['Executing UpstreamTask', 'Executing DownstreamTask']
+        )
+
+
+class HadoopCounterParserTest(TestCase):
+    """Test extracting counters from the output of the Hadoop client."""
+
+    def parse(self, lines):
+        """Returns the counters parsed from the lines."""
+        parser = instrumentation.HadoopCounterParser()
+        for line in lines:
+            parser.parse_line(line)
+        return parser.counters
+
+    def test_hadoop_2_counters(self):
+        counters = self.parse([
+            '16/05/02 18:48:13 INFO mapreduce.Job:  map 100% reduce 100%',
+            '16/05/02 18:48:14 INFO mapreduce.Job: Counters: 49',
+            'File System Counters',
+            'FILE: Number of bytes read=1234',
+            'HDFS: Number of bytes written=5678',
+            'Map-Reduce Framework',
+            'Map input records=10',
+            'Event Export',
+            'Raw Bytes Written=999',
+            '16/05/02 18:48:14 INFO streaming.StreamJob: Output directory: /tmp/output',
+            'Ignored=1',
+        ])
+        self.assertEquals(counters, {
+            'File System Counters': {
+                'FILE: Number of bytes read': 1234,
+                'HDFS: Number of bytes written': 5678,
+            },
+            'Map-Reduce Framework': {'Map input records': 10},
+            'Event Export': {'Raw Bytes Written': 999},
+        })
+
+    def test_hadoop_1_counters(self):
+        counters = self.parse([
+            '13/02/01 10:00:00 INFO mapred.JobClient: Counters: 29',
+            '13/02/01 10:00:00 INFO mapred.JobClient:   Job Counters ',
+            '13/02/01 10:00:00 INFO mapred.JobClient:     Launched reduce tasks=1',
+            '13/02/01 10:00:00 INFO mapred.JobClient:   Map-Reduce Framework',
+            '13/02/01 10:00:00 INFO mapred.JobClient:     Map input records=10',
+        ])
+        self.assertEquals(counters, {
+            'Job Counters': {'Launched reduce tasks': 1},
+            'Map-Reduce Framework': {'Map input records': 10},
+        })
+
+    def test_counters_summed_across_jobs(self):
+        lines = [
+            '16/05/02 18:48:14 INFO mapreduce.Job: Counters: 1',
+            'Map-Reduce Framework',
+            'Map input records=10',
+            '16/05/02 18:48:14 INFO mapreduce.Job: Job job_1 completed successfully',
+        ]
+        self.assertEquals(self.parse(lines * 2), {'Map-Reduce Framework': {'Map input records': 20}})
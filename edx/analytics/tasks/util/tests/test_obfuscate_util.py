@@ -252,6 +252,10 @@ class FindMatchesTestCase(TestCase):
         actual = obfuscate_util.find_username(raw, username)
         self.assertEquals(expected, actual)
 
+    def test_find_username_in_non_ascii_str(self):
+        result = obfuscate_util.find_username('caf\xc3\xa9 testuser', u'testuser')
+        self.assertEquals(result, 'caf\xc3\xa9 <<USERNAME>>')
+
     #####################
     # fullname
     #####################
@@ -674,3 +678,38 @@ class ObfuscatorTestCase(TestCase):
         user_info = {'name': ['Olav Øyaland'.decode('utf8'), 'Test User']}
         result = obfuscator.obfuscate_structure(text, 'root', user_info=user_info)
         self.assertEquals(result, expected)
+
+
+class ObfuscatorPerformanceTestCase(TestCase):
+    """Test that patterns are not compiled or searched for needlessly."""
+
+    USER_INFO = {
+        'username': ['testusername'],
+        'user_id': [12345],
+        'name': ['Test User'],
+    }
+
+    def test_clean_text_not_searched(self):
+        obfuscator = obfuscate_util.Obfuscator()
+        text = u'{"attempts": 1, "correct_map": {"i4x-edX-1_2_1": {"correctness": "correct"}}}'
+        with patch('edx.analytics.tasks.util.obfuscate_util.find_all_matches') as mock_find_all_matches:
+            result = obfuscator.obfuscate_text(text, user_info=self.USER_INFO, entities=['email', 'phone', 'username'])
+        self.assertEquals(result, text)
+        self.assertFalse(mock_find_all_matches.called)
+
+    def test_replaced_values_searched(self):
+        # The username matches the label that replaces the email address.
+        result = obfuscate_util.Obfuscator().obfuscate_text(
+            u'Address: testusername@example.com.', user_info={'username': ['email']}
+        )
+        self.assertEquals(result, u'Address: <<<<USERNAME>>>>.')
+
+    def test_user_patterns_reused(self):
+        self.assertIs(obfuscate_util.get_username_pattern(u'someone'), obfuscate_util.get_username_pattern(u'someone'))
+        self.assertIs(obfuscate_util.get_userid_pattern(42), obfuscate_util.get_userid_pattern(42))
+        self.assertIs(
+            obfuscate_util.get_fullname_pattern(u'Some One'), obfuscate_util.get_fullname_pattern(u'Some One')
+        )
+
+    def test_rejected_fullname_pattern(self):
+        self.assertIsNone(obfuscate_util.get_fullname_pattern(u'user@example.com'))
@@ -410,6 +410,142 @@ class RecordTestCase(TestCase):
         self.assertEqual(test_record, new_record)
 
 
+@ddt
+class FastRecordTestCase(TestCase):
+    """Test the generated record classes and the batch conversions"""
+
+    def test_same_class(self):
+        self.assertIs(SampleStruct.get_fast_class(), SampleStruct.get_fast_class())
+        self.assertIsNot(SampleStruct.get_fast_class(), SampleStruct.get_fast_class(validate=False))
+
+    def test_positional_and_keyword_args(self):
+        fast_class = SampleStruct.get_fast_class()
+        test_record = fast_class('a', date=datetime.date(2015, 11, 1), index=10)
+        self.assertIsInstance(test_record, SampleStruct)
+        self.assertEqual(test_record.name, 'a')
+        self.assertEqual(test_record.index, 10)
+        self.assertEqual(test_record.date, datetime.date(2015, 11, 1))
+        self.assertEqual(vars(test_record), {})
+
+    def test_equality(self):
+        fast_record = SampleStruct.get_fast_class()('a', 10, datetime.date(2015, 11, 1))
+        test_record = SampleStruct('a', 10, datetime.date(2015, 11, 1))
+        self.assertEqual(fast_record, test_record)
+        self.assertEqual(hash(fast_record), hash(test_record))
+        self.assertEqual(repr(fast_record), repr(test_record))
+
+    @data(
+        (),
+        ('a',),
+        ('a', 10, datetime.date(2015, 11, 1), 'b'),
+    )
+    def test_wrong_number_of_args(self, args):
+        with self.assertRaises(TypeError):
+            SampleStruct.get_fast_class()(*args)
+
+    def test_unknown_field(self):
+        with self.assertRaises(TypeError):
+            SampleStruct.get_fast_class()('a', 10, datetime.date(2015, 11, 1), foo='bar')
+
+    def test_sparse(self):
+        test_record = ThreeFieldSparseRecord.get_fast_class()(second='b')
+        self.assertEqual(test_record, ThreeFieldSparseRecord(None, 'b', None))
+
+    def test_validation(self):
+        with self.assertRaisesRegexp(
+                ValueError, "Unable to assign the value 'a' to the field named \"index\": The value is not an integer"
+        ):
+            SampleStruct.get_fast_class()('a', 'a', None)
+
+    def test_without_validation(self):
+        test_record = SampleStruct.get_fast_class(validate=False)('a', 'a', None)
+        self.assertEqual(test_record.index, 'a')
+
+    def test_immutability(self):
+        test_record = SampleStruct.get_fast_class()('a', 10, None)
+        with self.assertRaisesRegexp(TypeError, 'Records are intended to be immutable'):
+            test_record.name = 'b'
+
+    def test_no_fields(self):
+        self.assertEqual(NoFields.get_fast_class()().to_string_tuple(), tuple())
+
+    def test_single_field(self):
+        test_record = SingleFieldRecord.get_fast_class()('foo')
+        self.assertEqual(test_record.to_string_tuple(), ('foo',))
+
+    def test_subclass(self):
+        test_record = ExtendedSingleField.get_fast_class()('foo', 'bar')
+        self.assertEqual(test_record.get_values(), ('foo', 'bar'))
+        self.assertEqual(ExtendedSingleField.get_fast_class().get_fields(), ExtendedSingleField.get_fields())
+
+    def test_replace(self):
+        test_record = SampleStruct.get_fast_class()('a', 10, None)
+        self.assertEqual(test_record.replace(name='b'), SampleStruct('b', 10, None))
+
+    @data(True, False)
+    def test_pickle(self, validate):
+        test_record = SampleStruct.get_fast_class(validate)('a', 10, datetime.date(2015, 11, 1))
+        unpickled_record = pickle.loads(pickle.dumps(test_record, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(unpickled_record, test_record)
+        self.assertIs(unpickled_record.__class__, test_record.__class__)
+
+    def test_from_tsv(self):
+        fast_class = SampleStruct.get_fast_class(validate=False)
+        test_record = fast_class.from_tsv('a\t10\t2015-11-01\n')
+        self.assertIs(test_record.__class__, fast_class)
+        self.assertEqual(test_record, SampleStruct('a', 10, datetime.date(2015, 11, 1)))
+
+    def test_to_string_tuples(self):
+        records = [
+            SampleStruct(UNICODE_STRING, 0, datetime.date(2015, 11, 1)),
+            SampleStruct.get_fast_class()(None, 1, None),
+        ]
+        self.assertEqual(
+            list(SampleStruct.to_string_tuples(records)),
+            [record.to_string_tuple() for record in records]
+        )
+        self.assertEqual(
+            list(SampleStruct.to_string_tuples(records, string_encoder=HiveTsvEncoder(null_value='empty'))),
+            [(UTF8_BYTE_STRING, '0', '2015-11-01'), ('empty', '1', 'empty')]
+        )
+
+    def test_to_separated_values_lines(self):
+        records = [
+            SampleStruct('a', 0, datetime.date(2015, 11, 1)),
+            SampleStruct('b', 1, None),
+        ]
+        self.assertEqual(
+            list(SampleStruct.to_separated_values_lines(records, sep=u',')),
+            ['a,0,2015-11-01', 'b,1,\\N']
+        )
+
+    def test_from_tsv_lines(self):
+        lines = ['a\t0\t2015-11-01\n', '\\N\t1\t\\N\n']
+        self.assertEqual(
+            list(SampleStruct.from_tsv_lines(lines)),
+            [SampleStruct('a', 0, datetime.date(2015, 11, 1)), SampleStruct(None, 1, None)]
+        )
+
+    def test_from_tsv_lines_length_mismatch(self):
+        with self.assertRaisesRegexp(
+                ValueError, 'The length of the tuple of strings must exactly match the number of fields in the Record'
+        ):
+            list(SampleStruct.from_tsv_lines(['a\t0\n']))
+
+    def test_custom_encoder(self):
+
+        class UpperCaseEncoder(HiveTsvEncoder):
+            """An encoder that changes the encoded values."""
+
+            def encode(self, decoded_string, field_obj):
+                return super(UpperCaseEncoder, self).encode(decoded_string, field_obj).upper()
+
+        self.assertEqual(
+            list(SingleFieldRecord.to_string_tuples([SingleFieldRecord('foo')], string_encoder=UpperCaseEncoder())),
+            [('FOO',)]
+        )
+
+
 class NoFields(Record):
     """A record without any fields"""
     pass
@@ -138,3 +138,10 @@ class ScalableS3ClientTestCase(TestCase):
         output = list(generator)
         expected_output = [(1, 0, 250), (2, 250, 250), (3, 500, 250), (4, 750, 150)]
         self.assertEquals(output, expected_output)
+
+    def test_copy_file(self):
+        self.client.copy_file('s3://source-bucket/path/to/file', 's3://dest-bucket/other/file')
+        self.client.s3.get_bucket.assert_called_once_with('dest-bucket', validate=False)
+        self.client.s3.get_bucket.return_value.copy_key.assert_called_once_with(
+            'other/file', 'source-bucket', 'path/to/file', headers={'x-amz-acl': s3_util.DEFAULT_KEY_ACCESS_POLICY}
+        )
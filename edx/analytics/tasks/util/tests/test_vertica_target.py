@@ -0,0 +1,45 @@
+"""Tests of the targets for tables in Vertica."""
+
+import json
+from unittest import TestCase
+
+import vertica_python.errors
+from mock import MagicMock, patch
+
+from edx.analytics.tasks.util.tests.target import FakeTarget
+from edx.analytics.tasks.util.vertica_target import CredentialFileVerticaTarget
+
+
+class CredentialFileVerticaTargetTest(TestCase):
+    """Test checking whether tables loaded into Vertica exist."""
+
+    def setUp(self):
+        patcher = patch('edx.analytics.tasks.util.vertica_target.VerticaTarget.connect')
+        self.mock_connect = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_cursor = self.mock_connect.return_value.cursor.return_value
+
+        credentials = FakeTarget(value=json.dumps({'host': 'localhost', 'username': 'user', 'password': 'pass'}))
+        self.target = CredentialFileVerticaTarget(
+            credentials_target=credentials,
+            schema='foobar',
+            table='dummy_table',
+            update_id='update_1',
+        )
+
+    def test_get_existing_update_ids(self):
+        self.mock_cursor.fetchall.return_value = [('update_1',)]
+        self.assertEquals(self.target.get_existing_update_ids(['update_1', 'update_2']), set(['update_1']))
+        self.assertTrue(self.mock_connect.return_value.close.called)
+
+    def test_get_existing_update_ids_with_missing_schema(self):
+        error_response = MagicMock()
+        error_response.error_message.return_value = 'Severity: ROLLBACK, Message: Schema "foobar" does not exist'
+        self.mock_cursor.execute.side_effect = vertica_python.errors.MissingSchema(error_response, 'SELECT update_id')
+        self.assertEquals(self.target.get_existing_update_ids(['update_1']), set())
+        self.assertFalse(self.target.exists())
+
+    def test_get_existing_update_ids_with_other_error(self):
+        self.mock_cursor.execute.side_effect = vertica_python.errors.ConnectionError('Connection refused')
+        with self.assertRaises(vertica_python.errors.ConnectionError):
+            self.target.get_existing_update_ids(['update_1'])
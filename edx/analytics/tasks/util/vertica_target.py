@@ -3,6 +3,8 @@ import logging
 import json
 import luigi
 
+from edx.analytics.tasks.util.connection_pool import ConnectionPool
+
 logger = logging.getLogger('luigi-interface')  # pylint: disable=invalid-name
 
 try:
@@ -16,6 +18,28 @@ except ImportError:
     vertica_client_available = False  # pylint: disable=invalid-name
 
 
+class VerticaConnectionPool(ConnectionPool):
+    """Reuses connections to Vertica databases."""
+
+    def is_healthy(self, connection):
+        if connection.closed():
+            return False
+        cursor = connection.cursor()
+        cursor.execute("SELECT 1")
+        cursor.fetchall()
+        return True
+
+    def reset(self, connection):
+        connection.rollback()
+        # Restore the session settings that VerticaCopyTask and RunVerticaSqlScriptTask change.
+        cursor = connection.cursor()
+        cursor.execute("SET SEARCH_PATH TO DEFAULT")
+        cursor.execute("SET TIME ZONE TO DEFAULT")
+
+
+VERTICA_CONNECTION_POOL = VerticaConnectionPool('vertica')
+
+
 class VerticaTarget(luigi.Target):
     """
     Target for a resource in HP Vertica
@@ -111,6 +135,41 @@ class VerticaTarget(luigi.Target):
                 connection.close()
         return row is not None
 
+    def marker_table_location(self):
+        """Identifies the database and marker table that this target is recorded in."""
+        return (self.host, self.port, self.user, self.marker_schema, self.marker_table)
+
+    def get_existing_update_ids(self, update_ids):
+        """
+        Returns the subset of `update_ids` that are recorded in this target's marker table.
+
+        This checks whether many targets that share a marker table exist using a single query.
+        """
+        if not update_ids:
+            return set()
+
+        connection = self.connect(autocommit=True)
+        cursor = connection.cursor()
+        try:
+            cursor.execute(
+                """SELECT update_id FROM {marker_schema}.{marker_table}
+                WHERE update_id IN ({placeholders})""".format(
+                    marker_schema=self.marker_schema,
+                    marker_table=self.marker_table,
+                    placeholders=', '.join(['%s'] * len(update_ids))
+                ),
+                tuple(update_ids)
+            )
+            return set(row[0] for row in cursor.fetchall())
+        except vertica_python.errors.Error as err:
+            if (type(err) is vertica_python.errors.MissingRelation) or ('Sqlstate: 42V01' in err.args[0]):
+                # If so, then our query error failed because the table doesn't exist.
+                return set()
+            else:
+                raise
+        finally:
+            connection.close()
+
     def connect(self, autocommit=False):
         """
         Creates a connection to a Vertica database using the supplied credentials.
@@ -121,9 +180,16 @@ class VerticaTarget(luigi.Target):
 
         # vertica-python 0.5.0 changes the code for connecting to databases to use kwargs instead of a dictionary.
         # The 'database' parameter is included for DBAPI reasons and does not actually affect the session.
-        connection = vertica_python.connect(user=self.user, password=self.password, host=self.host, port=self.port,
-                                            database="", autocommit=autocommit, read_timeout=self.read_timeout)
-        return connection
+        def create_connection():
+            """Open a new connection, for when there is no idle connection to reuse."""
+            return vertica_python.connect(user=self.user, password=self.password, host=self.host, port=self.port,
+                                          database="", autocommit=autocommit, read_timeout=self.read_timeout)
+
+        return VERTICA_CONNECTION_POOL.connect(
+            (self.host, self.port, self.user, self.password, self.read_timeout),
+            create_connection,
+            autocommit=autocommit
+        )
 
     def create_marker_table(self):
         """
@@ -200,3 +266,10 @@ class CredentialFileVerticaTarget(VerticaTarget):
             return super(CredentialFileVerticaTarget, self).exists(connection=connection)
         except vertica_python.errors.ProgrammingError:
             return False
+
+    def get_existing_update_ids(self, update_ids):
+        # Tolerate the same errors as exists(), so that checking in a batch agrees with checking each target.
+        try:
+            return super(CredentialFileVerticaTarget, self).get_existing_update_ids(update_ids)
+        except vertica_python.errors.ProgrammingError:
+            return set()
@@ -18,6 +18,9 @@ class EventTypeDistributionTask(EventLogSelectionMixin, MapReduceJobTask):
     output_root = luigi.Parameter()
     events_list_file_path = luigi.Parameter(default=None)
 
+    # Every event is counted, so combine the counts before they are shuffled to the reducers.
+    enable_map_side_aggregation = True
+
     def requires_local(self):
         return ExternalURL(url=self.events_list_file_path)
 
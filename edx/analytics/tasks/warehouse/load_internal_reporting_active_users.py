@@ -34,6 +34,9 @@ class ActiveUsersDownstreamMixin(
 class ActiveUsersTask(ActiveUsersDownstreamMixin, EventLogSelectionMixin, MapReduceJobTask):
     """Task to compute active users."""
 
+    # Each user is usually active many times a week, so only emit each user once from each mapper.
+    enable_map_side_aggregation = True
+
     def mapper(self, line):
         value = self.get_event_and_date_string(line)
 
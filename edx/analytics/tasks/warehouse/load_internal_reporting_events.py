@@ -630,6 +630,9 @@ class TrackingEventRecordDataTask(EventLogSelectionMixin, BaseEventRecordDataTas
     event_mapping = None
     PROJECT_NAME = 'tracking_prod'
 
+    # The date used is not always the top-level "time" field, see get_event_time().
+    prefilter_event_time = False
+
     counter_category_name = 'Tracking Event Exports'
 
     def get_event_emission_time(self, event):
@@ -756,7 +759,7 @@ class TrackingEventRecordDataTask(EventLogSelectionMixin, BaseEventRecordDataTas
         event_mapping = self.get_event_mapping()
         self.add_event_info(event_dict, event_mapping, event)
 
-        record = EventRecord(**event_dict)
+        record = EventRecord.get_fast_class()(**event_dict)
 
         key = (date_received, project_name)
 
@@ -803,6 +806,9 @@ class SegmentEventRecordDataTask(SegmentEventLogSelectionMixin, BaseEventRecordD
 
     counter_category_name = 'Segment Event Exports'
 
+    # Segment events store their timestamps in other fields, see get_event_time().
+    prefilter_event_time = False
+
     def _get_project_name(self, project_id):
         if project_id not in self.project_names:
             if self.config is None:
@@ -1018,7 +1024,7 @@ class SegmentEventRecordDataTask(SegmentEventLogSelectionMixin, BaseEventRecordD
         event_mapping = self.get_event_mapping()
         self.add_event_info(event_dict, event_mapping, event)
 
-        record = EventRecord(**event_dict)
+        record = EventRecord.get_fast_class()(**event_dict)
         key = (date_received, project_name)
 
         self.incr_counter(self.counter_category_name, 'Output From Mapper', 1)